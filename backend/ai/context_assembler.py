@@ -0,0 +1,297 @@
+"""
+Token-budgeted assembly of LLM prompts.
+
+ContextAssembler builds the chat messages of a prompt from named sections and
+keeps each of them within a token budget:
+
+- system: the stage template or system prompt
+- business_info: details of the business, appended to the system message
+- history: recent messages, dropped oldest first
+- extracted_data: data extracted from the message, serialized as compact JSON
+
+A stage template can place business_info and history itself through the
+{{business_info}} and {{last_10_messages}} variables. Those sections are still
+budgeted and trimmed on their own and only rendered into the template once
+they fit, so the system budget covers the template's own text.
+
+Each section is first cut to its own budget. If the prompt is still over
+max_prompt_tokens, sections are trimmed further in priority order: history
+first, then extracted data, business info and finally the system template.
+The user input itself is never cut.
+
+Tokens are counted with tiktoken's encoding for the model when tiktoken is
+installed, and estimated at about four characters per token otherwise. The
+per-section counts of every prompt are returned with the messages so callers
+can report them into llm_calls.
+"""
+
+import re
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - token counts fall back to an estimate
+    tiktoken = None
+
+from backend.config import Config
+
+log = logging.getLogger(__name__)
+
+# Sections in the order they are trimmed when the prompt is over budget
+TRIM_ORDER = ('history', 'extracted_data', 'business_info', 'system')
+
+# Chat format overhead: tokens wrapping every message and priming the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+TRUNCATION_MARKER = ' ...'
+
+# Template variables through which a system template places a section
+SECTION_VARIABLES = {'business_info': 'business_info', 'last_10_messages': 'history'}
+SECTION_PLACEHOLDER = re.compile(
+    r'\{\{\s*(business_info|last_10_messages)\s*\}\}|\{(business_info|last_10_messages)\}'
+)
+
+
+@lru_cache(maxsize=32)
+def _encoding(model: str):
+    """Get the tiktoken encoding for a model, or None to fall back to estimates."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        log.warning(f"No tiktoken encoding available for {model}, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: Optional[str], model: str) -> int:
+    """Count the tokens of a text for a model."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Cut a text to at most max_tokens tokens, keeping its beginning."""
+    if max_tokens <= 0 or not text:
+        return ''
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    keep = max_tokens - count_tokens(TRUNCATION_MARKER, model)
+    if keep <= 0:
+        return ''
+    encoding = _encoding(model)
+    if encoding is None:
+        head = text[:max(0, (keep - 1) * 4)]
+    else:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:keep])
+    return head.rstrip() + TRUNCATION_MARKER
+
+
+def _without_empty(value: Any) -> Any:
+    if isinstance(value, dict):
+        items = ((key, _without_empty(item)) for key, item in value.items())
+        return {key: item for key, item in items if item not in (None, '', [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_without_empty(item) for item in value]
+    return value
+
+
+def compact_json(value: Any) -> str:
+    """Serialize a value as JSON without whitespace or empty fields."""
+    return json.dumps(_without_empty(value), separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def embedded_sections(template: Optional[str]) -> Set[str]:
+    """Sections a system template places itself through their template variables."""
+    return {
+        SECTION_VARIABLES[match.group(1) or match.group(2)]
+        for match in SECTION_PLACEHOLDER.finditer(template or '')
+    }
+
+
+def _render_sections(template: str, values: Dict[str, str]) -> str:
+    return SECTION_PLACEHOLDER.sub(lambda match: values[SECTION_VARIABLES[match.group(1) or match.group(2)]], template)
+
+
+class AssembledPrompt(NamedTuple):
+    """Chat messages of a prompt and the token count of each section."""
+    messages: List[Dict[str, str]]
+    token_counts: Dict[str, int]
+
+
+class ContextAssembler:
+    """Builds chat messages from prompt sections within per-section token budgets."""
+
+    def __init__(
+        self,
+        model: str,
+        max_prompt_tokens: int = 6000,
+        budgets: Optional[Dict[str, int]] = None
+    ):
+        """
+        Initialize the assembler.
+
+        Args:
+            model: Model whose tokenizer is used to count tokens
+            max_prompt_tokens: Budget for the whole prompt, including the user input
+            budgets: Token budget per section (system, business_info, history, extracted_data)
+        """
+        self.model = model
+        self.max_prompt_tokens = max_prompt_tokens
+        self.budgets = dict(budgets or {})
+
+    def count(self, text: Optional[str]) -> int:
+        """Count the tokens of a text for this assembler's model."""
+        return count_tokens(text, self.model)
+
+    def fit_text(self, section: str, text: Optional[str], budget: Optional[int] = None) -> str:
+        """Cut a text section to its budget; sections without a budget are kept whole."""
+        budget = self.budgets.get(section) if budget is None else budget
+        if not text or budget is None:
+            return text or ''
+        return truncate_tokens(text, budget, self.model)
+
+    def fit_messages(
+        self,
+        messages: Sequence[Dict[str, Any]],
+        budget: Optional[int] = None,
+        content_key: str = 'content'
+    ) -> List[Dict[str, Any]]:
+        """
+        Keep the latest messages that fit in the history budget.
+
+        Messages are dropped oldest first. If even the latest message is over
+        the budget on its own, it is kept and cut to fit.
+
+        Args:
+            messages: Messages, oldest first
+            budget: Token budget; defaults to the history budget
+            content_key: Key holding the text of each message
+
+        Returns:
+            The messages that fit, oldest first
+        """
+        budget = self.budgets.get('history') if budget is None else budget
+        if budget is None:
+            return list(messages)
+        kept, used = [], 0
+        for message in reversed(messages):
+            cost = self.count(message.get(content_key)) + MESSAGE_OVERHEAD_TOKENS
+            if used + cost > budget:
+                if not kept and budget > MESSAGE_OVERHEAD_TOKENS:
+                    content = truncate_tokens(message.get(content_key) or '', budget - MESSAGE_OVERHEAD_TOKENS, self.model)
+                    kept.append(dict(message, **{content_key: content}))
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+        return kept
+
+    def assemble(
+        self,
+        system: str,
+        user_input: str,
+        business_info: Optional[str] = None,
+        history: Optional[Sequence[Dict[str, str]]] = None,
+        extracted_data: Optional[Dict[str, Any]] = None,
+        budgeted: bool = True
+    ) -> AssembledPrompt:
+        """
+        Build the chat messages of a prompt within the token budgets.
+
+        Args:
+            system: System template or prompt
+            user_input: The user message, sent as is
+            business_info: Optional business details, appended to the system
+                message or rendered at {{business_info}}
+            history: Optional chat messages ({'role', 'content'}), oldest first,
+                sent as messages or rendered at {{last_10_messages}} as compact JSON
+            extracted_data: Optional extracted data, sent as compact JSON
+            budgeted: If False, the sections are only counted, not cut. For
+                calls whose caller already sizes the prompt, such as summaries.
+
+        Returns:
+            AssembledPrompt with the messages and per-section token counts
+        """
+        original = {
+            'system': system or '',
+            'business_info': business_info or '',
+            'extracted_data': compact_json(extracted_data) if extracted_data else '',
+        }
+        history = list(history or [])
+        sections = dict(original)
+        if budgeted:
+            sections = {name: self.fit_text(name, text) for name, text in original.items()}
+            history = self.fit_messages(history)
+
+        counts = {name: self.count(text) for name, text in sections.items()}
+        counts['history'] = sum(self.count(message['content']) for message in history)
+        counts['input'] = self.count(user_input)
+
+        excess = self._total(counts, sections, history) - self.max_prompt_tokens if budgeted else 0
+        for name in TRIM_ORDER:
+            if excess <= 0:
+                break
+            if not counts[name]:
+                continue
+            before = self._total(counts, sections, history)
+            if name == 'history':
+                history = self.fit_messages(history, budget=max(0, counts['history'] + len(history) * MESSAGE_OVERHEAD_TOKENS - excess))
+                counts['history'] = sum(self.count(message['content']) for message in history)
+            else:
+                sections[name] = truncate_tokens(sections[name], counts[name] - excess, self.model)
+                counts[name] = self.count(sections[name])
+            excess -= before - self._total(counts, sections, history)
+
+        embedded = embedded_sections(sections['system'])
+        system_content = sections['system']
+        if embedded:
+            system_content = _render_sections(system_content, {
+                'business_info': sections['business_info'],
+                'history': compact_json([
+                    {'sender': message['role'], 'content': message['content']} for message in history
+                ]),
+            })
+        if 'business_info' not in embedded:
+            system_content = '\n\n'.join(text for text in (system_content, sections['business_info']) if text)
+
+        messages = []
+        if system_content:
+            messages.append({'role': 'system', 'content': system_content})
+        if 'history' not in embedded:
+            messages.extend({'role': message['role'], 'content': message['content']} for message in history)
+        if sections['extracted_data']:
+            messages.append({'role': 'system', 'content': f"Context: {sections['extracted_data']}"})
+        messages.append({'role': 'user', 'content': user_input})
+
+        counts['total'] = sum(self.count(message['content']) for message in messages) + \
+            len(messages) * MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+        return AssembledPrompt(messages, counts)
+
+    @staticmethod
+    def _total(counts: Dict[str, int], sections: Dict[str, str], history: Sequence[Dict[str, str]]) -> int:
+        """Approximate size of the prompt the sections would produce."""
+        message_count = 1 + len(history) + bool(sections['system'] or sections['business_info']) + \
+            bool(sections['extracted_data'])
+        return sum(counts[name] for name in ('system', 'business_info', 'extracted_data', 'history', 'input')) + \
+            message_count * MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+
+
+# Assembler for the configured model, used by the template variables
+context_assembler = ContextAssembler(
+    Config.LLM_MODEL,
+    max_prompt_tokens=Config.LLM_CONTEXT_MAX_TOKENS,
+    budgets=Config.LLM_CONTEXT_BUDGETS
+)
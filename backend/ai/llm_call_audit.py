@@ -0,0 +1,252 @@
+"""
+Background, batched writer for the llm_calls audit table.
+
+LLMCallAuditSink queues llm_calls rows in memory and a background thread
+writes them with execute_values, one multi-row INSERT and one commit per
+batch, so recording a call does not touch the database on the request path.
+
+- A batch is flushed when batch_size rows are queued or flush_interval
+  seconds have passed since the oldest queued row.
+- The queue is bounded. When it is full, the overflow policy decides what
+  happens: drop the oldest row (default), drop the new row, or block the
+  caller for up to block_timeout seconds.
+- close() stops accepting rows, flushes what is queued and joins the thread.
+  The module-level llm_call_sink is closed at exit.
+
+record() never blocks on the database and never raises, so it is safe to call
+from request handlers and from coroutines.
+"""
+
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from psycopg2.extras import Json, execute_values
+
+from backend.config import Config
+
+log = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+LLM_CALL_COLUMNS = (
+    'call_id', 'business_id', 'input_text', 'response',
+    'system_prompt', 'call_type', 'created_at',
+    'prompt_tokens', 'token_counts'
+)
+
+
+def _default_connection() -> Tuple[Callable[[], Any], Callable[[Any], None]]:
+    from backend.db import get_db_connection, release_db_connection
+    return get_db_connection, release_db_connection
+
+
+class LLMCallAuditSink:
+    """Queues llm_calls rows and writes them in batches from a background thread."""
+
+    def __init__(
+        self,
+        get_connection: Optional[Callable[[], Any]] = None,
+        release_connection: Optional[Callable[[Any], None]] = None,
+        max_queue_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        overflow_policy: str = 'drop_oldest',
+        block_timeout: float = 0.5,
+        max_retries: int = 2
+    ):
+        """
+        Initialize the sink. The writer thread starts on the first record.
+
+        Args:
+            get_connection: Returns a psycopg2 connection; defaults to the app pool
+            release_connection: Returns a connection to its pool
+            max_queue_size: Maximum number of rows waiting to be written
+            batch_size: Rows written per INSERT; reaching it triggers a flush
+            flush_interval: Maximum seconds a queued row waits for a flush
+            overflow_policy: 'drop_oldest', 'drop_newest' or 'block'
+            block_timeout: Seconds record() may block under the 'block' policy
+            max_retries: Extra attempts for a batch whose write failed
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        if get_connection is None:
+            get_connection, release_connection = _default_connection()
+
+        self._get_connection = get_connection
+        self._release_connection = release_connection or (lambda conn: None)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.closed = False
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='llm-call-audit', daemon=True)
+                self._thread.start()
+
+    def record(
+        self,
+        business_id: str,
+        input_text: str,
+        response: str,
+        system_prompt: Optional[str] = None,
+        call_type: Optional[str] = None,
+        call_id: Optional[str] = None,
+        created_at: Optional[datetime] = None,
+        token_counts: Optional[Dict[str, int]] = None
+    ) -> bool:
+        """
+        Queue an LLM call for writing.
+
+        Args:
+            business_id: UUID of the business
+            input_text: Input text sent to the LLM
+            response: Response received from the LLM
+            system_prompt: System prompt used for the call
+            call_type: Type of call (e.g. 'intent', 'extraction', 'response')
+            call_id: Optional call id; a new UUID is generated if not given
+            created_at: Time of the call; defaults to now
+            token_counts: Prompt token count per section, with the total under 'total'
+
+        Returns:
+            True if the row was queued, False if it was dropped
+        """
+        if self.closed:
+            log.warning("LLM call audit sink is closed, dropping row")
+            return False
+
+        row = (
+            call_id or str(uuid.uuid4()),
+            business_id,
+            input_text,
+            response,
+            system_prompt,
+            call_type,
+            created_at or datetime.now(timezone.utc),
+            token_counts.get('total') if token_counts else None,
+            Json(token_counts) if token_counts else None,
+        )
+        self._ensure_started()
+
+        try:
+            if self.overflow_policy == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow_policy != 'drop_oldest':
+                log.warning("LLM call audit queue is full, dropping new row")
+                return False
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                return False
+            log.warning("LLM call audit queue is full, dropped oldest row")
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _take_batch(self) -> List[tuple]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        """Write one batch, retrying on failure before giving up on it."""
+        for attempt in range(self.max_retries + 1):
+            conn = None
+            try:
+                conn = self._get_connection()
+                with conn.cursor() as cursor:
+                    execute_values(
+                        cursor,
+                        f"INSERT INTO llm_calls ({', '.join(LLM_CALL_COLUMNS)}) VALUES %s",
+                        batch,
+                        page_size=self.batch_size
+                    )
+                conn.commit()
+                return
+            except Exception as e:
+                log.error(f"Error writing {len(batch)} LLM call rows (attempt {attempt + 1}): {str(e)}")
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                if attempt < self.max_retries:
+                    time.sleep(min(1.0, 0.1 * (2 ** attempt)))
+            finally:
+                if conn is not None:
+                    try:
+                        self._release_connection(conn)
+                    except Exception as release_error:
+                        log.error(f"Error releasing connection: {str(release_error)}")
+        log.error(f"Dropping {len(batch)} LLM call rows after {self.max_retries + 1} failed attempts")
+
+    def flush(self) -> None:
+        """Write everything currently queued, in batches, on the calling thread."""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write_batch(batch)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # Write full batches right away; a partial batch has waited at most flush_interval
+            self.flush()
+        self.flush()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Stop accepting rows, flush the queue and stop the writer thread.
+
+        Args:
+            timeout: Seconds to wait for the final flush
+        """
+        self.closed = True
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                log.warning(f"LLM call audit sink did not finish flushing within {timeout}s")
+        else:
+            self.flush()
+
+
+llm_call_sink = LLMCallAuditSink(
+    max_queue_size=Config.LLM_AUDIT_MAX_QUEUE,
+    batch_size=Config.LLM_AUDIT_BATCH_SIZE,
+    flush_interval=Config.LLM_AUDIT_FLUSH_INTERVAL,
+    overflow_policy=Config.LLM_AUDIT_OVERFLOW_POLICY
+)
+atexit.register(llm_call_sink.close)
@@ -0,0 +1,288 @@
+"""
+Response cache for deterministic LLM calls.
+
+Intent classification runs at temperature 0.0 against a short list of stage
+names, so the same model, system prompt, stage list and message always give
+the same answer. Those answers are cached under a SHA-256 hash of the four
+inputs, with the message normalized (case, whitespace and trailing
+punctuation) so "Hi!" and "hi" share an entry. Entries live in Redis with a
+TTL and are shared by all workers; without Redis an in-process LRU is used.
+
+An optional near-duplicate lookup catches messages that differ by a word or
+a typo. Each process keeps a bounded shingle index per (model, prompt,
+stages) scope and reuses the answer of the most similar cached message if
+its Jaccard similarity over character trigrams reaches the threshold. It is
+off unless LLM_CACHE_NEAR_DUPLICATE_THRESHOLD is set.
+
+Hits, near hits and misses are counted per business.
+"""
+
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from backend.config import Config
+from backend.message_processing.services.storage.redis_manager import RedisStateManager
+
+log = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s.!?,;:]+$')
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    text = _WHITESPACE.sub(' ', (text or '').lower()).strip()
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    """Character shingles of a normalized text."""
+    padded = f" {text} "
+    if len(padded) <= size:
+        return frozenset([padded])
+    return frozenset(padded[i:i + size] for i in range(len(padded) - size + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class LLMResponseCache:
+    """Exact and near-duplicate cache for deterministic LLM calls."""
+
+    def __init__(
+        self,
+        call_types: Iterable[str] = ('intent',),
+        ttl: int = 86400,
+        max_local_entries: int = 5000,
+        near_duplicate_threshold: float = 0.0,
+        max_index_entries: int = 500,
+        redis_manager: Optional[RedisStateManager] = None,
+        use_redis: bool = True,
+        enabled: bool = True
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            call_types: Call types whose responses are deterministic and cacheable
+            ttl: Seconds a response is kept
+            max_local_entries: Size of the in-process fallback when Redis is unavailable
+            near_duplicate_threshold: Minimum trigram Jaccard similarity for a
+                near-duplicate hit; 0 disables the lookup
+            max_index_entries: Messages kept in each near-duplicate index scope
+            redis_manager: Redis state manager; created on first use if not given
+            use_redis: Whether to store responses in Redis
+            enabled: Whether the cache is used at all
+        """
+        self.call_types = frozenset(call_types)
+        self.ttl = ttl
+        self.max_local_entries = max_local_entries
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.max_index_entries = max_index_entries
+        self.use_redis = use_redis
+        self.enabled = enabled
+        self._redis_manager = redis_manager
+        self._lock = threading.Lock()
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._index: Dict[str, "OrderedDict[str, Tuple[FrozenSet[str], str]]"] = {}
+        self._business_metrics: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {'hits': 0, 'near_hits': 0, 'misses': 0}
+        )
+
+    @property
+    def redis_manager(self) -> Optional[RedisStateManager]:
+        if self.use_redis and self._redis_manager is None:
+            self._redis_manager = RedisStateManager()
+        return self._redis_manager
+
+    def is_cacheable(self, call_type: str) -> bool:
+        return self.enabled and call_type in self.call_types
+
+    @staticmethod
+    def _scope(model: str, system_prompt: str, stages: Optional[Iterable[str]]) -> str:
+        payload = json.dumps([model, system_prompt or '', sorted(stages or [])])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _key(scope: str, normalized: str) -> str:
+        digest = hashlib.sha256(f"{scope}\n{normalized}".encode('utf-8')).hexdigest()
+        return f"llm_cache:{digest}"
+
+    def _count(self, business_id: Optional[str], metric: str) -> None:
+        with self._lock:
+            self._business_metrics[str(business_id or 'unknown')][metric] += 1
+
+    def _get_exact(self, key: str) -> Optional[str]:
+        redis_manager = self.redis_manager
+        if redis_manager is not None and redis_manager.redis_client is not None:
+            cached = redis_manager.get_state(key)
+            return cached.get('response') if cached else None
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return response
+
+    def _set_exact(self, key: str, response: str) -> None:
+        redis_manager = self.redis_manager
+        if redis_manager is not None and redis_manager.redis_client is not None:
+            redis_manager.set_state(key, {'response': response}, ttl=self.ttl)
+            return
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, response)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def _find_near_duplicate(self, scope: str, normalized: str) -> Optional[str]:
+        candidate = shingles(normalized)
+        best_score, best_response = 0.0, None
+        with self._lock:
+            for entry_shingles, response in self._index.get(scope, {}).values():
+                score = jaccard(candidate, entry_shingles)
+                if score > best_score:
+                    best_score, best_response = score, response
+        if best_score >= self.near_duplicate_threshold:
+            return best_response
+        return None
+
+    def _index_message(self, scope: str, normalized: str, response: str) -> None:
+        with self._lock:
+            entries = self._index.setdefault(scope, OrderedDict())
+            entries[normalized] = (shingles(normalized), response)
+            entries.move_to_end(normalized)
+            while len(entries) > self.max_index_entries:
+                entries.popitem(last=False)
+
+    def get(
+        self,
+        call_type: str,
+        model: str,
+        system_prompt: str,
+        input_text: str,
+        stages: Optional[Iterable[str]] = None,
+        business_id: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Look up a cached response.
+
+        Args:
+            call_type: Type of call; only configured call types are cached
+            model: Model name
+            system_prompt: System prompt sent with the call
+            input_text: User input before stage formatting
+            stages: Stage names offered to the classifier
+            business_id: Business the call is made for, used for hit rates
+
+        Returns:
+            The cached response, or None on a miss
+        """
+        if not self.is_cacheable(call_type):
+            return None
+        try:
+            scope = self._scope(model, system_prompt, stages)
+            normalized = normalize_text(input_text)
+            response = self._get_exact(self._key(scope, normalized))
+            if response is not None:
+                self._count(business_id, 'hits')
+                return response
+            if self.near_duplicate_threshold > 0:
+                response = self._find_near_duplicate(scope, normalized)
+                if response is not None:
+                    self._count(business_id, 'near_hits')
+                    return response
+        except Exception as e:
+            log.warning(f"LLM response cache lookup failed: {str(e)}")
+        self._count(business_id, 'misses')
+        return None
+
+    def set(
+        self,
+        call_type: str,
+        model: str,
+        system_prompt: str,
+        input_text: str,
+        response: str,
+        stages: Optional[Iterable[str]] = None
+    ) -> None:
+        """
+        Store a response for a deterministic call.
+
+        Args:
+            call_type: Type of call; other call types are ignored
+            model: Model name
+            system_prompt: System prompt sent with the call
+            input_text: User input before stage formatting
+            response: Final response returned to the caller
+            stages: Stage names offered to the classifier
+        """
+        if not self.is_cacheable(call_type) or not response:
+            return
+        try:
+            scope = self._scope(model, system_prompt, stages)
+            normalized = normalize_text(input_text)
+            self._set_exact(self._key(scope, normalized), response)
+            if self.near_duplicate_threshold > 0:
+                self._index_message(scope, normalized, response)
+        except Exception as e:
+            log.warning(f"LLM response cache store failed: {str(e)}")
+
+    def clear_local(self) -> None:
+        """Drop the in-process entries, near-duplicate index and counters."""
+        with self._lock:
+            self._local.clear()
+            self._index.clear()
+            self._business_metrics.clear()
+
+    def stats(self, business_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get hit rates overall and per business.
+
+        Args:
+            business_id: Limit the per-business breakdown to one business
+
+        Returns:
+            Totals plus a 'businesses' mapping of business id to counters
+        """
+        with self._lock:
+            businesses = {
+                business: dict(metrics) for business, metrics in self._business_metrics.items()
+                if business_id is None or business == str(business_id)
+            }
+        totals = {'hits': 0, 'near_hits': 0, 'misses': 0}
+        for metrics in businesses.values():
+            lookups = metrics['hits'] + metrics['near_hits'] + metrics['misses']
+            metrics['hit_rate'] = round((lookups - metrics['misses']) / lookups, 4) if lookups else 0.0
+            for name in totals:
+                totals[name] += metrics[name]
+        lookups = sum(totals.values())
+        return {
+            'enabled': self.enabled,
+            'call_types': sorted(self.call_types),
+            **totals,
+            'hit_rate': round((lookups - totals['misses']) / lookups, 4) if lookups else 0.0,
+            'businesses': businesses,
+        }
+
+
+llm_response_cache = LLMResponseCache(
+    call_types=Config.LLM_CACHE_CALL_TYPES,
+    ttl=Config.LLM_CACHE_TTL,
+    max_local_entries=Config.LLM_CACHE_MAX_LOCAL_ENTRIES,
+    near_duplicate_threshold=Config.LLM_CACHE_NEAR_DUPLICATE_THRESHOLD,
+    enabled=Config.LLM_CACHE_ENABLED
+)
@@ -9,11 +9,16 @@ various types of LLM calls.
 import logging
 import json
 import os
-import uuid
 from typing import Dict, Any, Optional, List
 from datetime import datetime
-from openai import OpenAI
-from backend.db import get_db_connection, release_db_connection, CONNECTION_POOL
+from backend.config import Config
+from backend.ai.llm_transport import llm_transport
+from backend.ai.llm_call_audit import llm_call_sink
+from backend.ai.llm_response_cache import llm_response_cache
+from backend.ai.context_assembler import ContextAssembler
+from backend.db import CONNECTION_POOL
+from backend.message_processing.template_variables import query_recent_messages
+from backend.message_processing.services.storage.message_window import message_window
 
 log = logging.getLogger(__name__)
 
@@ -25,19 +30,30 @@ class LLMService:
     with support for different agents and conversation contexts.
     """
     
-    def __init__(self, db_pool=None, api_key: Optional[str] = None):
+    MODEL = "gpt-3.5-turbo"  # You can adjust to gpt-4 or other models
+    
+    def __init__(self, db_pool=None, api_key: Optional[str] = None, audit_sink=None, response_cache=None,
+                 context_assembler=None):
         """
         Initialize the LLM service.
         
         Args:
             db_pool: Database connection pool
             api_key: Optional API key for the language model service
+            audit_sink: Optional LLMCallAuditSink; defaults to the shared sink
+            response_cache: Optional LLMResponseCache; defaults to the shared cache
+            context_assembler: Optional ContextAssembler; defaults to one for MODEL within the configured budgets
         """
+        self.audit_sink = audit_sink or llm_call_sink
+        self.response_cache = response_cache or llm_response_cache
+        self.context_assembler = context_assembler or ContextAssembler(
+            self.MODEL, max_prompt_tokens=Config.LLM_CONTEXT_MAX_TOKENS, budgets=Config.LLM_CONTEXT_BUDGETS
+        )
         self.api_key = api_key or os.environ.get('OPENAI_API_KEY')
         if not self.api_key:
             log.warning("No API key provided for LLM service")
         else:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = llm_transport.get_openai_client(self.api_key)
         # Store for conversation histories - only used for response generation
         self._conversation_store: Dict[str, List[Dict[str, str]]] = {}
         
@@ -67,9 +83,10 @@ class LLMService:
     
     def _save_llm_call(self, business_id: str, input_text: str, response: str, 
                       system_prompt: str, call_type: str, conversation_id: str = None,
-                      llm_call_id: Optional[str] = None) -> None:
+                      llm_call_id: Optional[str] = None,
+                      token_counts: Optional[Dict[str, int]] = None) -> None:
         """
-        Save an LLM call to the database.
+        Queue an LLM call for the llm_calls audit table.
         
         Args:
             business_id: UUID of the business
@@ -79,6 +96,7 @@ class LLMService:
             call_type: Type of call (e.g., 'intent', 'extraction', 'response')
             conversation_id: UUID of the conversation (optional)
             llm_call_id: Optional LLM call ID to use for tracking (if provided, will be used for all calls in the conversation)
+            token_counts: Prompt token count per section, from the context assembler
         """
         # Validate required fields
         if not business_id:
@@ -98,64 +116,17 @@ class LLMService:
             log.error("Cannot save LLM call: response is required")
             return
             
-        conn = None
-        cursor = None
-        try:
-            log.info(f"Saving LLM call: type={call_type}, conversation_id={conversation_id}, llm_call_id={llm_call_id}")
-            log.debug(f"Input text: {input_text[:100]}...")  # Log first 100 chars of input
-            log.debug(f"Response: {response[:100]}...")  # Log first 100 chars of response
-            
-            conn = get_db_connection()
-            if not conn:
-                log.error("Failed to get database connection")
-                return
-                
-            cursor = conn.cursor()
-            
-            # Always generate a new call_id for each LLM call
-            call_id = str(uuid.uuid4())
-            log.info(f"Generated new call_id for LLM call: {call_id}")
-            
-            # If conversation_id is provided, update the conversation's llm_call_id
-            # This is used for tracking purposes but doesn't affect the individual call IDs
-            # Note: This is now managed in the message_handler to prevent reusing the same llm_call_id
-            
-            # Insert new record with the unique call_id
-            cursor.execute(
-                """
-                INSERT INTO llm_calls (
-                    call_id, business_id, input_text, response, 
-                    system_prompt, call_type, created_at
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                """,
-                (call_id, business_id, input_text, response, system_prompt, call_type)
-            )
-            log.info(f"Created new LLM call record with call_id: {call_id}")
-            
-            # Commit all changes in a single transaction
-            conn.commit()
-            log.info(f"Successfully saved LLM call with call_id: {call_id}")
-            log.info(f"Saved LLM call with call_type={call_type}, conversation_id={conversation_id}")
-                
-        except Exception as e:
-            log.error(f"Error saving LLM call: {str(e)}", exc_info=True)
-            if conn:
-                try:
-                    conn.rollback()
-                except Exception as rollback_error:
-                    log.error(f"Error rolling back transaction: {str(rollback_error)}")
-        finally:
-            if cursor:
-                try:
-                    cursor.close()
-                except Exception as e:
-                    log.error(f"Error closing cursor: {str(e)}")
-            if conn:
-                try:
-                    release_db_connection(conn)
-                except Exception as e:
-                    log.error(f"Error releasing connection: {str(e)}")
+        # Rows are written in batches by the audit sink, off the request path
+        queued = self.audit_sink.record(
+            business_id=business_id,
+            input_text=input_text,
+            response=response,
+            system_prompt=system_prompt,
+            call_type=call_type,
+            token_counts=token_counts
+        )
+        if queued:
+            log.debug(f"Queued LLM call: type={call_type}, conversation_id={conversation_id}, llm_call_id={llm_call_id}")
     
     def generate_response(self, input_text: str, system_prompt: str = "", 
                          conversation_id: Optional[str] = None,
@@ -184,52 +155,50 @@ class LLMService:
             # Log the request
             log.info(f"Generating {call_type} response for conversation {conversation_id}, agent {agent_id}")
             
+            # Deterministic calls (intent classification) are answered from the cache when possible
+            cached = self.response_cache.get(
+                call_type, self.MODEL, system_prompt, input_text,
+                stages=available_stages, business_id=business_id
+            )
+            if cached is not None:
+                log.info(f"Serving cached {call_type} response for conversation {conversation_id}")
+                return cached
+            
             if not self.api_key:
                 log.error("No OpenAI API key available")
                 return "Error: OpenAI API key not configured"
             
-            # Prepare the messages for the API
-            messages = []
-            
-            # Add system prompt if provided
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            else:
-                # Default system prompts based on call type
+            # Use the system prompt if provided, otherwise a default based on call type
+            prompt = system_prompt
+            if not prompt:
                 if call_type == "intent":
-                    intent_prompt = (
+                    prompt = (
                         "You are a stage classifier. Your task is to select ONE stage name from the available stages list "
                         "that best matches the user's message. You must ONLY respond with the exact stage name - no other text. "
                         "If unsure, choose 'Default Conversation Stage'."
                     )
-                    messages.append({"role": "system", "content": intent_prompt})
                 elif call_type == "extraction":
-                    messages.append({"role": "system", "content": "You are a data extractor. Extract key information from the input in a structured format."})
+                    prompt = "You are a data extractor. Extract key information from the input in a structured format."
                 else:
-                    messages.append({"role": "system", "content": "You are a helpful assistant."})
+                    prompt = "You are a helpful assistant."
             
             # Only include conversation history for response generation
+            history = []
             if call_type == "response" and conversation_id:
-                # Fetch conversation history from database
-                conn = self.db_pool.getconn()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        SELECT message_content, sender_type = 'ai' as is_from_ai
-                        FROM messages
-                        WHERE conversation_id = %s
-                        ORDER BY created_at ASC
-                        LIMIT 10
-                    """, (conversation_id,))
-                    
-                    history = cursor.fetchall()
-                    for msg in history:
-                        role = "assistant" if msg[1] else "user"
-                        messages.append({"role": role, "content": msg[0]})
-                    
-                    log.info(f"Included {len(history)} messages from conversation history for {conversation_id}")
-                finally:
-                    self.db_pool.putconn(conn)
+                # Latest messages from the conversation's message window; a connection
+                # is only borrowed from the pool on a miss
+                def load_messages(count):
+                    conn = self.db_pool.getconn()
+                    try:
+                        return query_recent_messages(conn, conversation_id, count)
+                    finally:
+                        self.db_pool.putconn(conn)
+                
+                recent = message_window.get_or_load(conversation_id, 10, load_messages)
+                history = [
+                    {"role": "user" if msg['sender_type'] == 'user' else "assistant", "content": msg['message_content']}
+                    for msg in recent
+                ]
             
             # For intent detection, format the input to include available stages
             if call_type == "intent" and available_stages:
@@ -239,10 +208,21 @@ class LLMService:
                     f"User message: {input_text}\n\n"
                     f"Select exactly one stage name from the above list."
                 )
-                messages.append({"role": "user", "content": formatted_input})
             else:
-                # Add the current user message as is for other call types
-                messages.append({"role": "user", "content": input_text})
+                # Send the current user message as is for other call types
+                formatted_input = input_text
+            
+            # Fit response prompts into their token budgets; the oldest history goes first.
+            # Other call types size their own prompts (summaries batch their transcripts)
+            assembled = self.context_assembler.assemble(
+                prompt, formatted_input, history=history, budgeted=call_type == "response"
+            )
+            messages = assembled.messages
+            if history:
+                log.info(
+                    f"Included {len(messages) - 2} of {len(history)} history messages for {conversation_id} "
+                    f"({assembled.token_counts['total']} prompt tokens)"
+                )
             
             # Set temperature based on call type
             temperature = 0.0 if call_type == "intent" else 0.3 if call_type == "extraction" else 0.7
@@ -250,7 +230,7 @@ class LLMService:
             # Call the OpenAI API
             log.info(f"Calling OpenAI API for {call_type} with temperature {temperature}")
             response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",  # You can adjust to gpt-4 or other models
+                model=self.MODEL,
                 messages=messages,
                 temperature=temperature,  # Lower temperature for more deterministic responses
                 max_tokens=500
@@ -290,7 +270,8 @@ class LLMService:
                             system_prompt=system_prompt,
                             call_type=call_type,
                             conversation_id=conversation_id,
-                            llm_call_id=llm_call_id
+                            llm_call_id=llm_call_id,
+                            token_counts=assembled.token_counts
                         )
                         log.info(f"Saved LLM call with call_type={call_type}, conversation_id={conversation_id}")
                     else:
@@ -313,6 +294,11 @@ class LLMService:
                 if available_stages and assistant_message not in available_stages:
                     assistant_message = "Default Conversation Stage"
             
+            self.response_cache.set(
+                call_type, self.MODEL, system_prompt, input_text, assistant_message,
+                stages=available_stages
+            )
+            
             return assistant_message
                 
         except Exception as e:
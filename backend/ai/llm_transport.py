@@ -0,0 +1,190 @@
+"""
+Shared HTTP transport for LLM calls.
+
+Keeps pooled, keep-alive HTTP clients per process:
+
+- an aiohttp.ClientSession per event loop for the async services. Sessions
+  cannot be shared across loops, so they are meant for the long-lived loops
+  of the handler loop and the ingestion workers; the owner of a loop closes
+  its session with aclose() before stopping the loop (MessageHandler.close
+  does this).
+- an openai.OpenAI client per (api_key, base_url) for the sync services
+
+The module-level llm_transport is configured from the LLM_HTTP_* settings in
+Config and closed at process exit.
+"""
+
+import atexit
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+import openai
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - httpx ships with openai but is optional here
+    httpx = None
+
+from backend.config import Config
+
+log = logging.getLogger(__name__)
+
+
+class LLMTransport:
+    """Process-wide pooled HTTP clients for LLM providers."""
+
+    def __init__(
+        self,
+        total_timeout: float = 60.0,
+        connect_timeout: float = 10.0,
+        max_connections: int = 100,
+        max_connections_per_host: int = 20,
+        keepalive_timeout: float = 30.0,
+        max_retries: int = 2
+    ):
+        """
+        Initialize the transport. Clients are created on first use.
+
+        Args:
+            total_timeout: Seconds allowed for a whole request
+            connect_timeout: Seconds allowed to establish a connection
+            max_connections: Maximum open connections across all hosts
+            max_connections_per_host: Maximum open connections to one host
+            keepalive_timeout: Seconds an idle connection is kept open
+            max_retries: Retries performed by the OpenAI client
+        """
+        self.total_timeout = total_timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._openai_clients: Dict[Tuple[Optional[str], Optional[str]], Any] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout)
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the pooled aiohttp session for the running event loop.
+
+        Returns:
+            A shared ClientSession; callers must not close it
+
+        Raises:
+            RuntimeError: If called outside a running event loop
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._drop_closed_loops()
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    limit_per_host=self.max_connections_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=300
+                )
+                session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+                self._sessions[loop] = session
+            return session
+
+    def _drop_closed_loops(self) -> None:
+        """Forget sessions whose loop was closed without aclose(). Called with the lock held."""
+        for loop in [loop for loop in self._sessions if loop.is_closed()]:
+            session = self._sessions.pop(loop)
+            if not session.closed:
+                log.warning("LLM HTTP session dropped: its event loop was closed without aclose()")
+
+    def get_openai_client(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        Get the shared OpenAI client for an API key and base URL.
+
+        Args:
+            api_key: OpenAI API key
+            base_url: Optional API base URL
+
+        Returns:
+            A shared openai.OpenAI client
+        """
+        key = (api_key, base_url)
+        with self._lock:
+            client = self._openai_clients.get(key)
+            if client is None:
+                kwargs = {
+                    'api_key': api_key,
+                    'timeout': self.total_timeout,
+                    'max_retries': self.max_retries,
+                }
+                if base_url:
+                    kwargs['base_url'] = base_url
+                if httpx is not None:
+                    kwargs['http_client'] = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections_per_host,
+                            keepalive_expiry=self.keepalive_timeout
+                        ),
+                        timeout=httpx.Timeout(self.total_timeout, connect=self.connect_timeout)
+                    )
+                client = openai.OpenAI(**kwargs)
+                self._openai_clients[key] = client
+            return client
+
+    async def aclose(self) -> None:
+        """Close the session bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Close all clients.
+
+        Sessions are closed on their own loop: directly if the loop is idle,
+        or by submitting the close to it if it is running in another thread.
+        Call this from outside the loops it closes.
+        """
+        with self._lock:
+            sessions = list(self._sessions.items())
+            clients = list(self._openai_clients.values())
+            self._sessions.clear()
+            self._openai_clients.clear()
+
+        for loop, session in sessions:
+            if session.closed or loop.is_closed():
+                continue
+            try:
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout)
+                else:
+                    loop.run_until_complete(session.close())
+            except Exception as e:
+                log.warning(f"Error closing LLM HTTP session: {str(e)}")
+
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                log.warning(f"Error closing OpenAI client: {str(e)}")
+        log.debug("LLM transport closed")
+
+
+llm_transport = LLMTransport(
+    total_timeout=Config.LLM_HTTP_TIMEOUT,
+    connect_timeout=Config.LLM_HTTP_CONNECT_TIMEOUT,
+    max_connections=Config.LLM_HTTP_MAX_CONNECTIONS,
+    max_connections_per_host=Config.LLM_HTTP_MAX_CONNECTIONS_PER_HOST,
+    keepalive_timeout=Config.LLM_HTTP_KEEPALIVE_TIMEOUT,
+    max_retries=Config.LLM_HTTP_MAX_RETRIES
+)
+atexit.register(llm_transport.close)
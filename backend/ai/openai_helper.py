@@ -1,11 +1,11 @@
 # backend/openai_helper.py
-import openai
 import logging
 import os
 from dotenv import load_dotenv
 from backend.template_management import TemplateManager
 from backend.database.db import get_db_connection, release_db_connection
 from backend.config import Config
+from backend.ai.llm_transport import llm_transport
 
 load_dotenv()
 
@@ -36,8 +36,8 @@ def call_openai(prompt):
             log.warning("OPENAI_API_KEY appears to be invalid (should start with 'sk-'). Using mock response.")
             return f"This is a mock response to: '{prompt[:50]}...'. API key format is invalid."
         
-        # Create a client instance with the API key
-        client = openai.OpenAI(api_key=api_key)
+        # Reuse the pooled client for this API key
+        client = llm_transport.get_openai_client(api_key)
         
         # Make the API call
         response = client.chat.completions.create(
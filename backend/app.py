@@ -8,7 +8,6 @@ import logging
 from flask import Flask, jsonify, request, Response, make_response
 from flask_cors import CORS
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta
 import json
@@ -33,14 +32,20 @@ from backend.database.db import (
     get_db_connection,
     release_db_connection,
     execute_query,
+    get_pool_stats,
     CONNECTION_POOL
 )
 from backend.db.connection_utils import initialize_connection_pool
 from backend.config import Config
+# Registers the sliding-window:// limiter storage
+from backend.rate_limiter import rate_limit_key
 from backend.message_processing.messenger import setup_messenger_routes
 from backend.message_processing.whatsapp import setup_whatsapp_routes
 from backend.message_processing.ai_control_service import ai_control_service
 from backend.message_processing.message_handler import MessageHandler
+from backend.message_processing.template_variables import business_data_cache
+from backend.ai.llm_response_cache import llm_response_cache
+from backend.auth_cache import api_key_cache, invalidate_business_keys, invalidate_api_keys
 from backend.error_handling import register_error_handlers
 
 # Routes imports
@@ -62,6 +67,7 @@ from backend.routes.privacy import privacy_bp
 from backend.routes.template_test import bp as template_test_bp
 from backend.routes.message_simulator import bp as message_simulator_bp
 from backend.routes.user_stats import bp as user_stats_bp
+from backend.routes.conversation_summary import bp as conversation_summary_bp
 
 # Set up logging
 logging.basicConfig(
@@ -112,12 +118,18 @@ def create_app(test_config=None):
     app.config['ICMP_API_KEY'] = Config.ICMP_API_KEY
     log.info(f"ICMP_API_KEY loaded: {app.config['ICMP_API_KEY']}")
     
-    # Configure limiter
+    # Load the AI stops and start following changes before serving requests
+    ai_control_service.start()
+    
+    # Configure limiter: sliding windows per business (else per address),
+    # shared by all workers through Redis
     limiter = Limiter(
-        lambda: get_remote_address(),
+        rate_limit_key,
         app=app,
         default_limits=["100 per minute"],
-        storage_uri="memory://",
+        storage_uri="sliding-window://",
+        strategy="moving-window",
+        headers_enabled=True,
     )
     
     # Disable limiter in certain environments
@@ -177,6 +189,10 @@ def create_app(test_config=None):
                 "status": "healthy",
                 "date": datetime.now().isoformat(),
                 "database": "connected" if is_db_connected else "disconnected",
+                "database_pool": get_pool_stats(),
+                "business_cache": business_data_cache.stats(),
+                "llm_response_cache": llm_response_cache.stats(),
+                "auth_cache": api_key_cache.stats(),
                 "schemas_loaded": app.config.get('SCHEMAS') is not None
             })
         except Exception as e:
@@ -277,6 +293,9 @@ def create_app(test_config=None):
                         """, (business_api_key, user_id, business_id)
                     )
                 conn.commit()
+                # The business may have a new key, and the new key may be cached as invalid
+                invalidate_business_keys(business_id)
+                invalidate_api_keys(business_api_key)
                 log.info(f"Successfully saved configuration for user {user_id} and business {business_id}")
                 # Set the businessApiKey cookie
                 response = jsonify({
@@ -483,6 +502,7 @@ def create_app(test_config=None):
     app.register_blueprint(template_test_bp, url_prefix='/api/template-test')
     app.register_blueprint(message_simulator_bp, url_prefix='/api/simulate')
     app.register_blueprint(user_stats_bp)
+    app.register_blueprint(conversation_summary_bp, url_prefix='/api')
     
     # Setup Facebook Messenger routes
     setup_messenger_routes(app)
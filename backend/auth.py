@@ -12,7 +12,7 @@ import functools
 from flask import jsonify, request, current_app, g, make_response
 # Remove check_password_hash if no longer used for user passwords
 # from werkzeug.security import check_password_hash
-from backend.db import get_db_connection, release_db_connection
+from backend.auth_cache import api_key_cache
 from backend.utils import is_valid_uuid
 from functools import wraps
 import uuid
@@ -22,27 +22,11 @@ log = logging.getLogger(__name__)
 
 def validate_business_key(key: str) -> bool:
     """Validate a business API key."""
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM businesses WHERE api_key = %s", (key,))
-        return cursor.fetchone() is not None
-    finally:
-        if conn:
-            release_db_connection(conn)
+    return api_key_cache.verify('api', key) is not None
 
 def validate_internal_key(key: str) -> bool:
     """Validate an internal API key."""
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM businesses WHERE internal_api_key = %s", (key,))
-        return cursor.fetchone() is not None
-    finally:
-        if conn:
-            release_db_connection(conn)
+    return api_key_cache.verify('internal_only', key) is not None
 
 def require_auth(f):
     """
@@ -72,41 +56,27 @@ def require_auth(f):
                 "message": "Missing business API key"
             }), 401
 
-        # Verify business API key
-        conn = get_db_connection()
+        # Verify business API key (cached; see backend/auth_cache.py)
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT business_id 
-                FROM businesses 
-                WHERE api_key = %s
-                """,
-                (business_api_key,)
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                log.warning("Unauthorized access attempt - Invalid business API key.")
-                return jsonify({
-                    "error_code": "UNAUTHORIZED",
-                    "message": "Invalid business API key"
-                }), 401
-                
-            # Store business_id in request context for later use
-            g.business_id = result[0]
-            log.debug(f"Business API key validated successfully for business {g.business_id}")
-            return f(*args, **kwargs)
-            
+            business = api_key_cache.verify('api', business_api_key)
         except Exception as e:
             log.error(f"Error verifying business API key: {str(e)}")
             return jsonify({
                 "error_code": "SERVER_ERROR",
                 "message": "Error verifying credentials"
             }), 500
-        finally:
-            if conn:
-                release_db_connection(conn)
+
+        if not business:
+            log.warning("Unauthorized access attempt - Invalid business API key.")
+            return jsonify({
+                "error_code": "UNAUTHORIZED",
+                "message": "Invalid business API key"
+            }), 401
+
+        # Store business_id in request context for later use
+        g.business_id = business['business_id']
+        log.debug(f"Business API key validated successfully for business {g.business_id}")
+        return f(*args, **kwargs)
 
     return decorated_function
 
@@ -168,53 +138,28 @@ def require_internal_key(f):
                 "message": "Authorization token required"
             }), 401
 
-        conn = None
-        business = None
+        # Try internal_api_key, then fallback to api_key (cached; see backend/auth_cache.py)
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            # --- ORIGINAL LOGIC (commented out) ---
-            # cursor.execute("""
-            #     SELECT business_id, business_name FROM businesses 
-            #     WHERE internal_api_key = %s
-            # """, (provided_key,))
-            # business_row = cursor.fetchone()
-            # if not business_row:
-            #     log.warning(f"Invalid internal API key provided.")
-            #     return jsonify({
-            #         "error_code": "UNAUTHORIZED",
-            #         "message": "Invalid internal API key"
-            #     }), 401
-
-            # --- UPDATED LOGIC: Try internal_api_key, then fallback to api_key ---
-            cursor.execute("""
-                SELECT business_id, business_name FROM businesses 
-                WHERE internal_api_key = %s OR api_key = %s
-            """, (provided_key, provided_key))
-            business_row = cursor.fetchone()
-
-            if not business_row:
-                log.warning(f"Invalid internal or API key provided.")
-                return jsonify({
-                    "error_code": "UNAUTHORIZED",
-                    "message": "Invalid internal or API key"
-                }), 401
-
-            # Attach business context to the request global `g`
-            g.business_id = str(business_row[0])
-            g.business_name = business_row[1]
-            log.info(f"Internal/API key validated successfully for business_id: {g.business_id}")
-            return f(*args, **kwargs)
-
+            business = api_key_cache.verify('internal', provided_key)
         except Exception as e:
             log.error(f"Database error during internal/API key validation: {str(e)}", exc_info=True)
             return jsonify({
                 "error_code": "SERVER_ERROR",
                 "message": "Failed to validate credentials"
             }), 500
-        finally:
-            if conn:
-                release_db_connection(conn)
+
+        if not business:
+            log.warning(f"Invalid internal or API key provided.")
+            return jsonify({
+                "error_code": "UNAUTHORIZED",
+                "message": "Invalid internal or API key"
+            }), 401
+
+        # Attach business context to the request global `g`
+        g.business_id = business['business_id']
+        g.business_name = business['business_name']
+        log.info(f"Internal/API key validated successfully for business_id: {g.business_id}")
+        return f(*args, **kwargs)
 
     return decorated_function
 
@@ -0,0 +1,276 @@
+"""
+Cache for API key verification.
+
+ApiKeyCache remembers the result of a businesses table lookup, keyed by the
+SHA-256 of the key so raw keys are never stored:
+
+- Valid keys map to their business for AUTH_CACHE_TTL seconds.
+- Unknown keys are cached as invalid for the shorter AUTH_CACHE_NEGATIVE_TTL,
+  so repeated bad keys don't reach the database either.
+- Entries are shared by all workers through Redis. Each process also keeps
+  them for AUTH_CACHE_LOCAL_TTL seconds, which bounds how long another worker
+  can accept a key after it was rotated.
+
+Code that changes a business's keys calls invalidate_business_keys() for the
+business and invalidate_api_keys() for the new keys after committing.
+Lookups that fail on database errors are not cached. stats() reports
+verification latency by where the answer came from.
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from backend.config import Config
+from backend.db import get_db_connection, release_db_connection
+from backend.message_processing.services.storage.redis_manager import RedisStateManager
+
+log = logging.getLogger(__name__)
+
+# Key kinds and the query that verifies them
+KEY_QUERIES = {
+    'api': "SELECT business_id, business_name FROM businesses WHERE api_key = %s",
+    'internal': "SELECT business_id, business_name FROM businesses WHERE internal_api_key = %s OR api_key = %s",
+    'internal_only': "SELECT business_id, business_name FROM businesses WHERE internal_api_key = %s",
+}
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _query_business(kind: str, key: str) -> Optional[Dict[str, str]]:
+    """Look a key up in the database."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        query = KEY_QUERIES[kind]
+        cursor.execute(query, (key,) * query.count('%s'))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {'business_id': str(row[0]), 'business_name': row[1]}
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+class ApiKeyCache:
+    """Positive and negative cache of API key lookups, shared through Redis."""
+
+    def __init__(
+        self,
+        ttl: int = 300,
+        negative_ttl: int = 30,
+        local_ttl: float = 5.0,
+        max_local_entries: int = 10000,
+        redis_manager: Optional[RedisStateManager] = None,
+        use_redis: bool = True,
+        loader: Callable[[str, str], Optional[Dict[str, str]]] = _query_business
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds a valid key is cached
+            negative_ttl: Seconds an invalid key is cached
+            local_ttl: Seconds an entry is served from process memory
+            max_local_entries: Maximum number of entries kept in process
+            redis_manager: Redis state manager; created on first use if not given
+            use_redis: Whether to share entries through Redis
+            loader: Function (kind, key) returning the business or None
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local_ttl = local_ttl
+        self.max_local_entries = max_local_entries
+        self.use_redis = use_redis
+        self._redis_manager = redis_manager
+        self._loader = loader
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Verification latency by where the answer came from
+        self._latency = {source: [0, 0.0, 0.0] for source in ('local', 'redis', 'database')}
+
+    @property
+    def redis_manager(self) -> Optional[RedisStateManager]:
+        if self.use_redis and self._redis_manager is None:
+            self._redis_manager = RedisStateManager()
+        return self._redis_manager
+
+    @staticmethod
+    def _cache_key(kind: str, key_hash: str) -> str:
+        return f"auth:{kind}:{key_hash}"
+
+    @staticmethod
+    def _business_index_key(business_id: str) -> str:
+        return f"auth:business:{business_id}"
+
+    def _record(self, source: str, started: float) -> None:
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            entry = self._latency[source]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+    def _get_local(self, cache_key: str) -> tuple:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[cache_key]
+                return False, None
+            self._entries.move_to_end(cache_key)
+            return True, value
+
+    def _set_local(self, cache_key: str, value: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic() + min(self.local_ttl, ttl), value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_local_entries:
+                self._entries.popitem(last=False)
+
+    def _store(self, cache_key: str, value: Dict[str, Any]) -> None:
+        ttl = self.ttl if value.get('valid') else self.negative_ttl
+        self._set_local(cache_key, value, ttl)
+        redis_manager = self.redis_manager
+        if redis_manager is None or redis_manager.redis_client is None:
+            return
+        redis_manager.set_state(cache_key, value, ttl=ttl)
+        if value.get('valid'):
+            # Remember which entries belong to the business so rotation can drop them
+            try:
+                index_key = self._business_index_key(value['business_id'])
+                redis_manager.redis_client.sadd(index_key, cache_key)
+                redis_manager.redis_client.expire(index_key, self.ttl)
+            except Exception as e:
+                log.warning(f"Failed to index auth cache entry: {str(e)}")
+
+    def verify(self, kind: str, key: str) -> Optional[Dict[str, str]]:
+        """
+        Verify a key, from the cache when possible.
+
+        Args:
+            kind: 'api' for business API keys, 'internal' for internal or API
+                keys, 'internal_only' for internal API keys
+            key: The key as presented by the client
+
+        Returns:
+            Dict with business_id and business_name, or None if the key is invalid
+        """
+        if kind not in KEY_QUERIES:
+            raise ValueError(f"Unknown key kind: {kind}")
+        if not key:
+            return None
+
+        started = time.perf_counter()
+        cache_key = self._cache_key(kind, hash_key(key))
+
+        found, value = self._get_local(cache_key)
+        source = 'local'
+        if not found:
+            redis_manager = self.redis_manager
+            if redis_manager is not None:
+                value = redis_manager.get_state(cache_key)
+            if value is not None:
+                source = 'redis'
+                ttl = self.ttl if value.get('valid') else self.negative_ttl
+                self._set_local(cache_key, value, ttl)
+            else:
+                source = 'database'
+                business = self._loader(kind, key)
+                value = {'valid': True, **business} if business else {'valid': False}
+                self._store(cache_key, value)
+
+        self._record(source, started)
+        if not value.get('valid'):
+            return None
+        return {'business_id': value['business_id'], 'business_name': value.get('business_name')}
+
+    def invalidate_api_keys(self, *keys: str) -> None:
+        """
+        Drop cached results for specific keys, e.g. a newly issued key that
+        may have been cached as invalid.
+
+        Args:
+            keys: Raw keys to drop
+        """
+        cache_keys = [self._cache_key(kind, hash_key(key)) for key in keys if key for kind in KEY_QUERIES]
+        self._delete(cache_keys)
+
+    def invalidate_business_keys(self, business_id: str) -> None:
+        """
+        Drop every cached valid key of a business, after its keys changed.
+
+        Args:
+            business_id: UUID of the business
+        """
+        business_id = str(business_id)
+        cache_keys = []
+        with self._lock:
+            for cache_key, (_, value) in list(self._entries.items()):
+                if value.get('business_id') == business_id:
+                    cache_keys.append(cache_key)
+        redis_manager = self.redis_manager
+        if redis_manager is not None and redis_manager.redis_client is not None:
+            try:
+                index_key = self._business_index_key(business_id)
+                members = redis_manager.redis_client.smembers(index_key) or []
+                cache_keys.extend(m.decode('utf-8') if isinstance(m, bytes) else m for m in members)
+                redis_manager.redis_client.delete(index_key)
+            except Exception as e:
+                log.error(f"Failed to read auth cache index for business {business_id}: {str(e)}")
+        self._delete(cache_keys)
+        log.info(f"Invalidated cached API keys for business {business_id}")
+
+    def _delete(self, cache_keys) -> None:
+        with self._lock:
+            for cache_key in cache_keys:
+                self._entries.pop(cache_key, None)
+        redis_manager = self.redis_manager
+        if redis_manager is not None:
+            for cache_key in cache_keys:
+                redis_manager.delete_state(cache_key)
+
+    def clear_local(self) -> None:
+        """Drop every in-process entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get verification latency by source (local, redis, database)."""
+        with self._lock:
+            latency = {
+                source: {
+                    'count': count,
+                    'avg_ms': round(total / count, 3) if count else 0.0,
+                    'max_ms': round(peak, 3),
+                }
+                for source, (count, total, peak) in self._latency.items()
+            }
+            return {'entries': len(self._entries), 'latency': latency}
+
+
+api_key_cache = ApiKeyCache(
+    ttl=Config.AUTH_CACHE_TTL,
+    negative_ttl=Config.AUTH_CACHE_NEGATIVE_TTL,
+    local_ttl=Config.AUTH_CACHE_LOCAL_TTL,
+    max_local_entries=Config.AUTH_CACHE_MAX_LOCAL_ENTRIES
+)
+
+
+def invalidate_business_keys(business_id: str) -> None:
+    """Drop cached keys of a business from the shared cache."""
+    api_key_cache.invalidate_business_keys(business_id)
+
+
+def invalidate_api_keys(*keys: str) -> None:
+    """Drop cached results for specific keys from the shared cache."""
+    api_key_cache.invalidate_api_keys(*keys)
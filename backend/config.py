@@ -31,6 +31,14 @@ class Config:
     DB_HOST = os.environ.get("DB_HOST", "localhost")
     DB_PORT = os.environ.get("DB_PORT", "5432")
 
+    # Database connection pool
+    DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "2"))
+    DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+    DB_POOL_ACQUIRE_TIMEOUT = float(os.environ.get("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+    DB_POOL_IDLE_CHECK_AFTER = float(os.environ.get("DB_POOL_IDLE_CHECK_AFTER", "30"))
+    DB_POOL_MAX_IDLE_TIME = float(os.environ.get("DB_POOL_MAX_IDLE_TIME", "300"))
+    DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", "3600"))
+
     # Redis Configuration
     REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
@@ -38,6 +46,120 @@ class Config:
     REDIS_PASSWORD = os.environ.get("REDIS_PASSWORD", None)
     REDIS_SSL = os.environ.get("REDIS_SSL", "false").lower() == "true"
 
+    # Business data cache (business_info / available_stages variables)
+    BUSINESS_CACHE_MAX_ENTRIES = int(os.environ.get("BUSINESS_CACHE_MAX_ENTRIES", "1000"))
+    BUSINESS_CACHE_LOCAL_TTL = float(os.environ.get("BUSINESS_CACHE_LOCAL_TTL", "30"))
+    BUSINESS_CACHE_REDIS_TTL = int(os.environ.get("BUSINESS_CACHE_REDIS_TTL", "600"))
+
+    # HTTP clients for LLM providers
+    LLM_HTTP_TIMEOUT = float(os.environ.get("LLM_HTTP_TIMEOUT", "60"))
+    LLM_HTTP_CONNECT_TIMEOUT = float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+    LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+    LLM_HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("LLM_HTTP_KEEPALIVE_TIMEOUT", "30"))
+    LLM_HTTP_MAX_RETRIES = int(os.environ.get("LLM_HTTP_MAX_RETRIES", "2"))
+
+    # LLM request and token budgets
+    RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.environ.get("RATE_LIMIT_REQUESTS_PER_MINUTE", "60"))
+    RATE_LIMIT_TOKENS_PER_MINUTE = int(os.environ.get("RATE_LIMIT_TOKENS_PER_MINUTE", "40000"))
+    LLM_RATE_LIMIT_BURST_SECONDS = float(os.environ.get("LLM_RATE_LIMIT_BURST_SECONDS", "60"))
+    LLM_RATE_LIMIT_MAX_WAIT = float(os.environ.get("LLM_RATE_LIMIT_MAX_WAIT", "10"))
+
+    # llm_calls audit writer
+    LLM_AUDIT_MAX_QUEUE = int(os.environ.get("LLM_AUDIT_MAX_QUEUE", "10000"))
+    LLM_AUDIT_BATCH_SIZE = int(os.environ.get("LLM_AUDIT_BATCH_SIZE", "200"))
+    LLM_AUDIT_FLUSH_INTERVAL = float(os.environ.get("LLM_AUDIT_FLUSH_INTERVAL", "1.0"))
+    LLM_AUDIT_OVERFLOW_POLICY = os.environ.get("LLM_AUDIT_OVERFLOW_POLICY", "drop_oldest")
+
+    # Cache of deterministic (intent classification) LLM responses
+    LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_CALL_TYPES = tuple(
+        t.strip() for t in os.environ.get("LLM_CACHE_CALL_TYPES", "intent").split(",") if t.strip()
+    )
+    LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", "86400"))
+    LLM_CACHE_MAX_LOCAL_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_LOCAL_ENTRIES", "5000"))
+    LLM_CACHE_NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("LLM_CACHE_NEAR_DUPLICATE_THRESHOLD", "0"))
+
+    # API key verification cache
+    AUTH_CACHE_TTL = int(os.environ.get("AUTH_CACHE_TTL", "300"))
+    AUTH_CACHE_NEGATIVE_TTL = int(os.environ.get("AUTH_CACHE_NEGATIVE_TTL", "30"))
+    AUTH_CACHE_LOCAL_TTL = float(os.environ.get("AUTH_CACHE_LOCAL_TTL", "5"))
+    AUTH_CACHE_MAX_LOCAL_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_LOCAL_ENTRIES", "10000"))
+
+    # Webhook ingestion queue
+    INGESTION_BACKEND = os.environ.get("INGESTION_BACKEND", "redis").lower()
+    INGESTION_PARTITIONS = int(os.environ.get("INGESTION_PARTITIONS", "8"))
+    INGESTION_DEDUPE_TTL = int(os.environ.get("INGESTION_DEDUPE_TTL", "86400"))
+    INGESTION_MAX_STREAM_LENGTH = int(os.environ.get("INGESTION_MAX_STREAM_LENGTH", "100000"))
+    INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", "2"))
+    INGESTION_MAX_ATTEMPTS = int(os.environ.get("INGESTION_MAX_ATTEMPTS", "5"))
+    INGESTION_RETRY_BACKOFF = float(os.environ.get("INGESTION_RETRY_BACKOFF", "0.5"))
+    INGESTION_CLAIM_IDLE_MS = int(os.environ.get("INGESTION_CLAIM_IDLE_MS", "300000"))
+
+    # Webhook routing table
+    ROUTING_MAX_USERS = int(os.environ.get("ROUTING_MAX_USERS", "10000"))
+    ROUTING_REFRESH_INTERVAL = float(os.environ.get("ROUTING_REFRESH_INTERVAL", "300"))
+
+    # Process log store
+    PROCESS_LOG_CAPACITY = int(os.environ.get("PROCESS_LOG_CAPACITY", "200"))
+    PROCESS_LOG_TTL = int(os.environ.get("PROCESS_LOG_TTL", "3600"))
+    PROCESS_LOG_REDIS_CAPACITY = int(os.environ.get("PROCESS_LOG_REDIS_CAPACITY", "1000"))
+    PROCESS_LOG_REDIS_TTL = int(os.environ.get("PROCESS_LOG_REDIS_TTL", "86400"))
+    PROCESS_LOG_FLUSH_INTERVAL = float(os.environ.get("PROCESS_LOG_FLUSH_INTERVAL", "1.0"))
+
+    # AI stop state
+    AI_CONTROL_DEFAULT_STOP_HOURS = float(os.environ.get("AI_CONTROL_DEFAULT_STOP_HOURS", "24"))
+    AI_CONTROL_REFRESH_INTERVAL = float(os.environ.get("AI_CONTROL_REFRESH_INTERVAL", "60"))
+    AI_CONTROL_FLUSH_INTERVAL = float(os.environ.get("AI_CONTROL_FLUSH_INTERVAL", "1.0"))
+
+    # Per-conversation leases and message coalescing
+    CONVERSATION_LOCK_TTL = float(os.environ.get("CONVERSATION_LOCK_TTL", "30"))
+    CONVERSATION_LOCK_WAIT = float(os.environ.get("CONVERSATION_LOCK_WAIT", "60"))
+    CONVERSATION_COALESCE_WINDOW = float(os.environ.get("CONVERSATION_COALESCE_WINDOW", "0"))
+    CONVERSATION_COALESCE_MAX_MESSAGES = int(os.environ.get("CONVERSATION_COALESCE_MAX_MESSAGES", "10"))
+
+    # Message pipeline rate limits
+    MESSAGE_RATE_LIMIT_PER_BUSINESS = int(os.environ.get("MESSAGE_RATE_LIMIT_PER_BUSINESS", "100"))
+    MESSAGE_RATE_LIMIT_PER_USER = int(os.environ.get("MESSAGE_RATE_LIMIT_PER_USER", "30"))
+    MESSAGE_RATE_LIMIT_WINDOW = float(os.environ.get("MESSAGE_RATE_LIMIT_WINDOW", "60"))
+
+    # Rolling window of recent messages per conversation
+    MESSAGE_WINDOW_SIZE = int(os.environ.get("MESSAGE_WINDOW_SIZE", "20"))
+    MESSAGE_WINDOW_TTL = int(os.environ.get("MESSAGE_WINDOW_TTL", "86400"))
+
+    # Incremental conversation summaries
+    CONVERSATION_SUMMARY_MAX_AGE = float(os.environ.get("CONVERSATION_SUMMARY_MAX_AGE", "300"))
+    CONVERSATION_SUMMARY_BATCH_SIZE = int(os.environ.get("CONVERSATION_SUMMARY_BATCH_SIZE", "100"))
+    CONVERSATION_SUMMARY_REFRESH_INTERVAL = float(os.environ.get("CONVERSATION_SUMMARY_REFRESH_INTERVAL", "0"))
+    CONVERSATION_SUMMARY_ACTIVE_WINDOW = float(os.environ.get("CONVERSATION_SUMMARY_ACTIVE_WINDOW", "86400"))
+    CONVERSATION_SUMMARY_IDLE_SECONDS = float(os.environ.get("CONVERSATION_SUMMARY_IDLE_SECONDS", "120"))
+    CONVERSATION_SUMMARY_REFRESH_LIMIT = int(os.environ.get("CONVERSATION_SUMMARY_REFRESH_LIMIT", "50"))
+
+    # Prompt token budgets, counted with the model's tokenizer
+    LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4")
+    LLM_CONTEXT_MAX_TOKENS = int(os.environ.get("LLM_CONTEXT_MAX_TOKENS", "6000"))
+    LLM_CONTEXT_BUDGETS = {
+        'system': int(os.environ.get("LLM_CONTEXT_SYSTEM_TOKENS", "2500")),
+        'business_info': int(os.environ.get("LLM_CONTEXT_BUSINESS_TOKENS", "600")),
+        'history': int(os.environ.get("LLM_CONTEXT_HISTORY_TOKENS", "2000")),
+        'extracted_data': int(os.environ.get("LLM_CONTEXT_EXTRACTED_TOKENS", "400")),
+    }
+
+    # Pattern learning index
+    PATTERN_INDEX_PATH = os.environ.get("PATTERN_INDEX_PATH") or None
+    PATTERN_INDEX_SAVE_INTERVAL = float(os.environ.get("PATTERN_INDEX_SAVE_INTERVAL", "60"))
+    PATTERN_INDEX_THRESHOLD = float(os.environ.get("PATTERN_INDEX_THRESHOLD", "0.7"))
+    PATTERN_INDEX_FEATURES = int(os.environ.get("PATTERN_INDEX_FEATURES", "1024"))
+    PATTERN_INDEX_LSH_BANDS = int(os.environ.get("PATTERN_INDEX_LSH_BANDS", "16"))
+    PATTERN_INDEX_LSH_ROWS = int(os.environ.get("PATTERN_INDEX_LSH_ROWS", "6"))
+    PATTERN_INDEX_BRUTE_FORCE_LIMIT = int(os.environ.get("PATTERN_INDEX_BRUTE_FORCE_LIMIT", "256"))
+
+    # Pattern statistics
+    PATTERN_SKETCH_CAPACITY = int(os.environ.get("PATTERN_SKETCH_CAPACITY", "32"))
+    PATTERN_FLUSH_BATCH_SIZE = int(os.environ.get("PATTERN_FLUSH_BATCH_SIZE", "100"))
+    PATTERN_FLUSH_INTERVAL = float(os.environ.get("PATTERN_FLUSH_INTERVAL", "5"))
+    PATTERN_MAX_PENDING = int(os.environ.get("PATTERN_MAX_PENDING", "10000"))
+
     # API Configuration
     ICMP_API_KEY = os.environ.get("ICMP_API_KEY")
     if not ICMP_API_KEY:
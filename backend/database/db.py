@@ -6,6 +6,8 @@ from psycopg2.extras import DictCursor, RealDictCursor
 from dotenv import load_dotenv
 import sys
 from backend.database.db_config import get_db_config
+from backend.config import Config
+from backend.db.pool import BoundedConnectionPool
 
 load_dotenv()
 log = logging.getLogger(__name__)
@@ -33,19 +35,19 @@ CONNECTION_POOL = None
 # Skip real DB connection entirely during tests
 if not TESTING:
     try:
-        CONNECTION_POOL = psycopg2.pool.SimpleConnectionPool(
-            minconn=1,  # Start with fewer connections
-            maxconn=10,  # Reduce max connections
+        # Bounded, thread-safe pool: blocks (with a timeout) when exhausted and
+        # pre-warms its minimum connections, which also tests connectivity
+        CONNECTION_POOL = BoundedConnectionPool(
+            minconn=Config.DB_POOL_MIN,
+            maxconn=Config.DB_POOL_MAX,
+            acquire_timeout=Config.DB_POOL_ACQUIRE_TIMEOUT,
+            idle_check_after=Config.DB_POOL_IDLE_CHECK_AFTER,
+            max_idle_time=Config.DB_POOL_MAX_IDLE_TIME,
+            max_lifetime=Config.DB_POOL_MAX_LIFETIME,
             **DB_CONFIG,
             cursor_factory=DictCursor  # Use DictCursor for easier access to columns by name
         )
-        if CONNECTION_POOL:
-            # Test the connection
-            test_conn = CONNECTION_POOL.getconn()
-            if test_conn:
-                log.info("Database connection test successful")
-                CONNECTION_POOL.putconn(test_conn)
-            log.info("Database connection pool created successfully")
+        log.info("Database connection pool created successfully")
     except Exception as e:
         log.error(f"Error creating connection pool: {e}")
         CONNECTION_POOL = None
@@ -131,6 +133,12 @@ def execute_query(conn, query, params=None):
         # Always re-raise the exception, even in testing mode
         raise
 
+def get_pool_stats():
+    """Get connection pool metrics (waiters, checkout latency, connections in use)."""
+    if TESTING or not CONNECTION_POOL:
+        return None
+    return CONNECTION_POOL.stats()
+
 def get_db_pool():
     """Get the database connection pool."""
     if TESTING:
@@ -227,8 +235,8 @@ def setup_database():
                 (user_id IS NULL AND conversation_id IS NOT NULL)
             )
         );''')
-        execute_query(conn, 'CREATE INDEX IF NOT EXISTS idx_ai_control_user_id ON ai_control_settings(user_id);')
-        execute_query(conn, 'CREATE INDEX IF NOT EXISTS idx_ai_control_conversation_id ON ai_control_settings(conversation_id);')
+        execute_query(conn, 'CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_control_user_id ON ai_control_settings(user_id) WHERE user_id IS NOT NULL;')
+        execute_query(conn, 'CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_control_conversation_id ON ai_control_settings(conversation_id) WHERE conversation_id IS NOT NULL;')
 
         # Messages table
         execute_query(conn, '''CREATE TABLE IF NOT EXISTS messages (
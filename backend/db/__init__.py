@@ -8,21 +8,29 @@ This package provides functionality for:
 """
 
 from .connection_manager import ConnectionManager
+from .async_connection_manager import AsyncConnectionManager, create_async_pool
+from .pool import BoundedConnectionPool, PoolTimeoutError
 from .connection_utils import (
     get_db_connection,
     release_db_connection,
     execute_query,
     get_db_pool,
+    get_pool_stats,
     CONNECTION_POOL,
     initialize_connection_pool
 )
 
 __all__ = [
     'ConnectionManager',
+    'AsyncConnectionManager',
+    'create_async_pool',
     'get_db_connection',
     'release_db_connection',
     'execute_query',
     'get_db_pool',
+    'get_pool_stats',
+    'BoundedConnectionPool',
+    'PoolTimeoutError',
     'CONNECTION_POOL',
     'initialize_connection_pool'
 ] 
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Async connection manager for the message processing pipeline.
+
+This module is the asyncpg counterpart of ConnectionManager. Acquiring a
+connection, running the work and backing off between retries all happen on
+the event loop, so a slow query or a flaky database never blocks other
+messages being processed concurrently.
+"""
+
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+import asyncpg
+
+from backend.config import get_db_config
+
+log = logging.getLogger(__name__)
+
+# Errors that indicate the connection (not the query) failed and the
+# operation can safely be attempted again on a fresh connection.
+TRANSIENT_ERRORS = (
+    asyncpg.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.TooManyConnectionsError,
+    asyncpg.exceptions.ConnectionDoesNotExistError,
+    ConnectionError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+
+async def create_async_pool(min_size: int = 2, max_size: int = 10, **kwargs) -> asyncpg.Pool:
+    """
+    Create an asyncpg pool from the standard database configuration.
+
+    Args:
+        min_size: Number of connections opened up front
+        max_size: Maximum number of connections in the pool
+        **kwargs: Extra arguments passed through to asyncpg.create_pool
+
+    Returns:
+        The initialized asyncpg pool
+    """
+    db_config = get_db_config()
+    pool = await asyncpg.create_pool(
+        database=db_config['dbname'],
+        user=db_config['user'],
+        password=db_config['password'],
+        host=db_config['host'],
+        port=int(db_config['port']),
+        min_size=min_size,
+        max_size=max_size,
+        **kwargs
+    )
+    log.info(f"Async database pool created (min_size={min_size}, max_size={max_size})")
+    return pool
+
+
+class AsyncConnectionManager:
+    """Manages asyncpg connections with non-blocking retry and backoff."""
+
+    def __init__(
+        self,
+        db_pool,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 5.0,
+        acquire_timeout: Optional[float] = 10.0
+    ):
+        """
+        Initialize the async connection manager.
+
+        Args:
+            db_pool: asyncpg connection pool
+            max_retries: Maximum number of attempts per operation
+            retry_delay: Base delay between retries in seconds
+            max_retry_delay: Upper bound for the exponential backoff delay
+            acquire_timeout: Seconds to wait for a free pool connection
+        """
+        self.db_pool = db_pool
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.acquire_timeout = acquire_timeout
+        log.info(
+            f"AsyncConnectionManager initialized with max_retries={max_retries}, "
+            f"retry_delay={retry_delay}"
+        )
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter for the given (zero-based) attempt."""
+        delay = min(self.max_retry_delay, self.retry_delay * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    async def _acquire(self):
+        """Acquire a connection from the pool, retrying transient failures."""
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                return await self.db_pool.acquire(timeout=self.acquire_timeout)
+            except TRANSIENT_ERRORS as e:
+                last_error = e
+                log.warning(f"Connection attempt {attempt + 1}/{self.max_retries} failed: {str(e)}")
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(self._backoff_delay(attempt))
+
+        error_msg = (
+            f"Failed to get database connection after {self.max_retries} attempts. "
+            f"Last error: {str(last_error)}"
+        )
+        log.error(error_msg)
+        raise ConnectionError(error_msg)
+
+    @asynccontextmanager
+    async def get_connection(self):
+        """
+        Get a pooled connection with retry logic.
+
+        Yields:
+            An asyncpg connection, released back to the pool on exit
+        """
+        conn = await self._acquire()
+        try:
+            yield conn
+        finally:
+            await self.release_connection(conn)
+
+    async def execute_with_retry(self, func: Callable[[Any], Awaitable[Any]]) -> Any:
+        """
+        Run a coroutine function with a connection, retrying transient failures.
+
+        The whole unit of work is retried on a fresh connection when the
+        connection drops mid-flight. Query errors are raised immediately.
+
+        Args:
+            func: Coroutine function taking the connection as its only argument
+
+        Returns:
+            Result of the function execution
+        """
+        last_error = None
+        for attempt in range(self.max_retries):
+            conn = None
+            try:
+                conn = await self.db_pool.acquire(timeout=self.acquire_timeout)
+                return await func(conn)
+            except TRANSIENT_ERRORS as e:
+                last_error = e
+                log.warning(f"Transient database error (attempt {attempt + 1}/{self.max_retries}): {str(e)}")
+            except Exception as e:
+                log.error(f"Error executing function: {str(e)}", exc_info=True)
+                raise
+            finally:
+                await self.release_connection(conn)
+
+            if attempt < self.max_retries - 1:
+                await asyncio.sleep(self._backoff_delay(attempt))
+
+        raise ConnectionError(
+            f"Operation failed after {self.max_retries} attempts. Last error: {str(last_error)}"
+        )
+
+    async def fetch(self, query: str, *args) -> list:
+        """Run a query and return all rows, with retry."""
+        return await self.execute_with_retry(lambda conn: conn.fetch(query, *args))
+
+    async def fetchrow(self, query: str, *args) -> Optional[Any]:
+        """Run a query and return the first row, with retry."""
+        return await self.execute_with_retry(lambda conn: conn.fetchrow(query, *args))
+
+    async def execute(self, query: str, *args) -> str:
+        """Run a statement and return its status, with retry."""
+        return await self.execute_with_retry(lambda conn: conn.execute(query, *args))
+
+    async def release_connection(self, conn) -> None:
+        """
+        Safely release a connection back to the pool.
+
+        Args:
+            conn: Connection to release
+        """
+        if conn is None:
+            return
+        try:
+            await self.db_pool.release(conn)
+        except Exception as e:
+            log.error(f"Error releasing connection: {str(e)}", exc_info=True)
+            try:
+                conn.terminate()
+            except Exception as close_error:
+                log.error(f"Error terminating connection: {str(close_error)}", exc_info=True)
+
+    async def close(self) -> None:
+        """Close the underlying pool."""
+        if self.db_pool is not None:
+            await self.db_pool.close()
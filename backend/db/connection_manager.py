@@ -36,6 +36,10 @@ class ConnectionManager:
         """
         Get a database connection with retry logic.
         
+        Liveness is not re-tested here: the pool only runs a health check
+        on connections that have sat idle past its threshold, so a normal
+        checkout costs no extra round-trip.
+        
         Yields:
             A database connection
             
@@ -45,46 +49,31 @@ class ConnectionManager:
         conn = None
         last_error = None
         
-        try:
-            for attempt in range(self.max_retries):
-                try:
-                    log.info(f"Attempting to get connection (attempt {attempt + 1}/{self.max_retries})")
-                    conn = self.db_pool.getconn()
-                    if conn:
-                        # Test the connection
-                        with conn.cursor() as cur:
-                            cur.execute("SELECT 1")
-                            if cur.fetchone()[0] == 1:
-                                log.info("Successfully obtained and tested database connection")
-                                try:
-                                    yield conn
-                                    return
-                                finally:
-                                    if conn:
-                                        log.info("Releasing connection back to pool")
-                                        self.release_connection(conn)
-                                        conn = None
+        for attempt in range(self.max_retries):
+            try:
+                log.debug(f"Attempting to get connection (attempt {attempt + 1}/{self.max_retries})")
+                conn = self.db_pool.getconn()
+                if conn:
+                    break
+            except Exception as e:
+                last_error = e
+                log.error(f"Connection attempt {attempt + 1} failed: {str(e)}", exc_info=True)
                 
-                except Exception as e:
-                    last_error = e
-                    log.error(f"Connection attempt {attempt + 1} failed: {str(e)}", exc_info=True)
-                    if conn:
-                        log.info("Releasing failed connection")
-                        self.release_connection(conn)
-                        conn = None
-                    
-                if attempt < self.max_retries - 1:
-                    log.info(f"Waiting {self.retry_delay} seconds before next attempt")
-                    time.sleep(self.retry_delay)
-            
+            if attempt < self.max_retries - 1:
+                log.info(f"Waiting {self.retry_delay} seconds before next attempt")
+                time.sleep(self.retry_delay)
+        
+        if not conn:
             error_msg = f"Failed to get valid database connection after {self.max_retries} attempts. Last error: {str(last_error)}"
             log.error(error_msg)
             raise Exception(error_msg)
-            
+        
+        # Errors raised by the caller's block propagate; only checkout is retried
+        try:
+            yield conn
         finally:
-            if conn:
-                log.info("Releasing connection in finally block")
-                self.release_connection(conn)
+            log.debug("Releasing connection back to pool")
+            self.release_connection(conn)
     
     def execute_with_retry(self, func: Callable[[connection], Any]) -> Any:
         """
@@ -9,7 +9,8 @@ import logging
 import psycopg2
 import psycopg2.pool
 from psycopg2.extras import DictCursor
-from backend.config import get_db_config
+from backend.config import Config, get_db_config
+from backend.db.pool import BoundedConnectionPool
 
 log = logging.getLogger(__name__)
 
@@ -30,9 +31,13 @@ def initialize_connection_pool():
     
     if not CONNECTION_POOL:
         try:
-            CONNECTION_POOL = psycopg2.pool.ThreadedConnectionPool(
-                minconn=1,
-                maxconn=10,
+            CONNECTION_POOL = BoundedConnectionPool(
+                minconn=Config.DB_POOL_MIN,
+                maxconn=Config.DB_POOL_MAX,
+                acquire_timeout=Config.DB_POOL_ACQUIRE_TIMEOUT,
+                idle_check_after=Config.DB_POOL_IDLE_CHECK_AFTER,
+                max_idle_time=Config.DB_POOL_MAX_IDLE_TIME,
+                max_lifetime=Config.DB_POOL_MAX_LIFETIME,
                 **DB_CONFIG,
                 cursor_factory=DictCursor
             )
@@ -108,6 +113,15 @@ def execute_query(conn, query, params=None):
     finally:
         cursor.close()
 
+def get_pool_stats():
+    """
+    Get connection pool metrics.
+    
+    Returns:
+        Dictionary of pool metrics, or None if the pool is not initialized
+    """
+    return CONNECTION_POOL.stats() if CONNECTION_POOL else None
+
 def get_db_pool():
     """
     Get the database connection pool.
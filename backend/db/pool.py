@@ -0,0 +1,308 @@
+"""
+Bounded, thread-safe Postgres connection pool.
+
+This module provides a drop-in replacement for psycopg2's SimpleConnectionPool
+and ThreadedConnectionPool (same getconn/putconn/closeall interface) that:
+- blocks with a timeout when all connections are checked out instead of
+  failing immediately
+- opens minconn connections up front (pre-warming)
+- closes connections that have been idle for too long or lived too long
+- only runs a liveness check on checkout when a connection has been idle
+  past a threshold, instead of on every checkout
+- records metrics: waiters, checkout latency and connections in use
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError
+
+log = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(PoolError):
+    """Raised when no connection became available within the acquire timeout."""
+    pass
+
+
+class _PooledConnection:
+    """Bookkeeping for a connection owned by the pool."""
+
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class BoundedConnectionPool:
+    """Thread-safe connection pool with blocking acquire and health checking."""
+
+    def __init__(
+        self,
+        minconn: int,
+        maxconn: int,
+        acquire_timeout: float = 10.0,
+        idle_check_after: float = 30.0,
+        max_idle_time: float = 300.0,
+        max_lifetime: float = 3600.0,
+        **connect_kwargs
+    ):
+        """
+        Initialize the pool and pre-warm minconn connections.
+
+        Args:
+            minconn: Connections opened up front and kept through idle recycling
+            maxconn: Hard upper bound on open connections
+            acquire_timeout: Default seconds getconn waits for a free connection
+            idle_check_after: Idle seconds after which a checkout runs a liveness check
+            max_idle_time: Idle seconds after which surplus connections are closed
+            max_lifetime: Seconds after which a connection is replaced
+            **connect_kwargs: Arguments passed to psycopg2.connect
+        """
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool bounds: minconn={minconn}, maxconn={maxconn}")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.idle_check_after = idle_check_after
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self._connect_kwargs = connect_kwargs
+
+        self._lock = threading.Condition(threading.Lock())
+        self._idle = deque()  # oldest on the left, most recently used on the right
+        self._in_use: Dict[int, _PooledConnection] = {}
+        self._size = 0  # open connections plus connections being opened
+        self._waiters = 0
+        self.closed = False
+
+        self._metrics = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'total_wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'max_waiters': 0,
+            'health_checks': 0,
+            'failed_health_checks': 0,
+            'recycled': 0,
+            'created': 0,
+        }
+
+        self._prewarm()
+
+    def _prewarm(self) -> None:
+        """Open minconn connections so the first requests don't pay connect latency."""
+        for _ in range(self.minconn):
+            with self._lock:
+                self._size += 1
+            try:
+                pooled = self._connect()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            with self._lock:
+                self._idle.append(pooled)
+        log.info(f"Connection pool pre-warmed with {self.minconn} connections (max {self.maxconn})")
+
+    def _incr(self, metric: str) -> None:
+        """Increment a counter. Caller must not hold the lock."""
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def _connect(self) -> _PooledConnection:
+        conn = psycopg2.connect(**self._connect_kwargs)
+        self._incr('created')
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        """Close a connection and free its slot. Caller must not hold the lock."""
+        try:
+            if not pooled.conn.closed:
+                pooled.conn.close()
+        except Exception as e:
+            log.debug(f"Error closing pooled connection: {e}")
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _is_alive(self, pooled: _PooledConnection) -> bool:
+        """Run a liveness round-trip on a connection that has been idle a while."""
+        self._incr('health_checks')
+        try:
+            with pooled.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            pooled.conn.rollback()
+            return True
+        except Exception as e:
+            self._incr('failed_health_checks')
+            log.warning(f"Discarding dead pooled connection: {e}")
+            return False
+
+    def _is_expired(self, pooled: _PooledConnection, now: float) -> bool:
+        return bool(self.max_lifetime) and now - pooled.created_at > self.max_lifetime
+
+    def getconn(self, key=None, timeout: Optional[float] = None):
+        """
+        Check a connection out of the pool, waiting if none is free.
+
+        Args:
+            key: Accepted for psycopg2 pool compatibility, unused
+            timeout: Seconds to wait; defaults to acquire_timeout
+
+        Returns:
+            A psycopg2 connection
+
+        Raises:
+            PoolTimeoutError: If no connection became available in time
+            PoolError: If the pool is closed
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            pooled = None
+            create = False
+            with self._lock:
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout:.1f}s waiting for a database connection "
+                            f"({self._size} open, {self._waiters} waiting)"
+                        )
+                    self._waiters += 1
+                    self._metrics['max_waiters'] = max(self._metrics['max_waiters'], self._waiters)
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+                    continue
+
+            if create:
+                try:
+                    pooled = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            else:
+                now = time.monotonic()
+                if pooled.conn.closed or self._is_expired(pooled, now):
+                    self._incr('recycled')
+                    self._discard(pooled)
+                    continue
+                if now - pooled.last_used > self.idle_check_after and not self._is_alive(pooled):
+                    self._discard(pooled)
+                    continue
+
+            wait_time = time.monotonic() - started
+            with self._lock:
+                self._in_use[id(pooled.conn)] = pooled
+                self._metrics['checkouts'] += 1
+                self._metrics['total_wait_time'] += wait_time
+                self._metrics['max_wait_time'] = max(self._metrics['max_wait_time'], wait_time)
+            return pooled.conn
+
+    def putconn(self, conn, key=None, close: bool = False) -> None:
+        """
+        Return a connection to the pool.
+
+        Args:
+            conn: Connection previously returned by getconn
+            key: Accepted for psycopg2 pool compatibility, unused
+            close: Close the connection instead of keeping it
+        """
+        with self._lock:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            raise PoolError("trying to put unkeyed connection")
+
+        if not close and not self.closed and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as e:
+                log.warning(f"Error resetting connection before returning it to the pool: {e}")
+                close = True
+
+        if close or self.closed or conn.closed:
+            self._discard(pooled)
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(pooled)
+            self._lock.notify()
+        self.recycle_idle()
+
+    def recycle_idle(self) -> int:
+        """
+        Close surplus connections idle longer than max_idle_time.
+
+        Returns:
+            Number of connections closed
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            while (self._idle and self._size - len(expired) > self.minconn
+                   and now - self._idle[0].last_used > self.max_idle_time):
+                expired.append(self._idle.popleft())
+        for pooled in expired:
+            self._incr('recycled')
+            self._discard(pooled)
+        return len(expired)
+
+    def closeall(self) -> None:
+        """Close every connection and refuse further checkouts."""
+        with self._lock:
+            self.closed = True
+            idle = list(self._idle)
+            in_use = list(self._in_use.values())
+            self._idle.clear()
+            self._in_use.clear()
+            self._lock.notify_all()
+        for pooled in idle + in_use:
+            self._discard(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get a snapshot of pool state and checkout metrics."""
+        with self._lock:
+            checkouts = self._metrics['checkouts']
+            return {
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+                'open': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'waiters': self._waiters,
+                'max_waiters': self._metrics['max_waiters'],
+                'checkouts': checkouts,
+                'timeouts': self._metrics['timeouts'],
+                'avg_checkout_ms': round(self._metrics['total_wait_time'] / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_checkout_ms': round(self._metrics['max_wait_time'] * 1000, 3),
+                'health_checks': self._metrics['health_checks'],
+                'failed_health_checks': self._metrics['failed_health_checks'],
+                'recycled': self._metrics['recycled'],
+                'created': self._metrics['created'],
+            }
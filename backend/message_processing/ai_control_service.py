@@ -3,320 +3,515 @@ Service for controlling AI response generation.
 
 This module handles the logic for stopping and resuming AI responses
 for specific conversations and users.
+
+Stops are shared by every worker:
+
+- Redis holds the active stops, one hash per stop under ai_stop:{scope}:{id}
+  whose TTL ends at the stop's expiration, so expired stops disappear on
+  their own.
+- Each process mirrors the active stops in memory. Changes are published on
+  the ai_control channel and applied by a listener thread, which also reloads
+  the mirror from Redis after (re)subscribing and every
+  AI_CONTROL_REFRESH_INTERVAL seconds. Checking a message is a dict lookup.
+- ai_control_settings is written behind by a background thread. It seeds
+  Redis when Redis has lost the stops, e.g. after a Redis restart.
+
+Without Redis the service keeps working from the in-process mirror and the
+database, but stops are then only seen by the worker that issued them.
 """
 
+import json
+import time
 import logging
-from typing import Dict, Optional, Set
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime, timedelta
-import uuid
-from backend.db import get_db_connection, release_db_connection
 from datetime import timezone
+from backend.config import Config
+from backend.db import get_db_connection, release_db_connection
 
 log = logging.getLogger(__name__)
 
+CHANNEL = 'ai_control'
+
+# Set once Redis has been seeded from ai_control_settings
+LOADED_KEY = 'ai_stop:loaded'
+
+# Held by the worker seeding Redis; expires if that worker dies midway
+SEEDING_KEY = 'ai_stop:seeding'
+SEEDING_TTL = 60
+
+MARKER_KEYS = (LOADED_KEY, SEEDING_KEY)
+
+SCOPES = ('conversation', 'user')
+
+# Upsert of a stop by scope; relies on the unique indexes of migration 10
+UPSERT_QUERIES = {
+    scope: f"""
+        INSERT INTO ai_control_settings ({scope}_id, is_stopped, stop_time, expiration_time)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT ({scope}_id) WHERE {scope}_id IS NOT NULL
+        DO UPDATE SET is_stopped = EXCLUDED.is_stopped,
+                      stop_time = EXCLUDED.stop_time,
+                      expiration_time = EXCLUDED.expiration_time,
+                      updated_at = NOW()
+    """
+    for scope in SCOPES
+}
+
+
+def _to_id(value: Any) -> Optional[str]:
+    """Convert a UUID object or string ID to a string."""
+    return str(value) if value else None
+
+
+def _load_active_stops() -> Iterable[Tuple[str, str, float, float]]:
+    """Read the unexpired stops from the database as (scope, id, stop_time, expires_at)."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT conversation_id, user_id, stop_time, expiration_time
+            FROM ai_control_settings
+            WHERE is_stopped = true AND expiration_time > NOW()
+            """
+        )
+        stops = []
+        for conversation_id, user_id, stop_time, expiration_time in cursor.fetchall():
+            scope, entity_id = ('conversation', conversation_id) if conversation_id else ('user', user_id)
+            started = stop_time.timestamp() if stop_time else time.time()
+            stops.append((scope, str(entity_id), started, expiration_time.timestamp()))
+        return stops
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
 class AIControlService:
     """
     Service for controlling AI response generation.
-    
+
     This service manages the state of AI response generation for conversations
     and users, allowing for fine-grained control over when AI responses are
     generated.
     """
-    
-    def __init__(self):
-        """Initialize the AI control service."""
-        self._stopped_conversations: Set[str] = set()
+
+    def __init__(
+        self,
+        default_stop_hours: float = 24,
+        refresh_interval: float = 60.0,
+        flush_interval: float = 1.0,
+        redis_manager=None,
+        use_redis: bool = True,
+        use_database: bool = True,
+        loader=_load_active_stops
+    ):
+        """
+        Initialize the AI control service.
+
+        Args:
+            default_stop_hours: Duration of a stop when none is given
+            refresh_interval: Seconds between reloads of the mirror from Redis
+            flush_interval: Seconds between writes to ai_control_settings
+            redis_manager: Redis state manager; created on first use if not given
+            use_redis: Whether to share stops through Redis
+            use_database: Whether to persist stops to ai_control_settings
+            loader: Function returning the active stops stored in the database
+        """
         self._rate_limits: Dict[str, int] = {}
-        # Default stop duration (24 hours)
-        self._default_stop_duration = timedelta(hours=24)
-    
+        self._default_stop_duration = timedelta(hours=default_stop_hours)
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.use_redis = use_redis
+        self.use_database = use_database
+        self._redis_manager = redis_manager
+        self._loader = loader
+        # (scope, id) -> (stop_time, expires_at) as epoch seconds
+        self._stops: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        # (scope, id) -> stop or None for a resume, waiting to be persisted
+        self._pending: Dict[Tuple[str, str], Optional[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+        self._flusher: Optional[threading.Thread] = None
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def redis_client(self):
+        if not self.use_redis:
+            return None
+        if self._redis_manager is None:
+            from backend.message_processing.services.storage.redis_manager import RedisStateManager
+            self._redis_manager = RedisStateManager()
+        return self._redis_manager.redis_client
+
+    @staticmethod
+    def _stop_key(scope: str, entity_id: str) -> str:
+        return f"ai_stop:{scope}:{entity_id}"
+
     def _get_current_time(self):
         """Get current time in UTC timezone."""
         return datetime.now(timezone.utc)
-    
-    def stop_ai_responses(self, conversation_id: str) -> None:
+
+    def start(self) -> None:
+        """
+        Load the active stops and start the listener and writer threads.
+
+        Does blocking Redis and database I/O, so it is called once at app and
+        worker startup rather than on the request path.
         """
-        Stop AI responses for a conversation.
-        
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            redis_client = self.redis_client
+            if redis_client is not None:
+                self._seed_redis(redis_client)
+            self.reload()
+            if redis_client is not None:
+                self._listener = threading.Thread(target=self._listen, name="ai-control-listener", daemon=True)
+                self._listener.start()
+            if self.use_database:
+                self._flusher = threading.Thread(target=self._run_flusher, name="ai-control-writer", daemon=True)
+                self._flusher.start()
+            self._started = True
+
+    def stop(self) -> None:
+        """Stop the background threads after writing pending changes."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self.use_database:
+            self.flush()
+
+    def _seed_redis(self, redis_client) -> None:
+        """Copy the stops stored in the database to Redis if Redis doesn't have them yet."""
+        if not self.use_database:
+            return
+        try:
+            # The loaded marker has no TTL, so it disappears only with the data
+            if redis_client.exists(LOADED_KEY) or not redis_client.set(SEEDING_KEY, '1', nx=True, ex=SEEDING_TTL):
+                return
+        except Exception as e:
+            log.error(f"Error checking whether AI stops are in Redis: {str(e)}")
+            return
+        try:
+            stops = list(self._loader())
+            now = time.time()
+            pipe = redis_client.pipeline(transaction=True)
+            for scope, entity_id, stop_time, expires_at in stops:
+                if expires_at > now:
+                    self._write_stop(pipe, scope, entity_id, stop_time, expires_at)
+            # Marked loaded together with the stops, so a failed seed is retried
+            pipe.set(LOADED_KEY, '1')
+            pipe.execute()
+            log.info(f"Seeded {len(stops)} AI stops into Redis")
+        except Exception as e:
+            log.error(f"Error seeding AI stops into Redis: {str(e)}")
+        finally:
+            try:
+                redis_client.delete(SEEDING_KEY)
+            except Exception:
+                pass
+
+    def _write_stop(self, pipe, scope: str, entity_id: str, stop_time: float, expires_at: float) -> None:
+        key = self._stop_key(scope, entity_id)
+        pipe.hset(key, mapping={'stop_time': stop_time, 'expires_at': expires_at})
+        pipe.expireat(key, int(expires_at) + 1)
+
+    def reload(self) -> None:
+        """Rebuild the in-process mirror from Redis, or from the database without Redis."""
+        now = time.time()
+        stops: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        redis_client = self.redis_client
+        try:
+            if redis_client is not None:
+                keys = [key for key in redis_client.scan_iter(match='ai_stop:*', count=500) if key not in MARKER_KEYS]
+                pipe = redis_client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.hgetall(key)
+                for key, values in zip(keys, pipe.execute() if keys else []):
+                    _, scope, entity_id = key.split(':', 2)
+                    if values and float(values['expires_at']) > now:
+                        stops[(scope, entity_id)] = (float(values['stop_time']), float(values['expires_at']))
+            elif self.use_database:
+                for scope, entity_id, stop_time, expires_at in self._loader():
+                    stops[(scope, entity_id)] = (stop_time, expires_at)
+            else:
+                return
+        except Exception as e:
+            log.error(f"Error loading AI stops: {str(e)}")
+            return
+        with self._lock:
+            self._stops = stops
+            self._loaded_at = now
+
+    def _apply(self, scope: str, entity_id: str, stop: Optional[Tuple[float, float]]) -> None:
+        with self._lock:
+            if stop is None:
+                self._stops.pop((scope, entity_id), None)
+            else:
+                self._stops[(scope, entity_id)] = stop
+
+    def handle_notification(self, payload: str) -> None:
+        """
+        Apply a change published on the ai_control channel.
+
+        Args:
+            payload: JSON with action ('stop' or 'resume'), scope, id and, for
+                stops, stop_time and expires_at
+        """
+        try:
+            change = json.loads(payload)
+            stop = None
+            if change['action'] == 'stop':
+                stop = (float(change['stop_time']), float(change['expires_at']))
+            self._apply(change['scope'], change['id'], stop)
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning(f"Ignoring malformed AI control notification {payload!r}: {str(e)}")
+
+    def _listen(self) -> None:
+        while not self._stopping.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Catch up on changes made before subscribing or while disconnected
+                self.reload()
+                while not self._stopping.is_set():
+                    message = pubsub.get_message(timeout=min(self.refresh_interval, 1.0))
+                    if message is not None and message.get('type') == 'message':
+                        self.handle_notification(message['data'])
+                    elif self._loaded_at is None or time.time() - self._loaded_at >= self.refresh_interval:
+                        self.reload()
+            except Exception as e:
+                log.error(f"AI control listener error: {str(e)}")
+                self._stopping.wait(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _set(self, scope: str, entity_id: str, stop: Optional[Tuple[float, float]]) -> None:
+        """Record a stop (or a resume when stop is None) in every layer."""
+        self._apply(scope, entity_id, stop)
+        redis_client = self.redis_client
+        if redis_client is not None:
+            change = {'action': 'stop' if stop else 'resume', 'scope': scope, 'id': entity_id}
+            try:
+                pipe = redis_client.pipeline(transaction=True)
+                if stop is None:
+                    pipe.delete(self._stop_key(scope, entity_id))
+                else:
+                    self._write_stop(pipe, scope, entity_id, *stop)
+                    change.update(stop_time=stop[0], expires_at=stop[1])
+                pipe.publish(CHANNEL, json.dumps(change))
+                pipe.execute()
+            except Exception as e:
+                log.error(f"Error sharing AI control change for {scope} {entity_id}: {str(e)}")
+        if self.use_database:
+            with self._lock:
+                self._pending[(scope, entity_id)] = stop
+        self._wakeup.set()
+
+    def stop_ai_responses(self, conversation_id: Optional[str] = None, user_id: Optional[str] = None,
+                          duration: Optional[timedelta] = None) -> None:
+        """
+        Stop AI responses for a conversation, or for every conversation of a user.
+
         Args:
-            conversation_id: ID of the conversation to stop
+            conversation_id: ID of the conversation to stop (can be string or UUID)
+            user_id: Optional user ID; when given, the user is stopped instead of the conversation
+            duration: Optional duration for the stop (defaults to AI_CONTROL_DEFAULT_STOP_HOURS)
         """
-        self._stopped_conversations.add(conversation_id)
-        log.info(f"AI responses stopped for conversation {conversation_id}")
-    
-    def resume_ai_responses(self, conversation_id: str) -> None:
+        scope, entity_id = ('user', _to_id(user_id)) if user_id else ('conversation', _to_id(conversation_id))
+        if not entity_id:
+            raise ValueError("A conversation_id or user_id is required")
+        stop_time = time.time()
+        expires_at = stop_time + (duration or self._default_stop_duration).total_seconds()
+        self._set(scope, entity_id, (stop_time, expires_at))
+        log.info(f"AI responses stopped for {scope} {entity_id}")
+
+    def resume_ai_responses(self, conversation_id: Optional[str] = None, user_id: Optional[str] = None) -> None:
         """
-        Resume AI responses for a conversation.
-        
+        Resume AI responses for a conversation, or for every conversation of a user.
+
         Args:
-            conversation_id: ID of the conversation to resume
+            conversation_id: ID of the conversation to resume (can be string or UUID)
+            user_id: Optional user ID; when given, the user is resumed instead of the conversation
         """
-        self._stopped_conversations.discard(conversation_id)
-        log.info(f"AI responses resumed for conversation {conversation_id}")
-    
-    def is_ai_stopped(self, conversation_id: str) -> bool:
+        scope, entity_id = ('user', _to_id(user_id)) if user_id else ('conversation', _to_id(conversation_id))
+        if not entity_id:
+            raise ValueError("A conversation_id or user_id is required")
+        self._set(scope, entity_id, None)
+        log.info(f"AI responses resumed for {scope} {entity_id}")
+
+    def _active_stop(self, scope: str, entity_id: Optional[str]) -> Optional[Tuple[float, float]]:
+        if not entity_id:
+            return None
+        stop = self._stops.get((scope, entity_id))
+        if stop is not None and stop[1] <= time.time():
+            # Expired; Redis drops the key by TTL, the mirror drops it here
+            with self._lock:
+                self._stops.pop((scope, entity_id), None)
+            return None
+        return stop
+
+    def is_ai_stopped(self, conversation_id: Optional[str], user_id: Optional[str] = None) -> bool:
         """
         Check if AI responses are stopped for a conversation.
-        
+
         Args:
             conversation_id: ID of the conversation to check
-            
+            user_id: Optional ID of the conversation's user, whose stop applies too
+
         Returns:
             True if AI responses are stopped, False otherwise
         """
-        return conversation_id in self._stopped_conversations
-    
+        return (self._active_stop('conversation', _to_id(conversation_id)) is not None
+                or self._active_stop('user', _to_id(user_id)) is not None)
+
     def set_rate_limit(self, business_id: str, limit: int) -> None:
         """
         Set rate limit for a business.
-        
+
         Args:
             business_id: ID of the business
             limit: Maximum number of requests per minute
         """
         self._rate_limits[business_id] = limit
         log.info(f"Rate limit set to {limit} for business {business_id}")
-    
+
     def get_rate_limit(self, business_id: str) -> int:
         """
         Get rate limit for a business.
-        
+
         Args:
             business_id: ID of the business
-            
+
         Returns:
             Rate limit value
         """
         return self._rate_limits.get(business_id, 60)  # Default to 60 requests per minute
-    
-    def stop_ai_responses_for_user(self, user_id: Optional[str] = None, 
-                                  duration: Optional[timedelta] = None) -> None:
+
+    def stop_ai_responses_for_user(self, user_id: str, duration: Optional[timedelta] = None) -> None:
         """
         Stop AI from generating responses for a user.
-        
+
         Args:
-            user_id: Optional user ID to stop responses for all their conversations (can be string or UUID)
+            user_id: User ID to stop responses for all their conversations (can be string or UUID)
             duration: Optional duration for the stop (defaults to 24 hours)
         """
-        conn = None
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Calculate expiration time
-            stop_time = self._get_current_time()
-            expiration_time = stop_time + (duration or self._default_stop_duration)
-            
-            if user_id:
-                # Convert to string if it's a UUID object
-                user_id_str = str(user_id) if hasattr(user_id, 'hex') else user_id
-                # Check if user setting exists
-                cursor.execute(
-                    """
-                    SELECT id FROM ai_control_settings 
-                    WHERE user_id = %s
-                    """,
-                    (user_id_str,)
-                )
-                if cursor.fetchone():
-                    # Update existing setting
-                    cursor.execute(
-                        """
-                        UPDATE ai_control_settings 
-                        SET is_stopped = true,
-                            stop_time = %s,
-                            expiration_time = %s,
-                            updated_at = NOW()
-                        WHERE user_id = %s
-                        """,
-                        (stop_time, expiration_time, user_id_str)
-                    )
-                else:
-                    # Create new setting
-                    cursor.execute(
-                        """
-                        INSERT INTO ai_control_settings (
-                            user_id, is_stopped, stop_time, expiration_time
-                        )
-                        VALUES (%s, true, %s, %s)
-                        """,
-                        (user_id_str, stop_time, expiration_time)
-                    )
-                log.info(f"AI responses stopped for user {user_id_str}")
-            else:
-                # Convert to string if it's a UUID object
-                conv_id_str = str(conversation_id) if hasattr(conversation_id, 'hex') else conversation_id
-                # Check if conversation setting exists
-                cursor.execute(
-                    """
-                    SELECT id FROM ai_control_settings 
-                    WHERE conversation_id = %s
-                    """,
-                    (conv_id_str,)
-                )
-                if cursor.fetchone():
-                    # Update existing setting
-                    cursor.execute(
-                        """
-                        UPDATE ai_control_settings 
-                        SET is_stopped = true,
-                            stop_time = %s,
-                            expiration_time = %s,
-                            updated_at = NOW()
-                        WHERE conversation_id = %s
-                        """,
-                        (stop_time, expiration_time, conv_id_str)
-                    )
-                else:
-                    # Create new setting
-                    cursor.execute(
-                        """
-                        INSERT INTO ai_control_settings (
-                            conversation_id, is_stopped, stop_time, expiration_time
-                        )
-                        VALUES (%s, true, %s, %s)
-                        """,
-                        (conv_id_str, stop_time, expiration_time)
-                    )
-                log.info(f"AI responses stopped for conversation {conv_id_str}")
-            
-            conn.commit()
-            
-        except Exception as e:
-            log.error(f"Error stopping AI responses: {str(e)}")
-            if conn:
-                conn.rollback()
-            raise
-        finally:
-            if conn:
-                release_db_connection(conn)
-    
-    def resume_ai_responses_for_user(self, user_id: Optional[str] = None) -> None:
+        self.stop_ai_responses(user_id=user_id, duration=duration)
+
+    def resume_ai_responses_for_user(self, user_id: str) -> None:
         """
         Resume AI response generation for a user.
-        
+
         Args:
-            user_id: Optional user ID to resume responses for all their conversations (can be string or UUID)
+            user_id: User ID to resume responses for all their conversations (can be string or UUID)
         """
-        conn = None
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            if user_id:
-                # Convert to string if it's a UUID object
-                user_id_str = str(user_id) if hasattr(user_id, 'hex') else user_id
-                cursor.execute(
-                    """
-                    UPDATE ai_control_settings 
-                    SET is_stopped = false,
-                        stop_time = NULL,
-                        expiration_time = NULL,
-                        updated_at = NOW()
-                    WHERE user_id = %s
-                    """,
-                    (user_id_str,)
-                )
-                log.info(f"AI responses resumed for user {user_id_str}")
-            else:
-                # Convert to string if it's a UUID object
-                conv_id_str = str(conversation_id) if hasattr(conversation_id, 'hex') else conversation_id
-                cursor.execute(
-                    """
-                    UPDATE ai_control_settings 
-                    SET is_stopped = false,
-                        stop_time = NULL,
-                        expiration_time = NULL,
-                        updated_at = NOW()
-                    WHERE conversation_id = %s
-                    """,
-                    (conv_id_str,)
-                )
-                log.info(f"AI responses resumed for conversation {conv_id_str}")
-            
-            conn.commit()
-            
-        except Exception as e:
-            log.error(f"Error resuming AI responses: {str(e)}")
-            if conn:
-                conn.rollback()
-            raise
-        finally:
-            if conn:
-                release_db_connection(conn)
-    
+        self.resume_ai_responses(user_id=user_id)
+
     def get_stop_status(self, conversation_id: str, user_id: Optional[str] = None) -> Dict:
         """
         Get the current stop status for a conversation or user.
-        
+
         Args:
             conversation_id: The ID of the conversation to check (can be string or UUID)
             user_id: Optional user ID to check (can be string or UUID)
-            
+
         Returns:
             Dict: Status information including whether AI is stopped and expiration time
         """
-        conn = None
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            is_stopped = self.is_ai_stopped(conversation_id)
-            
-            if user_id:
-                # Convert to string if it's a UUID object
-                user_id_str = str(user_id) if hasattr(user_id, 'hex') else user_id
-                cursor.execute(
-                    """
-                    SELECT stop_time, expiration_time 
-                    FROM ai_control_settings 
-                    WHERE user_id = %s
-                    """,
-                    (user_id_str,)
-                )
-            else:
-                # Convert to string if it's a UUID object
-                conv_id_str = str(conversation_id) if hasattr(conversation_id, 'hex') else conversation_id
-                cursor.execute(
-                    """
-                    SELECT stop_time, expiration_time 
-                    FROM ai_control_settings 
-                    WHERE conversation_id = %s
-                    """,
-                    (conv_id_str,)
-                )
-            
-            result = cursor.fetchone()
-            
-            if result:
-                stop_time, expiration_time = result
-                time_remaining = expiration_time - self._get_current_time() if expiration_time else timedelta(0)
-                
-                return {
-                    'is_stopped': is_stopped,
-                    'stop_time': stop_time.isoformat() if stop_time else None,
-                    'expiration_time': expiration_time.isoformat() if expiration_time else None,
-                    'time_remaining_seconds': max(0, int(time_remaining.total_seconds()))
-                }
-            
-            return {
-                'is_stopped': is_stopped,
-                'stop_time': None,
-                'expiration_time': None,
-                'time_remaining_seconds': 0
-            }
-            
-        except Exception as e:
-            log.error(f"Error getting stop status: {str(e)}")
+        if user_id:
+            stop = self._active_stop('user', _to_id(user_id))
+        else:
+            stop = self._active_stop('conversation', _to_id(conversation_id))
+
+        if stop is None:
             return {
                 'is_stopped': False,
                 'stop_time': None,
                 'expiration_time': None,
                 'time_remaining_seconds': 0
             }
+
+        stop_time, expires_at = stop
+        return {
+            'is_stopped': True,
+            'stop_time': datetime.fromtimestamp(stop_time, timezone.utc).isoformat(),
+            'expiration_time': datetime.fromtimestamp(expires_at, timezone.utc).isoformat(),
+            'time_remaining_seconds': max(0, int(expires_at - time.time()))
+        }
+
+    def _run_flusher(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error(f"Error writing AI control settings: {str(e)}")
+
+    def flush(self) -> int:
+        """
+        Write stops and resumes changed since the last flush to ai_control_settings.
+
+        Only the latest change of each conversation or user is written.
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = []
+        for (scope, entity_id), stop in pending.items():
+            if stop is None:
+                rows.append((scope, (entity_id, False, None, None)))
+            else:
+                rows.append((scope, (entity_id, True,
+                                     datetime.fromtimestamp(stop[0], timezone.utc),
+                                     datetime.fromtimestamp(stop[1], timezone.utc))))
+        return self._write_rows(rows)
+
+    def _write_rows(self, rows: List[tuple]) -> int:
+        conn = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            for scope, params in rows:
+                cursor.execute(UPSERT_QUERIES[scope], params)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            log.error(f"Error writing {len(rows)} AI control settings: {str(e)}")
+            if len(rows) == 1:
+                # A single row that fails (e.g. an unknown conversation) is not retried
+                return 0
         finally:
             if conn:
                 release_db_connection(conn)
+        # Write the rows one by one so a bad row doesn't hold back the others
+        written = 0
+        for row in rows:
+            written += self._write_rows([row])
+        return written
 
 # Create a singleton instance of the service
-ai_control_service = AIControlService()
\ No newline at end of file
+ai_control_service = AIControlService(
+    default_stop_hours=Config.AI_CONTROL_DEFAULT_STOP_HOURS,
+    refresh_interval=Config.AI_CONTROL_REFRESH_INTERVAL,
+    flush_interval=Config.AI_CONTROL_FLUSH_INTERVAL,
+)
@@ -17,6 +17,8 @@ from ...services.template_service import TemplateService
 from ...services.data_extraction_service import DataExtractionService
 from ...services.llm_service import LLMService
 from ...storage.redis_manager import RedisStateManager
+from ...process_log_store import store_process_log
+from ...ai_control_service import ai_control_service
 
 logger = logging.getLogger(__name__)
 
@@ -49,8 +51,6 @@ class BaseMessageHandler:
         self.template_service = template_service
         self.data_extraction_service = data_extraction_service
         self.logger = logger
-        self._process_logs = {}
-        self._stop_flags = {}
         self._processors: List[Callable] = []
         
     async def validate_message(self, message_data: Dict[str, Any]) -> bool:
@@ -180,7 +180,7 @@ class BaseMessageHandler:
         Args:
             user_id: User ID to stop AI responses for
         """
-        self._stop_flags[user_id] = True
+        ai_control_service.stop_ai_responses(user_id=user_id)
         self.logger.info(f"AI responses stopped for user {user_id}")
         
     def resume_ai_responses(self, user_id: str) -> None:
@@ -189,7 +189,7 @@ class BaseMessageHandler:
         Args:
             user_id: User ID to resume AI responses for
         """
-        self._stop_flags[user_id] = False
+        ai_control_service.resume_ai_responses(user_id=user_id)
         self.logger.info(f"AI responses resumed for user {user_id}")
         
     def _is_ai_stopped(self, user_id: str) -> bool:
@@ -201,7 +201,7 @@ class BaseMessageHandler:
         Returns:
             True if AI responses are stopped
         """
-        return self._stop_flags.get(user_id, False)
+        return ai_control_service.is_ai_stopped(None, user_id)
         
     def _store_process_log(self, log_id: str, log_data: Dict[str, Any]) -> None:
         """Store process log data.
@@ -210,7 +210,7 @@ class BaseMessageHandler:
             log_id: Log ID
             log_data: Log data to store
         """
-        self._process_logs[log_id] = log_data
+        store_process_log(log_id, log_data)
         
     def _handle_ai_stopped_response(self, log_id: str) -> Dict[str, Any]:
         """Handle response when AI is stopped.
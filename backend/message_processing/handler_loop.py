@@ -0,0 +1,93 @@
+"""
+Process-wide MessageHandler for synchronous callers.
+
+MessageHandler's asyncpg pool and Redis client are bound to the event loop
+they were created on, and Flask runs each request on its own thread. The
+handler therefore lives on one event loop running in a background thread,
+and request threads submit coroutines to it. The loop, the handler and its
+pools are created on first use and closed at exit.
+"""
+
+import atexit
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Iterator
+
+log = logging.getLogger(__name__)
+
+
+async def _next_event(events):
+    return await events.__anext__()
+
+
+class HandlerLoop:
+    """Runs one MessageHandler on an event loop in a background thread."""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._handler = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Called with the lock held
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='message-handler-loop', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self._loop
+
+    def run(self, coro) -> Any:
+        """Run a coroutine on the handler's loop and wait for its result."""
+        with self._lock:
+            loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    @property
+    def handler(self):
+        """The process's MessageHandler, created on the loop on first use."""
+        with self._lock:
+            loop = self._ensure_loop()
+            if self._handler is None:
+                from .message_handler import MessageHandler
+                self._handler = asyncio.run_coroutine_threadsafe(MessageHandler.create(), loop).result()
+            return self._handler
+
+    def process_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Process a message and wait for the result."""
+        handler = self.handler
+        return self.run(handler.process_message(message_data))
+
+    def stream_message(self, message_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Process a message, yielding the events of MessageHandler.stream_message."""
+        events = self.handler.stream_message(message_data)
+        try:
+            while True:
+                try:
+                    yield self.run(_next_event(events))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(events.aclose())
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Close the handler and stop the loop."""
+        with self._lock:
+            loop, thread, handler = self._loop, self._thread, self._handler
+            self._loop = self._thread = self._handler = None
+        if loop is None:
+            return
+        if handler is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(handler.close(), loop).result(timeout)
+            except Exception as e:
+                log.warning(f"Error closing message handler: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not loop.is_running():
+            loop.close()
+
+
+handler_loop = HandlerLoop()
@@ -0,0 +1,492 @@
+"""
+Durable queue between platform webhooks and message processing.
+
+Facebook and WhatsApp expect webhooks to answer quickly and redeliver events
+that aren't acknowledged. The webhooks therefore only verify, enqueue and
+ack; a pool of worker processes (see ingestion_worker.py) does the work.
+
+- Events are spread over INGESTION_PARTITIONS streams by a stable hash of
+  (platform, recipient, sender), so all messages of a conversation land on
+  the same stream and are handled in order by the one worker that owns it.
+- Platform message IDs are remembered for INGESTION_DEDUPE_TTL seconds, so
+  redelivered webhooks are enqueued once, and an event that was processed
+  but not acknowledged before a crash isn't processed again.
+- Failed events are retried with exponential backoff before moving on, which
+  keeps per-conversation order; after INGESTION_MAX_ATTEMPTS they go to the
+  dead-letter stream.
+- Consumer names include the host and process id. Entries left pending by a
+  consumer that is gone (a crashed or scaled-down worker) are claimed by the
+  current owner of their partition once idle for INGESTION_CLAIM_IDLE_MS.
+
+Redis Streams with a consumer group are used in production. LocalStreamBackend
+is an in-process stand-in with the same interface for tests and development.
+"""
+
+import os
+import json
+import time
+import zlib
+import socket
+import logging
+import itertools
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.config import Config
+
+log = logging.getLogger(__name__)
+
+# (stream, entry id, fields) as returned by backend reads
+Entry = Tuple[str, str, Dict[str, str]]
+
+
+class RedisStreamBackend:
+    """Streams, consumer group and idempotency keys in Redis."""
+
+    def __init__(self, redis_client, group: str = 'ingestion', max_stream_length: int = 100000):
+        """
+        Initialize the backend.
+
+        Args:
+            redis_client: Synchronous Redis client with decode_responses=True
+            group: Consumer group shared by all workers
+            max_stream_length: Approximate cap on entries kept per stream
+        """
+        self.redis = redis_client
+        self.group = group
+        self.max_stream_length = max_stream_length
+        self._groups = set()
+
+    def _ensure_group(self, stream: str) -> None:
+        if stream in self._groups:
+            return
+        try:
+            self.redis.xgroup_create(stream, self.group, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._groups.add(stream)
+
+    def add(self, stream: str, fields: Dict[str, str]) -> str:
+        self._ensure_group(stream)
+        return self.redis.xadd(stream, fields, maxlen=self.max_stream_length, approximate=True)
+
+    def read(self, streams: List[str], consumer: str, count: int, block_ms: int,
+             pending: bool = False) -> List[Entry]:
+        """
+        Read entries for a consumer.
+
+        Args:
+            streams: Streams to read from
+            consumer: Consumer name; stable per worker so pending entries survive restarts
+            count: Maximum entries per stream
+            block_ms: Milliseconds to wait for new entries
+            pending: Re-read entries delivered to this consumer but never acknowledged
+
+        Returns:
+            List of (stream, entry id, fields)
+        """
+        for stream in streams:
+            self._ensure_group(stream)
+        start = '0' if pending else '>'
+        response = self.redis.xreadgroup(
+            self.group, consumer, {stream: start for stream in streams},
+            count=count, block=None if pending else block_ms
+        )
+        return [
+            (stream, entry_id, fields)
+            for stream, entries in (response or [])
+            for entry_id, fields in entries
+            if fields
+        ]
+
+    def claim(self, streams: List[str], consumer: str, count: int, min_idle_ms: int) -> List[Entry]:
+        """
+        Take over entries other consumers left pending for at least min_idle_ms.
+
+        Args:
+            streams: Streams to claim from
+            consumer: Consumer taking the entries over
+            count: Maximum entries claimed per stream
+            min_idle_ms: Milliseconds since an entry was last delivered
+
+        Returns:
+            List of (stream, entry id, fields), oldest first per stream
+        """
+        claimed = []
+        for stream in streams:
+            self._ensure_group(stream)
+            response = self.redis.xautoclaim(stream, self.group, consumer, min_idle_ms,
+                                             start_id='0-0', count=count)
+            claimed.extend((stream, entry_id, fields) for entry_id, fields in response[1] if fields)
+        return claimed
+
+    def ack(self, stream: str, entry_id: str) -> None:
+        self.redis.xack(stream, self.group, entry_id)
+
+    def set_if_absent(self, key: str, ttl: int) -> bool:
+        return bool(self.redis.set(key, '1', nx=True, ex=ttl))
+
+    def set(self, key: str, ttl: int) -> None:
+        self.redis.set(key, '1', ex=ttl)
+
+    def exists(self, key: str) -> bool:
+        return bool(self.redis.exists(key))
+
+    def delete(self, key: str) -> None:
+        self.redis.delete(key)
+
+    def length(self, stream: str) -> int:
+        return self.redis.xlen(stream)
+
+
+class LocalStreamBackend:
+    """In-memory stand-in for RedisStreamBackend, shared by threads of one process."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._streams: Dict[str, List[Tuple[str, Dict[str, str]]]] = defaultdict(list)
+        self._delivered: Dict[str, int] = defaultdict(int)
+        # stream -> entry id -> (consumer, fields, delivered at)
+        self._pending: Dict[str, Dict[str, Tuple[str, Dict[str, str], float]]] = defaultdict(dict)
+        self._keys: Dict[str, float] = {}
+        self._ids = itertools.count(1)
+
+    def add(self, stream: str, fields: Dict[str, str]) -> str:
+        with self._cond:
+            entry_id = f"{int(time.time() * 1000)}-{next(self._ids)}"
+            self._streams[stream].append((entry_id, dict(fields)))
+            self._cond.notify_all()
+            return entry_id
+
+    def read(self, streams: List[str], consumer: str, count: int, block_ms: int,
+             pending: bool = False) -> List[Entry]:
+        deadline = time.monotonic() + block_ms / 1000.0
+        with self._cond:
+            while True:
+                entries = []
+                for stream in streams:
+                    if pending:
+                        owned = [(i, f) for i, (c, f, _) in self._pending[stream].items() if c == consumer]
+                        entries.extend((stream, i, f) for i, f in owned[:count])
+                        continue
+                    start = self._delivered[stream]
+                    batch = self._streams[stream][start:start + count]
+                    self._delivered[stream] = start + len(batch)
+                    for entry_id, fields in batch:
+                        self._pending[stream][entry_id] = (consumer, fields, time.monotonic())
+                        entries.append((stream, entry_id, fields))
+                remaining = deadline - time.monotonic()
+                if entries or pending or remaining <= 0:
+                    return entries
+                self._cond.wait(remaining)
+
+    def claim(self, streams: List[str], consumer: str, count: int, min_idle_ms: int) -> List[Entry]:
+        now = time.monotonic()
+        claimed = []
+        with self._cond:
+            for stream in streams:
+                idle = [(i, f) for i, (c, f, at) in self._pending[stream].items()
+                        if (now - at) * 1000 >= min_idle_ms][:count]
+                for entry_id, fields in idle:
+                    self._pending[stream][entry_id] = (consumer, fields, now)
+                    claimed.append((stream, entry_id, fields))
+        return claimed
+
+    def ack(self, stream: str, entry_id: str) -> None:
+        with self._cond:
+            self._pending[stream].pop(entry_id, None)
+
+    def set_if_absent(self, key: str, ttl: int) -> bool:
+        with self._cond:
+            expires_at = self._keys.get(key)
+            if expires_at is not None and expires_at > time.monotonic():
+                return False
+            self._keys[key] = time.monotonic() + ttl
+            return True
+
+    def set(self, key: str, ttl: int) -> None:
+        with self._cond:
+            self._keys[key] = time.monotonic() + ttl
+
+    def exists(self, key: str) -> bool:
+        with self._cond:
+            expires_at = self._keys.get(key)
+            return expires_at is not None and expires_at > time.monotonic()
+
+    def delete(self, key: str) -> None:
+        with self._cond:
+            self._keys.pop(key, None)
+
+    def length(self, stream: str) -> int:
+        with self._cond:
+            return len(self._streams[stream])
+
+    def entries(self, stream: str) -> List[Dict[str, str]]:
+        """Get every entry ever added to a stream, for inspection in tests."""
+        with self._cond:
+            return [fields for _, fields in self._streams[stream]]
+
+
+class IngestionQueue:
+    """Partitioned, deduplicating queue of webhook events."""
+
+    def __init__(self, backend, partitions: int = 8, dedupe_ttl: int = 86400,
+                 prefix: str = 'ingest'):
+        """
+        Initialize the queue.
+
+        Args:
+            backend: RedisStreamBackend or LocalStreamBackend
+            partitions: Number of streams events are spread over
+            dedupe_ttl: Seconds a platform message ID is remembered
+            prefix: Prefix of stream and key names
+        """
+        self.backend = backend
+        self.partitions = partitions
+        self.dedupe_ttl = dedupe_ttl
+        self.prefix = prefix
+        self.dead_letter_stream = f"{prefix}:dead"
+
+    def stream_name(self, partition: int) -> str:
+        return f"{self.prefix}:{partition}"
+
+    def partition_for(self, event: Dict[str, Any]) -> int:
+        """Get the partition of an event; stable across processes and restarts."""
+        ordering_key = f"{event.get('platform')}:{event.get('recipient_id')}:{event.get('sender_id')}"
+        return zlib.crc32(ordering_key.encode('utf-8')) % self.partitions
+
+    def _key(self, kind: str, event: Dict[str, Any]) -> Optional[str]:
+        message_id = event.get('platform_message_id')
+        if not message_id:
+            return None
+        return f"{self.prefix}:{kind}:{event.get('platform')}:{message_id}"
+
+    def enqueue(self, event: Dict[str, Any]) -> bool:
+        """
+        Add an event unless its platform message ID was seen recently.
+
+        Args:
+            event: Dict with platform, sender_id, recipient_id, content and
+                platform_message_id
+
+        Returns:
+            bool: True if enqueued, False if it was a duplicate
+
+        Raises:
+            Exception: If the backend is unavailable; the webhook should then
+                answer with an error so the platform redelivers
+        """
+        seen_key = self._key('seen', event)
+        if seen_key and not self.backend.set_if_absent(seen_key, self.dedupe_ttl):
+            log.info(f"Skipping duplicate {event.get('platform')} message {event.get('platform_message_id')}")
+            return False
+
+        event = {**event, 'received_at': event.get('received_at', time.time())}
+        try:
+            self.backend.add(self.stream_name(self.partition_for(event)), {'event': json.dumps(event)})
+        except Exception:
+            if seen_key:
+                # Let the platform's redelivery through
+                self.backend.delete(seen_key)
+            raise
+        return True
+
+    def is_processed(self, event: Dict[str, Any]) -> bool:
+        done_key = self._key('done', event)
+        return bool(done_key) and self.backend.exists(done_key)
+
+    def mark_processed(self, event: Dict[str, Any]) -> None:
+        done_key = self._key('done', event)
+        if done_key:
+            self.backend.set(done_key, self.dedupe_ttl)
+
+    def dead_letter(self, event: Dict[str, Any], error: str, attempts: int) -> None:
+        """Move an event that kept failing to the dead-letter stream."""
+        self.backend.add(self.dead_letter_stream, {
+            'event': json.dumps(event),
+            'error': error,
+            'attempts': str(attempts),
+            'failed_at': str(time.time()),
+        })
+
+
+class IngestionWorker:
+    """Consumes the partitions owned by one worker, in order, with retries."""
+
+    def __init__(
+        self,
+        queue: IngestionQueue,
+        process: Callable[[Dict[str, Any]], None],
+        worker_index: int = 0,
+        worker_count: int = 1,
+        max_attempts: int = 5,
+        retry_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        batch_size: int = 10,
+        block_ms: int = 5000,
+        claim_idle_ms: int = 300000,
+        consumer: Optional[str] = None
+    ):
+        """
+        Initialize the worker.
+
+        Args:
+            queue: Queue to consume
+            process: Function handling one event; raises to have it retried
+            worker_index: Index of this worker among worker_count
+            worker_count: Number of workers sharing the partitions
+            max_attempts: Attempts before an event is dead-lettered
+            retry_backoff: Seconds before the first retry, doubled for each next one
+            max_backoff: Upper bound on the delay between retries
+            batch_size: Maximum entries read per stream at once
+            block_ms: Milliseconds to wait for new entries
+            claim_idle_ms: Milliseconds an entry pending on another consumer
+                must be idle before this worker claims it; keep it above the
+                longest retry sequence
+            consumer: Consumer name; defaults to the worker index, host and process id
+        """
+        self.queue = queue
+        self.process = process
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        # Each partition has exactly one owner, which is what keeps conversations ordered
+        self.partitions = [p for p in range(queue.partitions) if p % worker_count == worker_index]
+        self.streams = [queue.stream_name(p) for p in self.partitions]
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer = consumer or f"worker-{worker_index}-{socket.gethostname()}-{os.getpid()}"
+        self._stopping = threading.Event()
+        self._next_claim = 0.0
+
+    def stop(self) -> None:
+        """Stop after the current event; unfinished events stay pending for the next run."""
+        self._stopping.set()
+
+    def run_once(self, pending: bool = False) -> int:
+        """
+        Read and handle one batch.
+
+        Args:
+            pending: Handle entries left unacknowledged by a previous run instead of new ones
+
+        Returns:
+            int: Number of entries read
+        """
+        if not self.streams:
+            self._stopping.wait(self.block_ms / 1000.0)
+            return 0
+        entries = self.queue.backend.read(self.streams, self.consumer, self.batch_size,
+                                          self.block_ms, pending=pending)
+        return self._handle_all(entries)
+
+    def claim_once(self) -> int:
+        """
+        Claim and handle one batch of entries other consumers left pending.
+
+        Returns:
+            int: Number of entries claimed
+        """
+        if not self.streams:
+            return 0
+        entries = self.queue.backend.claim(self.streams, self.consumer, self.batch_size, self.claim_idle_ms)
+        return self._handle_all(entries)
+
+    def _handle_all(self, entries: List[Entry]) -> int:
+        for stream, entry_id, fields in entries:
+            if self._stopping.is_set():
+                break
+            self._handle(stream, entry_id, fields)
+        return len(entries)
+
+    def run(self) -> None:
+        """Recover pending and abandoned entries, then consume until stopped."""
+        log.info(f"Ingestion {self.consumer} consuming partitions {self.partitions}")
+        while not self._stopping.is_set() and self.run_once(pending=True):
+            pass
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() >= self._next_claim:
+                    # Abandoned entries are older than anything new, so they go first
+                    while not self._stopping.is_set() and self.claim_once():
+                        pass
+                    self._next_claim = time.monotonic() + self.claim_idle_ms / 1000.0
+                self.run_once()
+            except Exception as e:
+                log.error(f"Ingestion {self.consumer} failed to read: {str(e)}", exc_info=True)
+                self._stopping.wait(self.retry_backoff)
+
+    def _handle(self, stream: str, entry_id: str, fields: Dict[str, str]) -> None:
+        try:
+            event = json.loads(fields['event'])
+        except (KeyError, ValueError) as e:
+            log.error(f"Dropping malformed ingestion entry {entry_id}: {str(e)}")
+            self.queue.backend.ack(stream, entry_id)
+            return
+
+        if self.queue.is_processed(event):
+            # Processed before a crash that prevented the ack
+            self.queue.backend.ack(stream, entry_id)
+            return
+
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.process(event)
+                self.queue.mark_processed(event)
+                self.queue.backend.ack(stream, entry_id)
+                return
+            except Exception as e:
+                error = str(e)
+                log.warning(f"Attempt {attempt}/{self.max_attempts} failed for {event.get('platform')} "
+                            f"message {event.get('platform_message_id')}: {error}")
+            if attempt < self.max_attempts:
+                delay = min(self.max_backoff, self.retry_backoff * 2 ** (attempt - 1))
+                if self._stopping.wait(delay):
+                    # Leave it pending; the next run picks it up first
+                    return
+
+        log.error(f"Dead-lettering {event.get('platform')} message {event.get('platform_message_id')} "
+                  f"after {self.max_attempts} attempts: {error}")
+        self.queue.dead_letter(event, error, self.max_attempts)
+        self.queue.backend.ack(stream, entry_id)
+
+
+_queue: Optional[IngestionQueue] = None
+_queue_lock = threading.Lock()
+
+
+def create_backend():
+    """Build the backend named by INGESTION_BACKEND."""
+    if Config.INGESTION_BACKEND == 'local':
+        return LocalStreamBackend()
+    from backend.message_processing.services.storage.redis_manager import RedisStateManager
+    redis_client = RedisStateManager().redis_client
+    if redis_client is None:
+        raise RuntimeError("Redis is unavailable for the ingestion queue")
+    return RedisStreamBackend(redis_client, max_stream_length=Config.INGESTION_MAX_STREAM_LENGTH)
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """
+    Get the process-wide ingestion queue, creating it if needed.
+
+    With the local backend nothing outside this process can consume the
+    queue, so in-process worker threads are started alongside it.
+
+    Raises:
+        RuntimeError: If the Redis backend is configured but unreachable
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            queue = IngestionQueue(create_backend(), partitions=Config.INGESTION_PARTITIONS,
+                                   dedupe_ttl=Config.INGESTION_DEDUPE_TTL)
+            if Config.INGESTION_BACKEND == 'local':
+                from backend.message_processing.ingestion_worker import start_local_workers
+                start_local_workers(queue)
+            _queue = queue
+        return _queue
@@ -0,0 +1,209 @@
+"""
+Worker processes consuming the webhook ingestion queue.
+
+Each worker process owns a fixed share of the queue's partitions and runs a
+MessageHandler on its own event loop. Start the pool next to the web process:
+
+    python -m backend.message_processing.ingestion_worker --workers 4
+
+Events are dicts built by the webhooks:
+    platform: 'facebook' or 'whatsapp'
+    sender_id: Platform user ID
+    recipient_id: Facebook page ID or WhatsApp phone number ID
+    content: Message text
+    platform_message_id: Platform message ID, used for idempotency
+"""
+
+import sys
+import signal
+import asyncio
+import logging
+import argparse
+import threading
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+from backend.config import Config
+from backend.message_processing.core.errors import MessageProcessingError
+from backend.message_processing.ingestion_queue import (
+    IngestionQueue,
+    IngestionWorker,
+    create_backend,
+)
+from backend.message_processing.routing_table import routing_table
+from backend.message_processing.ai_control_service import ai_control_service
+from backend.services.conversation_summary_service import ConversationSummaryService, SummaryRefresher
+
+log = logging.getLogger(__name__)
+
+
+async def process_facebook_event(handler, event: Dict[str, Any]) -> None:
+    """Run a Messenger message through the pipeline for the page's business."""
+    business = routing_table.resolve_business('facebook', event['recipient_id'])
+    if not business:
+        # Retrying won't help until the page is configured
+        log.error(f"Could not find business associated with Facebook Page ID: {event['recipient_id']}")
+        return
+
+    business_id = business['business_id']
+    # Only a sender's first message misses the user cache and reaches the database
+    user_id = await asyncio.get_running_loop().run_in_executor(
+        None, routing_table.resolve_user, 'facebook', event['sender_id']
+    )
+    result = await handler.process_message({
+        'business_id': business_id,
+        'user_id': user_id,
+        'content': event['content'],
+        'platform': 'facebook',
+        # Makes a retry after a partial failure reuse the saved user message
+        'platform_message_id': event.get('platform_message_id'),
+    })
+    if not result.get('success'):
+        raise MessageProcessingError(
+            f"MessageHandler failed for business {business_id}: {result.get('error')}",
+            "INGESTION_ERROR"
+        )
+    log.info(f"Processed Facebook message {event.get('platform_message_id')} for business {business_id}")
+
+
+async def process_whatsapp_event(handler, event: Dict[str, Any]) -> None:
+    """Answer a WhatsApp message; a failed send is retried."""
+    from backend.message_processing.whatsapp import handle_whatsapp_message, send_whatsapp_message
+
+    response = handle_whatsapp_message(event['sender_id'], event['content'])
+    result = await asyncio.get_running_loop().run_in_executor(
+        None, send_whatsapp_message, event['sender_id'], response
+    )
+    if result is None or 'error' in result:
+        raise MessageProcessingError(f"Failed to send WhatsApp reply: {result}", "INGESTION_ERROR")
+
+
+PROCESSORS = {
+    'facebook': process_facebook_event,
+    'whatsapp': process_whatsapp_event,
+}
+
+
+class EventProcessor:
+    """Synchronous callable running events through a MessageHandler on a private loop."""
+
+    def __init__(self, handler=None):
+        """
+        Initialize the processor.
+
+        Args:
+            handler: MessageHandler to use; one bound to this processor's loop is created if not given
+        """
+        self.loop = asyncio.new_event_loop()
+        self._handler = handler
+
+    @property
+    def handler(self):
+        if self._handler is None:
+            from backend.message_processing.message_handler import MessageHandler
+            self._handler = self.loop.run_until_complete(MessageHandler.create())
+        return self._handler
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        processor = PROCESSORS.get(event.get('platform'))
+        if processor is None:
+            log.error(f"No processor for platform {event.get('platform')}; dropping event")
+            return
+        self.loop.run_until_complete(processor(self.handler, event))
+
+    def close(self) -> None:
+        if self._handler is not None:
+            self.loop.run_until_complete(self._handler.close())
+        self.loop.close()
+
+
+def _build_worker(queue: IngestionQueue, index: int, count: int, process) -> IngestionWorker:
+    return IngestionWorker(
+        queue,
+        process,
+        worker_index=index,
+        worker_count=count,
+        max_attempts=Config.INGESTION_MAX_ATTEMPTS,
+        retry_backoff=Config.INGESTION_RETRY_BACKOFF,
+        claim_idle_ms=Config.INGESTION_CLAIM_IDLE_MS,
+    )
+
+
+def start_local_workers(queue: IngestionQueue) -> List[IngestionWorker]:
+    """Consume an in-process queue from daemon threads, for development without Redis."""
+    workers = []
+    count = max(1, Config.INGESTION_WORKERS)
+    for index in range(count):
+        def run(index=index):
+            processor = EventProcessor()
+            worker = _build_worker(queue, index, count, processor)
+            workers.append(worker)
+            try:
+                worker.run()
+            finally:
+                processor.close()
+        threading.Thread(target=run, name=f"ingestion-worker-{index}", daemon=True).start()
+    return workers
+
+
+def run_worker(index: int, count: int) -> None:
+    """Entry point of one worker process."""
+    logging.basicConfig(level=logging.INFO)
+    queue = IngestionQueue(create_backend(), partitions=Config.INGESTION_PARTITIONS,
+                           dedupe_ttl=Config.INGESTION_DEDUPE_TTL)
+    # Load routes and AI stops up front so the first events don't pay for it
+    routing_table.start()
+    ai_control_service.start()
+    # One process keeps the summaries of active conversations current
+    if index == 0:
+        service = ConversationSummaryService(
+            max_age=Config.CONVERSATION_SUMMARY_MAX_AGE,
+            batch_size=Config.CONVERSATION_SUMMARY_BATCH_SIZE
+        )
+        SummaryRefresher(
+            service,
+            interval=Config.CONVERSATION_SUMMARY_REFRESH_INTERVAL,
+            active_window=Config.CONVERSATION_SUMMARY_ACTIVE_WINDOW,
+            idle_seconds=Config.CONVERSATION_SUMMARY_IDLE_SECONDS,
+            limit=Config.CONVERSATION_SUMMARY_REFRESH_LIMIT
+        ).start()
+    processor = EventProcessor()
+    worker = _build_worker(queue, index, count, processor)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    try:
+        worker.run()
+    finally:
+        processor.close()
+        log.info(f"Ingestion worker {index} stopped")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Consume the webhook ingestion queue")
+    parser.add_argument('--workers', type=int, default=Config.INGESTION_WORKERS,
+                        help="Number of worker processes; partitions are split between them")
+    args = parser.parse_args(argv)
+
+    if Config.INGESTION_BACKEND != 'redis':
+        parser.error("worker processes need INGESTION_BACKEND=redis")
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(index, args.workers), name=f"ingestion-worker-{index}")
+        for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(*_):
+        for process in processes:
+            process.terminate()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for process in processes:
+        process.join()
+    return 0 if all(process.exitcode == 0 for process in processes) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
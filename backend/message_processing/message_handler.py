@@ -10,11 +10,13 @@ This module provides a consolidated and enhanced message processing system that
 - Audit logging
 """
 
+import asyncio
 import logging
+from contextlib import AsyncExitStack
 import uuid
 import re
 import json
-from typing import Dict, Any, Optional, Tuple, List
+from typing import AsyncIterator, Dict, Any, Optional, Tuple, List
 from datetime import datetime
 
 # Core imports
@@ -25,17 +27,25 @@ from ..core.errors import (
 
 # Service imports
 from .services.llm_service import LLMService
-from .services.stage_service import StageService
-from .services.template_service import TemplateService
+from .services.async_stage_service import AsyncStageService
+from .services.async_template_service import AsyncTemplateService
 from .services.data_extraction_service import DataExtractionService
-from .services.storage.redis_manager import RedisStateManager
+from .services.conversation_lock import ConversationLock, ConversationSerializer, Lease, conversation_key
+from .services.storage.message_window import MessageWindow, window_entry
+from .storage.redis_manager import RedisStateManager
+from ..config import Config
 
 # Database imports
-from ..db.connection_manager import ConnectionManager
+from ..db.async_connection_manager import AsyncConnectionManager, create_async_pool
 
 # Local imports
-from .template_variables import TemplateVariableProvider
+from .template_variables import (
+    RECENT_MESSAGE_LIMIT, TemplateVariableProvider, aget_business_with_stages, format_business_info
+)
+from .process_log_store import store_process_log, get_process_log, get_recent_process_logs
 from .ai_control_service import ai_control_service
+from ..rate_limiter import RateLimitResult, Rule
+from ..ai.context_assembler import embedded_sections
 
 log = logging.getLogger(__name__)
 
@@ -44,7 +54,8 @@ class MessageHandler:
     Enhanced message handler that provides a complete, robust message handling system.
     
     Features:
-    - Rate limiting per business
+    - Sliding-window rate limiting per business and per user
+    - One turn at a time per conversation, optionally coalescing bursts
     - AI response control
     - Comprehensive error handling
     - State management
@@ -53,33 +64,85 @@ class MessageHandler:
     - Data extraction and validation
     """
     
-    # In-memory storage for process logs
-    _process_logs = {}
-    
-    # In-memory storage for stop flags per conversation
-    _stop_flags = {}
-    
-    def __init__(self, db_pool, redis_manager: RedisStateManager, llm_service: Optional[LLMService] = None):
+    def __init__(
+        self,
+        db_pool,
+        redis_manager: RedisStateManager,
+        llm_service: Optional[LLMService] = None,
+        serializer: Optional[ConversationSerializer] = None,
+        message_window: Optional[MessageWindow] = None
+    ):
         """
         Initialize the enhanced message handler.
         
         Args:
-            db_pool: Database connection pool
-            redis_manager: Redis state manager for caching and rate limiting
+            db_pool: asyncpg connection pool
+            redis_manager: Async Redis state manager for caching and rate limiting
             llm_service: Optional LLM service for AI responses
+            serializer: Optional per-conversation serializer; without one,
+                messages of a conversation may be processed concurrently
+            message_window: Optional rolling window of recent messages that
+                saved messages are appended to and history is read from;
+                without one, history is read from the database
         """
         self.db_pool = db_pool
         self.redis_manager = redis_manager
-        self.connection_manager = ConnectionManager(db_pool)
-        self.llm_service = llm_service or LLMService(db_pool)
-        self.stage_service = StageService(db_pool, redis_manager)
-        self.template_service = TemplateService(db_pool, redis_manager)
+        self.connection_manager = AsyncConnectionManager(db_pool)
+        self.llm_service = llm_service or LLMService(db_pool, redis_client=getattr(redis_manager, 'redis', None))
+        self.stage_service = AsyncStageService(self.connection_manager, redis_manager)
+        self.template_service = AsyncTemplateService(self.connection_manager, redis_manager)
         self.data_extraction_service = DataExtractionService()
+        self.serializer = serializer
+        self.message_window = message_window if message_window is not None else MessageWindow()
         
         # Rate limiting configuration
-        self.rate_limit_key_prefix = "rate_limit:"
-        self.rate_limit_window = 60  # 1 minute
-        self.rate_limit_max_requests = 100  # requests per minute
+        self.rate_limit_window = Config.MESSAGE_RATE_LIMIT_WINDOW
+        self.rate_limit_max_requests = Config.MESSAGE_RATE_LIMIT_PER_BUSINESS
+        self.rate_limit_max_user_requests = Config.MESSAGE_RATE_LIMIT_PER_USER
+    
+    @classmethod
+    async def create(
+        cls,
+        llm_service: Optional[LLMService] = None,
+        min_pool_size: int = 2,
+        max_pool_size: int = 10
+    ) -> "MessageHandler":
+        """
+        Build a handler with its own asyncpg pool and asyncio Redis client.
+        
+        Must be awaited inside the event loop that will process messages,
+        since both clients are bound to the loop they were created on.
+        
+        Args:
+            llm_service: Optional LLM service for AI responses
+            min_pool_size: Connections opened up front
+            max_pool_size: Maximum pooled connections
+            
+        Returns:
+            A ready-to-use MessageHandler
+        """
+        db_pool = await create_async_pool(min_size=min_pool_size, max_size=max_pool_size)
+        redis_manager = RedisStateManager.from_config()
+        return cls(
+            db_pool,
+            redis_manager,
+            llm_service,
+            ConversationSerializer(
+                ConversationLock(redis_manager.redis, ttl=Config.CONVERSATION_LOCK_TTL,
+                                 wait=Config.CONVERSATION_LOCK_WAIT),
+                coalesce_window=Config.CONVERSATION_COALESCE_WINDOW,
+                max_batch=Config.CONVERSATION_COALESCE_MAX_MESSAGES
+            ),
+            MessageWindow(redis_manager.redis, size=Config.MESSAGE_WINDOW_SIZE, ttl=Config.MESSAGE_WINDOW_TTL)
+        )
+    
+    async def close(self) -> None:
+        """Release the database pool, Redis connections and this loop's LLM session."""
+        await self.connection_manager.close()
+        await self.redis_manager.close()
+        transport = getattr(self.llm_service, 'transport', None)
+        if transport is not None:
+            await transport.aclose()
     
     def stop_ai_responses(self, conversation_id: str) -> None:
         """
@@ -88,8 +151,7 @@ class MessageHandler:
         Args:
             conversation_id: The ID of the conversation to stop
         """
-        self._stop_flags[conversation_id] = True
-        log.info(f"AI responses stopped for conversation {conversation_id}")
+        ai_control_service.stop_ai_responses(conversation_id)
     
     def resume_ai_responses(self, conversation_id: str) -> None:
         """
@@ -98,8 +160,7 @@ class MessageHandler:
         Args:
             conversation_id: The ID of the conversation to resume
         """
-        self._stop_flags[conversation_id] = False
-        log.info(f"AI responses resumed for conversation {conversation_id}")
+        ai_control_service.resume_ai_responses(conversation_id)
     
     def is_ai_stopped(self, conversation_id: str) -> bool:
         """
@@ -111,7 +172,7 @@ class MessageHandler:
         Returns:
             bool: True if AI responses are stopped, False otherwise
         """
-        return self._stop_flags.get(conversation_id, False)
+        return ai_control_service.is_ai_stopped(conversation_id)
     
     async def process_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -134,18 +195,16 @@ class MessageHandler:
             # Validate input
             self._validate_message_data(message_data)
             
-            # Check rate limits
-            await self._check_rate_limit(message_data['business_id'])
-            
             # Check AI control
-            if self._is_ai_stopped(message_data.get('conversation_id')):
+            if self._is_ai_stopped(message_data.get('conversation_id'), message_data.get('user_id')):
                 return self._create_ai_stopped_response(log_id)
             
-            # Process message with connection management
-            result = await self._process_with_connection(message_data)
+            if self.serializer is not None:
+                # One turn per conversation at a time; may be answered together with other messages
+                result = await self.serializer.run(message_data, self._process_turn)
+            else:
+                result = (await self._process_turn([message_data], None))[0]
             
-            # Update state and log success
-            await self._update_processing_state(result)
             self._log_successful_processing(log_id, result)
             
             return result
@@ -163,24 +222,46 @@ class MessageHandler:
                 field=missing_fields[0]
             )
     
-    async def _check_rate_limit(self, business_id: str) -> None:
-        """Check if the business has exceeded rate limits."""
-        rate_limit_key = f"{self.rate_limit_key_prefix}{business_id}"
-        current_count = await self.redis_manager.get_rate_limit(rate_limit_key)
+    def _rate_limit_rules(self, message_data: Dict[str, Any]) -> List[Rule]:
+        """Sliding-window limits a message counts against: its business and its user."""
+        business_id = message_data['business_id']
+        return [
+            (f"messages:business:{business_id}", self.rate_limit_max_requests, self.rate_limit_window),
+            (f"messages:user:{business_id}:{message_data['user_id']}",
+             self.rate_limit_max_user_requests, self.rate_limit_window),
+        ]
+    
+    async def _check_rate_limit(
+        self,
+        message_data: Dict[str, Any],
+        result: Optional[RateLimitResult] = None,
+        amount: int = 1
+    ) -> None:
+        """Count a message against its rate limits, unless already counted in result."""
+        if result is None:
+            result = await self.redis_manager.check_rate_limit(self._rate_limit_rules(message_data), amount)
         
-        if current_count >= self.rate_limit_max_requests:
+        if not result.allowed:
             raise RateLimitError(
-                f"Rate limit exceeded: {self.rate_limit_max_requests} requests per minute",
+                f"Rate limit exceeded: {self.rate_limit_max_requests} requests per business and "
+                f"{self.rate_limit_max_user_requests} per user every {self.rate_limit_window:g} seconds; "
+                f"retry after {max(result.retry_after, 0):.1f} seconds",
                 service="message_processing"
             )
-        
-        await self.redis_manager.increment_rate_limit(rate_limit_key)
     
-    def _is_ai_stopped(self, conversation_id: Optional[str]) -> bool:
-        """Check if AI responses are stopped for a conversation."""
-        if not conversation_id:
-            return False
-        return self._stop_flags.get(conversation_id, False)
+    async def _read_message_context(self, message_data: Dict[str, Any], amount: int = 1) -> Dict[str, Any]:
+        """Check the rate limits and read the cached stage and state of a message in one round trip."""
+        conversation_id = message_data.get('conversation_id')
+        return await self.redis_manager.read_message_context(
+            self._rate_limit_rules(message_data),
+            amount,
+            conversation_id,
+            self.stage_service.stage_key(conversation_id) if conversation_id else None
+        )
+    
+    def _is_ai_stopped(self, conversation_id: Optional[str], user_id: Optional[str] = None) -> bool:
+        """Check if AI responses are stopped for a conversation or its user."""
+        return ai_control_service.is_ai_stopped(conversation_id, user_id)
     
     def _create_ai_stopped_response(self, log_id: str) -> Dict[str, Any]:
         """Create response for when AI is stopped."""
@@ -194,96 +275,376 @@ class MessageHandler:
             'ai_stopped': True
         }
     
-    async def _process_with_connection(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process message with connection management."""
-        async def process_with_connection(conn):
-            # Get or create conversation
+    async def _process_with_connection(
+        self,
+        message_data: Dict[str, Any],
+        context: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process message with connection management.
+        
+        A pooled connection is only held while writing to the database; the
+        stage/template lookups and the LLM call run without pinning one.
+        """
+        conversation_id, message_id = await self.connection_manager.execute_with_retry(
+            lambda conn: self._save_user_message(conn, message_data)
+        )
+        
+        return await self._process_message_content(conversation_id, message_id, message_data, context)
+    
+    async def _process_turn(self, messages: List[Dict[str, Any]], lease: Optional[Lease]) -> List[Dict[str, Any]]:
+        """
+        Answer one or more messages of a conversation in a single LLM turn.
+        
+        Every message is saved; the LLM sees their contents joined in order.
+        State is written with the lease's fencing token when there is one.
+        
+        Returns:
+            One result per message, sharing the response
+        """
+        context = await self._read_message_context(messages[0], len(messages))
+        await self._check_rate_limit(messages[0], context['rate_limit'])
+        fencing_token = lease.token if lease else None
+        
+        if len(messages) == 1:
+            result = await self._process_with_connection(messages[0], context)
+            await self._update_processing_state(result, fencing_token)
+            return [result]
+        
+        conversation_id, message_ids = await self.connection_manager.execute_with_retry(
+            lambda conn: self._save_user_messages(conn, messages)
+        )
+        merged = {
+            **messages[-1],
+            'conversation_id': conversation_id,
+            'content': '\n'.join(message['content'] for message in messages)
+        }
+        result = await self._process_message_content(conversation_id, message_ids[-1], merged, context)
+        await self._update_processing_state(result, fencing_token, len(messages))
+        log.info(f"Answered {len(messages)} messages of conversation {conversation_id} in one turn")
+        return [
+            {**result, 'message_id': message_id, 'coalesced_message_ids': message_ids}
+            for message_id in message_ids
+        ]
+    
+    async def _save_user_messages(self, conn, messages: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+        """Get or create the conversation and save a burst of user messages in one transaction."""
+        first = messages[0]
+        async with conn.transaction():
+            conversation_id = await self._get_or_create_conversation(
+                conn,
+                first['business_id'],
+                first['user_id'],
+                first.get('conversation_id')
+            )
+            message_ids, saved = [], []
+            for message in messages:
+                existing = await self._find_platform_message(conn, message)
+                if existing is not None:
+                    message_ids.append(existing[1])
+                    continue
+                message_id = await self._save_message(
+                    conn, conversation_id, message['content'], 'user', message['user_id'],
+                    platform_message_id=message.get('platform_message_id')
+                )
+                message_ids.append(message_id)
+                saved.append(window_entry(message['content'], 'user', message_id=message_id))
+        await self._append_to_window(conversation_id, saved, create=not first.get('conversation_id'))
+        return conversation_id, message_ids
+    
+    async def _save_user_message(self, conn, message_data: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Get or create the conversation and save the user's message in one transaction.
+        
+        A message whose platform_message_id is already stored, saved by an
+        earlier attempt at the same event, is not saved again.
+        """
+        async with conn.transaction():
+            existing = await self._find_platform_message(conn, message_data)
+            if existing is not None:
+                return existing
             conversation_id = await self._get_or_create_conversation(
                 conn,
                 message_data['business_id'],
                 message_data['user_id'],
                 message_data.get('conversation_id')
             )
-            
-            # Process message
-            return await self._process_message_content(
+            message_id = await self._save_message(
                 conn,
                 conversation_id,
-                message_data
+                message_data['content'],
+                'user',
+                message_data['user_id'],
+                platform_message_id=message_data.get('platform_message_id')
             )
-        
-        return await self.connection_manager.execute_with_retry(process_with_connection)
+        await self._append_to_window(
+            conversation_id,
+            [window_entry(message_data['content'], 'user', message_id=message_id)],
+            create=not message_data.get('conversation_id')
+        )
+        return conversation_id, message_id
     
     async def _process_message_content(
         self,
-        conn,
         conversation_id: str,
-        message_data: Dict[str, Any]
+        message_id: str,
+        message_data: Dict[str, Any],
+        context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Process the actual message content."""
-        # Save user message
-        message_id = await self._save_message(
-            conn,
-            conversation_id,
-            message_data['content'],
-            'user',
-            message_data['user_id']
+        stage_info, extracted_data, template = await self._prepare_response(conversation_id, message_data, context)
+        sections = await self._template_sections(conversation_id, message_data['business_id'], template)
+        
+        # Response generation and stage resolution are independent, run them together
+        response, next_stage = await asyncio.gather(
+            self.llm_service.generate_response(
+                template.get('content') or '',
+                message_data['content'],
+                extracted_data,
+                business_id=message_data['business_id'],
+                **sections
+            ),
+            self.stage_service.determine_next_stage(
+                conversation_id,
+                stage_info['id'],
+                extracted_data
+            )
         )
         
-        # Get current stage
-        stage_info = await self.stage_service.get_current_stage(conversation_id)
+        # Save assistant response
+        response_id = await self.connection_manager.execute_with_retry(
+            lambda conn: self._save_message(
+                conn,
+                conversation_id,
+                response,
+                'assistant',
+                message_data['user_id'],
+                next_stage['id']
+            )
+        )
+        await self._append_to_window(conversation_id, [window_entry(response, 'assistant', message_id=response_id)])
+        
+        return {
+            'success': True,
+            'conversation_id': conversation_id,
+            'message_id': message_id,
+            'response_id': response_id,
+            'response': response,
+            'stage_id': next_stage['id'],
+            'extracted_data': extracted_data
+        }
+    
+    async def _prepare_response(
+        self,
+        conversation_id: str,
+        message_data: Dict[str, Any],
+        context: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+        """Resolve the current stage, extract data and load the template for a reply."""
+        # Get current stage, from the prefetched context when it agrees with the state
+        stage_info = self._cached_stage(context)
+        if stage_info is None:
+            stage_info = await self.stage_service.get_current_stage(
+                conversation_id,
+                message_data['business_id']
+            )
         if not stage_info:
             raise StageTransitionError("Could not determine conversation stage")
         
         # Extract data
-        extracted_data = await self.data_extraction_service.extract_data(
-            message_data['content'],
-            stage_info['extraction_rules']
-        )
+        extracted_data = {}
+        if stage_info.get('extraction_rules'):
+            extracted_data = await self.data_extraction_service.extract_data(
+                message_data['content'],
+                stage_info['extraction_rules']
+            )
         
-        # Get template and generate response
+        # Get template
         template = await self.template_service.get_template(
             stage_info['template_id'],
             message_data['business_id']
         )
-        
-        response = await self.llm_service.generate_response(
-            template,
-            message_data['content'],
-            extracted_data
+        return stage_info, extracted_data, template
+    
+    async def _template_sections(
+        self,
+        conversation_id: str,
+        business_id: str,
+        template: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Load the history and business info a template places, as prompt sections."""
+        embedded = embedded_sections(template.get('content'))
+        sections = {}
+        if 'history' in embedded:
+            entries = await self.message_window.aget_or_load(
+                conversation_id,
+                RECENT_MESSAGE_LIMIT,
+                lambda count: self._recent_messages(conversation_id, count)
+            )
+            sections['history'] = [
+                {
+                    'role': 'user' if entry['sender_type'] == 'user' else 'assistant',
+                    'content': entry['message_content']
+                }
+                for entry in entries
+            ]
+        if 'business_info' in embedded:
+            data = await aget_business_with_stages(self.connection_manager, business_id)
+            sections['business_info'] = format_business_info(data['business'])
+        return sections
+    
+    async def _recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Fetch the latest messages of a conversation from the database, oldest first."""
+        rows = await self.connection_manager.fetch(
+            """
+            SELECT message_id, message_content, sender_type, created_at
+            FROM messages
+            WHERE conversation_id = $1
+            ORDER BY created_at DESC
+            LIMIT $2
+            """,
+            conversation_id, limit
         )
+        return [dict(row) for row in reversed(rows)]
+    
+    @staticmethod
+    def _cached_stage(context: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Get the prefetched stage unless the conversation state points at another one."""
+        if not context or not context.get('stage'):
+            return None
+        stage = context['stage']
+        current_stage_id = (context.get('state') or {}).get('current_stage_id')
+        if current_stage_id and current_stage_id != stage.get('id'):
+            return None
+        return stage
+    
+    async def stream_message(self, message_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process an incoming message, streaming the response as it is generated.
         
-        # Determine next stage
-        next_stage = await self.stage_service.determine_next_stage(
-            conversation_id,
-            stage_info['id'],
-            extracted_data
-        )
+        Yields a 'start' event once the user message is saved, a 'token' event
+        per chunk of the response, and a final 'done' event after the full
+        response has been saved (or an 'error' event if processing fails).
         
-        return {
-            'conversation_id': conversation_id,
-            'message_id': message_id,
-            'response': response,
-            'stage_id': next_stage['id'],
-            'extracted_data': extracted_data
-        }
+        Args:
+            message_data: Dictionary containing message data
+            
+        Yields:
+            Event dictionaries with an 'event' key
+        """
+        log_id = str(uuid.uuid4())
+        self._store_process_log(log_id, {
+            'status': 'started',
+            'timestamp': datetime.now().isoformat(),
+            'message_data': message_data
+        })
+        
+        try:
+            self._validate_message_data(message_data)
+            await self._check_rate_limit(message_data)
+            
+            if self._is_ai_stopped(message_data.get('conversation_id'), message_data.get('user_id')):
+                yield {'event': 'done', **self._create_ai_stopped_response(log_id)}
+                return
+            
+            async with AsyncExitStack() as stack:
+                lease = None
+                if self.serializer is not None:
+                    lease = await stack.enter_async_context(
+                        self.serializer.lock.hold(conversation_key(message_data))
+                    )
+                
+                conversation_id, message_id = await self.connection_manager.execute_with_retry(
+                    lambda conn: self._save_user_message(conn, message_data)
+                )
+                yield {
+                    'event': 'start',
+                    'conversation_id': conversation_id,
+                    'message_id': message_id,
+                    'process_log_id': log_id
+                }
+            
+                stage_info, extracted_data, template = await self._prepare_response(conversation_id, message_data)
+                sections = await self._template_sections(conversation_id, message_data['business_id'], template)
+                next_stage_task = asyncio.ensure_future(
+                    self.stage_service.determine_next_stage(conversation_id, stage_info['id'], extracted_data)
+                )
+            
+                parts = []
+                try:
+                    async for token in self.llm_service.stream_response(
+                        template.get('content') or '',
+                        message_data['content'],
+                        extracted_data,
+                        business_id=message_data['business_id'],
+                        **sections
+                    ):
+                        parts.append(token)
+                        yield {'event': 'token', 'content': token}
+                    next_stage = await next_stage_task
+                finally:
+                    if not next_stage_task.done():
+                        next_stage_task.cancel()
+            
+                # Persist the assistant message once the stream is complete
+                response = ''.join(parts)
+                response_id = await self.connection_manager.execute_with_retry(
+                    lambda conn: self._save_message(
+                        conn,
+                        conversation_id,
+                        response,
+                        'assistant',
+                        message_data['user_id'],
+                        next_stage['id']
+                    )
+                )
+                await self._append_to_window(conversation_id, [window_entry(response, 'assistant', message_id=response_id)])
+            
+                result = {
+                    'success': True,
+                    'conversation_id': conversation_id,
+                    'message_id': message_id,
+                    'response_id': response_id,
+                    'response': response,
+                    'stage_id': next_stage['id'],
+                    'extracted_data': extracted_data
+                }
+                await self._update_processing_state(result, lease.token if lease else None)
+                self._log_successful_processing(log_id, result)
+                yield {'event': 'done', **result, 'process_log_id': log_id}
+            
+        except Exception as e:
+            yield {'event': 'error', **await self._handle_processing_error(e, log_id, message_data)}
     
-    async def _update_processing_state(self, result: Dict[str, Any]) -> None:
-        """Update processing state in Redis."""
+    async def _update_processing_state(
+        self,
+        result: Dict[str, Any],
+        fencing_token: Optional[int] = None,
+        message_count: int = 1
+    ) -> None:
+        """Update processing state in Redis, fenced by the conversation lease when given."""
         try:
-            await self.redis_manager.update_conversation_state(
+            applied = await self.redis_manager.update_conversation_state(
                 result['conversation_id'],
                 {
                     'last_message_id': result['message_id'],
                     'current_stage_id': result['stage_id'],
                     'last_updated': datetime.now().isoformat()
-                }
+                },
+                fencing_token=fencing_token,
+                increments={'messages_processed': message_count}
             )
         except Exception as e:
             raise StateManagementError(
                 f"Failed to update conversation state: {str(e)}",
                 state_key=f"conv:{result['conversation_id']}:state"
             )
+        if applied is False:
+            # Our lease expired and another turn of the conversation has written since
+            raise StateManagementError(
+                f"Conversation state was updated by a newer turn (fencing token {fencing_token})",
+                state_key=f"conv:{result['conversation_id']}:state"
+            )
     
     def _log_successful_processing(self, log_id: str, result: Dict[str, Any]) -> None:
         """Log successful message processing."""
@@ -340,10 +701,11 @@ class MessageHandler:
         await conn.execute(
             """
             INSERT INTO conversations (
-                conversation_id, business_id, user_id, created_at, updated_at
-            ) VALUES (%s, %s, %s, NOW(), NOW())
+                conversation_id, business_id, user_id, session_id,
+                status, start_time, last_updated
+            ) VALUES ($1, $2, $3, $4, 'active', NOW(), NOW())
             """,
-            (conversation_id, business_id, user_id)
+            conversation_id, business_id, user_id, str(uuid.uuid4())
         )
         
         return conversation_id
@@ -356,7 +718,8 @@ class MessageHandler:
         sender_type: str,
         user_id: Optional[str] = None,
         stage_id: Optional[str] = None,
-        status: str = 'delivered'
+        status: str = 'delivered',
+        platform_message_id: Optional[str] = None
     ) -> str:
         """Save a message to the database."""
         message_id = str(uuid.uuid4())
@@ -364,31 +727,47 @@ class MessageHandler:
         await conn.execute(
             """
             INSERT INTO messages (
-                message_id, conversation_id, content, sender_type,
-                user_id, stage_id, status, created_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                message_id, conversation_id, message_content, sender_type,
+                user_id, stage_id, status, platform_message_id, created_at
+            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, NOW())
             """,
-            (message_id, conversation_id, content, sender_type,
-             user_id, stage_id, status)
+            message_id, conversation_id, content, sender_type,
+            user_id, stage_id, status, platform_message_id
         )
         
         return message_id
     
+    async def _find_platform_message(self, conn, message_data: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        """Get (conversation_id, message_id) of an already saved platform message, if any."""
+        platform_message_id = message_data.get('platform_message_id')
+        if not platform_message_id:
+            return None
+        row = await conn.fetchrow(
+            "SELECT conversation_id, message_id FROM messages WHERE platform_message_id = $1",
+            platform_message_id
+        )
+        return (str(row['conversation_id']), str(row['message_id'])) if row else None
+    
+    async def _append_to_window(
+        self,
+        conversation_id: str,
+        entries: List[Dict[str, Any]],
+        create: bool = False
+    ) -> None:
+        """Append committed messages to the conversation's message window."""
+        await self.message_window.aappend(conversation_id, entries, create)
+    
     @classmethod
     def _store_process_log(cls, log_id: str, log_data: Dict[str, Any]) -> None:
         """Store a process log entry."""
-        cls._process_logs[log_id] = log_data
+        store_process_log(log_id, log_data)
     
     @classmethod
     def get_process_log(cls, log_id: str) -> Optional[Dict[str, Any]]:
         """Get a process log entry."""
-        return cls._process_logs.get(log_id)
+        return get_process_log(log_id)
     
     @classmethod
     def get_recent_process_logs(cls, business_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent process logs for a business."""
-        logs = [
-            log for log in cls._process_logs.values()
-            if log.get('message_data', {}).get('business_id') == business_id
-        ]
-        return sorted(logs, key=lambda x: x['timestamp'], reverse=True)[:limit]
\ No newline at end of file
+        return get_recent_process_logs(business_id, limit)
\ No newline at end of file
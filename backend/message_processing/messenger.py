@@ -3,10 +3,9 @@ import os
 import hmac
 import hashlib
 import json
-import uuid
 import logging
 from functools import wraps
-from backend.database.db import get_db_connection, release_db_connection, get_db_pool
+from backend.message_processing.routing_table import routing_table
 
 # Set up logging
 log = logging.getLogger(__name__)
@@ -26,47 +25,27 @@ def verify_fb_token(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def handle_message(sender_id, message):
+def handle_message(sender_id, message, page_id=None):
     """Handle incoming messages from Facebook Messenger"""
     log.info(f"Received message from {sender_id}: {message}")
     
-    # Get a database connection
-    conn = get_db_connection()
     try:
-        # Check if this user exists in our system
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users WHERE external_id = %s", (sender_id,))
-        result = cursor.fetchone()
-        
-        if result:
-            user_id = result[0]
-        else:
-            # Create a new user if they don't exist
-            user_id = str(uuid.uuid4())
-            cursor.execute(
-                "INSERT INTO users (user_id, external_id, first_name, last_name) VALUES (%s, %s, %s, %s)",
-                (user_id, sender_id, "Facebook", "User")
-            )
-            conn.commit()
-        
-        # Get the business ID (using a default for now)
-        cursor.execute("SELECT business_id FROM businesses LIMIT 1")
-        business_result = cursor.fetchone()
-        
-        if not business_result:
-            log.error("No business found in the database")
+        # Resolve the page's business and the sender's user from memory
+        business = routing_table.resolve_business('facebook', page_id) if page_id else None
+        if not business:
+            log.error(f"No business found for Facebook Page ID: {page_id}")
             return {
                 'recipient': {'id': sender_id},
                 'message': {'text': "Sorry, there was an error processing your message."}
             }
         
-        business_id = business_result[0]
+        business_id = business['business_id']
+        user_id = routing_table.resolve_user('facebook', sender_id)
         
-        # Process the message using the message handler
-        from backend.message_processing.message_handler import MessageHandler
+        # Process the message on the shared handler loop
+        from backend.message_processing.handler_loop import handler_loop
         
-        message_handler = MessageHandler(get_db_pool())
-        result = message_handler.process_message({
+        result = handler_loop.process_message({
             'business_id': business_id,
             'user_id': user_id,
             'content': message,
@@ -89,8 +68,6 @@ def handle_message(sender_id, message):
             'recipient': {'id': sender_id},
             'message': {'text': "Sorry, there was an error processing your message."}
         }
-    finally:
-        release_db_connection(conn)
 
 def send_message(recipient_id, response):
     """Send message to Facebook Messenger"""
@@ -133,6 +110,7 @@ def setup_messenger_routes(app):
                         sender_id = message['sender']['id']
                         if message['message'].get('text'):
                             message_text = message['message']['text']
-                            response = handle_message(sender_id, message_text)
+                            page_id = message.get('recipient', {}).get('id')
+                            response = handle_message(sender_id, message_text, page_id)
                             send_message(sender_id, response)
         return "Message Processed"
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""
+Incremental similarity index for pattern learning clusters.
+
+PatternIndex groups messages into clusters per template:
+
+- Messages are vectorized with a HashingVectorizer. It needs no fitting and
+  always produces n_features dimensions, so vectors stay comparable across
+  messages, processes and restarts.
+- Centers are kept per template in one contiguous float32 matrix, so
+  similarity against them is a single matrix-vector product.
+- Partitions larger than brute_force_limit are searched through random
+  hyperplane LSH: each center is filed under `bands` signatures of
+  `rows_per_band` bits, and only centers sharing a signature with the
+  message are scored. Assignment then costs a few bucket lookups instead
+  of a scan over every cluster.
+- Centers are running means of their members, so a cluster drifts with the
+  messages it absorbs.
+
+The index is saved to an .npz file (atomically, through a temporary file)
+and loaded at startup, so clusters survive restarts without being rebuilt.
+Workers share the file: a save locks it, merges in the clusters other
+processes saved since, and then replaces it.
+"""
+
+import os
+import json
+import fcntl
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+log = logging.getLogger(__name__)
+
+
+class _Partition:
+    """Centers of one template's clusters, with their LSH buckets."""
+
+    def __init__(self, n_features: int):
+        self.centers = np.zeros((8, n_features), dtype=np.float32)
+        self.counts = np.zeros(8, dtype=np.int64)
+        self.cluster_ids: List[str] = []
+        self.keys: List[Tuple[int, ...]] = []
+        self.buckets: Dict[Tuple[int, int], Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.cluster_ids)
+
+    def append(self, cluster_id: str, center: np.ndarray, count: int) -> int:
+        row = len(self.cluster_ids)
+        if row == len(self.centers):
+            # Grow by doubling so appends stay amortized O(1)
+            self.centers = np.concatenate([self.centers, np.zeros_like(self.centers)])
+            self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+        self.centers[row] = center
+        self.counts[row] = count
+        self.cluster_ids.append(cluster_id)
+        self.keys.append(())
+        return row
+
+    def file(self, row: int, keys: Tuple[int, ...]) -> None:
+        """File a center under its band keys, replacing the keys it had."""
+        for band, key in enumerate(self.keys[row]):
+            self.buckets.get((band, key), set()).discard(row)
+        for band, key in enumerate(keys):
+            self.buckets.setdefault((band, key), set()).add(row)
+        self.keys[row] = keys
+
+    def candidates(self, keys: Tuple[int, ...]) -> Set[int]:
+        rows: Set[int] = set()
+        for band, key in enumerate(keys):
+            rows |= self.buckets.get((band, key), set())
+        return rows
+
+
+class PatternIndex:
+    """Assigns messages to the most similar cluster of their template."""
+
+    def __init__(
+        self,
+        n_features: int = 1024,
+        threshold: float = 0.7,
+        bands: int = 16,
+        rows_per_band: int = 6,
+        brute_force_limit: int = 256,
+        seed: int = 0
+    ):
+        """
+        Initialize an empty index.
+
+        Args:
+            n_features: Dimensions of the hashed message vectors
+            threshold: Cosine similarity a message needs to join a cluster
+            bands: Number of LSH signatures per center
+            rows_per_band: Hyperplane bits per signature
+            brute_force_limit: Partitions up to this size are scanned in full
+            seed: Seed of the LSH hyperplanes; fixed so signatures survive restarts
+        """
+        self.n_features = n_features
+        self.threshold = threshold
+        self.bands = bands
+        self.rows_per_band = rows_per_band
+        self.brute_force_limit = brute_force_limit
+        self.seed = seed
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm='l2'
+        )
+        self._planes = np.random.default_rng(seed).standard_normal(
+            (n_features, bands * rows_per_band)
+        ).astype(np.float32)
+        self._bit_weights = 1 << np.arange(rows_per_band, dtype=np.int64)
+        self._partitions: Dict[str, _Partition] = {}
+        self._lock = threading.Lock()
+        self.dirty = False
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(partition) for partition in self._partitions.values())
+
+    def vectorize(self, message: str) -> np.ndarray:
+        """Hash a message into a unit-length float32 vector."""
+        return self.vectorizer.transform([message or '']).toarray()[0].astype(np.float32)
+
+    def _band_keys(self, vectors: np.ndarray) -> np.ndarray:
+        """LSH keys of one or more vectors, shape (n, bands)."""
+        bits = (np.atleast_2d(vectors) @ self._planes) > 0
+        bits = bits.reshape(-1, self.bands, self.rows_per_band)
+        return bits @ self._bit_weights
+
+    def _key(self, template_id: Optional[str]) -> str:
+        return str(template_id) if template_id is not None else ''
+
+    def assign(self, message: str, template_id: Optional[str], new_cluster_id: str) -> Tuple[str, bool]:
+        """
+        Add a message to the most similar cluster of its template.
+
+        If no cluster of the template reaches the similarity threshold, a new
+        cluster with id new_cluster_id is created around the message.
+
+        Args:
+            message: The message
+            template_id: Template the message was extracted with
+            new_cluster_id: Id to use if a new cluster is created
+
+        Returns:
+            (cluster_id, created)
+        """
+        vector = self.vectorize(message)
+        keys = tuple(int(key) for key in self._band_keys(vector)[0])
+        with self._lock:
+            partition = self._partitions.setdefault(self._key(template_id), _Partition(self.n_features))
+            row = self._best_match(partition, vector, keys)
+            if row is None:
+                row = partition.append(new_cluster_id, vector, 1)
+                partition.file(row, keys)
+                self.dirty = True
+                return new_cluster_id, True
+
+            # Move the center to the running mean of its members
+            count = partition.counts[row]
+            center = (partition.centers[row] * count + vector) / (count + 1)
+            norm = np.linalg.norm(center)
+            partition.centers[row] = center / norm if norm > 0 else center
+            partition.counts[row] = count + 1
+            partition.file(row, tuple(int(key) for key in self._band_keys(partition.centers[row])[0]))
+            self.dirty = True
+            return partition.cluster_ids[row], False
+
+    def _best_match(self, partition: _Partition, vector: np.ndarray, keys: Tuple[int, ...]) -> Optional[int]:
+        """Row of the most similar center at or above the threshold, if any."""
+        size = len(partition)
+        if size == 0:
+            return None
+        if size <= self.brute_force_limit:
+            rows = None
+            similarities = partition.centers[:size] @ vector
+        else:
+            rows = np.fromiter(partition.candidates(keys), dtype=np.int64)
+            if rows.size == 0:
+                return None
+            similarities = partition.centers[rows] @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return best if rows is None else int(rows[best])
+
+    def _config(self) -> Dict[str, Any]:
+        return {
+            'n_features': self.n_features, 'bands': self.bands,
+            'rows_per_band': self.rows_per_band, 'seed': self.seed,
+        }
+
+    def save(self, path: str) -> None:
+        """
+        Write the index to an .npz file, replacing it atomically.
+
+        The file is locked while it is rewritten. Clusters saved to it by
+        other processes are merged into this index first, so concurrent
+        writers keep each other's clusters. A cluster known to both keeps the
+        center with the most members.
+        """
+        with open(f"{path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(path):
+                    try:
+                        self._merge(*self._read(path))
+                    except ValueError as e:
+                        log.warning(f"Replacing incompatible pattern index: {str(e)}")
+                self._write(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, path: str) -> None:
+        with self._lock:
+            ids, templates, centers, counts = [], [], [], []
+            for template_key, partition in self._partitions.items():
+                size = len(partition)
+                ids.extend(partition.cluster_ids)
+                templates.extend([template_key] * size)
+                centers.append(partition.centers[:size])
+                counts.append(partition.counts[:size])
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    config=np.array(json.dumps(self._config())),
+                    cluster_ids=np.array(ids, dtype=str),
+                    template_ids=np.array(templates, dtype=str),
+                    centers=np.concatenate(centers) if centers else np.zeros((0, self.n_features), np.float32),
+                    counts=np.concatenate(counts) if counts else np.zeros(0, np.int64)
+                )
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    def _read(self, path: str) -> Tuple[List[str], List[str], np.ndarray, np.ndarray]:
+        """Read (cluster ids, template keys, centers, counts) from a saved index."""
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data['config']))
+            if config != self._config():
+                raise ValueError(f"Pattern index at {path} was saved with {config}, expected {self._config()}")
+            return (
+                [str(value) for value in data['cluster_ids']],
+                [str(value) for value in data['template_ids']],
+                data['centers'].astype(np.float32),
+                data['counts']
+            )
+
+    def _merge(self, cluster_ids: List[str], template_ids: List[str], centers: np.ndarray,
+               counts: np.ndarray) -> None:
+        """Add saved clusters this index lacks, and adopt saved centers with more members."""
+        keys = self._band_keys(centers) if len(centers) else []
+        with self._lock:
+            rows = {
+                cluster_id: (partition, row)
+                for partition in self._partitions.values()
+                for row, cluster_id in enumerate(partition.cluster_ids)
+            }
+            for i, cluster_id in enumerate(cluster_ids):
+                band_keys = tuple(int(key) for key in keys[i])
+                if cluster_id in rows:
+                    partition, row = rows[cluster_id]
+                    if counts[i] > partition.counts[row]:
+                        partition.centers[row] = centers[i]
+                        partition.counts[row] = counts[i]
+                        partition.file(row, band_keys)
+                    continue
+                partition = self._partitions.setdefault(template_ids[i], _Partition(self.n_features))
+                row = partition.append(cluster_id, centers[i], int(counts[i]))
+                partition.file(row, band_keys)
+
+    def load(self, path: str) -> int:
+        """
+        Replace the contents of the index with a saved one.
+
+        Args:
+            path: File written by save()
+
+        Returns:
+            Number of clusters loaded
+
+        Raises:
+            ValueError: If the file was saved with different dimensions or hyperplanes
+        """
+        cluster_ids, template_ids, centers, counts = self._read(path)
+        with self._lock:
+            self._partitions = {}
+        self._merge(cluster_ids, template_ids, centers, counts)
+        with self._lock:
+            self.dirty = False
+        return len(cluster_ids)
@@ -3,30 +3,87 @@ Pattern Learning Service for Data Extraction
 
 This module provides functionality to learn and improve extraction patterns
 over time based on successful extractions and user feedback.
+
+Messages are grouped into clusters per template by a PatternIndex, which is
+loaded from PATTERN_INDEX_PATH at startup and saved back there as clusters
+change.
+
+The values extracted for each field of a cluster are counted in a bounded
+SpaceSaving sketch, so a pattern_data row stays the same size however many
+extractions it has seen. Weights are normalized only when patterns are read.
+Extraction results and changed fields are written in batches: each changed
+(cluster, field) once per flush, after PATTERN_FLUSH_BATCH_SIZE changes or
+PATTERN_FLUSH_INTERVAL seconds.
 """
 
+import os
+import time
+import uuid
+import atexit
 import logging
 import json
+import threading
 from typing import Dict, Any, List, Optional, Set
 from datetime import datetime, timedelta
-import numpy as np
-from sklearn.cluster import DBSCAN
-from sklearn.feature_extraction.text import TfidfVectorizer
 from collections import defaultdict
 
+from psycopg2.extras import execute_values
+
+from ..config import Config
+from .pattern_index import PatternIndex
+from .pattern_sketch import SpaceSaving
+
 log = logging.getLogger(__name__)
 
+
+def _json_value(value: Any) -> Any:
+    """Decode a JSON column that may come back as text or already decoded."""
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
 class PatternLearningService:
     """
     Service for learning and improving extraction patterns over time.
     """
     
-    def __init__(self, db_pool):
+    def __init__(self, db_pool, index: Optional[PatternIndex] = None, index_path: Optional[str] = None,
+                 save_interval: Optional[float] = None):
+        """
+        Initialize the service.
+        
+        Args:
+            db_pool: Database connection pool
+            index: Optional PatternIndex; defaults to one built from the PATTERN_INDEX_* settings in Config
+            index_path: File the index is loaded from and saved to; defaults to PATTERN_INDEX_PATH
+            save_interval: Least seconds between saves of a changed index
+        """
         self.db_pool = db_pool
-        self.vectorizer = TfidfVectorizer()
+        self.index = index or PatternIndex(
+            n_features=Config.PATTERN_INDEX_FEATURES,
+            threshold=Config.PATTERN_INDEX_THRESHOLD,
+            bands=Config.PATTERN_INDEX_LSH_BANDS,
+            rows_per_band=Config.PATTERN_INDEX_LSH_ROWS,
+            brute_force_limit=Config.PATTERN_INDEX_BRUTE_FORCE_LIMIT
+        )
+        self.index_path = index_path if index_path is not None else Config.PATTERN_INDEX_PATH
+        self.save_interval = save_interval if save_interval is not None else Config.PATTERN_INDEX_SAVE_INTERVAL
+        self._last_save = time.monotonic()
+        if self.index_path:
+            self._load_index()
+            atexit.register(self.save_index)
+        
+        self.sketch_capacity = Config.PATTERN_SKETCH_CAPACITY
+        self.flush_batch_size = Config.PATTERN_FLUSH_BATCH_SIZE
+        self.flush_interval = Config.PATTERN_FLUSH_INTERVAL
+        self.max_pending = Config.PATTERN_MAX_PENDING
+        self._lock = threading.Lock()
+        self._pending_results: List[tuple] = []
+        self._dirty_fields: Set[tuple] = set()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+        
         self.pattern_clusters = {}
         self.feedback_history = defaultdict(list)
-        self.learning_rate = 0.1  # Rate at which patterns are updated
         
     def learn_from_extraction(self, message: str, template: Dict[str, Any], 
                             extracted_data: Dict[str, Any], success: bool = True):
@@ -46,11 +103,9 @@ class PatternLearningService:
             # Update pattern statistics
             self._update_pattern_stats(cluster_id, message, template, extracted_data, success)
             
-            # Update pattern weights
-            self._update_pattern_weights(cluster_id, success)
-            
-            # Store in database
+            # Queue for the database, writing a batch when one is due
             self._store_learning_data(cluster_id, message, template, extracted_data, success)
+            self._flush_if_due()
             
         except Exception as e:
             log.error(f"Error in pattern learning: {str(e)}")
@@ -66,6 +121,9 @@ class PatternLearningService:
             Dictionary of improved patterns
         """
         try:
+            # Read what this process learned along with everything stored before
+            self.flush()
+            
             # Get successful patterns for this template
             successful_patterns = self._get_successful_patterns(template_id)
             
@@ -95,151 +153,166 @@ class PatternLearningService:
             
             # Update patterns based on feedback
             self._update_patterns_from_feedback(extraction_id, feedback)
+            self._flush_if_due()
             
         except Exception as e:
             log.error(f"Error adding feedback: {str(e)}")
     
     def _get_cluster_id(self, message: str, template: Dict[str, Any]) -> str:
         """Get or create a cluster ID for similar messages."""
-        # Vectorize message
-        message_vector = self.vectorizer.fit_transform([message])
+        # Ids are unique across workers and restarts, since the index outlives the process
+        cluster_id, _ = self.index.assign(
+            message,
+            template.get('template_id'),
+            f"cluster_{uuid.uuid4().hex[:16]}"
+        )
         
-        # Find similar clusters
-        for cluster_id, cluster_data in self.pattern_clusters.items():
-            if cluster_data['template_id'] == template.get('template_id'):
-                # Calculate similarity with cluster center
-                similarity = np.dot(message_vector, cluster_data['center'].T).mean()
-                if similarity > 0.7:  # Similarity threshold
-                    return cluster_id
+        # Clusters loaded from a saved index start with empty in-memory stats
+        with self._lock:
+            self._cluster(cluster_id, template.get('template_id'))
         
-        # Create new cluster
-        new_cluster_id = f"cluster_{len(self.pattern_clusters)}"
-        self.pattern_clusters[new_cluster_id] = {
-            'template_id': template.get('template_id'),
-            'center': message_vector,
-            'messages': [message],
-            'success_count': 0,
-            'total_count': 0,
-            'patterns': {}
+        self._save_index_if_due()
+        return cluster_id
+    
+    def _load_index(self) -> None:
+        """Load the saved index, starting empty if there is none or it does not match."""
+        if not os.path.exists(self.index_path):
+            log.info(f"No pattern index at {self.index_path}, starting with an empty one")
+            return
+        try:
+            loaded = self.index.load(self.index_path)
+            log.info(f"Loaded {loaded} pattern clusters from {self.index_path}")
+        except Exception as e:
+            log.error(f"Error loading pattern index from {self.index_path}: {str(e)}")
+    
+    def _save_index_if_due(self) -> None:
+        if self.index_path and time.monotonic() - self._last_save >= self.save_interval:
+            self.save_index()
+    
+    def save_index(self) -> None:
+        """Save the index to index_path if it changed since the last save."""
+        if not self.index_path or not self.index.dirty:
+            return
+        try:
+            self.index.save(self.index_path)
+            self._last_save = time.monotonic()
+        except Exception as e:
+            log.error(f"Error saving pattern index to {self.index_path}: {str(e)}")
+    
+    def _new_field_stats(self) -> Dict[str, Any]:
+        return {
+            'sketch': SpaceSaving(self.sketch_capacity),
+            'success_rate': 0.0,
+            'updates': 0,
+            'seeded': False
         }
-        
-        return new_cluster_id
+    
+    def _cluster(self, cluster_id: str, template_id: Optional[str] = None) -> Dict[str, Any]:
+        """Get the in-memory stats of a cluster, creating empty ones if needed."""
+        if cluster_id not in self.pattern_clusters:
+            self.pattern_clusters[cluster_id] = {
+                'template_id': template_id,
+                'success_count': 0,
+                'total_count': 0,
+                'patterns': {}
+            }
+        return self.pattern_clusters[cluster_id]
     
     def _update_pattern_stats(self, cluster_id: str, message: str, 
                             template: Dict[str, Any], extracted_data: Dict[str, Any], 
                             success: bool):
-        """Update pattern statistics for a cluster."""
-        cluster = self.pattern_clusters[cluster_id]
-        cluster['total_count'] += 1
-        
-        if success:
-            cluster['success_count'] += 1
+        """Update pattern statistics for a cluster and mark its fields for the next flush."""
+        with self._lock:
+            cluster = self._cluster(cluster_id, template.get('template_id'))
+            cluster['total_count'] += 1
             
-            # Update patterns
-            for field, value in extracted_data.items():
-                if field not in cluster['patterns']:
-                    cluster['patterns'][field] = {
-                        'values': [],
-                        'weights': {},
-                        'success_rate': 0.0
-                    }
-                
-                pattern_data = cluster['patterns'][field]
-                pattern_data['values'].append(value)
+            if success:
+                cluster['success_count'] += 1
                 
-                # Update weights based on value frequency
-                if value not in pattern_data['weights']:
-                    pattern_data['weights'][value] = 1
-                else:
-                    pattern_data['weights'][value] += 1
-                
-                # Update success rate
-                pattern_data['success_rate'] = (
-                    pattern_data.get('success_rate', 0) * 0.9 +  # Decay old rate
-                    (1 if success else 0) * 0.1  # Add new result
-                )
-    
-    def _update_pattern_weights(self, cluster_id: str, success: bool):
-        """Update pattern weights based on success/failure."""
-        cluster = self.pattern_clusters[cluster_id]
-        
-        for field, pattern_data in cluster['patterns'].items():
-            # Adjust weights based on success
-            weight_adjustment = self.learning_rate * (1 if success else -1)
-            
-            for value in pattern_data['weights']:
-                pattern_data['weights'][value] *= (1 + weight_adjustment)
-            
-            # Normalize weights
-            total_weight = sum(pattern_data['weights'].values())
-            if total_weight > 0:
-                pattern_data['weights'] = {
-                    k: v/total_weight 
-                    for k, v in pattern_data['weights'].items()
-                }
+                # Count values in a bounded sketch; weights are normalized when read
+                for field, value in extracted_data.items():
+                    if field not in cluster['patterns']:
+                        cluster['patterns'][field] = self._new_field_stats()
+                    
+                    pattern_data = cluster['patterns'][field]
+                    pattern_data['sketch'].add(value)
+                    
+                    # Update success rate
+                    pattern_data['success_rate'] = (
+                        pattern_data['success_rate'] * 0.9 +  # Decay old rate
+                        (1 if success else 0) * 0.1  # Add new result
+                    )
+                    pattern_data['updates'] += 1
+                    self._dirty_fields.add((cluster_id, field))
     
     def _store_learning_data(self, cluster_id: str, message: str, 
                            template: Dict[str, Any], extracted_data: Dict[str, Any], 
                            success: bool):
-        """Store learning data in the database."""
+        """Queue the extraction result for the next flush."""
+        with self._lock:
+            if len(self._pending_results) >= self.max_pending:
+                log.warning("Pattern learning queue is full, dropping oldest extraction result")
+                self._pending_results.pop(0)
+            self._pending_results.append(
+                (cluster_id, message, template.get('template_id'),
+                 json.dumps(extracted_data, default=str), success, datetime.now())
+            )
+    
+    def _flush_if_due(self) -> None:
+        with self._lock:
+            pending = len(self._pending_results) + len(self._dirty_fields)
+            due = pending >= self.flush_batch_size or (
+                pending and time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+    
+    def flush(self) -> None:
+        """
+        Write queued extraction results and changed field stats in one transaction.
+        
+        Each changed (cluster, field) is written once per flush, however many
+        extractions touched it. On failure everything is queued again for the
+        next flush.
+        """
+        with self._lock:
+            results, self._pending_results = self._pending_results, []
+            dirty, self._dirty_fields = self._dirty_fields, set()
+            self._last_flush = time.monotonic()
+        if not results and not dirty:
+            return
+        
+        conn = None
         try:
             conn = self.db_pool.getconn()
             cursor = conn.cursor()
             
-            # Store extraction result
-            cursor.execute(
-                """
-                INSERT INTO extraction_results 
-                (cluster_id, message, template_id, extracted_data, success, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (cluster_id, message, template.get('template_id'), 
-                 json.dumps(extracted_data), success, datetime.now())
-            )
-            
-            # Store pattern data
-            for field, value in extracted_data.items():
-                if field not in self.pattern_clusters[cluster_id]['patterns']:
-                    self.pattern_clusters[cluster_id]['patterns'][field] = {
-                        'values': [],
-                        'weights': {},
-                        'success_rate': 0.0
-                    }
-                
-                pattern_data = self.pattern_clusters[cluster_id]['patterns'][field]
-                pattern_data['values'].append(value)
-                
-                # Update weights based on value frequency
-                if value not in pattern_data['weights']:
-                    pattern_data['weights'][value] = 1
-                else:
-                    pattern_data['weights'][value] += 1
-                
-                # Update success rate
-                pattern_data['success_rate'] = (
-                    pattern_data.get('success_rate', 0) * 0.9 +  # Decay old rate
-                    (1 if success else 0) * 0.1  # Add new result
+            if results:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO extraction_results 
+                    (cluster_id, message, template_id, extracted_data, success, timestamp)
+                    VALUES %s
+                    """,
+                    results
                 )
-                
-                # Store in database
-                cursor.execute(
+            
+            if dirty:
+                self._seed_from_database(cursor, dirty)
+                execute_values(
+                    cursor,
                     """
                     INSERT INTO pattern_data 
                     (cluster_id, field, pattern_values, weights, success_rate)
-                    VALUES (%s, %s, %s, %s, %s)
+                    VALUES %s
                     ON CONFLICT (cluster_id, field) 
                     DO UPDATE SET 
-                        pattern_values = %s,
-                        weights = %s,
-                        success_rate = %s
+                        pattern_values = EXCLUDED.pattern_values,
+                        weights = EXCLUDED.weights,
+                        success_rate = EXCLUDED.success_rate
                     """,
-                    (cluster_id, field, 
-                     json.dumps(pattern_data['values']),
-                     json.dumps(pattern_data['weights']),
-                     pattern_data['success_rate'],
-                     json.dumps(pattern_data['values']),
-                     json.dumps(pattern_data['weights']),
-                     pattern_data['success_rate'])
+                    self._pattern_rows(dirty)
                 )
             
             conn.commit()
@@ -248,12 +321,67 @@ class PatternLearningService:
             log.error(f"Error storing learning data: {str(e)}")
             if conn:
                 conn.rollback()
+            with self._lock:
+                self._pending_results = (results + self._pending_results)[-self.max_pending:]
+                self._dirty_fields |= dirty
         finally:
             if conn:
                 self.db_pool.putconn(conn)
     
+    def _seed_from_database(self, cursor, dirty: Set[tuple]) -> None:
+        """
+        Merge stored stats into fields first touched by this process.
+        
+        Clusters outlive the process, so a field may already have stats in
+        pattern_data. They are read once and merged in before the first
+        write, so a restart does not overwrite them.
+        """
+        with self._lock:
+            unseeded = {
+                (cluster_id, field) for cluster_id, field in dirty
+                if not self.pattern_clusters[cluster_id]['patterns'][field]['seeded']
+            }
+        if not unseeded:
+            return
+        
+        cursor.execute(
+            """
+            SELECT cluster_id, field, weights, success_rate
+            FROM pattern_data
+            WHERE cluster_id = ANY(%s)
+            """,
+            (sorted({cluster_id for cluster_id, _ in unseeded}),)
+        )
+        stored = {(row[0], row[1]): row for row in cursor.fetchall()}
+        
+        with self._lock:
+            for cluster_id, field in unseeded:
+                pattern_data = self.pattern_clusters[cluster_id]['patterns'][field]
+                row = stored.get((cluster_id, field))
+                if row:
+                    pattern_data['sketch'].merge(SpaceSaving.from_counts(_json_value(row[2]) or {}, self.sketch_capacity))
+                    # Continue the stored moving average through the updates made since
+                    pattern_data['success_rate'] += (row[3] or 0.0) * 0.9 ** pattern_data['updates']
+                pattern_data['seeded'] = True
+    
+    def _pattern_rows(self, dirty: Set[tuple]) -> List[tuple]:
+        """pattern_data rows of the given fields: top values, raw counts and success rate."""
+        rows = []
+        with self._lock:
+            for cluster_id, field in sorted(dirty):
+                pattern_data = self.pattern_clusters[cluster_id]['patterns'][field]
+                counts = pattern_data['sketch'].counts()
+                rows.append((
+                    cluster_id, field,
+                    json.dumps(list(counts)),
+                    json.dumps(counts),
+                    pattern_data['success_rate']
+                ))
+        return rows
+    
     def _get_successful_patterns(self, template_id: str) -> List[Dict[str, Any]]:
         """Get successful patterns for a template."""
+        conn = None
         try:
             conn = self.db_pool.getconn()
             cursor = conn.cursor()
@@ -272,13 +400,15 @@ class PatternLearningService:
                 (template_id,)
             )
             
+            # Weights are stored as raw counts and normalized here
             patterns = []
             for row in cursor.fetchall():
+                sketch = SpaceSaving.from_counts(_json_value(row[3]) or {}, self.sketch_capacity)
                 patterns.append({
                     'cluster_id': row[0],
                     'field': row[1],
-                    'values': json.loads(row[2]),
-                    'weights': json.loads(row[3]),
+                    'values': [value for value, _ in sketch.top()],
+                    'weights': sketch.weights(),
                     'success_rate': row[4]
                 })
             
@@ -342,6 +472,7 @@ class PatternLearningService:
     
     def _update_patterns_from_feedback(self, extraction_id: str, feedback: Dict[str, Any]):
         """Update patterns based on user feedback."""
+        conn = None
         try:
             # Get the extraction result
             conn = self.db_pool.getconn()
@@ -0,0 +1,93 @@
+"""
+Bounded heavy-hitter counts for extracted field values.
+
+SpaceSaving (Metwally et al.) tracks at most `capacity` values of a field,
+so its size does not grow with the number of extractions: a new value
+replaces the least counted one and inherits its count as an error bound.
+Any value seen more than total / capacity times is guaranteed to be tracked,
+and each tracked count overestimates the true count by at most its error.
+
+Counts are stored raw; weights are normalized only when they are read.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def value_key(value: Any) -> str:
+    """Key a value is counted under; non-strings are keyed by their JSON."""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class SpaceSaving:
+    """Top-k counter over a stream of values, in constant space."""
+
+    def __init__(self, capacity: int = 32):
+        """
+        Initialize an empty sketch.
+
+        Args:
+            capacity: Most values tracked at once
+        """
+        self.capacity = capacity
+        self.total = 0
+        self._counters: Dict[str, List[int]] = {}  # key -> [count, error]
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def add(self, value: Any, count: int = 1) -> None:
+        """Count a value, evicting the least counted value if the sketch is full."""
+        self._add(value_key(value), count, 0)
+        self.total += count
+
+    def _add(self, key: str, count: int, error: int) -> None:
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += count
+            counter[1] += error
+        elif len(self._counters) < self.capacity:
+            self._counters[key] = [count, error]
+        else:
+            smallest = min(self._counters, key=lambda k: self._counters[k][0])
+            floor = self._counters.pop(smallest)[0]
+            self._counters[key] = [floor + count, floor + error]
+
+    def merge(self, other: 'SpaceSaving') -> None:
+        """Add the counts of another sketch to this one."""
+        for key, (count, error) in other._counters.items():
+            self._add(key, count, error)
+        self.total += other.total
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Tracked values with their counts, most counted first."""
+        ranked = sorted(self._counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count) for key, (count, _) in ranked[:n]]
+
+    def error(self, value: Any) -> int:
+        """Most the count of a tracked value can exceed its true count."""
+        counter = self._counters.get(value_key(value))
+        return counter[1] if counter else 0
+
+    def weights(self) -> Dict[str, float]:
+        """Share of each tracked value in the tracked counts."""
+        tracked = sum(count for count, _ in self._counters.values())
+        if tracked == 0:
+            return {}
+        return {key: count / tracked for key, (count, _) in self._counters.items()}
+
+    def counts(self) -> Dict[str, int]:
+        """Raw counts of the tracked values, most counted first."""
+        return dict(self.top())
+
+    @classmethod
+    def from_counts(cls, counts: Dict[str, Any], capacity: int = 32) -> 'SpaceSaving':
+        """Rebuild a sketch from stored counts, keeping the capacity largest."""
+        sketch = cls(capacity)
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:capacity]
+        for key, count in ranked:
+            sketch._counters[key] = [count, 0]
+        sketch.total = sum(count for _, count in ranked)
+        return sketch
@@ -1,64 +1,287 @@
 """
 Process log store for storing and retrieving process logs.
 
-This module provides functionality for storing and retrieving process logs
-in a shared in-memory storage that persists between requests.
+Logs are kept in per-business ring buffers of PROCESS_LOG_CAPACITY entries
+that expire after PROCESS_LOG_TTL seconds, so memory stays bounded however
+many messages a worker handles. Lookups by ID are O(1) and the most recent k
+logs of a business are read in O(k).
+
+Entries are also written behind to Redis by a background thread: each log
+under process_log:{log_id} and the IDs of a business in a capped list
+process_logs:{business_id} of PROCESS_LOG_REDIS_CAPACITY entries. That keeps
+logs evicted from memory available and shares them between workers.
+
+Storing an ID again merges the new fields into the existing log, so the
+completed or error update keeps the business and message of the started one.
 """
 
+import json
+import time
 import logging
+import threading
+from collections import deque
 from typing import Dict, Any, Optional, List
 
+from backend.config import Config
+
 log = logging.getLogger(__name__)
 
-# Shared in-memory storage for process logs
-_process_logs: Dict[str, Dict[str, Any]] = {}
+
+def _business_of(log_data: Dict[str, Any]) -> Optional[str]:
+    business_id = log_data.get('business_id') or (log_data.get('message_data') or {}).get('business_id')
+    return str(business_id) if business_id else None
+
+
+class ProcessLogStore:
+    """Per-business ring buffers of process logs with Redis spillover."""
+
+    def __init__(
+        self,
+        capacity: int = 200,
+        ttl: int = 3600,
+        redis_capacity: int = 1000,
+        redis_ttl: int = 86400,
+        flush_interval: float = 1.0,
+        redis_manager=None,
+        use_redis: bool = True
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            capacity: Logs kept in memory per business
+            ttl: Seconds a log is served from memory
+            redis_capacity: Log IDs kept in Redis per business
+            redis_ttl: Seconds a log is kept in Redis
+            flush_interval: Seconds between writes to Redis
+            redis_manager: Redis state manager; created on first use if not given
+            use_redis: Whether to spill logs to Redis at all
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.redis_capacity = redis_capacity
+        self.redis_ttl = redis_ttl
+        self.flush_interval = flush_interval
+        self.use_redis = use_redis
+        self._redis_manager = redis_manager
+        # log_id -> [expires_at, business_id, data]
+        self._entries: Dict[str, list] = {}
+        self._rings: Dict[Optional[str], deque] = {}
+        # log_id -> True when the ID still has to be pushed to its business list
+        self._dirty: Dict[str, bool] = {}
+        # Logs evicted before they were written: log_id -> (is_new, business_id, data)
+        self._spilled: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    @property
+    def redis_client(self):
+        if not self.use_redis:
+            return None
+        if self._redis_manager is None:
+            from backend.message_processing.services.storage.redis_manager import RedisStateManager
+            self._redis_manager = RedisStateManager()
+        return self._redis_manager.redis_client
+
+    @staticmethod
+    def _log_key(log_id: str) -> str:
+        return f"process_log:{log_id}"
+
+    @staticmethod
+    def _business_key(business_id: Optional[str]) -> str:
+        return f"process_logs:{business_id or 'unknown'}"
+
+    def store(self, log_id: str, log_data: Dict[str, Any]) -> None:
+        """
+        Store a process log, merging into an existing log with the same ID.
+
+        Args:
+            log_id: ID of the process log
+            log_data: Data to store
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(log_id)
+            if entry is not None:
+                entry[0] = now + self.ttl
+                entry[2] = {**entry[2], **log_data}
+                if self.use_redis:
+                    self._dirty.setdefault(log_id, False)
+            else:
+                business_id = _business_of(log_data)
+                ring = self._rings.get(business_id)
+                if ring is None:
+                    ring = self._rings[business_id] = deque()
+                while ring and (len(ring) >= self.capacity or self._entries[ring[0]][0] <= now):
+                    # Oldest log of the business; still available from Redis
+                    evicted_id = ring.popleft()
+                    evicted = self._entries.pop(evicted_id)
+                    if evicted_id in self._dirty:
+                        self._spilled[evicted_id] = (self._dirty.pop(evicted_id), evicted[1], evicted[2])
+                ring.append(log_id)
+                self._entries[log_id] = [now + self.ttl, business_id, dict(log_data)]
+                if self.use_redis:
+                    self._dirty[log_id] = True
+        self._start_flusher()
+        log.debug(f"Stored process log with ID {log_id}")
+
+    def get(self, log_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve a process log by ID, from memory or Redis.
+
+        Args:
+            log_id: ID of the process log
+
+        Returns:
+            Process log data or None if not found
+        """
+        with self._lock:
+            entry = self._entries.get(log_id)
+            if entry is not None and entry[0] > time.monotonic():
+                return dict(entry[2])
+        return self._read_redis([log_id]).get(log_id)
+
+    def recent(self, business_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Retrieve the most recent process logs of a business, newest first.
+
+        Args:
+            business_id: ID of the business
+            limit: Maximum number of logs to retrieve
+
+        Returns:
+            List of process logs
+        """
+        business_id = str(business_id)
+        now = time.monotonic()
+        logs: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            ring = self._rings.get(business_id, ())
+            for log_id in reversed(ring):
+                if len(logs) >= limit:
+                    break
+                entry = self._entries.get(log_id)
+                if entry is not None and entry[0] > now:
+                    logs[log_id] = dict(entry[2])
+
+        # Logs of other workers and those evicted from memory
+        redis_client = self.redis_client
+        if redis_client is not None and limit > 0:
+            try:
+                ids = redis_client.lrange(self._business_key(business_id), 0, limit - 1)
+                logs.update(self._read_redis([i for i in ids if i not in logs]))
+            except Exception as e:
+                log.error(f"Error reading recent process logs from Redis: {str(e)}")
+
+        newest_first = sorted(logs.items(), key=lambda item: item[1].get('timestamp', ''), reverse=True)
+        return [{'log_id': log_id, **data} for log_id, data in newest_first[:limit]]
+
+    def _read_redis(self, log_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        redis_client = self.redis_client
+        if redis_client is None or not log_ids:
+            return {}
+        try:
+            values = redis_client.mget([self._log_key(log_id) for log_id in log_ids])
+            return {log_id: json.loads(value) for log_id, value in zip(log_ids, values) if value}
+        except Exception as e:
+            log.error(f"Error reading process logs from Redis: {str(e)}")
+            return {}
+
+    def _start_flusher(self) -> None:
+        if self._flusher is not None or not self.use_redis:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name="process-log-flusher", daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error(f"Error flushing process logs to Redis: {str(e)}")
+
+    def flush(self) -> int:
+        """
+        Write logs changed since the last flush to Redis in one pipeline.
+
+        Returns:
+            int: Number of logs written
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            spilled, self._spilled = self._spilled, {}
+            batch = [(log_id, is_new, business_id, data) for log_id, (is_new, business_id, data) in spilled.items()]
+            batch.extend((log_id, is_new, self._entries[log_id][1], dict(self._entries[log_id][2]))
+                         for log_id, is_new in dirty.items() if log_id in self._entries)
+        redis_client = self.redis_client
+        if not batch or redis_client is None:
+            # Without Redis there is nowhere to spill to
+            return 0
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for log_id, is_new, business_id, data in batch:
+                pipe.set(self._log_key(log_id), json.dumps(data, default=str), ex=self.redis_ttl)
+                if is_new:
+                    business_key = self._business_key(business_id)
+                    pipe.lpush(business_key, log_id)
+                    pipe.ltrim(business_key, 0, self.redis_capacity - 1)
+                    pipe.expire(business_key, self.redis_ttl)
+            pipe.execute()
+        except Exception as e:
+            log.error(f"Error writing process logs to Redis: {str(e)}")
+            # Keep them for the next flush
+            with self._lock:
+                for log_id, is_new, _, _ in batch:
+                    self._dirty[log_id] = self._dirty.get(log_id, False) or is_new
+            return 0
+        return len(batch)
+
+
+process_log_store = ProcessLogStore(
+    capacity=Config.PROCESS_LOG_CAPACITY,
+    ttl=Config.PROCESS_LOG_TTL,
+    redis_capacity=Config.PROCESS_LOG_REDIS_CAPACITY,
+    redis_ttl=Config.PROCESS_LOG_REDIS_TTL,
+    flush_interval=Config.PROCESS_LOG_FLUSH_INTERVAL,
+)
+
 
 def store_process_log(log_id: str, log_data: Dict[str, Any]) -> None:
     """
-    Store a process log in the shared in-memory storage.
-    
+    Store a process log in the shared store.
+
     Args:
         log_id: ID of the process log
         log_data: Data to store
     """
-    _process_logs[log_id] = log_data
-    log.debug(f"Stored process log with ID {log_id}")
+    process_log_store.store(log_id, log_data)
 
 def get_process_log(log_id: str) -> Optional[Dict[str, Any]]:
     """
     Retrieve a process log by ID.
-    
+
     Args:
         log_id: ID of the process log
-        
+
     Returns:
         Process log data or None if not found
     """
-    return _process_logs.get(log_id)
+    return process_log_store.get(log_id)
 
 def get_recent_process_logs(business_id: str, limit: int = 10) -> List[Dict[str, Any]]:
     """
     Retrieve recent process logs for a business.
-    
+
     Args:
         business_id: ID of the business
         limit: Maximum number of logs to retrieve
-        
+
     Returns:
-        List of process logs
+        List of process logs, newest first
     """
-    # Filter logs by business_id
-    business_logs = [
-        log for log in _process_logs.values()
-        if log.get('business_id') == business_id
-    ]
-    
-    # Sort by timestamp (newest first)
-    sorted_logs = sorted(
-        business_logs,
-        key=lambda x: x.get('timestamp', ''),
-        reverse=True
-    )
-    
-    # Return the most recent logs
-    return sorted_logs[:limit]
\ No newline at end of file
+    return process_log_store.recent(business_id, limit)
@@ -0,0 +1,259 @@
+"""
+In-memory routing of webhook events to businesses and users.
+
+Webhook events are routed to a business by the platform identifier they were
+sent to, and Messenger events to the user row of their sender. RoutingTable
+keeps both mappings in process memory:
+
+- Platform identifiers (Facebook page ID, WhatsApp phone number ID) map to
+  their business. The whole mapping is small, so it is loaded at once and
+  swapped atomically on reload; unknown identifiers resolve to None without
+  touching the database.
+- External sender IDs map to internal user IDs in a bounded LRU of
+  ROUTING_MAX_USERS entries, filled on a miss.
+
+Migration 09 adds triggers that publish on the routing_changes channel when
+a mapping changes. A listener thread reloads the businesses or drops the user
+on each notification, and also reloads every ROUTING_REFRESH_INTERVAL seconds
+and after reconnecting, in case notifications were missed.
+"""
+
+import uuid
+import select
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from backend.config import Config, get_db_config
+from backend.db import get_db_connection, release_db_connection
+
+log = logging.getLogger(__name__)
+
+CHANNEL = 'routing_changes'
+
+# Routing columns of businesses by platform
+PLATFORM_COLUMNS = {
+    'facebook': 'facebook_page_id',
+    'whatsapp': 'whatsapp_phone_number_id',
+}
+
+
+def _load_business_routes() -> Iterable[Tuple[str, str, Dict[str, str]]]:
+    """Read every platform identifier with its business from the database."""
+    columns = list(PLATFORM_COLUMNS.values())
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT business_id, internal_api_key, {', '.join(columns)}
+            FROM businesses
+            WHERE {' OR '.join(f'{column} IS NOT NULL' for column in columns)}
+            """
+        )
+        routes = []
+        for business_id, internal_api_key, *identifiers in cursor.fetchall():
+            business = {'business_id': str(business_id), 'internal_api_key': internal_api_key}
+            for platform, identifier in zip(PLATFORM_COLUMNS, identifiers):
+                if identifier:
+                    routes.append((platform, identifier, business))
+        return routes
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+def get_or_create_user(platform: str, external_id: str) -> str:
+    """
+    Get the user ID of a platform sender, creating the user on first contact.
+
+    Users are unique per (platform, external_id) (migration 14), so concurrent
+    first messages from one sender create a single user.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id FROM users WHERE platform = %s AND external_id = %s",
+            (platform, external_id)
+        )
+        row = cursor.fetchone()
+        if row:
+            return str(row[0])
+        cursor.execute(
+            """
+            INSERT INTO users (user_id, external_id, platform, first_name, last_name)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (platform, external_id) DO NOTHING
+            RETURNING user_id
+            """,
+            (str(uuid.uuid4()), external_id, platform, platform.title(), "User")
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # Another worker created the user since the lookup
+            cursor.execute(
+                "SELECT user_id FROM users WHERE platform = %s AND external_id = %s",
+                (platform, external_id)
+            )
+            row = cursor.fetchone()
+        conn.commit()
+        return str(row[0])
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+class RoutingTable:
+    """Platform identifier -> business map and external sender -> user LRU."""
+
+    def __init__(
+        self,
+        max_users: int = 10000,
+        refresh_interval: float = 300.0,
+        business_loader: Callable[[], Iterable[Tuple[str, str, Dict[str, str]]]] = _load_business_routes,
+        user_loader: Callable[[str, str], str] = get_or_create_user
+    ):
+        """
+        Initialize the routing table.
+
+        Args:
+            max_users: Maximum number of senders kept in the user LRU
+            refresh_interval: Seconds between full reloads when no notification arrives
+            business_loader: Function returning (platform, identifier, business) tuples
+            user_loader: Function (platform, external_id) returning the user ID
+        """
+        self.max_users = max_users
+        self.refresh_interval = refresh_interval
+        self._business_loader = business_loader
+        self._user_loader = user_loader
+        self._businesses: Optional[Dict[Tuple[str, str], Dict[str, str]]] = None
+        self._users: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+
+    def reload(self) -> None:
+        """Load the business mapping and swap it in."""
+        with self._load_lock:
+            businesses = {(platform, str(identifier)): business
+                          for platform, identifier, business in self._business_loader()}
+            with self._lock:
+                self._businesses = businesses
+        log.info(f"Loaded {len(businesses)} webhook routes")
+
+    def resolve_business(self, platform: str, identifier: str) -> Optional[Dict[str, str]]:
+        """
+        Get the business a platform identifier belongs to.
+
+        Args:
+            platform: 'facebook' or 'whatsapp'
+            identifier: Facebook page ID or WhatsApp phone number ID
+
+        Returns:
+            Dict with business_id and internal_api_key, or None if no business uses it
+        """
+        if self._businesses is None:
+            self.reload()
+        with self._lock:
+            return self._businesses.get((platform, str(identifier)))
+
+    def resolve_user(self, platform: str, external_id: str) -> str:
+        """
+        Get the internal user ID of a platform sender.
+
+        Args:
+            platform: Platform the sender wrote from
+            external_id: Sender ID on that platform
+
+        Returns:
+            UUID of the user, created on first contact
+        """
+        key = (platform, str(external_id))
+        with self._lock:
+            user_id = self._users.get(key)
+            if user_id is not None:
+                self._users.move_to_end(key)
+                return user_id
+
+        user_id = self._user_loader(platform, external_id)
+        with self._lock:
+            self._users[key] = user_id
+            self._users.move_to_end(key)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return user_id
+
+    def invalidate_user(self, external_id: str) -> None:
+        """Drop a sender from the user LRU on every platform."""
+        with self._lock:
+            for key in [k for k in self._users if k[1] == external_id]:
+                del self._users[key]
+
+    def handle_notifications(self, payloads: Iterable[str]) -> None:
+        """
+        Apply change notifications from the routing_changes channel.
+
+        Args:
+            payloads: 'businesses' or 'user:<external_id>' per notification
+        """
+        reload = False
+        for payload in payloads:
+            if payload == 'businesses':
+                reload = True
+            elif payload.startswith('user:'):
+                self.invalidate_user(payload[len('user:'):])
+        if reload:
+            # Several business notifications in a burst need a single reload
+            self.reload()
+
+    def start(self) -> None:
+        """Load the business mapping and start listening for changes."""
+        if self._listener is not None:
+            return
+        self.reload()
+        self._listener = threading.Thread(target=self._listen, name="routing-table-listener", daemon=True)
+        self._listener.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _listen(self) -> None:
+        reconnecting = False
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**get_db_config())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f"LISTEN {CHANNEL}")
+                if reconnecting:
+                    # Catch up on changes made while disconnected
+                    self.reload()
+                reconnecting = True
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], self.refresh_interval) == ([], [], []):
+                        self.reload()
+                        continue
+                    conn.poll()
+                    payloads = [notify.payload for notify in conn.notifies]
+                    conn.notifies.clear()
+                    self.handle_notifications(payloads)
+            except Exception as e:
+                log.error(f"Routing table listener error: {str(e)}")
+                self._stopping.wait(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+routing_table = RoutingTable(
+    max_users=Config.ROUTING_MAX_USERS,
+    refresh_interval=Config.ROUTING_REFRESH_INTERVAL,
+)
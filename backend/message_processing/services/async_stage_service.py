@@ -0,0 +1,223 @@
+"""
+Async stage service for the message processing pipeline.
+
+This service provides the stage lookups needed while a message is being
+processed. It reads through the asyncio Redis state manager and falls back to
+Postgres via the async connection manager, so nothing on this path blocks the
+event loop.
+"""
+
+import logging
+from typing import Dict, Any, Optional
+from datetime import datetime
+
+from ..errors import StageNotFoundError, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+STAGE_COLUMNS = """
+    s.stage_id, s.business_id, s.stage_name, s.stage_description, s.stage_type,
+    s.stage_selection_template_id, s.data_extraction_template_id,
+    s.response_generation_template_id
+"""
+
+
+class AsyncStageService:
+    """Async service for resolving and advancing conversation stages."""
+
+    def __init__(self, connection_manager, redis_manager, stage_ttl: int = 1800):
+        """Initialize async stage service.
+
+        Args:
+            connection_manager: AsyncConnectionManager for database access
+            redis_manager: Async RedisStateManager for stage state
+            stage_ttl: Seconds a conversation's current stage stays cached
+        """
+        self.connection_manager = connection_manager
+        self.redis_manager = redis_manager
+        self.stage_ttl = stage_ttl
+
+    @staticmethod
+    def stage_key(conversation_id: str) -> str:
+        """Redis key of a conversation's cached current stage."""
+        return f"stage:{conversation_id}"
+
+    @staticmethod
+    def _normalize_stage(row) -> Dict[str, Any]:
+        """Convert a stages row into the shape used by the message pipeline."""
+        stage = dict(row)
+        stage_id = str(stage['stage_id'])
+        return {
+            'id': stage_id,
+            'stage_id': stage_id,
+            'business_id': str(stage['business_id']) if stage.get('business_id') else None,
+            'name': stage.get('stage_name'),
+            'description': stage.get('stage_description'),
+            'type': stage.get('stage_type'),
+            'template_id': str(stage['response_generation_template_id'])
+            if stage.get('response_generation_template_id') else None,
+            'selection_template_id': str(stage['stage_selection_template_id'])
+            if stage.get('stage_selection_template_id') else None,
+            'extraction_template_id': str(stage['data_extraction_template_id'])
+            if stage.get('data_extraction_template_id') else None,
+            'extraction_rules': stage.get('extraction_rules') or [],
+            'updated_at': datetime.now().isoformat()
+        }
+
+    async def get_stage(self, stage_id: str) -> Dict[str, Any]:
+        """Get stage by ID.
+
+        Args:
+            stage_id: Stage ID
+
+        Returns:
+            Normalized stage data
+
+        Raises:
+            StageNotFoundError: If stage not found
+            DatabaseError: If database error occurs
+        """
+        try:
+            row = await self.connection_manager.fetchrow(
+                f"SELECT {STAGE_COLUMNS} FROM stages s WHERE s.stage_id = $1",
+                stage_id
+            )
+        except Exception as e:
+            logger.error(f"Error getting stage {stage_id}: {str(e)}")
+            raise DatabaseError(f"Failed to get stage: {str(e)}")
+
+        if not row:
+            raise StageNotFoundError(f"Stage {stage_id} not found")
+        return self._normalize_stage(row)
+
+    async def get_current_stage(
+        self,
+        conversation_id: str,
+        business_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get current stage for conversation.
+
+        Redis is checked first. On a miss the conversation's stage (or the
+        business's first stage) is loaded from Postgres and cached.
+
+        Args:
+            conversation_id: Conversation ID
+            business_id: Optional business ID used to fall back to its first stage
+
+        Returns:
+            Current stage data or None if no stage can be determined
+
+        Raises:
+            DatabaseError: If database error occurs
+        """
+        key = self.stage_key(conversation_id)
+        try:
+            cached = await self.redis_manager.get_with_custom_ttl(key)
+            if cached:
+                return cached
+        except Exception as e:
+            # A Redis outage must not stop message processing
+            logger.warning(f"Stage cache unavailable for conversation {conversation_id}: {str(e)}")
+
+        try:
+            row = await self.connection_manager.fetchrow(
+                f"""
+                SELECT {STAGE_COLUMNS}
+                FROM conversations c
+                JOIN stages s ON s.stage_id = c.stage_id
+                WHERE c.conversation_id = $1
+                """,
+                conversation_id
+            )
+            if not row and business_id:
+                row = await self.connection_manager.fetchrow(
+                    f"""
+                    SELECT {STAGE_COLUMNS}
+                    FROM businesses b
+                    JOIN stages s ON s.stage_id = b.first_stage_id
+                    WHERE b.business_id = $1
+                    """,
+                    business_id
+                )
+        except Exception as e:
+            logger.error(f"Error getting current stage for conversation {conversation_id}: {str(e)}")
+            raise DatabaseError(f"Failed to get current stage: {str(e)}")
+
+        if not row:
+            return None
+
+        stage_data = self._normalize_stage(row)
+        await self._cache_stage(conversation_id, stage_data)
+        return stage_data
+
+    async def set_current_stage(self, conversation_id: str, stage_id: str) -> Dict[str, Any]:
+        """Set current stage for conversation.
+
+        Args:
+            conversation_id: Conversation ID
+            stage_id: Stage ID
+
+        Returns:
+            Updated stage data
+
+        Raises:
+            StageNotFoundError: If stage not found
+            DatabaseError: If database error occurs
+        """
+        stage_data = await self.get_stage(stage_id)
+        try:
+            await self.connection_manager.execute(
+                "UPDATE conversations SET stage_id = $1, last_updated = NOW() WHERE conversation_id = $2",
+                stage_id,
+                conversation_id
+            )
+        except Exception as e:
+            logger.error(f"Error setting current stage for conversation {conversation_id}: {str(e)}")
+            raise DatabaseError(f"Failed to set current stage: {str(e)}")
+
+        await self._cache_stage(conversation_id, stage_data)
+        return stage_data
+
+    async def determine_next_stage(
+        self,
+        conversation_id: str,
+        stage_id: str,
+        extracted_data: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Determine the stage the conversation moves to after this message.
+
+        A ``next_stage_id`` in the extracted data triggers a transition;
+        otherwise the conversation stays in its current stage.
+
+        Args:
+            conversation_id: Conversation ID
+            stage_id: Current stage ID
+            extracted_data: Data extracted from the message
+
+        Returns:
+            Stage data for the next stage
+        """
+        next_stage_id = (extracted_data or {}).get('next_stage_id')
+        if next_stage_id and str(next_stage_id) != str(stage_id):
+            return await self.set_current_stage(conversation_id, str(next_stage_id))
+
+        current = await self.get_current_stage(conversation_id)
+        if current and current.get('id') == str(stage_id):
+            return current
+        return await self.get_stage(stage_id)
+
+    async def clear_stage_state(self, conversation_id: str) -> None:
+        """Clear cached stage state for conversation."""
+        try:
+            await self.redis_manager.redis.delete(self.stage_key(conversation_id))
+        except Exception as e:
+            logger.error(f"Error clearing stage state for conversation {conversation_id}: {str(e)}")
+            raise DatabaseError(f"Failed to clear stage state: {str(e)}")
+
+    async def _cache_stage(self, conversation_id: str, stage_data: Dict[str, Any]) -> None:
+        try:
+            await self.redis_manager.set_with_custom_ttl(
+                self.stage_key(conversation_id), stage_data, self.stage_ttl
+            )
+        except Exception as e:
+            logger.warning(f"Failed to cache stage for conversation {conversation_id}: {str(e)}")
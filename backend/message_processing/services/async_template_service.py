@@ -0,0 +1,112 @@
+"""
+Async Template Service
+
+This module provides the non-blocking template lookups used by the message
+pipeline. Templates are served from the Redis template cache and loaded from
+Postgres through the async connection manager on a miss.
+"""
+
+import logging
+from typing import Dict, Any, Optional
+
+from ..templates.compiler import render_template
+from ..errors import (
+    TemplateError,
+    TemplateNotFoundError,
+    DatabaseError
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTemplateService:
+    """Async access to message templates."""
+
+    def __init__(self, connection_manager, redis_manager):
+        """Initialize async template service.
+
+        Args:
+            connection_manager: AsyncConnectionManager for database access
+            redis_manager: Async RedisStateManager used as the template cache
+        """
+        self.connection_manager = connection_manager
+        self.redis_manager = redis_manager
+
+    async def get_template(self, template_id: str, business_id: Optional[str] = None) -> Dict[str, Any]:
+        """Get template by ID.
+
+        Args:
+            template_id: Template ID
+            business_id: Optional business ID the template must belong to
+
+        Returns:
+            Template data
+
+        Raises:
+            TemplateNotFoundError: If template not found
+            DatabaseError: If database error occurs
+        """
+        try:
+            cached = await self.redis_manager.get_cached_template(template_id)
+        except Exception as e:
+            logger.warning(f"Template cache unavailable for {template_id}: {str(e)}")
+            cached = None
+
+        if cached:
+            template = cached
+        else:
+            try:
+                row = await self.connection_manager.fetchrow(
+                    """
+                    SELECT template_id, business_id, template_name, template_type,
+                           content, system_prompt
+                    FROM templates
+                    WHERE template_id = $1
+                    """,
+                    template_id
+                )
+            except Exception as e:
+                logger.error(f"Error getting template {template_id}: {str(e)}")
+                raise DatabaseError(f"Failed to get template: {str(e)}")
+
+            if not row:
+                raise TemplateNotFoundError(f"Template {template_id} not found")
+
+            template = {
+                key: str(value) if key in ('template_id', 'business_id') and value else value
+                for key, value in dict(row).items()
+            }
+            try:
+                await self.redis_manager.cache_template(template_id, template)
+            except Exception as e:
+                logger.warning(f"Failed to cache template {template_id}: {str(e)}")
+
+        if business_id and template.get('business_id') and template['business_id'] != str(business_id):
+            raise TemplateNotFoundError(f"Template {template_id} not found")
+
+        return template
+
+    async def process_template(self, template_id: str, variables: Dict[str, Any]) -> str:
+        """Process template with variables.
+
+        Args:
+            template_id: Template ID
+            variables: Variables to use in template
+
+        Returns:
+            Processed template content
+
+        Raises:
+            TemplateNotFoundError: If template not found
+            TemplateError: If processing fails
+        """
+        template = await self.get_template(template_id)
+        try:
+            return render_template(template.get('content') or '', variables, template_id)
+        except Exception as e:
+            logger.error(f"Error processing template {template_id}: {str(e)}")
+            raise TemplateError(f"Failed to process template: {str(e)}")
+
+    async def invalidate_template(self, template_id: str) -> None:
+        """Drop a template from the cache after it has been changed."""
+        await self.redis_manager.invalidate_template_cache(template_id)
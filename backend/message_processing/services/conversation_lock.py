@@ -0,0 +1,306 @@
+"""
+Per-conversation serialization of message processing.
+
+Messages of one conversation are processed one turn at a time across all
+workers, so concurrent turns can't read the same stage and overwrite each
+other's state. ConversationLock is a lease per conversation in Redis:
+
+- Acquiring sets conv_lock:{key} to a fencing token taken from one global
+  counter, in a single Lua script. Tokens only grow, so a holder whose lease
+  expired carries a smaller token than whoever took over, and fenced state
+  writes (RedisStateManager.update_conversation_state) reject it.
+- Leases last CONVERSATION_LOCK_TTL seconds and are renewed while held.
+  Waiters poll with backoff for at most CONVERSATION_LOCK_WAIT seconds.
+- Release and renewal only act while the lease still holds the caller's token.
+
+ConversationSerializer runs messages under the lock. With a
+CONVERSATION_COALESCE_WINDOW above zero, a message first waits that long, and
+then for the lock, while further messages of the same conversation arriving
+in this process join it. The batch is answered in a single LLM turn. Webhook
+events of a conversation always reach the same ingestion worker, so bursts on
+that path coalesce fully.
+
+If Redis is not configured or not reachable, leases are kept in process.
+"""
+
+import time
+import random
+import asyncio
+import logging
+import itertools
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..core.errors import StateManagementError
+
+log = logging.getLogger(__name__)
+
+FENCE_KEY = 'conv_lock:fence'
+
+# KEYS[1]: lease key, KEYS[2]: fencing counter. ARGV[1]: lease in milliseconds.
+# Returns the new fencing token, or 0 if the lease is held.
+ACQUIRE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], token, 'PX', ARGV[1])
+return token
+"""
+
+# KEYS[1]: lease key. ARGV[1]: token. Deletes the lease if it is still ours.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1]: lease key. ARGV[1]: token, ARGV[2]: lease in milliseconds.
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def conversation_key(message_data: Dict[str, Any]) -> str:
+    """Key messages are serialized by: the conversation, or the user's new conversation."""
+    if message_data.get('conversation_id'):
+        return str(message_data['conversation_id'])
+    return f"{message_data['business_id']}:{message_data['user_id']}"
+
+
+class _LocalLeases:
+    """In-process leases, shared by every lock in the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = itertools.count(1)
+        self._leases: Dict[str, Tuple[int, float]] = {}  # key -> (token, expires_at)
+
+    def acquire(self, key: str, ttl: float) -> int:
+        with self._lock:
+            now = time.monotonic()
+            lease = self._leases.get(key)
+            if lease is not None and lease[1] > now:
+                return 0
+            token = next(self._tokens)
+            self._leases[key] = (token, now + ttl)
+            return token
+
+    def release(self, key: str, token: int) -> bool:
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease[0] != token:
+                return False
+            del self._leases[key]
+            return True
+
+    def renew(self, key: str, token: int, ttl: float) -> bool:
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease[0] != token or lease[1] <= time.monotonic():
+                return False
+            self._leases[key] = (token, time.monotonic() + ttl)
+            return True
+
+
+_local_leases = _LocalLeases()
+
+
+class Lease:
+    """A held conversation lease and its fencing token."""
+
+    def __init__(self, key: str, token: int):
+        self.key = key
+        self.token = token
+        # Set when a renewal found the lease gone; fenced writes will be rejected
+        self.lost = False
+
+
+class ConversationLock:
+    """Per-conversation leases with fencing tokens, shared through Redis."""
+
+    def __init__(self, redis_client=None, ttl: float = 30.0, wait: float = 60.0):
+        """
+        Initialize the lock.
+
+        Args:
+            redis_client: redis.asyncio client; None uses in-process leases
+            ttl: Seconds a lease lasts without renewal
+            wait: Default seconds to wait for a lease
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.wait = wait
+        self._scripts: Dict[str, Any] = {}
+
+    @staticmethod
+    def _lease_key(key: str) -> str:
+        return f"conv_lock:{key}"
+
+    async def _run_script(self, name: str, source: str, keys: List[str], args: List[Any]) -> Optional[int]:
+        """Run a lease script in Redis; None means Redis is unavailable."""
+        if self.redis is None:
+            return None
+        try:
+            if name not in self._scripts:
+                self._scripts[name] = self.redis.register_script(source)
+            return int(await self._scripts[name](keys=keys, args=args))
+        except Exception as e:
+            log.warning(f"Redis conversation lock unavailable, using in-process lease: {str(e)}")
+            return None
+
+    async def try_acquire(self, key: str) -> int:
+        """Take the lease if it is free; return its fencing token, or 0 if held."""
+        token = await self._run_script('acquire', ACQUIRE_SCRIPT, [self._lease_key(key), FENCE_KEY],
+                                       [int(self.ttl * 1000)])
+        return _local_leases.acquire(key, self.ttl) if token is None else token
+
+    async def acquire(self, key: str, wait: Optional[float] = None) -> Lease:
+        """
+        Take the lease of a conversation, waiting while another holder has it.
+
+        Args:
+            key: Conversation key
+            wait: Seconds to wait at most; defaults to the lock's wait
+
+        Returns:
+            The lease
+
+        Raises:
+            StateManagementError: If the lease is not free before the deadline
+        """
+        wait = self.wait if wait is None else wait
+        started = time.monotonic()
+        delay = 0.02
+        while True:
+            token = await self.try_acquire(key)
+            if token:
+                return Lease(key, token)
+            if time.monotonic() - started + delay > wait:
+                raise StateManagementError(
+                    f"Conversation {key} is busy; gave up after {wait} seconds",
+                    state_key=self._lease_key(key)
+                )
+            # Jitter keeps waiters from retrying in lockstep
+            await asyncio.sleep(delay * (1 + random.random() * 0.2))
+            delay = min(delay * 2, 0.5)
+
+    async def release(self, lease: Lease) -> bool:
+        """Give the lease back if it is still ours."""
+        released = await self._run_script('release', RELEASE_SCRIPT, [self._lease_key(lease.key)], [lease.token])
+        return _local_leases.release(lease.key, lease.token) if released is None else bool(released)
+
+    async def renew(self, lease: Lease) -> bool:
+        """Extend the lease if it is still ours."""
+        renewed = await self._run_script('renew', RENEW_SCRIPT, [self._lease_key(lease.key)],
+                                         [lease.token, int(self.ttl * 1000)])
+        if renewed is None:
+            renewed = _local_leases.renew(lease.key, lease.token, self.ttl)
+        if not renewed:
+            lease.lost = True
+            log.warning(f"Lost the lease of conversation {lease.key} (token {lease.token})")
+        return bool(renewed)
+
+    async def _keep_alive(self, lease: Lease) -> None:
+        while not lease.lost:
+            await asyncio.sleep(self.ttl / 3)
+            await self.renew(lease)
+
+    @asynccontextmanager
+    async def hold(self, key: str, wait: Optional[float] = None) -> AsyncIterator[Lease]:
+        """Hold the lease of a conversation for the duration of the block, renewing it."""
+        lease = await self.acquire(key, wait)
+        keep_alive = asyncio.ensure_future(self._keep_alive(lease))
+        try:
+            yield lease
+        finally:
+            keep_alive.cancel()
+            if not lease.lost:
+                await self.release(lease)
+
+
+class _Batch:
+    """Messages of one conversation waiting to be answered together."""
+
+    def __init__(self, message_data: Dict[str, Any]):
+        self.messages = [message_data]
+        # Futures of the callers that joined; the first caller runs the batch
+        self.futures: List[asyncio.Future] = []
+
+
+class ConversationSerializer:
+    """Runs messages one conversation turn at a time, optionally coalescing bursts."""
+
+    def __init__(self, lock: ConversationLock, coalesce_window: float = 0.0, max_batch: int = 10):
+        """
+        Initialize the serializer.
+
+        Args:
+            lock: Lock leases are taken from
+            coalesce_window: Seconds a message waits for more messages of its
+                conversation; 0 answers every message on its own
+            max_batch: Most messages answered in one turn
+        """
+        self.lock = lock
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self._batches: Dict[str, _Batch] = {}
+
+    async def run(
+        self,
+        message_data: Dict[str, Any],
+        process: Callable[[List[Dict[str, Any]], Lease], Awaitable[List[Dict[str, Any]]]]
+    ) -> Dict[str, Any]:
+        """
+        Process a message under its conversation's lease.
+
+        Args:
+            message_data: The incoming message
+            process: Coroutine function answering a list of messages in one
+                turn and returning one result per message
+
+        Returns:
+            The result for this message
+        """
+        key = conversation_key(message_data)
+
+        if self.coalesce_window <= 0:
+            async with self.lock.hold(key) as lease:
+                return (await process([message_data], lease))[0]
+
+        batch = self._batches.get(key)
+        if batch is not None and len(batch.messages) < self.max_batch:
+            future = asyncio.get_running_loop().create_future()
+            batch.messages.append(message_data)
+            batch.futures.append(future)
+            return await future
+
+        batch = self._batches[key] = _Batch(message_data)
+        try:
+            await asyncio.sleep(self.coalesce_window)
+            async with self.lock.hold(key) as lease:
+                # Close the batch once the lease is ours; later messages start the next one
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+                results = await process(list(batch.messages), lease)
+        except BaseException as e:
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+            for future in batch.futures:
+                if future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            raise
+        for future, result in zip(batch.futures, results[1:]):
+            if not future.done():
+                future.set_result(result)
+        return results[0]
+
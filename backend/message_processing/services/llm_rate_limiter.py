@@ -0,0 +1,240 @@
+"""
+Token-bucket rate limiter for LLM request and token budgets.
+
+Budgets are shared by every worker through an atomic Redis Lua script. Each
+budget is a bucket that refills continuously at limit/60 per second, so there
+is no burst at a window boundary. A call takes one request and its estimated
+tokens from both buckets in a single step, or takes nothing and learns how
+long to wait.
+
+Callers near the limit wait for capacity up to a deadline instead of failing
+immediately. RateLimitError is raised only when the wait would pass the
+deadline. If Redis is not configured or not reachable, the same algorithm runs
+on buckets shared by all limiters in the process.
+"""
+
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ..core.errors import RateLimitError
+
+log = logging.getLogger(__name__)
+
+# KEYS: bucket keys. ARGV: capacity, refill rate per second and cost for each key.
+# Returns {1, "0"} when every bucket had enough and was debited, otherwise
+# {0, "<seconds to wait>"} with no bucket changed.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[(i - 1) * 3 + 1])
+    local rate = tonumber(ARGV[(i - 1) * 3 + 2])
+    local cost = tonumber(ARGV[(i - 1) * 3 + 3])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[(i - 1) * 3 + 1])
+    local rate = tonumber(ARGV[(i - 1) * 3 + 2])
+    local cost = tonumber(ARGV[(i - 1) * 3 + 3])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) * 2 + 1)
+end
+return {1, '0'}
+"""
+
+# KEYS[1]: bucket key. ARGV: capacity, refill rate per second, amount to take
+# (negative to give back). The level may go below zero, which makes later
+# callers wait until the overdraft has refilled.
+ADJUST_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+tokens = math.min(capacity, tokens - amount)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2 + 1)
+return tostring(tokens)
+"""
+
+
+class _LocalBuckets:
+    """In-process buckets, shared by every limiter in the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, timestamp)
+
+    def _level(self, key: str, capacity: float, rate: float, now: float) -> float:
+        tokens, ts = self._buckets.get(key, (capacity, now))
+        return min(capacity, tokens + max(0.0, now - ts) * rate)
+
+    def acquire(self, buckets: List[Tuple[str, float, float, float]]) -> float:
+        """Take cost from every bucket or nothing; return seconds to wait (0 if taken)."""
+        with self._lock:
+            now = time.monotonic()
+            levels = [self._level(key, capacity, rate, now) for key, capacity, rate, _ in buckets]
+            wait = max(
+                ((cost - level) / rate for (_, _, rate, cost), level in zip(buckets, levels) if level < cost),
+                default=0.0
+            )
+            if wait > 0:
+                return wait
+            for (key, _, _, cost), level in zip(buckets, levels):
+                self._buckets[key] = (level - cost, now)
+            return 0.0
+
+    def adjust(self, key: str, capacity: float, rate: float, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(capacity, self._level(key, capacity, rate, now) - amount)
+            self._buckets[key] = (tokens, now)
+            return tokens
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+_local_buckets = _LocalBuckets()
+
+
+class LLMRateLimiter:
+    """Request and token budgets for LLM calls, shared through Redis."""
+
+    def __init__(
+        self,
+        redis_client=None,
+        requests_per_minute: int = 60,
+        tokens_per_minute: int = 40000,
+        burst_seconds: float = 60.0,
+        max_wait: float = 10.0,
+        scope: str = 'default'
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            redis_client: redis.asyncio client; None uses the in-process buckets
+            requests_per_minute: Sustained request budget
+            tokens_per_minute: Sustained token budget
+            burst_seconds: Bucket capacity as seconds of budget; smaller values
+                spread calls out more evenly
+            max_wait: Default seconds a call may wait for capacity
+            scope: Budget name, for example the model or API key
+        """
+        self.redis = redis_client
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self.scope = scope
+
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = max(1.0, self.token_rate * burst_seconds)
+
+        self._request_key = f"ratelimit:llm:{scope}:requests"
+        self._token_key = f"ratelimit:llm:{scope}:tokens"
+        self._acquire_script = None
+        self._adjust_script = None
+
+    def _buckets(self, tokens: float) -> List[Tuple[str, float, float, float]]:
+        # A single call larger than the bucket would never fit, so cap its cost
+        return [
+            (self._request_key, self.request_capacity, self.request_rate, 1.0),
+            (self._token_key, self.token_capacity, self.token_rate, min(float(tokens), self.token_capacity)),
+        ]
+
+    async def _try_acquire(self, tokens: float) -> float:
+        """Attempt to take budget once; return seconds to wait (0 if taken)."""
+        buckets = self._buckets(tokens)
+        if self.redis is not None:
+            try:
+                if self._acquire_script is None:
+                    self._acquire_script = self.redis.register_script(ACQUIRE_SCRIPT)
+                args = [value for _, capacity, rate, cost in buckets for value in (capacity, rate, cost)]
+                allowed, wait = await self._acquire_script(keys=[key for key, _, _, _ in buckets], args=args)
+                return 0.0 if int(allowed) else float(wait)
+            except Exception as e:
+                log.warning(f"Redis rate limiter unavailable, using in-process budget: {str(e)}")
+        return _local_buckets.acquire(buckets)
+
+    async def acquire(self, tokens: float = 0, max_wait: Optional[float] = None) -> float:
+        """
+        Take one request and the given tokens from the budget, waiting if needed.
+
+        Args:
+            tokens: Estimated tokens the call will use
+            max_wait: Seconds to wait at most; defaults to the limiter's max_wait
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitError: If capacity will not be available before the deadline
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        started = time.monotonic()
+        deadline = started + max_wait
+
+        while True:
+            wait = await self._try_acquire(tokens)
+            now = time.monotonic()
+            if wait <= 0:
+                return now - started
+            if now + wait > deadline:
+                raise RateLimitError(
+                    f"LLM rate limit exceeded: {self.requests_per_minute} requests and "
+                    f"{self.tokens_per_minute} tokens per minute",
+                    service="llm",
+                    details={'retry_after': round(wait, 3)}
+                )
+            # Jitter keeps waiters from retrying in lockstep
+            await asyncio.sleep(wait * (1 + random.random() * 0.1))
+
+    async def record_usage(self, estimated_tokens: float, actual_tokens: float) -> None:
+        """
+        Correct the token budget once the real usage is known.
+
+        Args:
+            estimated_tokens: Tokens taken by acquire()
+            actual_tokens: Tokens reported by the provider
+        """
+        amount = float(actual_tokens) - min(float(estimated_tokens), self.token_capacity)
+        if not amount:
+            return
+        if self.redis is not None:
+            try:
+                if self._adjust_script is None:
+                    self._adjust_script = self.redis.register_script(ADJUST_SCRIPT)
+                await self._adjust_script(keys=[self._token_key], args=[self.token_capacity, self.token_rate, amount])
+                return
+            except Exception as e:
+                log.warning(f"Redis rate limiter unavailable, using in-process budget: {str(e)}")
+        _local_buckets.adjust(self._token_key, self.token_capacity, self.token_rate, amount)
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token estimate (about four characters per token)."""
+    return sum(len(text or '') for text in texts) // 4 + 1
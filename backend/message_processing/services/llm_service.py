@@ -1,152 +1,227 @@
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional
 import os
 import json
-import time
+import logging
+from backend.config import Config
+from backend.ai.llm_transport import llm_transport
+from backend.ai.llm_call_audit import LLMCallAuditSink, llm_call_sink
+from backend.ai.context_assembler import AssembledPrompt, ContextAssembler
+from .llm_rate_limiter import LLMRateLimiter, estimate_tokens
 from ..core.errors import LLMServiceError, RateLimitError
 
+log = logging.getLogger(__name__)
+
 class LLMService:
-    def __init__(self, db_pool):
+    def __init__(self, db_pool, transport=None, rate_limiter: LLMRateLimiter = None, redis_client=None,
+                 audit_sink: LLMCallAuditSink = None, context_assembler: ContextAssembler = None):
         self.db_pool = db_pool
+        self.audit_sink = audit_sink or llm_call_sink
+        self.transport = transport or llm_transport
         self.api_key = os.getenv('LLM_API_KEY')
         self.api_endpoint = os.getenv('LLM_API_ENDPOINT', 'https://api.openai.com/v1')
-        self.model = os.getenv('LLM_MODEL', 'gpt-4')
+        self.model = Config.LLM_MODEL
         self.max_tokens = int(os.getenv('LLM_MAX_TOKENS', '2000'))
         self.temperature = float(os.getenv('LLM_TEMPERATURE', '0.7'))
-        self.rate_limit_requests = int(os.getenv('RATE_LIMIT_REQUESTS_PER_MINUTE', '60'))
-        self.rate_limit_tokens = int(os.getenv('RATE_LIMIT_TOKENS_PER_MINUTE', '40000'))
         
-        # Initialize rate limiting state
-        self.request_count = 0
-        self.token_count = 0
-        self.last_reset = time.time()
+        # Prompts are built within per-section token budgets for the model
+        self.context_assembler = context_assembler or ContextAssembler(
+            self.model, max_prompt_tokens=Config.LLM_CONTEXT_MAX_TOKENS, budgets=Config.LLM_CONTEXT_BUDGETS
+        )
+        
+        # Request and token budgets shared by all workers (in-process if no Redis)
+        self.rate_limiter = rate_limiter or LLMRateLimiter(
+            redis_client,
+            requests_per_minute=Config.RATE_LIMIT_REQUESTS_PER_MINUTE,
+            tokens_per_minute=Config.RATE_LIMIT_TOKENS_PER_MINUTE,
+            burst_seconds=Config.LLM_RATE_LIMIT_BURST_SECONDS,
+            max_wait=Config.LLM_RATE_LIMIT_MAX_WAIT,
+            scope=self.model
+        )
 
     async def generate_response(
         self,
         prompt: str,
         message_content: str,
-        context: Dict[str, Any]
+        context: Dict[str, Any],
+        business_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        business_info: Optional[str] = None
     ) -> str:
         """Generate response using LLM with rate limiting."""
-        await self._check_rate_limits()
+        assembled = self._assemble(prompt, message_content, context, history, business_info)
+        estimated_tokens = assembled.token_counts['total'] + self.max_tokens
+        await self._check_rate_limits(estimated_tokens)
         
         try:
-            # Prepare the request
-            request_data = {
-                'model': self.model,
-                'messages': [
-                    {'role': 'system', 'content': prompt},
-                    {'role': 'user', 'content': message_content}
-                ],
-                'max_tokens': self.max_tokens,
-                'temperature': self.temperature
-            }
+            request_data = self._build_request(assembled)
             
-            # Add context if provided
-            if context:
-                request_data['messages'].append({
-                    'role': 'system',
-                    'content': f"Context: {json.dumps(context)}"
-                })
+            # Make API request on the shared keep-alive session
+            session = self.transport.get_session()
+            async with session.post(
+                f"{self.api_endpoint}/chat/completions",
+                headers=self._headers(),
+                json=request_data
+            ) as response:
+                if response.status == 429:
+                    raise RateLimitError("Rate limit exceeded", service="llm")
+                
+                response.raise_for_status()
+                result = await response.json()
             
-            # Make API request
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_endpoint}/chat/completions",
-                    headers={
-                        'Authorization': f'Bearer {self.api_key}',
-                        'Content-Type': 'application/json'
-                    },
-                    json=request_data
-                ) as response:
-                    if response.status == 429:
-                        raise RateLimitError("Rate limit exceeded", service="llm")
-                    
-                    response.raise_for_status()
-                    result = await response.json()
-                    
-                    # Update rate limiting counters
-                    self._update_rate_limits(result)
-                    
-                    # Log the request
-                    await self._log_request(prompt, message_content, result)
-                    
-                    return result['choices'][0]['message']['content']
+            # Correct the token budget with the real usage
+            await self._update_rate_limits(result, estimated_tokens)
+            
+            # Log the request
+            await self._log_request(prompt, message_content, result, business_id, assembled.token_counts)
+            
+            return result['choices'][0]['message']['content']
                     
         except Exception as e:
             if isinstance(e, RateLimitError):
                 raise
             raise LLMServiceError(f"Error generating response: {str(e)}", model=self.model)
 
-    async def _check_rate_limits(self) -> None:
-        """Check if we're within rate limits."""
-        current_time = time.time()
-        if current_time - self.last_reset >= 60:
-            # Reset counters every minute
-            self.request_count = 0
-            self.token_count = 0
-            self.last_reset = current_time
+    async def stream_response(
+        self,
+        prompt: str,
+        message_content: str,
+        context: Dict[str, Any],
+        business_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        business_info: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Generate a response with streaming, yielding content tokens as they arrive."""
+        assembled = self._assemble(prompt, message_content, context, history, business_info)
+        estimated_tokens = assembled.token_counts['total'] + self.max_tokens
+        await self._check_rate_limits(estimated_tokens)
         
-        if self.request_count >= self.rate_limit_requests:
-            raise RateLimitError(
-                f"Request rate limit exceeded: {self.rate_limit_requests} requests per minute",
-                service="llm"
-            )
+        request_data = self._build_request(assembled)
+        request_data['stream'] = True
+        parts = []
         
-        if self.token_count >= self.rate_limit_tokens:
-            raise RateLimitError(
-                f"Token rate limit exceeded: {self.rate_limit_tokens} tokens per minute",
-                service="llm"
-            )
+        try:
+            session = self.transport.get_session()
+            async with session.post(
+                f"{self.api_endpoint}/chat/completions",
+                headers=self._headers(),
+                json=request_data
+            ) as response:
+                if response.status == 429:
+                    raise RateLimitError("Rate limit exceeded", service="llm")
+                
+                response.raise_for_status()
+                # Server-sent events: one "data: {chunk}" line per delta, then "data: [DONE]"
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    choices = json.loads(data).get('choices') or [{}]
+                    token = (choices[0].get('delta') or {}).get('content')
+                    if token:
+                        parts.append(token)
+                        yield token
+        except Exception as e:
+            if isinstance(e, RateLimitError):
+                raise
+            raise LLMServiceError(f"Error streaming response: {str(e)}", model=self.model)
+        
+        # Streams carry no usage block, so estimate the completion from its text
+        content = ''.join(parts)
+        result = {
+            'choices': [{'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'total_tokens': assembled.token_counts['total'] + estimate_tokens(content)}
+        }
+        await self._update_rate_limits(result, estimated_tokens)
+        await self._log_request(prompt, message_content, result, business_id, assembled.token_counts)
+
+    def _assemble(
+        self,
+        prompt: str,
+        message_content: str,
+        context: Dict[str, Any],
+        history: Optional[List[Dict[str, str]]] = None,
+        business_info: Optional[str] = None
+    ) -> AssembledPrompt:
+        """
+        Build the prompt messages within the token budgets.
+
+        History and business info are separate sections with their own budgets,
+        rendered into the template where it places them; the context is sent
+        as compact JSON.
+        """
+        return self.context_assembler.assemble(
+            prompt, message_content, business_info=business_info, history=history, extracted_data=context
+        )
+
+    def _build_request(self, assembled: AssembledPrompt) -> Dict[str, Any]:
+        """Build the chat completion request body."""
+        return {
+            'model': self.model,
+            'messages': assembled.messages,
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperature
+        }
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
 
-    def _update_rate_limits(self, response: Dict[str, Any]) -> None:
-        """Update rate limiting counters."""
-        self.request_count += 1
+    async def _check_rate_limits(self, estimated_tokens: int = 0) -> None:
+        """Take budget for one request, waiting up to the limiter's deadline.
+        
+        Raises:
+            RateLimitError: If the budget will not allow the call before the deadline
+        """
+        await self.rate_limiter.acquire(estimated_tokens)
+
+    async def _update_rate_limits(self, response: Dict[str, Any], estimated_tokens: int = 0) -> None:
+        """Replace the estimated token cost with the usage the provider reported."""
         if 'usage' in response:
-            self.token_count += response['usage'].get('total_tokens', 0)
+            try:
+                await self.rate_limiter.record_usage(estimated_tokens, response['usage'].get('total_tokens', 0))
+            except Exception as e:
+                log.error(f"Error recording LLM token usage: {str(e)}")
 
     async def _log_request(
         self,
         prompt: str,
         message_content: str,
-        response: Dict[str, Any]
+        response: Dict[str, Any],
+        business_id: Optional[str] = None,
+        token_counts: Optional[Dict[str, int]] = None
     ) -> None:
-        """Log LLM request to database."""
+        """Queue the LLM request for the llm_calls audit table."""
+        if not business_id:
+            return
         try:
-            async with self.db_pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO llm_calls (
-                        prompt,
-                        message_content,
-                        response,
-                        model,
-                        tokens_used,
-                        created_at
-                    ) VALUES ($1, $2, $3, $4, $5, CURRENT_TIMESTAMP)
-                    """,
-                    prompt,
-                    message_content,
-                    json.dumps(response),
-                    self.model,
-                    response.get('usage', {}).get('total_tokens', 0)
-                )
+            self.audit_sink.record(
+                business_id=business_id,
+                input_text=message_content or "Empty input",
+                response=response['choices'][0]['message']['content'],
+                system_prompt=prompt,
+                call_type='response',
+                token_counts=token_counts
+            )
         except Exception as e:
             # Log error but don't fail the request
-            print(f"Error logging LLM request: {str(e)}")
+            log.error(f"Error logging LLM request: {str(e)}")
 
     async def get_available_models(self) -> list:
         """Get list of available models."""
         try:
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.api_endpoint}/models",
-                    headers={'Authorization': f'Bearer {self.api_key}'}
-                ) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-                    return [model['id'] for model in result['data']]
+            session = self.transport.get_session()
+            async with session.get(
+                f"{self.api_endpoint}/models",
+                headers={'Authorization': f'Bearer {self.api_key}'}
+            ) as response:
+                response.raise_for_status()
+                result = await response.json()
+            return [model['id'] for model in result['data']]
         except Exception as e:
             raise LLMServiceError(f"Error getting available models: {str(e)}", model=self.model)
 
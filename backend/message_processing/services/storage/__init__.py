@@ -3,5 +3,6 @@ Storage services for message processing.
 """
 
 from .redis_manager import RedisStateManager
+from .tiered_cache import TieredCache
 
-__all__ = ['RedisStateManager'] 
\ No newline at end of file
+__all__ = ['RedisStateManager', 'TieredCache'] 
\ No newline at end of file
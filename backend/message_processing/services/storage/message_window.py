@@ -0,0 +1,295 @@
+"""
+Rolling window of the latest messages of each conversation, kept in Redis.
+
+The conversation_history and last_10_messages variables and the chat history
+of the LLM service read conv:{id}:window: a list of the last
+MESSAGE_WINDOW_SIZE messages, oldest first, with their content sanitized.
+
+- Message writers append after committing. Appends only extend a window that
+  is complete, i.e. seeded from the database or started with the
+  conversation, so a window never has gaps.
+- A reader that misses loads the messages from the database and seeds the
+  window. Every append bumps conv:{id}:window_version, and the seed is
+  skipped if the version moved since before the database read, so a seed
+  can not drop a message committed meanwhile.
+- Windows expire MESSAGE_WINDOW_TTL seconds after the last write; deleting a
+  conversation drops its window.
+
+If Redis is not configured or not reachable, every read goes to the database.
+"""
+
+import re
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from backend.config import Config
+
+log = logging.getLogger(__name__)
+
+# KEYS[1]: window, KEYS[2]: version. ARGV[1]: create flag, ARGV[2]: size,
+# ARGV[3]: TTL in seconds, ARGV[4..]: JSON entries.
+# Appends unless the window is missing and the create flag is unset.
+APPEND_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if ARGV[1] ~= '1' and redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 4, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+# KEYS[1]: window, KEYS[2]: version. ARGV[1]: version read before loading,
+# ARGV[2]: TTL in seconds, ARGV[3..]: JSON entries.
+# Seeds a missing window unless a message was appended since the version read.
+SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 or (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+for i = 3, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# Assistant replies that echo the prompt they were generated from:
+# "user message:<message>\n,\nconversation sumary:...\n,\nlast mesages [...]"
+_ECHOED_PROMPT = re.compile(r'^user message:(.*?)(?:\n,\nconversation sumary:|$)', re.DOTALL)
+_ECHOED_PROMPT_PARTS = re.compile(r'user message:|\n,\nconversation sumary:.*|\n,\nlast mesages \[.*', re.DOTALL)
+
+
+def sanitize_content(content: Optional[str], sender_type: str) -> str:
+    """Strip echoed prompts from assistant replies and surrounding whitespace."""
+    content = content or ''
+    if sender_type == 'assistant':
+        match = _ECHOED_PROMPT.search(content)
+        content = match.group(1) if match else _ECHOED_PROMPT_PARTS.sub('', content)
+    return content.strip()
+
+
+def window_entry(
+    content: str,
+    sender_type: str,
+    created_at: Optional[datetime] = None,
+    message_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Build a sanitized window entry with the shape of a messages row."""
+    return {
+        'message_id': str(message_id) if message_id else None,
+        'message_content': sanitize_content(content, sender_type),
+        'sender_type': sender_type,
+        'created_at': created_at or datetime.now(timezone.utc),
+    }
+
+
+def _encode(entry: Dict[str, Any]) -> str:
+    created_at = entry.get('created_at')
+    return json.dumps({
+        **entry,
+        'message_id': str(entry['message_id']) if entry.get('message_id') else None,
+        'created_at': created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+    })
+
+
+def _decode(value: str) -> Dict[str, Any]:
+    entry = json.loads(value)
+    if entry.get('created_at'):
+        entry['created_at'] = datetime.fromisoformat(entry['created_at'])
+    return entry
+
+
+class MessageWindow:
+    """Capped Redis lists of the latest sanitized messages per conversation."""
+
+    def __init__(self, redis_client=None, size: int = 20, ttl: int = 86400, use_redis: bool = False):
+        """
+        Initialize the window.
+
+        Args:
+            redis_client: Synchronous or redis.asyncio client; None disables
+                the window unless use_redis is set. get_or_load() and append()
+                need a synchronous client, aget_or_load() and aappend() an
+                asyncio one.
+            size: Messages kept per conversation
+            ttl: Seconds a window is kept after its last write
+            use_redis: Without a client, use a RedisStateManager created on first use
+        """
+        self._redis = redis_client
+        self.size = size
+        self.ttl = ttl
+        self.use_redis = use_redis
+        self._redis_manager = None
+        self._scripts: Dict[str, Any] = {}
+
+    @property
+    def redis(self):
+        if self._redis is not None or not self.use_redis:
+            return self._redis
+        if self._redis_manager is None:
+            from .redis_manager import RedisStateManager
+            self._redis_manager = RedisStateManager()
+        return self._redis_manager.redis_client
+
+    @staticmethod
+    def _key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}:window"
+
+    @staticmethod
+    def _version_key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}:window_version"
+
+    def _script(self, name: str, source: str):
+        if name not in self._scripts:
+            self._scripts[name] = self.redis.register_script(source)
+        return self._scripts[name]
+
+    def _error(self, action: str, conversation_id: str, error: Exception) -> None:
+        log.warning(f"Message window {action} failed for conversation {conversation_id}: {str(error)}")
+
+    def _append_args(self, conversation_id: str, entries: List[Dict[str, Any]], create: bool) -> Dict[str, list]:
+        return {
+            'keys': [self._key(conversation_id), self._version_key(conversation_id)],
+            'args': ['1' if create else '0', self.size, self.ttl, *[_encode(entry) for entry in entries]],
+        }
+
+    @staticmethod
+    def _entries(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [window_entry(row['message_content'], row['sender_type'], row.get('created_at'), row.get('message_id'))
+                for row in rows]
+
+    def _seed_args(self, conversation_id: str, version: Any, entries: List[Dict[str, Any]]) -> Dict[str, list]:
+        return {
+            'keys': [self._key(conversation_id), self._version_key(conversation_id)],
+            'args': [version, self.ttl, *[_encode(entry) for entry in entries]],
+        }
+
+    def get_or_load(
+        self,
+        conversation_id: str,
+        limit: int,
+        loader: Callable[[int], List[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the latest messages of a conversation, oldest first.
+
+        Args:
+            conversation_id: UUID of the conversation
+            limit: Maximum number of messages to return
+            loader: Function returning the latest n messages from the
+                database, oldest first, on a miss
+
+        Returns:
+            Up to limit message dicts with message_content, sender_type and created_at
+        """
+        conversation_id = str(conversation_id)
+        if self.redis is None or limit > self.size:
+            return self._entries(loader(limit))
+
+        version = ''
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lrange(self._key(conversation_id), -limit, -1)
+            pipe.get(self._version_key(conversation_id))
+            values, version = pipe.execute()
+            if values:
+                return [_decode(value) for value in values]
+            version = version or ''
+        except Exception as e:
+            self._error('read', conversation_id, e)
+
+        entries = self._entries(loader(self.size))
+        if entries:
+            try:
+                self._script('seed', SEED_SCRIPT)(**self._seed_args(conversation_id, version, entries))
+            except Exception as e:
+                self._error('seed', conversation_id, e)
+        return entries[-limit:]
+
+    async def aget_or_load(
+        self,
+        conversation_id: str,
+        limit: int,
+        loader: Callable[[int], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """Async get_or_load() for a redis.asyncio client and an async loader."""
+        conversation_id = str(conversation_id)
+        if self.redis is None or limit > self.size:
+            return self._entries(await loader(limit))
+
+        version = ''
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lrange(self._key(conversation_id), -limit, -1)
+            pipe.get(self._version_key(conversation_id))
+            values, version = await pipe.execute()
+            if values:
+                return [_decode(value) for value in values]
+            version = version or ''
+        except Exception as e:
+            self._error('read', conversation_id, e)
+
+        entries = self._entries(await loader(self.size))
+        if entries:
+            try:
+                await self._script('seed', SEED_SCRIPT)(**self._seed_args(conversation_id, version, entries))
+            except Exception as e:
+                self._error('seed', conversation_id, e)
+        return entries[-limit:]
+
+    def append(self, conversation_id: str, entries: List[Dict[str, Any]], create: bool = False) -> bool:
+        """
+        Append committed messages to a conversation's window.
+
+        Args:
+            conversation_id: UUID of the conversation
+            entries: Entries from window_entry(), oldest first
+            create: Start the window; only for a conversation created with these messages
+
+        Returns:
+            True if the window was extended or started
+        """
+        if self.redis is None or not entries:
+            return False
+        try:
+            appended = self._script('append', APPEND_SCRIPT)(**self._append_args(str(conversation_id), entries, create))
+            return bool(appended)
+        except Exception as e:
+            self._error('append', conversation_id, e)
+            return False
+
+    async def aappend(self, conversation_id: str, entries: List[Dict[str, Any]], create: bool = False) -> bool:
+        """Async append() for a redis.asyncio client."""
+        if self.redis is None or not entries:
+            return False
+        try:
+            appended = await self._script('append', APPEND_SCRIPT)(
+                **self._append_args(str(conversation_id), entries, create)
+            )
+            return bool(appended)
+        except Exception as e:
+            self._error('append', conversation_id, e)
+            return False
+
+    def invalidate(self, conversation_id: str) -> None:
+        """Drop a conversation's window after its messages were deleted."""
+        if self.redis is None:
+            return
+        try:
+            # Bumping the version also voids any seed loaded before the delete
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(self._key(conversation_id))
+            pipe.incr(self._version_key(conversation_id))
+            pipe.expire(self._version_key(conversation_id), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self._error('invalidate', conversation_id, e)
+
+
+message_window = MessageWindow(size=Config.MESSAGE_WINDOW_SIZE, ttl=Config.MESSAGE_WINDOW_TTL, use_redis=True)
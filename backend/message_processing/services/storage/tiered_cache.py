@@ -0,0 +1,201 @@
+"""
+Two-tier cache for rarely changing data.
+
+Lookups go to an in-process LRU with a short TTL first, then to Redis through
+RedisStateManager, and only then to the loader (usually a database query).
+Values must be JSON serializable so they can be shared through Redis.
+
+Writers call invalidate() after committing. That drops the local entry and
+the Redis key. Other processes keep their local copy until the local TTL
+expires, so the local TTL bounds how stale a read can be after a write.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .redis_manager import RedisStateManager
+
+log = logging.getLogger(__name__)
+
+
+class TieredCache:
+    """In-process LRU with TTL in front of a Redis cache."""
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int = 1000,
+        local_ttl: float = 30.0,
+        redis_ttl: int = 600,
+        redis_manager: Optional[RedisStateManager] = None,
+        use_redis: bool = True
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            namespace: Prefix for Redis keys and name used in logs
+            max_entries: Maximum number of entries kept in process
+            local_ttl: Seconds an entry is served from process memory
+            redis_ttl: Seconds an entry is kept in Redis
+            redis_manager: Redis state manager; created on first use if not given
+            use_redis: Whether to use the Redis tier at all
+        """
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.use_redis = use_redis
+        self._redis_manager = redis_manager
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'evictions': 0,
+        }
+
+    @property
+    def redis_manager(self) -> Optional[RedisStateManager]:
+        if self.use_redis and self._redis_manager is None:
+            self._redis_manager = RedisStateManager()
+        return self._redis_manager
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.namespace}:{key}"
+
+    def _incr(self, metric: str) -> None:
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def _get_local(self, key: str) -> tuple:
+        """Return (found, value) from the in-process tier."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            self._metrics['local_hits'] += 1
+            return True, value
+
+    def _set_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.local_ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Get a value from the cache, loading and caching it on a miss.
+
+        Args:
+            key: Cache key within the namespace
+            loader: Function returning the value when neither tier has it
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        key = str(key)
+        found, value = self._get_local(key)
+        if found:
+            return value
+
+        redis_manager = self.redis_manager
+        if redis_manager is not None:
+            cached = redis_manager.get_state(self._redis_key(key))
+            if cached is not None:
+                self._incr('redis_hits')
+                value = cached.get('value')
+                self._set_local(key, value)
+                return value
+
+        self._incr('misses')
+        value = loader()
+        if redis_manager is not None:
+            redis_manager.set_state(self._redis_key(key), {'value': value}, ttl=self.redis_ttl)
+        self._set_local(key, value)
+        return value
+
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async get_or_load() for callers on an event loop.
+
+        The Redis tier is synchronous, so its reads and writes run in the
+        loop's default executor.
+
+        Args:
+            key: Cache key within the namespace
+            loader: Coroutine function returning the value when neither tier has it
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        key = str(key)
+        found, value = self._get_local(key)
+        if found:
+            return value
+
+        loop = asyncio.get_running_loop()
+        redis_manager = self.redis_manager
+        if redis_manager is not None:
+            cached = await loop.run_in_executor(None, redis_manager.get_state, self._redis_key(key))
+            if cached is not None:
+                self._incr('redis_hits')
+                value = cached.get('value')
+                self._set_local(key, value)
+                return value
+
+        self._incr('misses')
+        value = await loader()
+        if redis_manager is not None:
+            await loop.run_in_executor(
+                None, lambda: redis_manager.set_state(self._redis_key(key), {'value': value}, ttl=self.redis_ttl)
+            )
+        self._set_local(key, value)
+        return value
+
+    def invalidate(self, key: str) -> None:
+        """
+        Drop a key from both tiers.
+
+        Args:
+            key: Cache key within the namespace
+        """
+        key = str(key)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._metrics['invalidations'] += 1
+        redis_manager = self.redis_manager
+        if redis_manager is not None:
+            redis_manager.delete_state(self._redis_key(key))
+        log.debug(f"Invalidated {self.namespace} cache entry {key}")
+
+    def clear_local(self) -> None:
+        """Drop every in-process entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and the current size of the local tier."""
+        with self._lock:
+            lookups = self._metrics['local_hits'] + self._metrics['redis_hits'] + self._metrics['misses']
+            hits = lookups - self._metrics['misses']
+            return {
+                'namespace': self.namespace,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                **self._metrics,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -11,6 +11,7 @@ from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from ..templates.compiler import render_template
 from ..errors import (
     TemplateError,
     TemplateNotFoundError,
@@ -94,16 +95,7 @@ class TemplateService:
             # Get template
             template = self.get_template(template_id)
             
-            # Get template content
-            content = template['content']
-            
-            # Replace variables
-            for var_name, var_value in variables.items():
-                placeholder = f"{{{var_name}}}"
-                if placeholder in content:
-                    content = content.replace(placeholder, str(var_value))
-            
-            return content
+            return render_template(template['content'], variables, template_id)
             
         except TemplateNotFoundError:
             raise
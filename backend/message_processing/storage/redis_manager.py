@@ -1,23 +1,131 @@
 import json
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 import redis.asyncio as redis
 from datetime import timedelta
 import logging
+from backend.config import Config
+from backend.rate_limiter import RateLimitResult, Rule, SlidingWindowRateLimiter
 
 log = logging.getLogger(__name__)
 
+# Conversation state is a hash under conv:{id}:state whose values are JSON
+# encoded, so HINCRBY works on numeric fields and strings round-trip.
+#
+# KEYS[1]: state hash, KEYS[2]: stage history list.
+# ARGV[1]: JSON object of JSON-encoded field values to set
+# ARGV[2]: JSON object of integer increments
+# ARGV[3]: fencing token, or '' for an unfenced update
+# ARGV[4]: TTL in seconds, ARGV[5]: stage history length
+# A changed current_stage_id also records the transition in the history and
+# counts it. Returns 0 without writing if the state was last written under a
+# newer fencing token, otherwise 1.
+UPDATE_STATE_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok == 'string' then
+    -- State written as a JSON string by an older version
+    redis.call('DEL', KEYS[1])
+end
+local token = tonumber(ARGV[3])
+if token then
+    local current = tonumber(redis.call('HGET', KEYS[1], 'fencing_token'))
+    if current and current > token then
+        return 0
+    end
+end
+local fields = cjson.decode(ARGV[1])
+local stage = fields['current_stage_id']
+if stage then
+    local previous = redis.call('HGET', KEYS[1], 'current_stage_id')
+    if previous and previous ~= stage then
+        local now = redis.call('TIME')[1]
+        redis.call('LPUSH', KEYS[2], '{"from":' .. previous .. ',"to":' .. stage .. ',"at":' .. now .. '}')
+        redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[5]) - 1)
+        redis.call('EXPIRE', KEYS[2], ARGV[4])
+        redis.call('HINCRBY', KEYS[1], 'stage_transitions', 1)
+        fields['previous_stage_id'] = previous
+    end
+end
+local args = {}
+for field, value in pairs(fields) do
+    args[#args + 1] = field
+    args[#args + 1] = value
+end
+if #args > 0 then
+    redis.call('HSET', KEYS[1], unpack(args))
+end
+for field, amount in pairs(cjson.decode(ARGV[2])) do
+    redis.call('HINCRBY', KEYS[1], field, amount)
+end
+if token then
+    redis.call('HSET', KEYS[1], 'fencing_token', token)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+def _encode_fields(state: Dict[str, Any]) -> Dict[str, str]:
+    return {field: json.dumps(value) for field, value in state.items()}
+
+
+def _decode_fields(fields: Dict[str, str]) -> Dict[str, Any]:
+    state = {}
+    for field, value in fields.items():
+        try:
+            state[field] = json.loads(value)
+        except (TypeError, ValueError):
+            state[field] = value
+    return state
+
+
+def _decode_json(value: Optional[str]) -> Optional[Dict]:
+    return json.loads(value) if value else None
+
+
 class RedisStateManager:
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
         self.default_ttl = 3600  # 1 hour
         self.template_cache_ttl = 3600  # 1 hour for templates
         self.conversation_ttl = 1800  # 30 minutes for conversations
+        self.stage_history_length = 50
+        self._update_state_script = None
+        self.rate_limiter = SlidingWindowRateLimiter(redis_client)
+
+    @classmethod
+    def from_config(cls) -> "RedisStateManager":
+        """Create a manager backed by an asyncio Redis client built from Config."""
+        client = redis.Redis(
+            host=Config.REDIS_HOST,
+            port=Config.REDIS_PORT,
+            db=Config.REDIS_DB,
+            password=Config.REDIS_PASSWORD,
+            ssl=Config.REDIS_SSL,
+            decode_responses=True
+        )
+        return cls(client)
+
+    async def close(self) -> None:
+        """Close the underlying Redis connection pool."""
+        await self.redis.close()
+
+    @staticmethod
+    def _state_key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}:state"
+
+    @staticmethod
+    def _history_key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}:stage_history"
 
     async def set_conversation_state(self, conversation_id: str, state: Dict) -> None:
-        """Store conversation state in Redis with TTL."""
-        key = f"conv:{conversation_id}:state"
+        """Replace conversation state in Redis with TTL, in one round trip."""
+        key = self._state_key(conversation_id)
         try:
-            await self.redis.set(key, json.dumps(state), ex=self.conversation_ttl)
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(key)
+            if state:
+                pipe.hset(key, mapping=_encode_fields(state))
+                pipe.expire(key, self.conversation_ttl)
+            await pipe.execute()
             log.debug(f"Stored conversation state for {conversation_id}")
         except Exception as e:
             log.error(f"Error storing conversation state: {str(e)}")
@@ -25,36 +133,123 @@ class RedisStateManager:
 
     async def get_conversation_state(self, conversation_id: str) -> Optional[Dict]:
         """Retrieve conversation state from Redis."""
-        key = f"conv:{conversation_id}:state"
+        key = self._state_key(conversation_id)
         try:
-            data = await self.redis.get(key)
-            if data:
-                return json.loads(data)
-            return None
+            fields = await self.redis.hgetall(key)
+            return _decode_fields(fields) if fields else None
         except Exception as e:
             log.error(f"Error retrieving conversation state: {str(e)}")
             raise
 
     async def delete_conversation_state(self, conversation_id: str) -> None:
-        """Delete conversation state from Redis."""
-        key = f"conv:{conversation_id}:state"
+        """Delete conversation state and stage history from Redis."""
         try:
-            await self.redis.delete(key)
+            await self.redis.delete(self._state_key(conversation_id), self._history_key(conversation_id))
             log.debug(f"Deleted conversation state for {conversation_id}")
         except Exception as e:
             log.error(f"Error deleting conversation state: {str(e)}")
             raise
 
-    async def update_conversation_state(self, conversation_id: str, state_update: Dict) -> None:
-        """Update specific fields in conversation state."""
+    async def update_conversation_state(
+        self,
+        conversation_id: str,
+        state_update: Dict,
+        fencing_token: Optional[int] = None,
+        increments: Optional[Dict[str, int]] = None
+    ) -> bool:
+        """
+        Update specific fields in conversation state.
+        
+        Fields are set and counters incremented in place by one Lua script,
+        which also refreshes the TTL, so concurrent updates of different
+        fields don't overwrite each other. A changed current_stage_id is
+        recorded in the stage history in the same call.
+        
+        Args:
+            conversation_id: Conversation ID
+            state_update: Fields to set
+            fencing_token: Optional token of the conversation lease; the update
+                is refused if the state was written under a newer token
+            increments: Optional integer amounts to add to counter fields
+        
+        Returns:
+            bool: False if the update was refused as stale
+        """
         try:
-            current_state = await self.get_conversation_state(conversation_id) or {}
-            current_state.update(state_update)
-            await self.set_conversation_state(conversation_id, current_state)
-            log.debug(f"Updated conversation state for {conversation_id}")
+            if self._update_state_script is None:
+                self._update_state_script = self.redis.register_script(UPDATE_STATE_SCRIPT)
+            applied = await self._update_state_script(
+                keys=[self._state_key(conversation_id), self._history_key(conversation_id)],
+                args=[
+                    json.dumps(_encode_fields(state_update)),
+                    json.dumps(increments or {}),
+                    '' if fencing_token is None else fencing_token,
+                    self.conversation_ttl,
+                    self.stage_history_length
+                ]
+            )
         except Exception as e:
             log.error(f"Error updating conversation state: {str(e)}")
             raise
+        if not int(applied):
+            log.warning(f"Refused stale state update for {conversation_id} (token {fencing_token})")
+            return False
+        log.debug(f"Updated conversation state for {conversation_id}")
+        return True
+
+    async def get_stage_history(self, conversation_id: str, limit: int = 10) -> List[Dict]:
+        """Get the most recent stage transitions of a conversation, newest first."""
+        try:
+            entries = await self.redis.lrange(self._history_key(conversation_id), 0, limit - 1)
+            return [json.loads(entry) for entry in entries]
+        except Exception as e:
+            log.error(f"Error retrieving stage history: {str(e)}")
+            raise
+
+    async def read_message_context(
+        self,
+        rate_limits: List[Rule],
+        cost: int = 1,
+        conversation_id: Optional[str] = None,
+        stage_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Check rate limits and read what processing a message needs in one round trip.
+        
+        Args:
+            rate_limits: (key, limit, window seconds) rules the message counts against
+            cost: Amount the message counts for
+            conversation_id: Optional conversation whose state to read
+            stage_key: Optional key of the conversation's cached stage
+        
+        Returns:
+            Dict with the rate_limit result, and stage and state (None when missing)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        self.rate_limiter.queue(pipe, rate_limits, cost)
+        if stage_key:
+            pipe.get(stage_key)
+        if conversation_id:
+            pipe.hgetall(self._state_key(conversation_id))
+        try:
+            replies = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            log.error(f"Error reading message context: {str(e)}")
+            raise
+        context = {
+            'rate_limit': await self.rate_limiter.aresult(replies[0], rate_limits, cost),
+            'stage': None,
+            'state': None
+        }
+        index = 1
+        # A failed cache read only means falling back to the usual lookups
+        if stage_key:
+            if not isinstance(replies[index], Exception):
+                context['stage'] = _decode_json(replies[index])
+            index += 1
+        if conversation_id and replies[index] and not isinstance(replies[index], Exception):
+            context['state'] = _decode_fields(replies[index])
+        return context
 
     async def set_with_custom_ttl(self, key: str, value: Dict, ttl_seconds: int) -> None:
         """Store data with custom TTL."""
@@ -105,28 +300,6 @@ class RedisStateManager:
             log.error(f"Error invalidating template cache: {str(e)}")
             raise
 
-    async def set_rate_limit(self, key: str, limit: int, window: int) -> None:
-        """Set a rate limit counter."""
-        try:
-            await self.redis.set(key, 0, ex=window)
-            log.debug(f"Set rate limit for {key}")
-        except Exception as e:
-            log.error(f"Error setting rate limit: {str(e)}")
-            raise
-
-    async def increment_rate_limit(self, key: str) -> int:
-        """Increment a rate limit counter."""
-        try:
-            return await self.redis.incr(key)
-        except Exception as e:
-            log.error(f"Error incrementing rate limit: {str(e)}")
-            raise
-
-    async def get_rate_limit(self, key: str) -> int:
-        """Get current rate limit count."""
-        try:
-            count = await self.redis.get(key)
-            return int(count) if count else 0
-        except Exception as e:
-            log.error(f"Error getting rate limit: {str(e)}")
-            raise 
\ No newline at end of file
+    async def check_rate_limit(self, rate_limits: List[Rule], cost: int = 1) -> RateLimitResult:
+        """Count a call against sliding-window limits if all of them allow it."""
+        return await self.rate_limiter.ahit(rate_limits, cost)
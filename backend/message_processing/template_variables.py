@@ -3,30 +3,72 @@ Template variable system for message processing.
 
 This module provides functionality for managing and processing template variables
 used in message templates.
+
+Providers can declare the shared data they need (for example ``messages`` or
+``business``). generate_variable_values runs each data loader once per call,
+so several history variables share a single messages query and the business
+and stage variables share a single business query. Business data is also
+kept in a two-tier cache (process memory, then Redis) and invalidated by the
+routes and services that write businesses and stages, and recent messages
+come from the conversation's rolling message window in Redis.
 """
 
+import json
+import inspect
 import logging
-from typing import Dict, Any, Optional, Set, Callable
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Set, Callable, Iterable, List
+from datetime import date, datetime
 from functools import wraps
+from uuid import UUID
+
+from backend.config import Config
+from .services.storage.tiered_cache import TieredCache
+from .services.storage.message_window import message_window
+from .templates.compiler import compile_template
 
 log = logging.getLogger(__name__)
 
+# Number of recent messages fetched once and shared by the history variables
+RECENT_MESSAGE_LIMIT = 10
+
+# Business rows and their stages, shared by business_info and available_stages
+business_data_cache = TieredCache(
+    'business_data',
+    max_entries=Config.BUSINESS_CACHE_MAX_ENTRIES,
+    local_ttl=Config.BUSINESS_CACHE_LOCAL_TTL,
+    redis_ttl=Config.BUSINESS_CACHE_REDIS_TTL
+)
+
 class TemplateVariableProvider:
     """Provider for template variables."""
     
     _providers = {}
     _provider_metadata = {}
+    _data_loaders = {}
     
     @classmethod
-    def register_provider(cls, variable_name: str, description: str = None, auth_requirement: str = None):
+    def register_provider(
+        cls,
+        variable_name: str,
+        description: str = None,
+        auth_requirement: str = None,
+        requires: Optional[Iterable[str]] = None
+    ):
         """
         Decorator to register a provider function for a template variable.
         
+        Providers are called with the context entries matching their parameter
+        names (conn, business_id, conversation_id, ..., or context for the whole
+        context dict), plus any data keys they declare in requires.
+        
         Args:
             variable_name: Name of the variable
             description: Optional description of the variable
             auth_requirement: Optional authentication requirement
+            requires: Data keys the provider reads from registered data loaders.
+                An empty tuple marks a provider that does no I/O; None (the
+                default) means the provider runs its own queries.
             
         Returns:
             Decorator function
@@ -38,11 +80,41 @@ class TemplateVariableProvider:
             cls._providers[variable_name] = wrapper
             cls._provider_metadata[variable_name] = {
                 'description': description,
-                'auth_requirement': auth_requirement
+                'auth_requirement': auth_requirement,
+                'requires': tuple(requires) if requires is not None else None,
+                'parameters': tuple(inspect.signature(provider_func).parameters)
             }
             return wrapper
         return decorator
     
+    @classmethod
+    def register_data_loader(cls, *data_keys: str):
+        """
+        Decorator to register a loader for data shared between providers.
+        
+        The loader is called at most once per generate_variable_values call as
+        loader(conn, context) and must return a dict with a value for each of
+        the data keys it is registered for.
+        
+        Args:
+            *data_keys: Data keys the loader provides
+            
+        Returns:
+            Decorator function
+        """
+        def decorator(loader_func: Callable):
+            for key in data_keys:
+                cls._data_loaders[key] = loader_func
+            return loader_func
+        return decorator
+    
+    @classmethod
+    def _call_provider(cls, variable_name: str, context: Dict[str, Any]) -> Any:
+        """Call a provider with the context entries named in its signature."""
+        parameters = cls._provider_metadata[variable_name]['parameters']
+        kwargs = {name: context[name] for name in parameters if name in context}
+        return cls._providers[variable_name](**kwargs)
+    
     @classmethod
     def is_variable_registered(cls, variable_name: str) -> bool:
         """
@@ -78,7 +150,7 @@ class TemplateVariableProvider:
         if variable_name not in cls._providers:
             raise KeyError(f"No provider registered for variable: {variable_name}")
             
-        return cls._providers[variable_name](context)
+        return cls._call_provider(variable_name, dict(context, context=context))
     
     @classmethod
     def extract_variables_from_template(cls, template_content: str) -> Set[str]:
@@ -91,9 +163,7 @@ class TemplateVariableProvider:
         Returns:
             Set of variable names found in the template
         """
-        import re
-        pattern = r'\{([a-zA-Z_][a-zA-Z0-9_]*)\}'
-        return set(re.findall(pattern, template_content))
+        return set(compile_template(template_content).variables)
     
     @classmethod
     def validate_template_variables(cls, template_content: str) -> Dict[str, bool]:
@@ -117,11 +187,20 @@ class TemplateVariableProvider:
         user_id: str, 
         conversation_id: str, 
         message_content: str,
-        template_vars: Optional[Set[str]] = None
+        template_vars: Optional[Set[str]] = None,
+        db_pool=None,
+        max_workers: int = 4
     ) -> Dict[str, Any]:
         """
         Generate values for all requested variables.
         
+        Variables are resolved in two phases. First every data loader needed by
+        the requested providers runs once, together with providers that run
+        their own queries. When db_pool is given and there is more than one of
+        these, they run concurrently, each on its own pooled connection.
+        Then the providers that declared their data are formatted from the
+        shared results without touching the database.
+        
         Args:
             conn: Database connection
             business_id: UUID of the business
@@ -129,6 +208,8 @@ class TemplateVariableProvider:
             conversation_id: UUID of the conversation
             message_content: Content of the current message
             template_vars: Optional set of specific variable names to generate
+            db_pool: Optional connection pool (getconn/putconn) for concurrent loading
+            max_workers: Maximum number of concurrent loads when db_pool is given
             
         Returns:
             Dictionary mapping variable names to their values
@@ -146,44 +227,323 @@ class TemplateVariableProvider:
         }
         
         # Get variables to process
-        variables_to_process = template_vars or cls._providers.keys()
+        variables_to_process = [
+            var_name for var_name in (template_vars or list(cls._providers.keys()))
+            if cls.is_variable_registered(var_name)
+        ]
         
-        # Generate values for each variable
+        # Split providers into ones reading shared data and ones doing their own I/O
+        declared, undeclared, loaders = [], [], []
         for var_name in variables_to_process:
+            requires = cls._provider_metadata[var_name]['requires']
+            if requires is None:
+                undeclared.append(var_name)
+                continue
+            declared.append(var_name)
+            for key in requires:
+                loader = cls._data_loaders.get(key)
+                if loader is None:
+                    log.warning(f"No data loader registered for '{key}' required by {var_name}")
+                elif loader not in loaders:
+                    loaders.append(loader)
+        
+        tasks = [('loader', loader) for loader in loaders] + [('provider', name) for name in undeclared]
+        log.debug(
+            f"Resolving {len(variables_to_process)} variables with {len(loaders)} data loads "
+            f"and {len(undeclared)} standalone providers"
+        )
+        
+        # Phase 1: shared data loads and standalone providers
+        shared_data = {}
+        for (kind, target), (ok, result) in zip(tasks, cls._run_io_tasks(conn, db_pool, base_context, tasks, max_workers)):
+            if kind == 'loader':
+                if ok:
+                    shared_data.update(result)
+            else:
+                variable_values[target] = result if ok else None
+        
+        # Phase 2: providers formatted from the shared data. Data that failed to
+        # load is left out so the provider can fall back to its own query.
+        context = dict(base_context, **shared_data)
+        context['context'] = context
+        for var_name in declared:
             try:
-                if cls.is_variable_registered(var_name):
-                    variable_values[var_name] = cls.get_variable_value(var_name, base_context)
+                variable_values[var_name] = cls._call_provider(var_name, context)
             except Exception as e:
                 log.error(f"Error generating value for variable {var_name}: {str(e)}")
                 variable_values[var_name] = None
         
         return variable_values
+    
+    @classmethod
+    def render_template(
+        cls,
+        conn,
+        template_content: str,
+        business_id: str,
+        user_id: str,
+        conversation_id: str,
+        message_content: str,
+        template_id: Optional[str] = None,
+        db_pool=None
+    ) -> str:
+        """
+        Render a template, running only the providers it references.
+        
+        Args:
+            conn: Database connection
+            template_content: The template text
+            business_id: UUID of the business
+            user_id: UUID of the user
+            conversation_id: UUID of the conversation
+            message_content: Content of the current message
+            template_id: Optional template id used for the compile cache
+            db_pool: Optional connection pool for concurrent loading
+            
+        Returns:
+            Rendered template text
+        """
+        compiled = compile_template(template_content, template_id)
+        if not compiled.variables:
+            return compiled.render({})
+        values = cls.generate_variable_values(
+            conn, business_id, user_id, conversation_id, message_content,
+            template_vars=set(compiled.variables), db_pool=db_pool
+        )
+        return compiled.render({name: value for name, value in values.items() if value is not None})
+    
+    @classmethod
+    def _run_io_task(cls, kind: str, target, conn, base_context: Dict[str, Any]) -> tuple:
+        """Run one data loader or standalone provider, returning (ok, result)."""
+        context = dict(base_context, conn=conn)
+        context['context'] = context
+        try:
+            if kind == 'loader':
+                return True, target(conn, context)
+            return True, cls._call_provider(target, context)
+        except Exception as e:
+            name = getattr(target, '__name__', target)
+            log.error(f"Error generating value for {name}: {str(e)}")
+            return False, None
+    
+    @classmethod
+    def _run_io_tasks(cls, conn, db_pool, base_context: Dict[str, Any], tasks: List[tuple], max_workers: int) -> List[tuple]:
+        """Run I/O tasks, concurrently on pooled connections when a pool is available."""
+        if db_pool is None or len(tasks) < 2:
+            return [cls._run_io_task(kind, target, conn, base_context) for kind, target in tasks]
+        
+        def run_pooled(kind, target):
+            try:
+                task_conn = db_pool.getconn()
+            except Exception as e:
+                log.warning(f"Could not get a pooled connection, falling back to the shared one: {str(e)}")
+                return None
+            try:
+                return cls._run_io_task(kind, target, task_conn, base_context)
+            finally:
+                db_pool.putconn(task_conn)
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+            results = list(executor.map(lambda task: run_pooled(*task), tasks))
+        
+        # Anything that could not get its own connection runs on the shared one
+        return [
+            result if result is not None else cls._run_io_task(kind, target, conn, base_context)
+            for (kind, target), result in zip(tasks, results)
+        ]
+
+def load_recent_messages(conn, conversation_id: str, limit: int = RECENT_MESSAGE_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Get the most recent messages of a conversation in chronological order.
+    
+    Served from the conversation's message window, falling back to the
+    database (and seeding the window) on a miss.
+    
+    Args:
+        conn: Database connection used on a miss
+        conversation_id: UUID of the conversation
+        limit: Maximum number of messages to return
+        
+    Returns:
+        List of message dicts with sanitized message_content, sender_type and created_at
+    """
+    return message_window.get_or_load(
+        conversation_id,
+        limit,
+        lambda count: query_recent_messages(conn, conversation_id, count)
+    )
+
+def query_recent_messages(conn, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Fetch the most recent messages of a conversation from the database, oldest first."""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT message_id, message_content, sender_type, created_at
+            FROM messages
+            WHERE conversation_id = %s
+            ORDER BY created_at DESC
+            LIMIT %s
+            """,
+            (conversation_id, limit)
+        )
+        rows = cursor.fetchall()
+    return [dict(row) for row in reversed(rows)]
+
+# Business row with its stages; {param} is the driver's placeholder for the business ID
+BUSINESS_WITH_STAGES_QUERY = """
+    SELECT
+        b.business_id,
+        b.api_key,
+        b.internal_api_key,
+        b.owner_id,
+        b.business_name,
+        b.business_description,
+        b.address,
+        b.phone_number,
+        b.website,
+        b.first_stage_id,
+        b.facebook_page_id,
+        b.created_at,
+        b.updated_at,
+        b.business_information,
+        COALESCE(
+            (SELECT json_agg(
+                json_build_object(
+                    'stage_name', s.stage_name,
+                    'stage_description', s.stage_description
+                ) ORDER BY s.stage_name)
+             FROM stages s
+             WHERE s.business_id = b.business_id),
+            '[]'::json
+        ) AS stages
+    FROM businesses b
+    WHERE b.business_id = {param}
+"""
+
+def load_business_with_stages(conn, business_id: str) -> Dict[str, Any]:
+    """
+    Fetch a business and its stages in a single query.
+    
+    Args:
+        conn: Database connection
+        business_id: UUID of the business
+        
+    Returns:
+        Dict with 'business' (empty dict if not found) and 'stages'
+        (list of dicts with stage_name and stage_description). Dates and
+        UUIDs are converted to strings so the result can be cached in Redis.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(BUSINESS_WITH_STAGES_QUERY.format(param='%s'), (business_id,))
+        row = cursor.fetchone()
+    return _business_with_stages(row)
+
+async def aload_business_with_stages(connection_manager, business_id: str) -> Dict[str, Any]:
+    """load_business_with_stages() through an AsyncConnectionManager."""
+    row = await connection_manager.fetchrow(BUSINESS_WITH_STAGES_QUERY.format(param='$1'), business_id)
+    return _business_with_stages(row)
+
+def _business_with_stages(row) -> Dict[str, Any]:
+    if not row:
+        return {'business': {}, 'stages': []}
+    business = {key: _json_safe(value) for key, value in dict(row).items()}
+    stages = business.pop('stages') or []
+    # asyncpg returns json columns as text
+    if isinstance(stages, str):
+        stages = json.loads(stages)
+    return {'business': business, 'stages': stages}
+
+def format_business_info(business: Dict[str, Any]) -> str:
+    """Prompt text of a business row: one line per field that is set."""
+    lines = [
+        ('Name', business.get('business_name')),
+        ('Description', business.get('business_description')),
+        ('Additional Information', business.get('business_information')),
+        ('Address', business.get('address')),
+        ('Phone', business.get('phone_number')),
+        ('Website', business.get('website')),
+    ]
+    return '\n'.join(f"{label}: {value}" for label, value in lines if value)
+
+def _json_safe(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+def get_business_with_stages(conn, business_id: str) -> Dict[str, Any]:
+    """
+    Get a business and its stages through the business data cache.
+    
+    Args:
+        conn: Database connection used on a cache miss
+        business_id: UUID of the business
+        
+    Returns:
+        Same shape as load_business_with_stages
+    """
+    return business_data_cache.get_or_load(
+        business_id,
+        lambda: load_business_with_stages(conn, business_id)
+    )
+
+async def aget_business_with_stages(connection_manager, business_id: str) -> Dict[str, Any]:
+    """get_business_with_stages() for async callers, loading through an AsyncConnectionManager."""
+    return await business_data_cache.aget_or_load(
+        business_id,
+        lambda: aload_business_with_stages(connection_manager, business_id)
+    )
+
+def invalidate_business_data(business_id: str) -> None:
+    """
+    Drop cached business and stage data after a write.
+    
+    Args:
+        business_id: UUID of the business whose row or stages changed
+    """
+    if not business_id:
+        return
+    try:
+        business_data_cache.invalidate(str(business_id))
+    except Exception as e:
+        log.error(f"Error invalidating business data cache for {business_id}: {str(e)}")
 
 # Register standard variable providers
 def register_standard_providers():
     """Register standard variable providers."""
     
-    @TemplateVariableProvider.register_provider('timestamp')
+    @TemplateVariableProvider.register_data_loader('messages')
+    def messages_loader(conn, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Load the recent messages shared by the history variables."""
+        return {'messages': load_recent_messages(conn, context['conversation_id'])}
+    
+    @TemplateVariableProvider.register_data_loader('business', 'stages')
+    def business_loader(conn, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Load the business row and its stages shared by the business variables."""
+        return get_business_with_stages(conn, context['business_id'])
+    
+    @TemplateVariableProvider.register_provider('timestamp', requires=())
     def timestamp_provider(context: Dict[str, Any]) -> str:
         """Provide current timestamp."""
         return context['timestamp'].isoformat()
     
-    @TemplateVariableProvider.register_provider('business_id')
+    @TemplateVariableProvider.register_provider('business_id', requires=())
     def business_id_provider(context: Dict[str, Any]) -> str:
         """Provide business ID."""
         return context['business_id']
     
-    @TemplateVariableProvider.register_provider('user_id')
+    @TemplateVariableProvider.register_provider('user_id', requires=())
     def user_id_provider(context: Dict[str, Any]) -> str:
         """Provide user ID."""
         return context['user_id']
     
-    @TemplateVariableProvider.register_provider('conversation_id')
+    @TemplateVariableProvider.register_provider('conversation_id', requires=())
     def conversation_id_provider(context: Dict[str, Any]) -> str:
         """Provide conversation ID."""
         return context['conversation_id']
     
-    @TemplateVariableProvider.register_provider('message_content')
+    @TemplateVariableProvider.register_provider('message_content', requires=())
     def message_content_provider(context: Dict[str, Any]) -> str:
         """Provide message content."""
         return context['message_content']
@@ -8,5 +8,13 @@ variable handling, rendering, and validation.
 from .variable_provider import TemplateVariableProvider
 from .renderer import TemplateRenderer
 from .validator import TemplateValidator
+from .compiler import CompiledTemplate, compile_template, render_template
 
-__all__ = ['TemplateVariableProvider', 'TemplateRenderer', 'TemplateValidator'] 
\ No newline at end of file
+__all__ = [
+    'TemplateVariableProvider',
+    'TemplateRenderer',
+    'TemplateValidator',
+    'CompiledTemplate',
+    'compile_template',
+    'render_template'
+] 
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Template compiler.
+
+Templates are parsed once into literal and placeholder segments and cached by
+template id and content hash. Rendering is a single pass that fills the
+placeholder slots and joins the parts, instead of one str.replace over the
+whole template per context key.
+
+Both placeholder styles used across the code base are recognised:
+``{name}`` and ``{{name}}`` (whitespace inside double braces is allowed).
+Placeholders without a value in the context are left as written.
+"""
+
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+PLACEHOLDER_PATTERN = re.compile(
+    r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}|\{([A-Za-z_][A-Za-z0-9_]*)\}'
+)
+
+# Maximum number of compiled templates kept in memory
+MAX_CACHED_TEMPLATES = 512
+
+
+class CompiledTemplate:
+    """A template parsed into literal and placeholder segments."""
+
+    __slots__ = ('content', '_parts', '_slots', 'variables')
+
+    def __init__(self, content: str):
+        """
+        Parse template content.
+
+        Args:
+            content: Template text
+        """
+        self.content = content
+        parts: List[str] = []
+        slots: List[Tuple[int, str, str]] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(content):
+            if match.start() > position:
+                parts.append(content[position:match.start()])
+            slots.append((len(parts), match.group(1) or match.group(2), match.group(0)))
+            parts.append(match.group(0))
+            position = match.end()
+        if position < len(content):
+            parts.append(content[position:])
+
+        self._parts = tuple(parts)
+        self._slots = tuple(slots)
+        self.variables: FrozenSet[str] = frozenset(name for _, name, _ in slots)
+
+    def render(self, context: Dict[str, Any]) -> str:
+        """
+        Render the template.
+
+        Args:
+            context: Variable values; values are converted with str()
+
+        Returns:
+            Rendered text
+        """
+        if not self._slots:
+            return self.content
+        parts = list(self._parts)
+        for index, name, raw in self._slots:
+            if name in context:
+                parts[index] = str(context[name])
+        return ''.join(parts)
+
+    def missing_variables(self, context: Dict[str, Any]) -> FrozenSet[str]:
+        """Get the variables the template uses that the context does not provide."""
+        return frozenset(name for name in self.variables if name not in context)
+
+
+_cache: "OrderedDict[Tuple[str, str], CompiledTemplate]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def compile_template(content: str, template_id: Optional[str] = None) -> CompiledTemplate:
+    """
+    Get the compiled form of a template, compiling it on first use.
+
+    Args:
+        content: Template text
+        template_id: Optional template id; combined with a hash of the content
+            so an edited template is recompiled
+
+    Returns:
+        The compiled template
+    """
+    content = content or ''
+    key = (str(template_id or ''), hashlib.sha1(content.encode('utf-8')).hexdigest())
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            return compiled
+
+    compiled = CompiledTemplate(content)
+    with _cache_lock:
+        _cache[key] = compiled
+        while len(_cache) > MAX_CACHED_TEMPLATES:
+            _cache.popitem(last=False)
+    log.debug(f"Compiled template {template_id or '<inline>'} with variables {sorted(compiled.variables)}")
+    return compiled
+
+
+def render_template(content: str, context: Dict[str, Any], template_id: Optional[str] = None) -> str:
+    """
+    Render template text with the given context.
+
+    Args:
+        content: Template text
+        context: Variable values
+        template_id: Optional template id used for the compile cache
+
+    Returns:
+        Rendered text
+    """
+    return compile_template(content, template_id).render(context)
+
+
+def clear_template_cache() -> None:
+    """Drop every compiled template."""
+    with _cache_lock:
+        _cache.clear()
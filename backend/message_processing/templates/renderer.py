@@ -8,6 +8,7 @@ and conditional logic.
 import logging
 from typing import Dict, Any, List, Optional
 from .variable_provider import TemplateVariableProvider
+from .compiler import compile_template
 
 log = logging.getLogger(__name__)
 
@@ -25,12 +26,7 @@ class TemplateRenderer:
             if not template_text:
                 return ''
                 
-            # Replace variables in template
-            for key, value in context.items():
-                placeholder = f"{{{{{key}}}}}"
-                template_text = template_text.replace(placeholder, str(value))
-                
-            return template_text
+            return compile_template(template_text, content.get('template_id')).render(context)
             
         except Exception as e:
             log.error(f"Text template rendering failed: {str(e)}")
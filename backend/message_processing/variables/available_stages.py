@@ -8,7 +8,7 @@ for a business from the database.
 from typing import Dict, Any, List
 from .base_provider import BaseVariableProvider
 from .database_utils import DatabaseUtils
-from backend.message_processing.template_variables import TemplateVariableProvider
+from backend.message_processing.template_variables import TemplateVariableProvider, get_business_with_stages
 import logging
 
 log = logging.getLogger(__name__)
@@ -16,36 +16,29 @@ log = logging.getLogger(__name__)
 @TemplateVariableProvider.register_provider(
     'available_stages',
     description='Returns a list of available conversation stages for a business',
-    auth_requirement='business_key'
+    auth_requirement='business_key',
+    requires=('stages',)
 )
-def provide_available_stages(conn, business_id: str, **kwargs) -> str:
+def provide_available_stages(conn, business_id: str, stages=None, **kwargs) -> str:
     """
     Generate a formatted list of available stages for a business.
     
     Args:
         conn: Database connection
         business_id: ID of the business
+        stages: Stages already loaded, ordered by name; read through the
+            business data cache when not given
         
     Returns:
         Formatted string with available stages
     """
     try:
-        if not conn:
-            log.error("No database connection provided")
-            return "Error: No database connection"
+        if stages is None:
+            if not conn:
+                log.error("No database connection provided")
+                return "Error: No database connection"
+            stages = get_business_with_stages(conn, business_id)['stages']
             
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT stage_name, stage_description
-            FROM stages 
-            WHERE business_id = %s
-            ORDER BY stage_name
-            """,
-            (business_id,)
-        )
-        
-        stages = cursor.fetchall()
         if not stages:
             return "No stages available"
             
@@ -1,4 +1,4 @@
-from backend.message_processing.template_variables import TemplateVariableProvider
+from backend.message_processing.template_variables import TemplateVariableProvider, load_recent_messages
 import logging
 
 log = logging.getLogger(__name__)
@@ -6,14 +6,17 @@ log = logging.getLogger(__name__)
 @TemplateVariableProvider.register_provider(
     'conversation_history',
     description='Provides the history of messages in a conversation',
-    auth_requirement='business_key'
+    auth_requirement='business_key',
+    requires=('messages',)
 )
-def provide_conversation_history(conn, conversation_id: str, **kwargs) -> str:
+def provide_conversation_history(conn, conversation_id: str, messages=None, **kwargs) -> str:
     """
     Generate a formatted conversation history.
     Args:
         conn: Database connection
         conversation_id: UUID of the conversation
+        messages: Recent messages already loaded in chronological order;
+            fetched from the database when not given
         **kwargs: Additional arguments including:
             - max_messages: Maximum number of messages to retrieve (default: 10)
             - include_timestamps: Whether to include timestamps (default: False)
@@ -21,23 +24,14 @@ def provide_conversation_history(conn, conversation_id: str, **kwargs) -> str:
         Formatted string with conversation messages
     """
     try:
-        if not conn:
-            log.error("No database connection provided")
-            return "Error: No database connection"
         max_messages = kwargs.get('max_messages', 10)
         include_timestamps = kwargs.get('include_timestamps', False)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT message_content, sender_type, created_at 
-            FROM messages 
-            WHERE conversation_id = %s 
-            ORDER BY created_at ASC
-            LIMIT %s
-            """,
-            (conversation_id, max_messages)
-        )
-        messages = cursor.fetchall()
+        if messages is None:
+            if not conn:
+                log.error("No database connection provided")
+                return "Error: No database connection"
+            messages = load_recent_messages(conn, conversation_id, max_messages)
+        messages = messages[-max_messages:] if max_messages else []
         if not messages:
             return "No conversation history"
         history = []
@@ -3,14 +3,21 @@ import os
 import hmac
 import hashlib
 import json
+import logging
 import requests
 from functools import wraps
+from backend.message_processing.ingestion_queue import get_ingestion_queue
+
+log = logging.getLogger(__name__)
 
 # WhatsApp API credentials
 WHATSAPP_TOKEN = os.getenv('WHATSAPP_TOKEN')
 WHATSAPP_PHONE_NUMBER_ID = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
 WHATSAPP_VERIFY_TOKEN = os.getenv('WHATSAPP_VERIFY_TOKEN')
 
+# Seconds a send may take before it fails and the worker retries it
+WHATSAPP_SEND_TIMEOUT = float(os.getenv('WHATSAPP_SEND_TIMEOUT', '10'))
+
 def verify_whatsapp_token(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -43,10 +50,10 @@ def send_whatsapp_message(recipient_id, response):
     }
     
     try:
-        result = requests.post(url, headers=headers, json=response)
+        result = requests.post(url, headers=headers, json=response, timeout=WHATSAPP_SEND_TIMEOUT)
         return result.json()
     except Exception as e:
-        print(f"Error sending WhatsApp message: {e}")
+        log.error(f"Error sending WhatsApp message: {e}")
         return None
 
 def setup_whatsapp_routes(app):
@@ -56,19 +63,34 @@ def setup_whatsapp_routes(app):
         if request.method == 'POST':
             output = request.get_json()
             
-            # Handle WhatsApp message
+            # Enqueue WhatsApp messages; ingestion_worker.py answers them
+            events = []
             if 'entry' in output:
                 for entry in output['entry']:
                     for change in entry.get('changes', []):
                         if 'value' in change:
                             value = change['value']
                             if 'messages' in value:
+                                phone_number_id = value.get('metadata', {}).get('phone_number_id', WHATSAPP_PHONE_NUMBER_ID)
                                 for message in value['messages']:
                                     if message['type'] == 'text':
-                                        sender_id = message['from']
-                                        message_text = message['text']['body']
-                                        response = handle_whatsapp_message(sender_id, message_text)
-                                        send_whatsapp_message(sender_id, response)
+                                        events.append({
+                                            'platform': 'whatsapp',
+                                            'sender_id': message['from'],
+                                            'recipient_id': phone_number_id,
+                                            'content': message['text']['body'],
+                                            'platform_message_id': message.get('id'),
+                                        })
+
+            if events:
+                try:
+                    queue = get_ingestion_queue()
+                    for event in events:
+                        queue.enqueue(event)
+                except Exception as e:
+                    # Not acknowledged, so WhatsApp redelivers; duplicates are dropped by message ID
+                    log.error(f"Failed to enqueue WhatsApp webhook events: {str(e)}", exc_info=True)
+                    return jsonify({'status': 'error'}), 503
             
             return jsonify({'status': 'success'})
         
@@ -0,0 +1,9 @@
+-- Migration: Indexes for keyset-paginated conversation and message listing
+-- Purpose: GET /api/conversations pages by (last_updated, conversation_id) per business,
+-- and GET /api/conversations/<id>/messages pages by (created_at, message_id) per conversation
+
+CREATE INDEX IF NOT EXISTS idx_conversations_business_last_updated
+ON conversations (business_id, last_updated DESC, conversation_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created_at
+ON messages (conversation_id, created_at DESC, message_id DESC);
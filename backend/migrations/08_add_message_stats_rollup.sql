@@ -0,0 +1,163 @@
+-- Migration: Incrementally maintained message counters
+-- Purpose: Conversation listings and user message counts read small rollup
+-- tables instead of aggregating the messages table on every request.
+-- Statement-level triggers keep the rollups current for every writer; run
+-- SELECT rebuild_message_stats(); (or backend/tools/rebuild_message_stats.py)
+-- once after applying this migration to backfill existing history.
+
+CREATE TABLE IF NOT EXISTS conversation_stats (
+    conversation_id UUID PRIMARY KEY REFERENCES conversations(conversation_id) ON DELETE CASCADE,
+    business_id UUID NOT NULL,
+    total_messages INTEGER NOT NULL DEFAULT 0,
+    user_messages INTEGER NOT NULL DEFAULT 0,
+    agent_messages INTEGER NOT NULL DEFAULT 0,
+    last_message_time TIMESTAMP WITH TIME ZONE,
+    last_user_message TEXT,
+    last_agent_message TEXT,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_stats_business_id
+ON conversation_stats (business_id);
+
+CREATE TABLE IF NOT EXISTS user_message_stats (
+    business_id UUID NOT NULL,
+    user_id UUID NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_message_time TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (business_id, user_id)
+);
+
+-- Recompute the rollup rows of the given conversations from messages
+CREATE OR REPLACE FUNCTION refresh_conversation_stats(p_conversation_ids UUID[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM conversation_stats WHERE conversation_id = ANY(p_conversation_ids);
+
+    INSERT INTO conversation_stats (
+        conversation_id, business_id, total_messages, user_messages, agent_messages,
+        last_message_time, last_user_message, last_agent_message, updated_at
+    )
+    SELECT
+        m.conversation_id,
+        c.business_id,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE m.sender_type <> 'assistant'),
+        COUNT(*) FILTER (WHERE m.sender_type = 'assistant'),
+        MAX(m.created_at),
+        (array_agg(m.message_content ORDER BY m.created_at DESC) FILTER (WHERE m.sender_type <> 'assistant'))[1],
+        (array_agg(m.message_content ORDER BY m.created_at DESC) FILTER (WHERE m.sender_type = 'assistant'))[1],
+        NOW()
+    FROM messages m
+    JOIN conversations c ON c.conversation_id = m.conversation_id
+    WHERE m.conversation_id = ANY(p_conversation_ids)
+    GROUP BY m.conversation_id, c.business_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Add the inserted rows to both rollups, one upsert per conversation and user
+CREATE OR REPLACE FUNCTION message_stats_after_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO conversation_stats AS s (
+        conversation_id, business_id, total_messages, user_messages, agent_messages,
+        last_message_time, last_user_message, last_agent_message, updated_at
+    )
+    SELECT
+        n.conversation_id,
+        c.business_id,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE n.sender_type <> 'assistant'),
+        COUNT(*) FILTER (WHERE n.sender_type = 'assistant'),
+        MAX(n.created_at),
+        (array_agg(n.message_content ORDER BY n.created_at DESC) FILTER (WHERE n.sender_type <> 'assistant'))[1],
+        (array_agg(n.message_content ORDER BY n.created_at DESC) FILTER (WHERE n.sender_type = 'assistant'))[1],
+        NOW()
+    FROM new_messages n
+    JOIN conversations c ON c.conversation_id = n.conversation_id
+    GROUP BY n.conversation_id, c.business_id
+    ON CONFLICT (conversation_id) DO UPDATE SET
+        total_messages = s.total_messages + EXCLUDED.total_messages,
+        user_messages = s.user_messages + EXCLUDED.user_messages,
+        agent_messages = s.agent_messages + EXCLUDED.agent_messages,
+        last_message_time = GREATEST(s.last_message_time, EXCLUDED.last_message_time),
+        last_user_message = COALESCE(EXCLUDED.last_user_message, s.last_user_message),
+        last_agent_message = COALESCE(EXCLUDED.last_agent_message, s.last_agent_message),
+        updated_at = NOW();
+
+    INSERT INTO user_message_stats AS s (business_id, user_id, message_count, last_message_time)
+    SELECT c.business_id, n.user_id, COUNT(*), MAX(n.created_at)
+    FROM new_messages n
+    JOIN conversations c ON c.conversation_id = n.conversation_id
+    WHERE n.user_id IS NOT NULL
+    GROUP BY c.business_id, n.user_id
+    ON CONFLICT (business_id, user_id) DO UPDATE SET
+        message_count = s.message_count + EXCLUDED.message_count,
+        last_message_time = GREATEST(s.last_message_time, EXCLUDED.last_message_time);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deletes are rare (whole conversations); recompute the affected rows.
+-- Messages removed by ON DELETE CASCADE after their conversation is gone
+-- can't be attributed to a business; rebuild_message_stats() corrects that.
+CREATE OR REPLACE FUNCTION message_stats_after_delete() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_conversation_stats(ARRAY(SELECT DISTINCT conversation_id FROM old_messages));
+
+    UPDATE user_message_stats s
+    SET message_count = s.message_count - d.removed
+    FROM (
+        SELECT c.business_id, o.user_id, COUNT(*) AS removed
+        FROM old_messages o
+        JOIN conversations c ON c.conversation_id = o.conversation_id
+        WHERE o.user_id IS NOT NULL
+        GROUP BY c.business_id, o.user_id
+    ) d
+    WHERE s.business_id = d.business_id AND s.user_id = d.user_id;
+
+    DELETE FROM user_message_stats WHERE message_count <= 0;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS messages_stats_insert ON messages;
+CREATE TRIGGER messages_stats_insert
+AFTER INSERT ON messages
+REFERENCING NEW TABLE AS new_messages
+FOR EACH STATEMENT EXECUTE FUNCTION message_stats_after_insert();
+
+DROP TRIGGER IF EXISTS messages_stats_delete ON messages;
+CREATE TRIGGER messages_stats_delete
+AFTER DELETE ON messages
+REFERENCING OLD TABLE AS old_messages
+FOR EACH STATEMENT EXECUTE FUNCTION message_stats_after_delete();
+
+-- Rebuild both rollups from messages, for all businesses or one
+CREATE OR REPLACE FUNCTION rebuild_message_stats(p_business_id UUID DEFAULT NULL) RETURNS void AS $$
+BEGIN
+    PERFORM refresh_conversation_stats(ARRAY(
+        SELECT conversation_id FROM conversations
+        WHERE p_business_id IS NULL OR business_id = p_business_id
+    ));
+    IF p_business_id IS NULL THEN
+        -- Drop rows of conversations that no longer exist or have no messages
+        DELETE FROM conversation_stats s
+        WHERE NOT EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = s.conversation_id);
+    END IF;
+
+    DELETE FROM user_message_stats WHERE p_business_id IS NULL OR business_id = p_business_id;
+    INSERT INTO user_message_stats (business_id, user_id, message_count, last_message_time)
+    SELECT c.business_id, m.user_id, COUNT(*), MAX(m.created_at)
+    FROM messages m
+    JOIN conversations c ON c.conversation_id = m.conversation_id
+    WHERE m.user_id IS NOT NULL
+      AND (p_business_id IS NULL OR c.business_id = p_business_id)
+    GROUP BY c.business_id, m.user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE conversation_stats IS
+'Per-conversation message counts and last-message previews, maintained by triggers on messages';
+COMMENT ON TABLE user_message_stats IS
+'Per-business, per-user message counts, maintained by triggers on messages';
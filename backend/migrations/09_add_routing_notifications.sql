@@ -0,0 +1,40 @@
+-- Migration: Change notifications for the webhook routing table
+-- Purpose: Webhook workers keep platform identifiers -> business and external
+-- sender ids -> user in memory (backend/message_processing/routing_table.py).
+-- Triggers publish on the routing_changes channel whenever a mapping changes,
+-- for every writer, so the workers reload without polling the database.
+
+ALTER TABLE businesses ADD COLUMN IF NOT EXISTS whatsapp_phone_number_id TEXT UNIQUE;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS external_id TEXT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS platform TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_users_external_id ON users (external_id);
+
+-- Any change to a business's routing columns reloads the business table
+CREATE OR REPLACE FUNCTION notify_business_routing_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('routing_changes', 'businesses');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS businesses_routing_change ON businesses;
+CREATE TRIGGER businesses_routing_change
+AFTER INSERT OR DELETE OR UPDATE OF facebook_page_id, whatsapp_phone_number_id, internal_api_key
+ON businesses
+FOR EACH STATEMENT EXECUTE FUNCTION notify_business_routing_change();
+
+-- New users are picked up on a cache miss; removed or re-linked ones must be dropped
+CREATE OR REPLACE FUNCTION notify_user_routing_change() RETURNS trigger AS $$
+BEGIN
+    IF OLD.external_id IS NOT NULL THEN
+        PERFORM pg_notify('routing_changes', 'user:' || OLD.external_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_routing_change ON users;
+CREATE TRIGGER users_routing_change
+AFTER DELETE OR UPDATE OF external_id ON users
+FOR EACH ROW EXECUTE FUNCTION notify_user_routing_change();
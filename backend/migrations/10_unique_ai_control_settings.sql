@@ -0,0 +1,25 @@
+-- Migration: One AI control row per conversation and per user
+-- Purpose: AIControlService writes stops and resumes behind with
+-- INSERT ... ON CONFLICT, which needs unique indexes on the entity columns.
+-- Duplicate rows are collapsed to the most recently updated one first.
+
+DELETE FROM ai_control_settings a
+USING ai_control_settings b
+WHERE a.user_id IS NOT NULL
+  AND a.user_id = b.user_id
+  AND (a.updated_at, a.id::text) < (b.updated_at, b.id::text);
+
+DELETE FROM ai_control_settings a
+USING ai_control_settings b
+WHERE a.conversation_id IS NOT NULL
+  AND a.conversation_id = b.conversation_id
+  AND (a.updated_at, a.id::text) < (b.updated_at, b.id::text);
+
+DROP INDEX IF EXISTS idx_ai_control_user_id;
+DROP INDEX IF EXISTS idx_ai_control_conversation_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_control_user_id
+ON ai_control_settings (user_id) WHERE user_id IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_control_conversation_id
+ON ai_control_settings (conversation_id) WHERE conversation_id IS NOT NULL;
@@ -0,0 +1,18 @@
+-- Migration: Watermarks for incremental conversation summaries
+-- Purpose: ConversationSummaryService folds only the messages after the
+-- watermark into the previous summary, and serves the stored summary while
+-- no newer message exists. Messages are ordered by (created_at, message_id),
+-- matching idx_messages_conversation_created_at from migration 07.
+
+ALTER TABLE conversations
+ADD COLUMN IF NOT EXISTS summary_watermark_id UUID,
+ADD COLUMN IF NOT EXISTS summary_watermark_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS summary_message_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS summary_updated_at TIMESTAMP WITH TIME ZONE;
+
+COMMENT ON COLUMN conversations.summary_watermark_id IS
+'Last message folded into conversation_summary; NULL means the summary, if any, is rebuilt from the first message';
+
+COMMENT ON COLUMN conversations.summary_message_count IS
+'Number of messages folded into conversation_summary';
+
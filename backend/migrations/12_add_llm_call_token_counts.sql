@@ -0,0 +1,15 @@
+-- Migration: Prompt token counts on llm_calls
+-- Purpose: Prompts are assembled within per-section token budgets by
+-- ContextAssembler. Every call records the size of its prompt and the token
+-- count of each section (system, business_info, history, extracted_data,
+-- input), so prompt growth can be tracked per business and call type.
+
+ALTER TABLE llm_calls
+ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER,
+ADD COLUMN IF NOT EXISTS token_counts JSONB;
+
+COMMENT ON COLUMN llm_calls.prompt_tokens IS
+'Tokens in the prompt sent to the model, including chat message overhead';
+
+COMMENT ON COLUMN llm_calls.token_counts IS
+'Prompt token count per section, e.g. {"system": 812, "history": 430, "input": 25, "total": 1290}';
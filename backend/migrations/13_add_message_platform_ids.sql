@@ -0,0 +1,9 @@
+-- Migration: Platform message ids on messages
+-- Purpose: The ingestion worker retries an event when processing fails. A
+-- retry after the user message was saved must not save it again, so user
+-- messages from a platform keep their platform message id, which is unique.
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS platform_message_id TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_platform_message_id
+ON messages (platform_message_id) WHERE platform_message_id IS NOT NULL;
@@ -0,0 +1,16 @@
+-- Migration: One user per platform sender
+-- Purpose: The routing table creates users on a sender's first message
+-- (backend/message_processing/routing_table.py). Without a unique key, two
+-- workers handling that sender's first messages at once could both insert.
+-- The unique index lets the insert use ON CONFLICT, and covers the
+-- (platform, external_id) lookup, so the external_id index is no longer needed.
+-- Creating the index fails if duplicate senders already exist; merge them first.
+
+-- Senders created before the platform column were all Messenger senders and
+-- have no platform. Without it they would not match the (platform,
+-- external_id) lookup, and would get a second user on their next message.
+UPDATE users SET platform = 'facebook' WHERE external_id IS NOT NULL AND platform IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_platform_external_id ON users (platform, external_id);
+
+DROP INDEX IF EXISTS idx_users_external_id;
@@ -0,0 +1,424 @@
+"""
+Sliding-window rate limiting shared by the HTTP API and message processing.
+
+The message pipeline and flask-limiter count calls with one algorithm:
+
+- Each limit is a sliding window approximated by two fixed buckets: the
+  previous bucket's count is weighted by how much of it still overlaps the
+  window. Memory is two counters per key however high the limit.
+- One Lua script checks every limit of a call (e.g. per business and per
+  user) and, only if all of them allow it, counts the call in each. It returns
+  whether the call was allowed, the remaining quota and the seconds until a
+  denied call would be allowed, using the Redis clock so all workers agree.
+- The caller passes both bucket keys of each limit in KEYS, so the script
+  only touches keys it was given. Bucket keys expire after two windows.
+
+SlidingWindowStorage plugs the same script into flask-limiter as the
+sliding-window:// storage (with the moving-window strategy). If Redis is not
+configured or not reachable, the same algorithm runs on in-process counters.
+"""
+
+import time
+import math
+import logging
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from flask import g, request
+from flask_limiter.util import get_remote_address
+from limits.storage import MovingWindowSupport, Storage
+from redis.exceptions import NoScriptError
+
+log = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ratelimit:sw'
+
+# (key, limit, window in seconds)
+Rule = Tuple[str, int, float]
+
+# KEYS: current and previous bucket key of each limit, in pairs.
+# ARGV[1]: cost, then limit, window and current bucket start for each limit.
+# Returns {allowed, remaining, retry after}; retry after is "-1" if the cost
+# exceeds a limit and the call can never be allowed.
+SLIDING_WINDOW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local allowed = 1
+local remaining = nil
+local retry = 0
+local buckets = {}
+for i = 1, #KEYS / 2 do
+    local limit = tonumber(ARGV[i * 3 - 1])
+    local window = tonumber(ARGV[i * 3])
+    -- The caller picks the bucket; the Redis clock places the call within it
+    local elapsed = math.min(math.max(now - tonumber(ARGV[i * 3 + 1]), 0), window)
+    local current = tonumber(redis.call('GET', KEYS[i * 2 - 1])) or 0
+    local previous = tonumber(redis.call('GET', KEYS[i * 2])) or 0
+    local count = previous * (window - elapsed) / window + current
+    buckets[i] = {KEYS[i * 2 - 1], math.ceil(window * 2)}
+    if count + cost > limit then
+        allowed = 0
+        local wait
+        if cost > limit then
+            wait = -1
+        elseif current + cost <= limit then
+            -- Wait for the previous bucket's share to decay
+            wait = window * (1 - (limit - current - cost) / previous) - elapsed
+        else
+            -- Wait until the current bucket becomes the previous one and decays
+            wait = (window - elapsed) + window * (1 - (limit - cost) / current)
+        end
+        if wait < 0 or retry < 0 then
+            retry = -1
+        else
+            retry = math.max(retry, wait)
+        end
+    end
+    local left = math.floor(limit - count)
+    if remaining == nil or left < remaining then
+        remaining = left
+    end
+end
+if allowed == 1 then
+    for _, bucket in ipairs(buckets) do
+        redis.call('INCRBY', bucket[1], cost)
+        redis.call('EXPIRE', bucket[1], bucket[2])
+    end
+    remaining = remaining - cost
+end
+return {allowed, math.max(0, remaining or 0), tostring(retry)}
+"""
+
+# Fixed-window counter for flask-limiter's fixed-window strategies.
+# KEYS[1]: counter key. ARGV: amount, expiry in seconds, "1" to restart the
+# expiry on every call (elastic expiry).
+FIXED_WINDOW_SCRIPT = """
+local count = redis.call('INCRBY', KEYS[1], ARGV[1])
+if count == tonumber(ARGV[1]) or ARGV[3] == '1' then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return count
+"""
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a rate limit check."""
+    allowed: bool
+    # Calls left in the tightest window after this one
+    remaining: int
+    # Seconds until a denied call would be allowed; 0 if allowed, -1 if never
+    retry_after: float
+
+
+class _LocalWindows:
+    """In-process sliding windows, shared by every limiter in the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[int, float]] = {}  # bucket key -> (count, expires_at)
+
+    def _count(self, key: str, now: float) -> float:
+        count, expires_at = self._buckets.get(key, (0, now))
+        return count if expires_at > now else 0
+
+    def hit(self, rules: Sequence[Rule], cost: int) -> RateLimitResult:
+        with self._lock:
+            now = time.time()
+            allowed = True
+            remaining = None
+            retry = 0.0
+            buckets = []
+            for key, limit, window in rules:
+                bucket = math.floor(now / window)
+                elapsed = now - bucket * window
+                current = self._count(f"{key}:{bucket}", now)
+                previous = self._count(f"{key}:{bucket - 1}", now)
+                count = previous * (window - elapsed) / window + current
+                buckets.append((f"{key}:{bucket}", now + window * 2))
+                if count + cost > limit:
+                    allowed = False
+                    if cost > limit:
+                        wait = -1.0
+                    elif current + cost <= limit:
+                        wait = window * (1 - (limit - current - cost) / previous) - elapsed
+                    else:
+                        wait = (window - elapsed) + window * (1 - (limit - cost) / current)
+                    retry = -1.0 if wait < 0 or retry < 0 else max(retry, wait)
+                left = math.floor(limit - count)
+                remaining = left if remaining is None else min(remaining, left)
+            if allowed:
+                for bucket_key, expires_at in buckets:
+                    self._buckets[bucket_key] = (self._count(bucket_key, now) + cost, expires_at)
+                remaining -= cost
+                # Expired buckets are dropped as the process goes
+                if len(self._buckets) > 10000:
+                    self._buckets = {k: v for k, v in self._buckets.items() if v[1] > now}
+            return RateLimitResult(allowed, max(0, remaining or 0), retry)
+
+    def incr(self, key: str, expiry: float, amount: int, elastic_expiry: bool) -> int:
+        with self._lock:
+            now = time.time()
+            count = self._count(key, now)
+            expires_at = self._buckets[key][1] if count else now + expiry
+            if elastic_expiry:
+                expires_at = now + expiry
+            self._buckets[key] = (count + amount, expires_at)
+            return count + amount
+
+    def get(self, key: str) -> Tuple[int, float]:
+        """Count of a key and when it expires."""
+        with self._lock:
+            now = time.time()
+            count = self._count(key, now)
+            return count, self._buckets[key][1] if count else now
+
+    def clear(self, prefix: str = '') -> int:
+        with self._lock:
+            keys = [k for k in self._buckets if k.startswith(prefix)]
+            for key in keys:
+                del self._buckets[key]
+            return len(keys)
+
+
+_local_windows = _LocalWindows()
+
+
+class SlidingWindowRateLimiter:
+    """Sliding-window limits checked and counted atomically in Redis."""
+
+    def __init__(self, redis_client=None):
+        """
+        Initialize the limiter.
+
+        Args:
+            redis_client: Synchronous or redis.asyncio client; None uses
+                in-process windows. hit() needs a synchronous client and
+                ahit() an asyncio one.
+        """
+        self.redis = redis_client
+        self._script = None
+        self._fixed_script = None
+
+    @staticmethod
+    def _script_args(rules: Sequence[Rule], cost: int) -> Tuple[List[str], List[Any]]:
+        now = time.time()
+        keys: List[str] = []
+        args: List[Any] = [cost]
+        for key, limit, window in rules:
+            bucket = math.floor(now / window)
+            keys.extend((f"{KEY_PREFIX}:{key}:{bucket}", f"{KEY_PREFIX}:{key}:{bucket - 1}"))
+            args.extend((limit, window, bucket * window))
+        return keys, args
+
+    def _get_script(self):
+        if self._script is None:
+            self._script = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+        return self._script
+
+    def _redis_failed(self, error: Exception) -> None:
+        log.warning(f"Redis rate limiter unavailable, using in-process windows: {str(error)}")
+
+    def _local(self, rules: Sequence[Rule], cost: int, error: Exception) -> RateLimitResult:
+        self._redis_failed(error)
+        return _local_windows.hit([(f"{KEY_PREFIX}:{key}", limit, window) for key, limit, window in rules], cost)
+
+    def result(self, reply: Any, rules: Sequence[Rule], cost: int = 1) -> RateLimitResult:
+        """
+        Turn a script reply into a result.
+
+        Args:
+            reply: Reply of the queued script, or the exception it raised
+            rules: Rules the script was queued with
+            cost: Cost the script was queued with
+        """
+        if isinstance(reply, Exception):
+            return self._local(rules, cost, reply)
+        allowed, remaining, retry = reply
+        return RateLimitResult(bool(int(allowed)), int(remaining), float(retry))
+
+    async def aresult(self, reply: Any, rules: Sequence[Rule], cost: int = 1) -> RateLimitResult:
+        """
+        Async result() for a redis.asyncio pipeline.
+
+        If Redis did not have the script cached (e.g. after a restart), nothing
+        was counted, so the check is run again with ahit(), which loads it.
+        """
+        if isinstance(reply, Exception) and isinstance(reply, NoScriptError):
+            return await self.ahit(rules, cost)
+        return self.result(reply, rules, cost)
+
+    def queue(self, pipe, rules: Sequence[Rule], cost: int = 1) -> None:
+        """Add the check to a pipeline by script hash; pass its reply to result() or aresult()."""
+        keys, args = self._script_args(rules, cost)
+        pipe.evalsha(self._get_script().sha, len(keys), *keys, *args)
+
+    def hit(self, rules: Sequence[Rule], cost: int = 1) -> RateLimitResult:
+        """
+        Count a call against every rule if all of them allow it.
+
+        Args:
+            rules: (key, limit, window seconds) per limit that applies
+            cost: Amount the call counts for; 0 only reads the remaining quota
+
+        Returns:
+            Whether the call was allowed, the remaining quota and retry-after
+        """
+        if self.redis is None:
+            return _local_windows.hit([(f"{KEY_PREFIX}:{key}", limit, window) for key, limit, window in rules], cost)
+        try:
+            keys, args = self._script_args(rules, cost)
+            return self.result(self._get_script()(keys=keys, args=args), rules, cost)
+        except Exception as e:
+            return self._local(rules, cost, e)
+
+    async def ahit(self, rules: Sequence[Rule], cost: int = 1) -> RateLimitResult:
+        """Async hit() for a redis.asyncio client."""
+        if self.redis is None:
+            return _local_windows.hit([(f"{KEY_PREFIX}:{key}", limit, window) for key, limit, window in rules], cost)
+        try:
+            keys, args = self._script_args(rules, cost)
+            return self.result(await self._get_script()(keys=keys, args=args), rules, cost)
+        except Exception as e:
+            return self._local(rules, cost, e)
+
+    def incr(self, key: str, expiry: int, amount: int = 1, elastic_expiry: bool = False) -> int:
+        """
+        Add to a fixed-window counter, for flask-limiter's fixed-window strategies.
+
+        Args:
+            key: Counter key
+            expiry: Seconds the window lasts from its first call
+            amount: Amount to add
+            elastic_expiry: Restart the window on every call
+
+        Returns:
+            The count after adding
+        """
+        key = f"{KEY_PREFIX}:{key}:fixed"
+        if self.redis is not None:
+            try:
+                if self._fixed_script is None:
+                    self._fixed_script = self.redis.register_script(FIXED_WINDOW_SCRIPT)
+                return int(self._fixed_script(keys=[key], args=[amount, int(math.ceil(expiry)), int(elastic_expiry)]))
+            except Exception as e:
+                self._redis_failed(e)
+        return _local_windows.incr(key, expiry, amount, elastic_expiry)
+
+    def get(self, key: str) -> Tuple[int, float]:
+        """Get a fixed-window counter and the time its window ends."""
+        key = f"{KEY_PREFIX}:{key}:fixed"
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.ttl(key)
+                count, ttl = pipe.execute()
+                return int(count or 0), time.time() + max(int(ttl), 0)
+            except Exception as e:
+                self._redis_failed(e)
+        return _local_windows.get(key)
+
+    def clear(self, key: Optional[str] = None) -> int:
+        """
+        Drop the counters of a key, or of every key.
+
+        Returns:
+            Number of counters dropped
+        """
+        prefix = f"{KEY_PREFIX}:{key}:" if key is not None else f"{KEY_PREFIX}:"
+        cleared = _local_windows.clear(prefix)
+        if self.redis is None:
+            return cleared
+        try:
+            bucket_keys = list(self.redis.scan_iter(match=f"{prefix}*"))
+            if bucket_keys:
+                cleared += self.redis.delete(*bucket_keys)
+        except Exception as e:
+            log.error(f"Error clearing rate limit {key or '(all)'}: {str(e)}")
+        return cleared
+
+
+class SlidingWindowStorage(Storage, MovingWindowSupport):
+    """
+    flask-limiter storage backed by the sliding-window script.
+
+    Use with storage_uri="sliding-window://" and strategy="moving-window".
+    The fixed-window strategies work too, on plain counters kept next to the
+    sliding windows.
+    """
+
+    STORAGE_SCHEME = ['sliding-window']
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.limiter = options.get('limiter')
+        if self.limiter is None:
+            from backend.message_processing.services.storage.redis_manager import RedisStateManager
+            self.limiter = SlidingWindowRateLimiter(RedisStateManager().redis_client)
+
+    @property
+    def base_exceptions(self):
+        return Exception
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        return self.limiter.hit([(key, limit, expiry)], amount).allowed
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> Tuple[float, int]:
+        result = self.limiter.hit([(key, limit, expiry)], 0)
+        # flask-limiter reports window_start + expiry as the reset time
+        return time.time() + max(0.0, result.retry_after) - expiry, limit - result.remaining
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        return self.limiter.incr(key, expiry, amount, elastic_expiry)
+
+    def get(self, key: str) -> int:
+        return self.limiter.get(key)[0]
+
+    def get_expiry(self, key: str) -> float:
+        return self.limiter.get(key)[1]
+
+    def check(self) -> bool:
+        redis_client = self.limiter.redis
+        if redis_client is None:
+            return True
+        try:
+            return bool(redis_client.ping())
+        except Exception:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self.limiter.clear()
+
+    def clear(self, key: str) -> None:
+        self.limiter.clear(key)
+
+
+def rate_limit_key() -> str:
+    """
+    flask-limiter key: the business of the presented API key, else the client address.
+
+    Keys are verified through the API key cache, so made-up keys fall back to
+    the address instead of getting a fresh quota each.
+    """
+    business_id = getattr(g, 'business_id', None)
+    if not business_id:
+        from backend.auth_cache import api_key_cache
+        presented = [('api', request.headers.get('businessapikey') or request.cookies.get('businessApiKey'))]
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            presented.append(('internal', auth_header[len('Bearer '):].strip()))
+        for kind, key in presented:
+            if not key:
+                continue
+            try:
+                business = api_key_cache.verify(kind, key)
+            except Exception as e:
+                log.warning(f"Could not resolve rate limit key: {str(e)}")
+                break
+            if business:
+                business_id = business['business_id']
+                break
+    if business_id:
+        return f"business:{business_id}"
+    return f"ip:{get_remote_address()}"
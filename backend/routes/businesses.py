@@ -14,6 +14,8 @@ if os.path.dirname(os.path.dirname(os.path.abspath(__file__))) not in sys.path:
 from backend.db import get_db_connection, execute_query, release_db_connection
 from backend.auth import require_api_key, require_internal_key
 from backend.routes.utils import is_valid_uuid
+from backend.message_processing.template_variables import invalidate_business_data
+from backend.auth_cache import invalidate_business_keys, invalidate_api_keys
 
 log = logging.getLogger(__name__)
 
@@ -176,6 +178,7 @@ def update_business(business_path_id):
             log.warning(f"Update affected 0 rows for business {business_id_to_update}. Concurrent modification?")
 
         conn.commit()
+        invalidate_business_data(business_id_to_update)
         log.info(f"Business {business_id_to_update} updated successfully by admin.")
         
         response = jsonify({"message": "Business updated successfully"})
@@ -249,6 +252,7 @@ def create_business():
         ))
         result = cursor.fetchone()
         conn.commit()
+        invalidate_business_data(business_id)
         log.info(f"Business created successfully: {business_id}")
         return jsonify({
             "message": "Business created successfully",
@@ -265,4 +269,45 @@ def create_business():
         return jsonify({"error_code": "DB_ERROR", "message": f"Database error: {str(e)}"}), 500
     finally:
         if conn:
-            release_db_connection(conn)
\ No newline at end of file
+            release_db_connection(conn)
+
+@bp.route('/<business_path_id>/rotate-keys', methods=['POST'])
+@require_api_key
+def rotate_business_keys(business_path_id):
+    """Issue new API and internal keys for a business; the old keys stop working."""
+    if not is_valid_uuid(business_path_id):
+        return jsonify({"error_code": "INVALID_REQUEST", "message": "Invalid business_id format in URL"}), 400
+
+    internal_api_key = secrets.token_hex(32)
+    api_key = secrets.token_hex(32)
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE businesses
+            SET api_key = %s, internal_api_key = %s
+            WHERE business_id = %s;
+        """, (api_key, internal_api_key, business_path_id))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return jsonify({"error_code": "NOT_FOUND", "message": "Business not found"}), 404
+        conn.commit()
+        invalidate_business_keys(business_path_id)
+        invalidate_api_keys(api_key, internal_api_key)
+        log.info(f"Rotated API keys for business {business_path_id}")
+        return jsonify({
+            "message": "Keys rotated successfully",
+            "business_id": business_path_id,
+            "api_key": api_key,
+            "internal_api_key": internal_api_key
+        }), 200
+
+    except Exception as e:
+        if conn: conn.rollback()
+        log.error(f"Error rotating keys for business {business_path_id}: {str(e)}", exc_info=True)
+        return jsonify({"error_code": "DB_ERROR", "message": f"Database error: {str(e)}"}), 500
+    finally:
+        if conn:
+            release_db_connection(conn)
@@ -11,12 +11,16 @@ from flask import Blueprint, jsonify, request, g
 import logging
 import uuid
 import json # Added for parsing message data
-from backend.db import get_db_connection, release_db_connection, get_db_pool # Added get_db_pool
+from backend.db import get_db_connection, release_db_connection
 from backend.auth import require_internal_key, require_api_key
 from psycopg2.extras import RealDictCursor
 from backend.message_processing.message_handler import MessageHandler
+from backend.message_processing.handler_loop import handler_loop
 from backend.message_processing.services.storage.redis_manager import RedisStateManager
+from backend.message_processing.services.storage.message_window import message_window
 from backend.utils import is_valid_uuid # Import utility
+from backend.routes.utils import get_page_limit, encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from backend.message_processing.process_log_store import get_process_log, get_recent_process_logs
 from datetime import timedelta
 
 log = logging.getLogger(__name__)
@@ -29,21 +33,33 @@ conversation_bp = Blueprint('conversations', __name__)
 # def test_route():
 #     return jsonify({"message": "Conversation blueprint test route OK"}), 200
 
+def _cors_response(payload, methods='GET,OPTIONS'):
+    response = jsonify(payload)
+    response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,businessapikey,Accept')
+    response.headers.add('Access-Control-Allow-Methods', methods)
+    response.headers.add('Access-Control-Allow-Credentials', 'true')
+    return response
+
 @conversation_bp.route('', methods=['GET', 'OPTIONS'])
 @require_api_key
 def get_conversations():
     """
-    Get all conversations, requires admin key.
-    Optionally filter by business_id query parameter.
+    List conversations, newest activity first, requires admin key.
+    
+    Query Parameters:
+    - business_id: Optional business filter
+    - user_id: Optional user filter
+    - limit: Page size (default 50, max 200)
+    - cursor: next_cursor from the previous page
+    
+    Each conversation carries a message_summary (counts and last-message
+    previews) read from the trigger-maintained conversation_stats rollup;
+    messages are paged separately through /conversations/<id>/messages.
     """
     # Handle CORS preflight requests
     if request.method == 'OPTIONS':
-        response = jsonify({'success': True})
-        response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,businessapikey,Accept')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        return response
+        return _cors_response({'success': True})
 
     # Get optional business_id and user_id filter from query parameter
     business_id_filter = request.args.get('business_id')
@@ -52,136 +68,106 @@ def get_conversations():
          return jsonify({"error_code": "BAD_REQUEST", "message": "Invalid business_id format in query parameter"}), 400
     if user_id_filter and not is_valid_uuid(user_id_filter):
          return jsonify({"error_code": "BAD_REQUEST", "message": "Invalid user_id format in query parameter"}), 400
+
+    limit = get_page_limit(request.args.get('limit'))
+    if limit is None:
+        return jsonify({"error_code": "BAD_REQUEST", "message": "limit must be an integer"}), 400
+    cursor_param = request.args.get('cursor')
+    try:
+        after = decode_cursor(cursor_param) if cursor_param else None
+    except ValueError:
+        return jsonify({"error_code": "BAD_REQUEST", "message": "Invalid cursor"}), 400
     
-    log_msg = "Fetching all conversations (admin)"
+    log_msg = f"Fetching conversations (admin, limit {limit})"
     if business_id_filter:
         log_msg += f" filtered by business_id={business_id_filter}"
     if user_id_filter:
         log_msg += f" and user_id={user_id_filter}"
     log.info(log_msg)
     
+    where_clauses = []
+    params = []
+    if business_id_filter:
+        where_clauses.append("c.business_id = %s")
+        params.append(business_id_filter)
+    if user_id_filter:
+        where_clauses.append("c.user_id = %s")
+        params.append(user_id_filter)
+    if after:
+        # Keyset: continue strictly after the last row of the previous page
+        where_clauses.append("(c.last_updated, c.conversation_id) < (%s, %s)")
+        params.extend(after)
+    where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+
+    query = f"""
+        SELECT 
+            c.conversation_id, 
+            c.business_id, 
+            c.user_id, 
+            c.session_id, 
+            c.start_time, 
+            c.last_updated, 
+            c.stage_id,
+            u.first_name,
+            u.last_name,
+            stats.total_messages,
+            stats.agent_messages,
+            stats.last_message_time,
+            stats.last_user_message,
+            stats.last_agent_message
+        FROM conversations c
+        LEFT JOIN users u ON c.user_id = u.user_id
+        LEFT JOIN conversation_stats stats ON stats.conversation_id = c.conversation_id
+        {where_sql}
+        ORDER BY c.last_updated DESC, c.conversation_id DESC
+        LIMIT %s;
+    """
+
     conn = None
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            
-            params = []
-            base_query = """
-                SELECT 
-                    c.conversation_id, 
-                    c.business_id, 
-                    c.user_id, 
-                    c.session_id, 
-                    c.start_time, 
-                    c.last_updated, 
-                    c.stage_id,
-                    u.first_name,
-                    u.last_name,
-                    COALESCE(
-                        (
-                            SELECT json_agg(
-                                json_build_object(
-                                    'message_id', m.message_id,
-                                    'content', m.message_content,
-                                    'message_content', m.message_content,
-                                    'sender_type', m.sender_type,
-                                    'timestamp', m.created_at,
-                                    'is_from_agent', CASE WHEN m.sender_type = 'assistant' THEN true ELSE false END
-                                ) ORDER BY m.created_at ASC
-                            )
-                            FROM messages m
-                            WHERE m.conversation_id = c.conversation_id" + (" AND m.user_id = %s" if user_id_filter else "") + "
-                        ),
-                        '[]'::json
-                    ) as messages
-                FROM conversations c
-                LEFT JOIN users u ON c.user_id = u.user_id
-            """
-            
-            where_clauses = []
-            if business_id_filter:
-                where_clauses.append("c.business_id = %s")
-                params.append(business_id_filter)
-            if user_id_filter:
-                where_clauses.append("c.user_id = %s")
-                params.append(user_id_filter)
-            
-            if where_clauses:
-                query = base_query + " WHERE " + " AND ".join(where_clauses)
-            else:
-                query = base_query
-            
-            query += " GROUP BY c.conversation_id, c.business_id, c.user_id, c.session_id, c.start_time, c.last_updated, c.stage_id, u.first_name, u.last_name"
-            query += " ORDER BY c.last_updated DESC;"
-            
-            # If user_id_filter is present, add it to params for the subquery
-            subquery_params = tuple(params) + ((user_id_filter,) if user_id_filter else tuple())
-            cursor.execute(query, subquery_params)
-            
-            conversations = cursor.fetchall()
-            
-            # If no conversations found, return empty list
-            if not conversations:
-                response = jsonify([])
-                response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
-                response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,businessapikey,Accept')
-                response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
-                response.headers.add('Access-Control-Allow-Credentials', 'true')
-                return response, 200
-            
-            # Process conversations and messages
-            for conv in conversations:
-                conv['conversation_id'] = str(conv['conversation_id'])
-                conv['business_id'] = str(conv['business_id'])
-                conv['user_id'] = str(conv['user_id'])
-                conv['user_name'] = f"{conv.get('first_name', '')} {conv.get('last_name', '')}".strip()
-                if conv['session_id']:
-                    conv['session_id'] = str(conv['session_id'])
-                if conv['stage_id']:
-                    conv['stage_id'] = str(conv['stage_id'])
-                conv['start_time'] = conv['start_time'].isoformat() if conv['start_time'] else None
-                conv['last_updated'] = conv['last_updated'].isoformat() if conv['last_updated'] else None
-                
-                # Process messages
-                messages = conv.get('messages', [])
-                if messages and messages[0] is not None:  # Check if there are any messages
-                    for msg in messages:
-                        msg['message_id'] = str(msg['message_id'])
-                        # Only call isoformat if timestamp is a datetime object
-                        if msg['timestamp'] and not isinstance(msg['timestamp'], str):
-                            msg['timestamp'] = msg['timestamp'].isoformat()
-                else:
-                    conv['messages'] = []
-                
-                # Add message summary
-                if messages and messages[0] is not None:
-                    user_messages = [msg for msg in messages if not msg['is_from_agent']]
-                    agent_messages = [msg for msg in messages if msg['is_from_agent']]
-                    
-                    conv['message_summary'] = {
-                        'total_messages': len(messages),
-                        'user_messages': len(user_messages),
-                        'agent_messages': len(agent_messages),
-                        'last_user_message': user_messages[-1]['message_content'] if user_messages else None,
-                        'last_agent_message': agent_messages[-1]['message_content'] if agent_messages else None,
-                        'last_message_time': messages[-1]['timestamp'] if messages else None
-                    }
-                else:
-                    conv['message_summary'] = {
-                        'total_messages': 0,
-                        'user_messages': 0,
-                        'agent_messages': 0,
-                        'last_user_message': None,
-                        'last_agent_message': None,
-                        'last_message_time': None
-                    }
-            
-            response = jsonify(conversations)
-            response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
-            response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,businessapikey,Accept')
-            response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
-            response.headers.add('Access-Control-Allow-Credentials', 'true')
-            return response, 200
+            cursor.execute(query, tuple(params))
+            rows = cursor.fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        conversations = []
+        for row in rows:
+            total = row['total_messages'] or 0
+            agent = row['agent_messages'] or 0
+            conversations.append({
+                'conversation_id': str(row['conversation_id']),
+                'business_id': str(row['business_id']),
+                'user_id': str(row['user_id']),
+                'session_id': str(row['session_id']) if row['session_id'] else None,
+                'stage_id': str(row['stage_id']) if row['stage_id'] else None,
+                'start_time': row['start_time'].isoformat() if row['start_time'] else None,
+                'last_updated': row['last_updated'].isoformat() if row['last_updated'] else None,
+                'first_name': row.get('first_name'),
+                'last_name': row.get('last_name'),
+                'user_name': f"{row.get('first_name') or ''} {row.get('last_name') or ''}".strip(),
+                'message_summary': {
+                    'total_messages': total,
+                    'user_messages': total - agent,
+                    'agent_messages': agent,
+                    'last_user_message': row['last_user_message'],
+                    'last_agent_message': row['last_agent_message'],
+                    'last_message_time': row['last_message_time'].isoformat() if row['last_message_time'] else None
+                }
+            })
+        
+        next_cursor = None
+        if has_more and rows[-1]['last_updated']:
+            next_cursor = encode_cursor(rows[-1]['last_updated'], rows[-1]['conversation_id'])
+        
+        return _cors_response({
+            'conversations': conversations,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }), 200
     
     except Exception as e:
         log.error(f"Error retrieving conversations: {str(e)}", exc_info=True)
@@ -191,6 +177,77 @@ def get_conversations():
         if conn:
             release_db_connection(conn)
 
+@conversation_bp.route('/<uuid:conversation_id>/messages', methods=['GET', 'OPTIONS'])
+@require_api_key
+def get_conversation_messages(conversation_id):
+    """
+    Page through the messages of a conversation, newest page first, requires admin key.
+    
+    Query Parameters:
+    - limit: Page size (default 50, max 200)
+    - cursor: next_cursor from the previous page, to load older messages
+    
+    Messages within a page are in chronological order.
+    """
+    if request.method == 'OPTIONS':
+        return _cors_response({'success': True})
+
+    limit = get_page_limit(request.args.get('limit'))
+    if limit is None:
+        return jsonify({"error_code": "BAD_REQUEST", "message": "limit must be an integer"}), 400
+    cursor_param = request.args.get('cursor')
+    try:
+        before = decode_cursor(cursor_param) if cursor_param else None
+    except ValueError:
+        return jsonify({"error_code": "BAD_REQUEST", "message": "Invalid cursor"}), 400
+
+    params = [str(conversation_id)]
+    keyset_sql = ""
+    if before:
+        keyset_sql = "AND (m.created_at, m.message_id) < (%s, %s)"
+        params.extend(before)
+    params.append(limit + 1)
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(f"""
+                SELECT m.message_id, m.message_content, m.sender_type, m.created_at
+                FROM messages m
+                WHERE m.conversation_id = %s {keyset_sql}
+                ORDER BY m.created_at DESC, m.message_id DESC
+                LIMIT %s;
+            """, tuple(params))
+            rows = cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['message_id']) if has_more else None
+        messages = [{
+            'message_id': str(row['message_id']),
+            'content': row['message_content'],
+            'message_content': row['message_content'],
+            'sender_type': row['sender_type'],
+            'timestamp': row['created_at'].isoformat() if row['created_at'] else None,
+            'is_from_agent': row['sender_type'] == 'assistant'
+        } for row in reversed(rows)]
+
+        return _cors_response({
+            'conversation_id': str(conversation_id),
+            'messages': messages,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }), 200
+
+    except Exception as e:
+        log.error(f"Error retrieving messages for conversation {conversation_id}: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Failed to retrieve messages: {str(e)}"}), 500
+
+    finally:
+        if conn:
+            release_db_connection(conn)
+
 @conversation_bp.route('/<uuid:conversation_id>', methods=['DELETE', 'OPTIONS'])
 @require_internal_key
 def delete_conversation(conversation_id):
@@ -228,6 +285,7 @@ def delete_conversation(conversation_id):
             cursor.execute("DELETE FROM conversations WHERE conversation_id = %s", (conversation_id,))
             
             conn.commit()
+            message_window.invalidate(conversation_id)
             log.info(f"Deleted conversation {conversation_id} for business {business_id}")
             
             return jsonify({
@@ -354,13 +412,6 @@ def process_api_message():
         return jsonify({"error": "Message processing component not available"}), 503 # Service Unavailable
 
     try:
-        # Pass the actual db pool object to the handler
-        db_pool = get_db_pool() # Call the function to get the pool
-        if not db_pool:
-            log.error("Failed to get database pool.")
-            return jsonify({"error": "Database connection pool unavailable"}), 503
-        
-        message_handler = MessageHandler(db_pool) # Pass the pool object
         message_data = {
             'business_id': business_id,
             'user_id': user_id,
@@ -368,8 +419,8 @@ def process_api_message():
             'platform': 'api' # Indicate the source is the direct API
         }
         
-        # Process the message
-        result = message_handler.process_message(message_data)
+        # Process the message on the shared handler loop
+        result = handler_loop.process_message(message_data)
         
         # Log and return the result
         if result.get('success'):
@@ -412,33 +463,16 @@ def get_recent_logs():
     if not is_valid_uuid(business_id):
         return jsonify({"error": "Invalid business_id format"}), 400
 
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
     log.info(f"Fetching recent logs (limit {limit}) for business {business_id}")
-    conn = None
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT log_id, business_id, user_id, conversation_id, original_message, start_time
-                FROM process_logs
-                WHERE business_id = %s
-                ORDER BY start_time DESC
-                LIMIT %s;
-            """, (business_id, limit))
-            logs = cursor.fetchall()
-            # Convert UUIDs and datetime to strings
-            for log_entry in logs:
-                for key, value in log_entry.items():
-                    if isinstance(value, uuid.UUID):
-                        log_entry[key] = str(value)
-                    elif hasattr(value, 'isoformat'): # Check for datetime objects
-                         log_entry[key] = value.isoformat()
-            return jsonify(logs), 200
+        # Ring buffers in memory plus the logs of other workers from Redis; no scan or sort of every log
+        logs = get_recent_process_logs(business_id, limit)
+        return jsonify(logs), 200
     except Exception as e:
         log.error(f"Error fetching recent logs for business {business_id}: {str(e)}", exc_info=True)
         return jsonify({"error": "Failed to retrieve recent logs"}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
 
 
 @conversation_bp.route('/message/logs/<log_id>', methods=['GET'])
@@ -458,6 +492,10 @@ def get_log_details(log_id):
         return jsonify({"error": "Invalid log_id format"}), 400
 
     log.info(f"Fetching log details for log_id {log_id} requested by business {business_id}")
+    stored_log = get_process_log(log_id)
+    if stored_log and str((stored_log.get('message_data') or {}).get('business_id')) == business_id:
+        return jsonify({'log_id': log_id, **stored_log}), 200
+
     conn = None
     try:
         conn = get_db_connection()
@@ -1,10 +1,10 @@
 # backend/routes/message_handling.py
-from flask import jsonify, request, Blueprint, current_app, make_response
+from flask import jsonify, request, Blueprint, current_app, make_response, Response
 import uuid
 import logging
 import json
 from jsonschema import validate, ValidationError
-from db import get_db_connection, release_db_connection, get_db_pool
+from db import get_db_connection, release_db_connection
 from backend.ai.openai_helper import call_openai
 from backend.auth import require_internal_key, require_api_key
 import re
@@ -12,6 +12,8 @@ import hmac # For signature verification
 import hashlib # For signature verification
 import requests # For calling internal APIs
 from backend.message_processing.message_handler import MessageHandler
+from backend.message_processing.handler_loop import handler_loop
+from backend.message_processing.ingestion_queue import get_ingestion_queue
 from backend.routes.utils import is_valid_uuid
 from backend.message_processing.services.storage.redis_manager import RedisStateManager
 from backend.message_processing.services.template_service import TemplateService
@@ -96,84 +98,32 @@ def facebook_webhook():
         
         log.info(f"Received Facebook webhook payload: {json.dumps(data)}")
 
-        # 3. Process each message entry (Facebook sends batches)
+        # 3. Enqueue each message (Facebook sends batches); workers process them
+        # in ingestion_worker.py so the webhook acks within Facebook's timeout
+        events = []
         if data.get("object") == "page":
             for entry in data.get("entry", []):
                 for messaging_event in entry.get("messaging", []):
-                    if messaging_event.get("message"):
-                        sender_id = messaging_event["sender"]["id"] # Platform User ID
-                        recipient_id = messaging_event["recipient"]["id"] # Your Page ID
-                        message_text = messaging_event["message"].get("text")
-                        # mid = messaging_event["message"].get("mid") # Message ID
-                        
-                        if message_text:
-                            log.info(f"Processing message from {sender_id} to page {recipient_id}: '{message_text}'")
-                            
-                            # 4. Identify Business & Get Internal Key
-                            conn = None
-                            internal_key = None
-                            business_id = None
-                            try:
-                                conn = get_db_connection()
-                                cursor = conn.cursor()
-                                # TODO: Update DB schema and query to map recipient_id (Page ID) to business_id
-                                # Example assumes `facebook_page_id` column exists on `businesses` table:
-                                cursor.execute("SELECT business_id, internal_api_key FROM businesses WHERE facebook_page_id = %s", (recipient_id,))
-                                result = cursor.fetchone()
-                                if result:
-                                    business_id = str(result[0])
-                                    internal_key = result[1]
-                                    log.info(f"Mapped page {recipient_id} to business {business_id}")
-                                else:
-                                    log.error(f"Could not find business associated with Facebook Page ID: {recipient_id}")
-                                    continue # Skip processing this message
-                            except Exception as e:
-                                log.error(f"DB error looking up business for page {recipient_id}: {str(e)}", exc_info=True)
-                                continue # Skip processing this message
-                            finally:
-                                if conn:
-                                    release_db_connection(conn)
-                            
-                            if not internal_key or not business_id:
-                                continue # Skip if mapping failed
+                    message = messaging_event.get("message")
+                    if message and message.get("text"):
+                        events.append({
+                            'platform': 'facebook',
+                            'sender_id': messaging_event["sender"]["id"], # Platform User ID
+                            'recipient_id': messaging_event["recipient"]["id"], # Your Page ID
+                            'content': message["text"],
+                            'platform_message_id': message.get("mid"),
+                        })
 
-                            # 5. Process Message using MessageHandler (if available)
-                            if MessageHandler:
-                                try:
-                                    # Assuming MessageHandler takes db_pool or connection factory
-                                    # And internal_key if it needs to make authenticated internal API calls
-                                    # message_handler = MessageHandler(get_db_pool(), internal_api_key=internal_key) 
-                                    message_handler = MessageHandler(get_db_pool()) # Simpler assumption
-                                    
-                                    # Prepare data for the handler
-                                    message_data = {
-                                        'business_id': business_id,
-                                        'user_id': sender_id, # Use platform sender ID as user ID
-                                        'content': message_text,
-                                        'platform': 'facebook' # Add platform info
-                                        # Add conversation_id if available from context/lookup
-                                    }
-                                    
-                                    processing_result = message_handler.process_message(message_data)
-                                    
-                                    # 6. Handle Result & Respond to Platform
-                                    if processing_result.get('success'):
-                                        response_to_user = processing_result.get('response', "Sorry, I couldn't process that.")
-                                        log.info(f"Successfully processed message for business {business_id}. Response: '{response_to_user[:50]}...'")
-                                        # TODO: Implement logic to send `response_to_user` back to Facebook `sender_id`
-                                        # using Facebook Graph API (requires Page Access Token)
-                                        # send_facebook_message(recipient_id, sender_id, response_to_user)
-                                    else:
-                                        log.error(f"MessageHandler failed for business {business_id}: {processing_result.get('error')}")
-                                        # TODO: Optionally send an error message back to the user via Facebook API
-                                        # send_facebook_message(recipient_id, sender_id, "Sorry, an error occurred.")
-
-                                except Exception as proc_err:
-                                    log.error(f"Error invoking MessageHandler for business {business_id}: {proc_err}", exc_info=True)
-                                    # TODO: Optionally send an error message back to the user
-                            else:
-                                log.error("MessageHandler not loaded, cannot process message.")
-                                # TODO: Optionally send error message back to user
+        if events:
+            try:
+                queue = get_ingestion_queue()
+                for event in events:
+                    queue.enqueue(event)
+            except Exception as e:
+                # Not acknowledged, so Facebook redelivers; duplicates are dropped by message ID
+                log.error(f"Failed to enqueue Facebook webhook events: {str(e)}", exc_info=True)
+                return jsonify({"status": "error", "message": "Temporarily unavailable"}), 503
+            log.info(f"Enqueued {len(events)} Facebook message(s)")
 
         return "EVENT_RECEIVED", 200 # Acknowledge receipt to Facebook
     else:
@@ -230,11 +180,8 @@ def handle_message():
         }), 400
 
     try:
-        # Initialize message handler
-        message_handler = MessageHandler(get_db_pool())
-        
-        # Process the message
-        result = message_handler.process_message({
+        # Process the message on the shared handler loop
+        result = handler_loop.process_message({
             'business_id': business_id,
             'user_id': user_id,
             'content': content,
@@ -256,6 +203,71 @@ def handle_message():
             'error': f"Error processing message: {str(e)}"
         }), 500
 
+def _sse_event(event: dict) -> str:
+    """Format an event dictionary as a server-sent event."""
+    event = dict(event)
+    name = event.pop('event', 'message')
+    return f"event: {name}\ndata: {json.dumps(event, default=str)}\n\n"
+
+def _stream_message_events(message_data: dict):
+    """Stream MessageHandler.stream_message events from the shared handler loop as SSE frames."""
+    try:
+        for event in handler_loop.stream_message(message_data):
+            yield _sse_event(event)
+    except Exception as e:
+        log.error(f"Error streaming message: {str(e)}", exc_info=True)
+        yield _sse_event({'event': 'error', 'success': False, 'error': f"Error processing message: {str(e)}"})
+
+@bp.route('/message/stream', methods=['POST'])
+@require_api_key
+def stream_message():
+    """
+    Process a message and stream the AI response as server-sent events.
+    
+    Expects JSON body: { business_id: uuid, user_id: uuid, content: string, conversation_id?: uuid }
+    
+    Events:
+    - start: the user message was saved (conversation_id, message_id)
+    - token: a chunk of the response (content)
+    - done: the full response was saved (same fields as /api/message)
+    - error: processing failed (error)
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'error': 'No data provided'}), 400
+
+    message_data = {
+        'business_id': data.get('business_id'),
+        'user_id': data.get('user_id'),
+        'content': data.get('content'),
+        'conversation_id': data.get('conversation_id')
+    }
+    missing = [field for field in ('business_id', 'user_id', 'content') if not message_data[field]]
+    if missing:
+        return jsonify({
+            'success': False,
+            'error': f"Missing required fields: {', '.join(missing)}"
+        }), 400
+
+    for field in ('business_id', 'user_id', 'conversation_id'):
+        if message_data[field] and not is_valid_uuid(message_data[field]):
+            return jsonify({
+                'success': False,
+                'error': f'Invalid UUID format for {field}'
+            }), 400
+
+    if not MessageHandler:
+        return jsonify({'success': False, 'error': 'Message processing component not available'}), 503
+
+    return Response(
+        _stream_message_events(message_data),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Don't let proxies buffer the stream
+        }
+    )
+
 @bp.route('/user/<user_id>', methods=['GET'])
 @require_api_key
 def get_user_messages(user_id):
@@ -9,6 +9,7 @@ from .utils import is_valid_uuid
 import os
 import re
 from psycopg2.extras import RealDictCursor
+from backend.message_processing.template_variables import invalidate_business_data
 
 log = logging.getLogger(__name__)
 
@@ -229,6 +230,7 @@ def post_stages():
         
         new_stage = cursor.fetchone()
         conn.commit()
+        invalidate_business_data(business_id)
         log.info(f"Admin created stage {stage_id} for business {business_id}, agent {agent_id}")
         
         # Convert UUIDs/datetimes for response
@@ -300,6 +302,7 @@ def update_stage(stage_id):
             
             cursor.execute(query, tuple(update_values))
             conn.commit()
+            invalidate_business_data(stage['business_id'])
             
             # Return updated stage
             cursor.execute(
@@ -360,6 +363,7 @@ def delete_stage(stage_id):
         )
         
         conn.commit()
+        invalidate_business_data(stage['business_id'])
         return jsonify({"message": "Stage deleted successfully"}), 200
         
     except Exception as e:
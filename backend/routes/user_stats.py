@@ -13,13 +13,12 @@ def get_user_message_counts():
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
+        # Counts come from the trigger-maintained rollup (migration 08)
         cursor.execute(
             '''
-            SELECT m.user_id, COUNT(*) as message_count
-            FROM messages m
-            JOIN conversations c ON m.conversation_id = c.conversation_id
-            WHERE c.business_id = %s
-            GROUP BY m.user_id
+            SELECT user_id, message_count
+            FROM user_message_stats
+            WHERE business_id = %s
             ''',
             (business_id,)
         )
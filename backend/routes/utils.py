@@ -1,5 +1,8 @@
 # utils.py
 import uuid
+import json
+import base64
+from datetime import datetime
 
 def is_valid_uuid(uuid_string):
     """
@@ -18,4 +21,40 @@ def sanitize_input(input_string):
     """
     if not isinstance(input_string, str):
         return ""  # Or raise an exception
-    return input_string.replace("<", "&lt;").replace(">", "&gt;")
\ No newline at end of file
+    return input_string.replace("<", "&lt;").replace(">", "&gt;")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def get_page_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Parse a page size query parameter, clamped to 1..maximum.
+    Returns None if the value is not an integer.
+    """
+    if value is None or value == '':
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return None
+
+def encode_cursor(timestamp, row_id):
+    """
+    Encode a keyset pagination position (timestamp, id) as an opaque string.
+    """
+    payload = json.dumps({'t': timestamp.isoformat(), 'id': str(row_id)})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor into (timestamp, id).
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        timestamp = datetime.fromisoformat(payload['t'])
+        row_id = str(uuid.UUID(payload['id']))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return timestamp, row_id
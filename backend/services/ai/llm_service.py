@@ -8,6 +8,8 @@ from typing import Dict, Any, Optional
 import openai
 from datetime import datetime
 
+from backend.config import Config
+
 log = logging.getLogger(__name__)
 
 class LLMService:
@@ -23,7 +25,7 @@ class LLMService:
         self.db_pool = db_pool
         self.api_key = os.getenv('LLM_API_KEY')
         self.api_endpoint = os.getenv('LLM_API_ENDPOINT', 'https://api.openai.com/v1')
-        self.model = os.getenv('LLM_MODEL', 'gpt-4')
+        self.model = Config.LLM_MODEL
         self.max_tokens = int(os.getenv('LLM_MAX_TOKENS', '2000'))
         self.temperature = float(os.getenv('LLM_TEMPERATURE', '0.7'))
         
@@ -1,38 +1,157 @@
 """
 Service for generating and managing conversation summaries.
+
+Summaries are maintained incrementally. The stored summary carries a
+watermark, the last message it covers (migration 11). A refresh sends the
+LLM only the previous summary and the messages after the watermark, in
+batches of CONVERSATION_SUMMARY_BATCH_SIZE, and moves the watermark forward
+with each batch. A conversation's first summary starts from an empty one the
+same way.
+
+get_summary returns the stored summary without calling the LLM when no
+message came after the watermark, or when it was refreshed less than
+CONVERSATION_SUMMARY_MAX_AGE seconds ago. SummaryRefresher keeps the
+summaries of recently active conversations current in the background.
 """
 
 import json
 import logging
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, List, Optional
 from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+from psycopg2.extras import RealDictCursor
 
 log = logging.getLogger(__name__)
 
+FALLBACK_SUMMARY = {
+    "overview": "Unable to generate structured summary",
+    "key_points": [],
+    "decisions": [],
+    "pending_items": [],
+    "next_steps": [],
+    "sentiment": "neutral",
+    "confidence_score": 0.0
+}
+
+CONVERSATION_QUERY = """
+    SELECT c.conversation_id, c.business_id, c.start_time, c.last_updated,
+           c.conversation_summary, c.summary_watermark_id, c.summary_watermark_at,
+           c.summary_message_count, c.summary_updated_at,
+           s.last_message_time,
+           b.business_name, u.first_name, u.last_name
+    FROM conversations c
+    JOIN businesses b ON c.business_id = b.business_id
+    JOIN users u ON c.user_id = u.user_id
+    LEFT JOIN conversation_stats s ON s.conversation_id = c.conversation_id
+    WHERE c.conversation_id = %s
+"""
+
+# Messages after the watermark; %s::timestamptz IS NULL selects from the first message
+NEW_MESSAGES_QUERY = """
+    SELECT message_id, sender_type, message_content, created_at
+    FROM messages
+    WHERE conversation_id = %s
+      AND (%s::timestamptz IS NULL OR (created_at, message_id) > (%s::timestamptz, %s::uuid))
+    ORDER BY created_at, message_id
+    LIMIT %s
+"""
+
+# Writes only if nobody moved the watermark since it was read
+SAVE_QUERY = """
+    UPDATE conversations
+    SET conversation_summary = %s,
+        summary_watermark_id = %s,
+        summary_watermark_at = %s,
+        summary_message_count = %s,
+        summary_updated_at = NOW()
+    WHERE conversation_id = %s
+      AND summary_watermark_id IS NOT DISTINCT FROM %s
+"""
+
+# Conversations with messages after their watermark, quiet for a moment
+ACTIVE_CONVERSATIONS_QUERY = """
+    SELECT c.conversation_id
+    FROM conversation_stats s
+    JOIN conversations c ON c.conversation_id = s.conversation_id
+    WHERE s.last_message_time > NOW() - make_interval(secs => %s)
+      AND s.last_message_time < NOW() - make_interval(secs => %s)
+      AND (c.summary_watermark_at IS NULL OR s.last_message_time > c.summary_watermark_at)
+    ORDER BY s.last_message_time DESC
+    LIMIT %s
+"""
+
+
 class ConversationSummaryService:
     """Service for generating and managing conversation summaries."""
-    
-    def __init__(self, template_path: str = None):
+
+    def __init__(self, template_path: str = None, update_template_path: str = None,
+                 max_age: float = 300.0, batch_size: int = 100, llm_service=None):
         """
         Initialize the conversation summary service.
-        
+
         Args:
             template_path: Path to the template file. If None, uses default path.
+            update_template_path: Path to the template for folding new messages
+                into a summary. If None, uses default path.
+            max_age: Seconds a summary is served without looking for new messages
+            batch_size: Most new messages sent to the LLM in one call
+            llm_service: Optional LLM service; created on first use if not given
         """
-        if template_path is None:
-            template_path = Path(__file__).parent.parent / 'templates' / 'conversation_summary_template.txt'
-        
-        self.template_path = Path(template_path)
-        if not self.template_path.exists():
-            raise FileNotFoundError(f"Template file not found at {template_path}")
-            
-        with open(self.template_path, 'r') as f:
-            self.template = f.read()
-    
+        templates_dir = Path(__file__).parent.parent / 'templates'
+        self.template = self._read_template(template_path or templates_dir / 'conversation_summary_template.txt')
+        self.update_template = self._read_template(
+            update_template_path or templates_dir / 'conversation_summary_update_template.txt'
+        )
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self._llm_service = llm_service
+
+    @staticmethod
+    def _read_template(path) -> str:
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Template file not found at {path}")
+        with open(path, 'r') as f:
+            return f.read()
+
+    @property
+    def llm_service(self):
+        if self._llm_service is None:
+            # Import here to avoid circular imports
+            from backend.ai.llm_service import LLMService
+            self._llm_service = LLMService()
+        return self._llm_service
+
+    def _complete(self, system_prompt: str, input_text: str, business_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Ask the LLM for a summary; None if the reply is not a JSON object."""
+        summary_response = self.llm_service.generate_response(
+            business_id=business_id,
+            input_text=input_text,
+            system_prompt=system_prompt,
+            call_type="summary"
+        )
+        try:
+            summary = json.loads(summary_response)
+        except (TypeError, json.JSONDecodeError) as e:
+            log.error(f"Error parsing summary JSON: {str(e)}")
+            return None
+        return summary if isinstance(summary, dict) else None
+
+    def _template_context(self, conversation_data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'business_name': conversation_data.get('business_name', 'Unknown Business'),
+            'user_name': conversation_data.get('user_name', 'Unknown User'),
+            'conversation_id': conversation_data.get('conversation_id', 'Unknown'),
+            'start_time': conversation_data.get('start_time', 'Unknown'),
+            'last_updated': conversation_data.get('last_updated', 'Unknown'),
+        }
+
     def generate_summary(self, conversation_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Generate a summary for a conversation.
-        
+
         Args:
             conversation_data: Dictionary containing conversation information:
                 - business_name: Name of the business
@@ -41,68 +160,62 @@ class ConversationSummaryService:
                 - start_time: Start time of the conversation
                 - last_updated: Last update time of the conversation
                 - conversation_history: List of messages in the conversation
-                
+
         Returns:
             Dictionary containing the structured summary
         """
         try:
-            # Format the conversation history
-            formatted_history = self._format_conversation_history(
-                conversation_data.get('conversation_history', [])
-            )
-            
-            # Prepare the prompt
-            prompt = self.template.format(
-                business_name=conversation_data.get('business_name', 'Unknown Business'),
-                user_name=conversation_data.get('user_name', 'Unknown User'),
-                conversation_id=conversation_data.get('conversation_id', 'Unknown'),
-                start_time=conversation_data.get('start_time', 'Unknown'),
-                last_updated=conversation_data.get('last_updated', 'Unknown'),
-                conversation_history=formatted_history
-            )
-            
-            # Import here to avoid circular imports
-            from backend.ai.llm_service import LLMService
-            
-            # Initialize LLM service
-            llm_service = LLMService()
-            
-            # Call LLM service to generate summary
-            summary_response = llm_service.generate_response(
-                business_id=conversation_data.get('business_id'),
-                input_text=formatted_history,
-                system_prompt=prompt,
-                call_type="summary"
-            )
-            
-            # Parse JSON response
-            try:
-                summary = json.loads(summary_response)
-                return summary
-            except json.JSONDecodeError as e:
-                log.error(f"Error parsing summary JSON: {str(e)}")
-                # Return a fallback summary
-                return {
-                    "overview": "Unable to generate structured summary",
-                    "key_points": [],
-                    "decisions": [],
-                    "pending_items": [],
-                    "next_steps": [],
-                    "sentiment": "neutral",
-                    "confidence_score": 0.0
-                }
-            
+            summary = self.update_summary(conversation_data, None, 0)
+            return summary if summary is not None else dict(FALLBACK_SUMMARY)
+
         except Exception as e:
             log.error(f"Error generating conversation summary: {str(e)}")
             raise
-    
+
+    def update_summary(
+        self,
+        conversation_data: Dict[str, Any],
+        previous_summary: Optional[Dict[str, Any]],
+        summarized_count: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fold new messages into a conversation's summary.
+
+        Args:
+            conversation_data: Same as for generate_summary, with only the new
+                messages in conversation_history
+            previous_summary: Summary of the messages before them, or None
+            summarized_count: Number of messages previous_summary covers
+
+        Returns:
+            The updated summary, or None if the LLM reply could not be parsed
+        """
+        formatted_history = self._format_conversation_history(conversation_data.get('conversation_history', []))
+        if not previous_summary:
+            # The prompt carries the transcript, so it is not sent twice
+            return self._complete(
+                self.template.format(conversation_history=formatted_history,
+                                     **self._template_context(conversation_data)),
+                "Summarize the conversation above.",
+                conversation_data.get('business_id')
+            )
+        return self._complete(
+            self.update_template.format(
+                previous_summary=json.dumps(previous_summary, indent=2),
+                summarized_count=summarized_count,
+                **self._template_context(conversation_data)
+            ),
+            formatted_history,
+            conversation_data.get('business_id')
+        )
+
     def _format_conversation_history(self, messages: list) -> str:
         """
         Format conversation messages into a readable string.
-        
+
         Args:
             messages: List of message dictionaries with 'sender' and 'content' keys
-            
+
         Returns:
             Formatted string of the conversation
         """
@@ -112,35 +225,209 @@ class ConversationSummaryService:
             content = msg.get('content', '')
             timestamp = msg.get('timestamp', '')
             formatted_messages.append(f"{sender} ({timestamp}): {content}")
-        
+
         return "\n".join(formatted_messages)
-    
-    def save_summary(self, conn, conversation_id: str, summary: Dict[str, Any]) -> bool:
+
+    def _load_conversation(self, conn, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(CONVERSATION_QUERY, (conversation_id,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def _load_new_messages(self, conn, conversation: Dict[str, Any]) -> List[Dict[str, Any]]:
+        watermark_at = conversation['summary_watermark_at'] if conversation['summary_watermark_id'] else None
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(NEW_MESSAGES_QUERY, (
+                conversation['conversation_id'], watermark_at, watermark_at,
+                conversation['summary_watermark_id'], self.batch_size
+            ))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def _is_fresh(self, conversation: Dict[str, Any], refresh: bool) -> bool:
+        """Whether the stored summary can be served without looking for new messages."""
+        if not conversation['conversation_summary'] or not conversation['summary_watermark_id']:
+            return False
+        last_message_time = conversation['last_message_time']
+        if last_message_time is not None and last_message_time <= conversation['summary_watermark_at']:
+            return True
+        updated_at = conversation['summary_updated_at']
+        return (not refresh and updated_at is not None
+                and datetime.now(timezone.utc) - updated_at < timedelta(seconds=self.max_age))
+
+    def save_summary(
+        self,
+        conn,
+        conversation_id: str,
+        summary: Dict[str, Any],
+        last_message: Dict[str, Any],
+        message_count: int,
+        previous_watermark_id: Optional[str] = None
+    ) -> bool:
         """
-        Save the generated summary to the database.
-        
+        Save a summary and its watermark to the database.
+
         Args:
             conn: Database connection
             conversation_id: UUID of the conversation
             summary: Dictionary containing the summary
-            
+            last_message: Last message the summary covers, with message_id and created_at
+            message_count: Number of messages the summary covers
+            previous_watermark_id: Watermark the summary was built on; the save
+                is skipped if another writer moved it meanwhile
+
         Returns:
-            True if successful, False otherwise
+            True if saved, False if the watermark moved or the write failed
         """
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                UPDATE conversations 
-                SET conversation_summary = %s
-                WHERE conversation_id = %s
-                """,
-                (json.dumps(summary), conversation_id)
-            )
+            with conn.cursor() as cursor:
+                cursor.execute(SAVE_QUERY, (
+                    json.dumps(summary), last_message['message_id'], last_message['created_at'],
+                    message_count, conversation_id, previous_watermark_id
+                ))
+                saved = cursor.rowcount == 1
             conn.commit()
-            return True
-            
+            return saved
+
         except Exception as e:
             log.error(f"Error saving conversation summary: {str(e)}")
             conn.rollback()
-            return False
\ No newline at end of file
+            return False
+
+    def get_summary(
+        self,
+        conn,
+        conversation_id: str,
+        business_id: Optional[str] = None,
+        refresh: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get a conversation's summary, folding in messages after its watermark if needed.
+
+        Args:
+            conn: Database connection
+            conversation_id: UUID of the conversation
+            business_id: If given, the conversation must belong to this business
+            refresh: Look for new messages even if the summary is younger than max_age
+
+        Returns:
+            The summary, or None if the conversation does not exist
+        """
+        conversation = self._load_conversation(conn, conversation_id)
+        if not conversation or (business_id and str(conversation['business_id']) != str(business_id)):
+            return None
+        if self._is_fresh(conversation, refresh):
+            return conversation['conversation_summary']
+
+        conversation_data = {
+            "business_id": str(conversation['business_id']),
+            "business_name": conversation['business_name'],
+            "user_name": f"{conversation['first_name']} {conversation['last_name']}",
+            "conversation_id": str(conversation['conversation_id']),
+            "start_time": conversation['start_time'].isoformat(),
+            "last_updated": conversation['last_updated'].isoformat(),
+        }
+        # A summary without a watermark predates incremental summaries and is rebuilt
+        summary = conversation['conversation_summary'] if conversation['summary_watermark_id'] else None
+        count = conversation['summary_message_count'] if summary else 0
+        while True:
+            messages = self._load_new_messages(conn, conversation)
+            if not messages:
+                break
+            updated = self.update_summary(
+                {
+                    **conversation_data,
+                    "conversation_history": [
+                        {
+                            "sender": msg['sender_type'],
+                            "content": msg['message_content'],
+                            "timestamp": msg['created_at'].isoformat()
+                        }
+                        for msg in messages
+                    ]
+                },
+                summary,
+                count
+            )
+            if updated is None:
+                break
+            if not self.save_summary(conn, conversation_id, updated, messages[-1], count + len(messages),
+                                     conversation['summary_watermark_id']):
+                # Another request or the refresher got there first; serve theirs
+                conversation = self._load_conversation(conn, conversation_id) or conversation
+                return conversation['conversation_summary'] or summary
+            summary, count = updated, count + len(messages)
+            conversation['summary_watermark_id'] = messages[-1]['message_id']
+            conversation['summary_watermark_at'] = messages[-1]['created_at']
+            if len(messages) < self.batch_size:
+                break
+
+        return summary if summary is not None else dict(FALLBACK_SUMMARY)
+
+
+class SummaryRefresher:
+    """Background thread keeping summaries of recently active conversations current."""
+
+    def __init__(self, service: ConversationSummaryService, interval: float = 300.0,
+                 active_window: float = 86400.0, idle_seconds: float = 120.0, limit: int = 50):
+        """
+        Initialize the refresher.
+
+        Args:
+            service: Summary service used for refreshing
+            interval: Seconds between passes
+            active_window: Only conversations with a message this many seconds ago or later
+            idle_seconds: Skip conversations with a message in the last this many
+                seconds, so a running conversation is not summarized after every message
+            limit: Most conversations refreshed per pass
+        """
+        self.service = service
+        self.interval = interval
+        self.active_window = active_window
+        self.idle_seconds = idle_seconds
+        self.limit = limit
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """Refresh the summaries of active conversations once; returns how many were refreshed."""
+        from backend.db import get_db_connection, release_db_connection
+
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(ACTIVE_CONVERSATIONS_QUERY, (self.active_window, self.idle_seconds, self.limit))
+                conversation_ids = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+            refreshed = 0
+            for conversation_id in conversation_ids:
+                if self._stopping.is_set():
+                    break
+                try:
+                    self.service.get_summary(conn, str(conversation_id), refresh=True)
+                    refreshed += 1
+                except Exception as e:
+                    conn.rollback()
+                    log.error(f"Error refreshing summary of conversation {conversation_id}: {str(e)}")
+            return refreshed
+        finally:
+            release_db_connection(conn)
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                refreshed = self.run_once()
+                if refreshed:
+                    log.info(f"Refreshed {refreshed} conversation summaries")
+            except Exception as e:
+                log.error(f"Error refreshing conversation summaries: {str(e)}")
+
+    def start(self) -> None:
+        """Start refreshing in a daemon thread; an interval of 0 disables the refresher."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="summary-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop after the conversation being refreshed."""
+        self._stopping.set()
@@ -5,6 +5,7 @@ Template management system for handling message templates.
 import logging
 from typing import Dict, Any, Optional
 from backend.database.db import get_db_connection, release_db_connection
+from backend.message_processing.templates.compiler import render_template
 
 log = logging.getLogger(__name__)
 
@@ -45,16 +46,7 @@ class TemplateManager:
             if not result:
                 raise ValueError(f"Template not found: {template_id}")
                 
-            template_content = result[0]
-            
-            # Simple variable replacement
-            # TODO: Implement more sophisticated template engine
-            for key, value in context.items():
-                placeholder = f"{{{key}}}"
-                if placeholder in template_content:
-                    template_content = template_content.replace(placeholder, str(value))
-            
-            return template_content
+            return render_template(result[0], context, template_id)
             
         except Exception as e:
             log.error(f"Error rendering template {template_id}: {str(e)}")
@@ -0,0 +1,190 @@
+"""
+Benchmark concurrent message throughput of MessageHandler.process_message.
+
+Postgres, Redis and the LLM are replaced with in-process stand-ins that add a
+fixed latency per call. The same workload is run twice:
+
+- async:    stand-ins await asyncio.sleep, like asyncpg / redis.asyncio
+- blocking: stand-ins call time.sleep, like psycopg2 / sync Redis inside a coroutine
+
+Usage:
+    python backend/tools/benchmark_message_pipeline.py --messages 200 --concurrency 50
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import logging
+from contextlib import asynccontextmanager
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+os.environ.setdefault('ICMP_API_KEY', 'benchmark')
+
+from backend.message_processing.message_handler import MessageHandler
+from backend.message_processing.storage.redis_manager import RedisStateManager
+
+logging.basicConfig(level=logging.WARNING)
+
+STAGE_ID = str(uuid.uuid4())
+TEMPLATE_ID = str(uuid.uuid4())
+BUSINESS_ID = str(uuid.uuid4())
+
+
+class LatencyModel:
+    """Applies a fixed delay either cooperatively or by blocking the loop."""
+
+    def __init__(self, blocking: bool):
+        self.blocking = blocking
+
+    async def wait(self, seconds: float) -> None:
+        if self.blocking:
+            time.sleep(seconds)
+        else:
+            await asyncio.sleep(seconds)
+
+
+class StandInConnection:
+    """Minimal asyncpg-like connection."""
+
+    def __init__(self, latency: LatencyModel, query_latency: float):
+        self.latency = latency
+        self.query_latency = query_latency
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query, *args):
+        await self.latency.wait(self.query_latency)
+        return "INSERT 0 1"
+
+    async def fetchrow(self, query, *args):
+        await self.latency.wait(self.query_latency)
+        if 'FROM templates' in query:
+            return {
+                'template_id': TEMPLATE_ID, 'business_id': BUSINESS_ID,
+                'template_name': 'bench', 'template_type': 'response_generation',
+                'content': 'You are a helpful assistant.', 'system_prompt': None
+            }
+        return {
+            'stage_id': STAGE_ID, 'business_id': BUSINESS_ID, 'stage_name': 'Default',
+            'stage_description': 'Benchmark stage', 'stage_type': 'conversation',
+            'stage_selection_template_id': None, 'data_extraction_template_id': None,
+            'response_generation_template_id': TEMPLATE_ID
+        }
+
+
+class StandInPool:
+    """Bounded pool handing out StandInConnection objects."""
+
+    def __init__(self, latency: LatencyModel, size: int, query_latency: float):
+        self._semaphore = asyncio.Semaphore(size)
+        self._latency = latency
+        self._query_latency = query_latency
+
+    async def acquire(self, timeout=None):
+        await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        return StandInConnection(self._latency, self._query_latency)
+
+    async def release(self, conn):
+        self._semaphore.release()
+
+    async def close(self):
+        pass
+
+
+class StandInRedis:
+    """Dictionary-backed subset of the redis.asyncio client."""
+
+    def __init__(self, latency: LatencyModel, command_latency: float):
+        self._data = {}
+        self._latency = latency
+        self._command_latency = command_latency
+
+    async def get(self, key):
+        await self._latency.wait(self._command_latency)
+        return self._data.get(key)
+
+    async def set(self, key, value, ex=None):
+        await self._latency.wait(self._command_latency)
+        self._data[key] = value
+        return True
+
+    async def incr(self, key):
+        await self._latency.wait(self._command_latency)
+        self._data[key] = int(self._data.get(key, 0)) + 1
+        return self._data[key]
+
+    async def delete(self, key):
+        await self._latency.wait(self._command_latency)
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    async def close(self):
+        pass
+
+
+class StandInLLM:
+    """LLM stand-in with a fixed completion latency."""
+
+    def __init__(self, latency: LatencyModel, completion_latency: float):
+        self._latency = latency
+        self._completion_latency = completion_latency
+
+    async def generate_response(self, prompt, message_content, context, business_id=None):
+        await self._latency.wait(self._completion_latency)
+        return f"Echo: {message_content}"
+
+
+async def run_workload(blocking: bool, args) -> float:
+    """Process args.messages messages with args.concurrency in flight; return msgs/sec."""
+    latency = LatencyModel(blocking)
+    pool = StandInPool(latency, args.pool_size, args.db_latency)
+    redis_manager = RedisStateManager(StandInRedis(latency, args.redis_latency))
+    handler = MessageHandler(pool, redis_manager, StandInLLM(latency, args.llm_latency))
+    handler.rate_limit_max_requests = args.messages + 1
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(i: int):
+        async with semaphore:
+            result = await handler.process_message({
+                'business_id': BUSINESS_ID,
+                'user_id': str(uuid.uuid4()),
+                'content': f"benchmark message {i}",
+                'conversation_id': str(uuid.uuid4())
+            })
+            if not result.get('success'):
+                raise RuntimeError(result.get('error'))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(args.messages)))
+    elapsed = time.perf_counter() - started
+    return args.messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the async message pipeline')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--db-latency', type=float, default=0.005, help='seconds per query')
+    parser.add_argument('--redis-latency', type=float, default=0.001, help='seconds per command')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='seconds per completion')
+    args = parser.parse_args()
+
+    async_rate = asyncio.run(run_workload(False, args))
+    blocking_rate = asyncio.run(run_workload(True, args))
+
+    print(f"\n=== MESSAGE PIPELINE THROUGHPUT ({args.messages} messages, concurrency {args.concurrency}) ===")
+    print(f"blocking stand-ins: {blocking_rate:8.1f} msg/s")
+    print(f"async stand-ins:    {async_rate:8.1f} msg/s")
+    print(f"speedup:            {async_rate / blocking_rate:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Backfill or rebuild the conversation_stats and user_message_stats rollups.
+
+The rollups are kept current by triggers on messages (migration 08). Run this
+once after applying the migration, or whenever the counters need to be
+recomputed from the full message history.
+
+Usage:
+    python backend/tools/rebuild_message_stats.py
+    python backend/tools/rebuild_message_stats.py --business-id <uuid>
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import logging
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from backend.db import get_db_connection, release_db_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def rebuild_message_stats(business_id=None):
+    """Recompute the rollups in a single transaction."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        cursor.execute("SELECT rebuild_message_stats(%s::uuid);", (business_id,))
+        cursor.execute(
+            "SELECT COUNT(*) FROM conversation_stats WHERE %s::uuid IS NULL OR business_id = %s::uuid;",
+            (business_id, business_id)
+        )
+        conversations = cursor.fetchone()[0]
+        conn.commit()
+        scope = f"business {business_id}" if business_id else "all businesses"
+        logger.info(f"Rebuilt message stats for {scope}: {conversations} conversations in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error rebuilding message stats: {e}")
+        raise
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--business-id', help="Only rebuild this business's rows")
+    args = parser.parse_args()
+    if args.business_id:
+        uuid.UUID(args.business_id)
+    rebuild_message_stats(args.business_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from typing import Dict, Any, Optional
 from .base_update_service import BaseUpdateService
+from backend.message_processing.template_variables import invalidate_business_data
 import logging
 import uuid
 
@@ -71,6 +72,7 @@ class BusinessUpdateService(BaseUpdateService):
                     )
                     
                     conn.commit()
+                    invalidate_business_data(business_id)
                     new_business = cursor.fetchone()
                     return dict(new_business) if new_business else None
                     
@@ -108,6 +110,7 @@ class BusinessUpdateService(BaseUpdateService):
             
         # Execute update
         if self._execute_update(self.table, self.id_field, business_id, filtered_data):
+            invalidate_business_data(business_id)
             return self._get_record(self.table, self.id_field, business_id)
         return None
         
@@ -71,14 +71,16 @@ export const sendMessage = async (message, businessId, userId, options = {}) =>
 };
 
 /**
- * Fetch conversation history for a business
+ * Fetch one page of conversations for a business
  * @param {string} businessId - Business ID
- * @returns {Promise<Array>} - Conversation history
+ * @param {string} [cursor] - next_cursor from the previous page
+ * @returns {Promise<Object>} - { conversations, next_cursor, has_more }
  */
-export const fetchConversationHistory = async (businessId) => {
+export const fetchConversationHistory = async (businessId, cursor) => {
   try {
+    const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
     const response = await fetch(
-      `${API_CONFIG.BASE_URL}/api/conversations?business_id=${businessId}`,
+      `${API_CONFIG.BASE_URL}/api/conversations?business_id=${businessId}${cursorParam}`,
       {
         method: 'GET',
         headers: getAuthHeaders(),
@@ -0,0 +1,98 @@
+"""
+Local OpenAI-compatible mock server for LLM tests.
+
+Serves /chat/completions and /models on 127.0.0.1 with a configurable
+latency. It counts requests and distinct TCP connections, so tests can check
+connection reuse without network access.
+"""
+
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+
+class MockLLMServer:
+    """Minimal OpenAI-compatible HTTP server running on the test event loop."""
+
+    def __init__(self, latency: float = 0.0, reply: str = "Mock reply", handshake_latency: float = 0.0):
+        """
+        Args:
+            latency: Seconds to wait before answering each request
+            reply: Assistant message returned by /chat/completions
+            handshake_latency: Extra seconds added to the first request on a new
+                connection, standing in for TCP and TLS setup
+        """
+        self.latency = latency
+        self.reply = reply
+        self.handshake_latency = handshake_latency
+        self.requests = []
+        self.connections = set()
+        self._runner = None
+        self.base_url = None
+
+    async def _delay(self, request: web.Request) -> None:
+        connection = id(request.transport)
+        if connection not in self.connections:
+            self.connections.add(connection)
+            if self.handshake_latency:
+                await asyncio.sleep(self.handshake_latency)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests.append(body)
+        await self._delay(request)
+
+        if body.get('stream'):
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+            await response.prepare(request)
+            for token in self.reply.split(' '):
+                chunk = {'choices': [{'delta': {'content': token + ' '}, 'index': 0}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in body.get('messages', []))
+        completion_tokens = len(self.reply.split())
+        return web.json_response({
+            'id': f"chatcmpl-{len(self.requests)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': self.reply},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    async def _models(self, request: web.Request) -> web.Response:
+        await self._delay(request)
+        return web.json_response({'object': 'list', 'data': [{'id': 'mock-model'}, {'id': 'gpt-4'}]})
+
+    async def start(self) -> str:
+        """Start serving on a free local port and return the base URL."""
+        app = web.Application()
+        app.router.add_post('/chat/completions', self._chat_completions)
+        app.router.add_get('/models', self._models)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
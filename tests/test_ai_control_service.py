@@ -0,0 +1,115 @@
+"""
+Tests for the shared AI stop state.
+"""
+
+import json
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock, Mock, patch
+
+from backend.message_processing.ai_control_service import AIControlService
+
+
+def make_service(stops=None, use_database=False):
+    loader = Mock(side_effect=lambda: list(stops or []))
+    return AIControlService(use_redis=False, use_database=use_database, loader=loader), loader
+
+
+def test_stops_are_checked_locally_and_user_stop_covers_conversations():
+    service, _ = make_service()
+
+    service.stop_ai_responses('conv-1')
+    service.stop_ai_responses('conv-2', user_id='user-1', duration=timedelta(hours=1))
+
+    assert service.is_ai_stopped('conv-1')
+    assert not service.is_ai_stopped('conv-2')
+    assert service.is_ai_stopped('conv-3', user_id='user-1')
+    assert service.get_stop_status('conv-2', 'user-1')['time_remaining_seconds'] > 3500
+
+    service.resume_ai_responses('conv-1')
+    assert not service.is_ai_stopped('conv-1')
+    assert service.get_stop_status('conv-1')['is_stopped'] is False
+
+
+def test_expired_stops_are_not_reported():
+    service, _ = make_service()
+
+    service.stop_ai_responses('conv-1', duration=timedelta(seconds=-1))
+
+    assert not service.is_ai_stopped('conv-1')
+    assert service._stops == {}
+
+
+def test_notifications_apply_changes_from_other_workers():
+    service, _ = make_service()
+    now = time.time()
+
+    service.handle_notification(json.dumps({
+        'action': 'stop', 'scope': 'conversation', 'id': 'conv-1',
+        'stop_time': now, 'expires_at': now + 60
+    }))
+    assert service.is_ai_stopped('conv-1')
+
+    service.handle_notification('not json')
+    service.handle_notification(json.dumps({'action': 'resume', 'scope': 'conversation', 'id': 'conv-1'}))
+    assert not service.is_ai_stopped('conv-1')
+
+
+def test_active_stops_load_from_database_without_redis():
+    now = time.time()
+    service, loader = make_service(stops=[('user', 'user-1', now, now + 60)], use_database=True)
+
+    with patch('threading.Thread'):
+        service.start()
+        assert service.is_ai_stopped('conv-1', user_id='user-1')
+        assert service.is_ai_stopped('conv-2', user_id='user-1')
+
+    assert loader.call_count == 1
+
+
+def test_checks_do_not_start_the_service():
+    """Starting does blocking I/O, so it happens at startup and never on a check."""
+    service, loader = make_service(use_database=True)
+
+    assert not service.is_ai_stopped('conv-1')
+
+    loader.assert_not_called()
+
+
+def test_failed_seed_leaves_redis_unmarked_for_the_next_worker():
+    redis_client = MagicMock()
+    redis_client.exists.return_value = 0
+    redis_client.set.return_value = True
+    service = AIControlService(use_database=True, loader=Mock(side_effect=Exception('database down')))
+
+    service._seed_redis(redis_client)
+
+    redis_client.pipeline.return_value.execute.assert_not_called()
+    assert redis_client.set.call_args.args[0] == 'ai_stop:seeding'
+    redis_client.delete.assert_called_once_with('ai_stop:seeding')
+
+    service._loader = Mock(return_value=[('user', 'user-1', time.time(), time.time() + 60)])
+    service._seed_redis(redis_client)
+
+    pipe = redis_client.pipeline.return_value
+    pipe.set.assert_called_once_with('ai_stop:loaded', '1')
+    pipe.execute.assert_called_once()
+
+
+def test_flush_writes_latest_change_per_entity():
+    service, _ = make_service(use_database=True)
+    conn = MagicMock()
+
+    with patch('threading.Thread'), \
+         patch('backend.message_processing.ai_control_service.get_db_connection', return_value=conn), \
+         patch('backend.message_processing.ai_control_service.release_db_connection'):
+        service.stop_ai_responses('conv-1')
+        service.resume_ai_responses('conv-1')
+        service.stop_ai_responses(user_id='user-1')
+        assert service.flush() == 2
+        assert service.flush() == 0
+
+    rows = {call.args[1][0]: call.args[1] for call in conn.cursor.return_value.execute.call_args_list}
+    assert rows['conv-1'][1:] == (False, None, None)
+    assert rows['user-1'][1] is True
+    conn.commit.assert_called_once()
@@ -0,0 +1,86 @@
+"""
+Tests for the async connection manager.
+"""
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from backend.db.async_connection_manager import AsyncConnectionManager
+
+
+@pytest.fixture
+def conn():
+    """Mock asyncpg connection."""
+    return Mock()
+
+
+@pytest.fixture
+def pool(conn):
+    """Mock asyncpg pool handing out the mock connection."""
+    pool = Mock()
+    pool.acquire = AsyncMock(return_value=conn)
+    pool.release = AsyncMock()
+    pool.close = AsyncMock()
+    return pool
+
+
+@pytest.fixture
+def manager(pool):
+    """Connection manager with no real backoff delay."""
+    return AsyncConnectionManager(pool, max_retries=3, retry_delay=0)
+
+
+@pytest.mark.asyncio
+async def test_execute_with_retry_returns_result(manager, pool, conn):
+    """The function result is returned and the connection released."""
+    func = AsyncMock(return_value='ok')
+
+    result = await manager.execute_with_retry(func)
+
+    assert result == 'ok'
+    func.assert_awaited_once_with(conn)
+    pool.release.assert_awaited_once_with(conn)
+
+
+@pytest.mark.asyncio
+async def test_execute_with_retry_retries_transient_errors(manager, pool):
+    """Connection-level failures are retried on a fresh connection."""
+    func = AsyncMock(side_effect=[ConnectionResetError('reset'), 'ok'])
+
+    result = await manager.execute_with_retry(func)
+
+    assert result == 'ok'
+    assert func.await_count == 2
+    assert pool.release.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_execute_with_retry_does_not_retry_query_errors(manager, pool):
+    """Query errors surface immediately without a retry."""
+    func = AsyncMock(side_effect=ValueError('bad query'))
+
+    with pytest.raises(ValueError):
+        await manager.execute_with_retry(func)
+
+    assert func.await_count == 1
+    pool.release.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_acquire_gives_up_after_max_retries(manager, pool):
+    """Acquisition failures stop after max_retries attempts."""
+    pool.acquire.side_effect = OSError('refused')
+
+    with pytest.raises(ConnectionError):
+        async with manager.get_connection():
+            pass
+
+    assert pool.acquire.await_count == 3
+    pool.release.assert_not_awaited()
+
+
+def test_backoff_delay_is_capped():
+    """Exponential backoff never exceeds max_retry_delay."""
+    manager = AsyncConnectionManager(Mock(), retry_delay=1.0, max_retry_delay=2.0)
+
+    assert all(manager._backoff_delay(attempt) <= 2.0 for attempt in range(10))
@@ -0,0 +1,117 @@
+"""
+Tests for the API key verification cache.
+"""
+
+from unittest.mock import Mock
+
+import pytest
+
+from backend.auth_cache import ApiKeyCache, hash_key
+
+BUSINESS = {'business_id': 'biz-1', 'business_name': 'Acme'}
+
+
+def make_cache(businesses=None, **kwargs):
+    """Cache without Redis whose loader counts database lookups."""
+    businesses = businesses if businesses is not None else {'good-key': BUSINESS}
+    loader = Mock(side_effect=lambda kind, key: businesses.get(key))
+    return ApiKeyCache(use_redis=False, loader=loader, **kwargs), loader
+
+
+def test_valid_key_is_looked_up_once():
+    cache, loader = make_cache()
+
+    assert cache.verify('api', 'good-key') == BUSINESS
+    assert cache.verify('api', 'good-key') == BUSINESS
+
+    assert loader.call_count == 1
+    stats = cache.stats()
+    assert stats['latency']['database']['count'] == 1
+    assert stats['latency']['local']['count'] == 1
+
+
+def test_invalid_key_is_negatively_cached():
+    """Repeated bad keys don't reach the database within the negative TTL."""
+    cache, loader = make_cache()
+
+    assert cache.verify('api', 'bad-key') is None
+    assert cache.verify('api', 'bad-key') is None
+
+    assert loader.call_count == 1
+    assert cache.stats()['latency']['local']['count'] == 1
+
+
+def test_key_kinds_are_cached_separately():
+    cache, loader = make_cache()
+
+    cache.verify('api', 'good-key')
+    cache.verify('internal', 'good-key')
+
+    assert [c.args[0] for c in loader.call_args_list] == ['api', 'internal']
+
+
+@pytest.mark.parametrize('kind, params', [('internal', ('k', 'k')), ('internal_only', ('k',))])
+def test_only_the_internal_kind_accepts_api_keys(monkeypatch, kind, params):
+    from backend import auth_cache
+    conn = Mock()
+    conn.cursor.return_value.fetchone.return_value = None
+    monkeypatch.setattr(auth_cache, 'get_db_connection', Mock(return_value=conn))
+    monkeypatch.setattr(auth_cache, 'release_db_connection', Mock())
+
+    assert auth_cache._query_business(kind, 'k') is None
+
+    query, args = conn.cursor.return_value.execute.call_args.args
+    assert ('api_key = %s' in query.replace('internal_api_key', '')) == (kind == 'internal')
+    assert args == params
+
+
+def test_database_errors_are_not_cached():
+    cache = ApiKeyCache(use_redis=False, loader=Mock(side_effect=[Exception('db down'), BUSINESS]))
+
+    with pytest.raises(Exception):
+        cache.verify('api', 'good-key')
+
+    assert cache.verify('api', 'good-key') == BUSINESS
+
+
+def test_rotation_invalidates_old_and_new_keys():
+    """After rotation the old key is rejected and the new one accepted."""
+    businesses = {'old-key': BUSINESS}
+    cache, _ = make_cache(businesses)
+    assert cache.verify('api', 'old-key') == BUSINESS
+    assert cache.verify('api', 'new-key') is None
+
+    businesses.clear()
+    businesses['new-key'] = BUSINESS
+    cache.invalidate_business_keys('biz-1')
+    cache.invalidate_api_keys('new-key')
+
+    assert cache.verify('api', 'old-key') is None
+    assert cache.verify('api', 'new-key') == BUSINESS
+
+
+def test_entries_are_shared_through_redis_by_hashed_key():
+    """Valid entries go to Redis under the key hash and are indexed by business."""
+    redis_manager = Mock()
+    redis_manager.get_state.return_value = None
+    cache = ApiKeyCache(redis_manager=redis_manager, ttl=120, loader=Mock(return_value=BUSINESS))
+
+    cache.verify('api', 'good-key')
+
+    cache_key, value = redis_manager.set_state.call_args.args
+    assert cache_key == f"auth:api:{hash_key('good-key')}"
+    assert 'good-key' not in cache_key
+    assert value == {'valid': True, **BUSINESS}
+    assert redis_manager.set_state.call_args.kwargs['ttl'] == 120
+    redis_manager.redis_client.sadd.assert_called_once_with('auth:business:biz-1', cache_key)
+
+
+def test_redis_hit_skips_database():
+    redis_manager = Mock()
+    redis_manager.get_state.return_value = {'valid': True, **BUSINESS}
+    loader = Mock()
+    cache = ApiKeyCache(redis_manager=redis_manager, loader=loader)
+
+    assert cache.verify('internal', 'good-key') == BUSINESS
+    loader.assert_not_called()
+    assert cache.stats()['latency']['redis']['count'] == 1
@@ -0,0 +1,110 @@
+"""
+Tests for the bounded connection pool.
+"""
+
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+import psycopg2.extensions
+
+from backend.db.pool import BoundedConnectionPool, PoolTimeoutError
+
+
+def make_connection():
+    """Create a mock psycopg2 connection in the idle state."""
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+@pytest.fixture
+def connect():
+    """Patch psycopg2.connect to hand out mock connections."""
+    with patch('backend.db.pool.psycopg2.connect', side_effect=lambda **kwargs: make_connection()) as connect:
+        yield connect
+
+
+def test_pool_prewarms_minconn(connect):
+    """minconn connections are opened when the pool is created."""
+    pool = BoundedConnectionPool(minconn=2, maxconn=5)
+
+    assert connect.call_count == 2
+    assert pool.stats()['idle'] == 2
+    assert pool.stats()['open'] == 2
+
+
+def test_checkout_reuses_without_health_check(connect):
+    """Recently used connections are handed out without a SELECT 1."""
+    pool = BoundedConnectionPool(minconn=1, maxconn=1, idle_check_after=60)
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    again = pool.getconn()
+
+    assert again is conn
+    conn.cursor.assert_not_called()
+    assert pool.stats()['health_checks'] == 0
+
+
+def test_idle_connection_is_health_checked(connect):
+    """Connections idle past the threshold are checked and replaced if dead."""
+    pool = BoundedConnectionPool(minconn=1, maxconn=1, idle_check_after=0)
+    dead = pool._idle[0].conn
+    dead.cursor.side_effect = psycopg2.OperationalError('server closed the connection')
+
+    conn = pool.getconn()
+
+    assert conn is not dead
+    assert pool.stats()['failed_health_checks'] == 1
+    assert pool.stats()['open'] == 1
+
+
+def test_exhausted_pool_times_out(connect):
+    """An exhausted pool raises PoolTimeoutError after waiting."""
+    pool = BoundedConnectionPool(minconn=0, maxconn=1)
+    pool.getconn()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn(timeout=0.05)
+
+    assert pool.stats()['timeouts'] == 1
+    assert pool.stats()['in_use'] == 1
+
+
+def test_waiter_gets_returned_connection(connect):
+    """A blocked getconn is woken up when a connection is returned."""
+    pool = BoundedConnectionPool(minconn=0, maxconn=1)
+    conn = pool.getconn()
+    result = {}
+
+    waiter = threading.Thread(target=lambda: result.setdefault('conn', pool.getconn(timeout=5)))
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join(timeout=5)
+
+    assert result['conn'] is conn
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_surplus_idle_connections_are_recycled(connect):
+    """Connections idle past max_idle_time are closed down to minconn."""
+    pool = BoundedConnectionPool(minconn=1, maxconn=3, max_idle_time=0)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+
+    assert pool.stats()['open'] == 1
+    assert pool.stats()['recycled'] >= 1
+
+
+def test_putconn_rolls_back_open_transaction(connect):
+    """Connections returned mid-transaction are rolled back."""
+    pool = BoundedConnectionPool(minconn=1, maxconn=1)
+    conn = pool.getconn()
+    conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+    pool.putconn(conn)
+
+    conn.rollback.assert_called_once()
@@ -0,0 +1,124 @@
+"""
+Tests for token-budgeted prompt assembly.
+"""
+
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from backend.ai import context_assembler
+from backend.ai.context_assembler import ContextAssembler, compact_json, count_tokens
+from backend.config import Config
+from backend.message_processing.services.llm_service import LLMService
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """Count tokens with the four-characters-per-token estimate, with or without tiktoken."""
+    monkeypatch.setattr(context_assembler, 'tiktoken', None)
+    context_assembler._encoding.cache_clear()
+    yield
+    context_assembler._encoding.cache_clear()
+
+
+def make_assembler(max_prompt_tokens=1000, **budgets):
+    return ContextAssembler('gpt-4', max_prompt_tokens=max_prompt_tokens, budgets=budgets)
+
+
+def history(n, size=40):
+    return [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"{i:02d}" + 'x' * (size - 2)}
+            for i in range(n)]
+
+
+def test_prompt_within_budget_is_sent_whole():
+    assembler = make_assembler(system=100, history=100)
+
+    prompt = assembler.assemble('Be helpful', 'Hello', history=history(2), extracted_data={'name': 'Ada'})
+
+    assert [m['role'] for m in prompt.messages] == ['system', 'user', 'assistant', 'system', 'user']
+    assert prompt.messages[-2]['content'] == 'Context: {"name":"Ada"}'
+    assert prompt.token_counts['input'] == count_tokens('Hello', 'gpt-4')
+    assert prompt.token_counts['total'] == sum(count_tokens(m['content'], 'gpt-4') for m in prompt.messages) + 5 * 4 + 3
+
+
+def test_history_over_its_budget_keeps_the_latest_messages():
+    assembler = make_assembler(history=30)
+
+    prompt = assembler.assemble('Be helpful', 'Hello', history=history(5))
+
+    assert [m['content'][:2] for m in prompt.messages[1:-1]] == ['03', '04']
+
+
+def test_sections_are_cut_to_their_own_budget():
+    assembler = make_assembler(business_info=10)
+
+    prompt = assembler.assemble('Be helpful', 'Hello', business_info='Name: Acme\n' + 'y' * 200)
+
+    system = prompt.messages[0]['content']
+    assert system.startswith('Be helpful\n\nName: Acme')
+    assert system.endswith(' ...')
+    assert prompt.token_counts['business_info'] <= 10
+
+
+def test_over_total_budget_trims_history_before_the_system_prompt():
+    assembler = make_assembler(max_prompt_tokens=120)
+    system = 's' * 200
+
+    prompt = assembler.assemble(system, 'Hello', history=history(10))
+
+    assert prompt.messages[0]['content'] == system
+    assert prompt.token_counts['total'] <= 120
+    assert prompt.messages[-1] == {'role': 'user', 'content': 'Hello'}
+    assert 0 < len(prompt.messages) - 2 < 10
+
+
+def test_unbudgeted_prompt_is_counted_but_not_cut():
+    assembler = make_assembler(max_prompt_tokens=10, system=5)
+    system = 's' * 400
+
+    prompt = assembler.assemble(system, 'Hello', budgeted=False)
+
+    assert prompt.messages[0]['content'] == system
+    assert prompt.token_counts['system'] == 101
+
+
+STAGE_TEMPLATE = (
+    "You are the booking assistant.\n"
+    "Business:\n{{business_info}}\n"
+    "Conversation so far: {{last_10_messages}}\n"
+    "Always answer in one short paragraph and end by asking for the booking date."
+)
+
+
+def test_sections_placed_by_the_template_are_budgeted_on_their_own():
+    assembler = make_assembler(max_prompt_tokens=400, system=60, business_info=20, history=100)
+
+    prompt = assembler.assemble(STAGE_TEMPLATE, 'Hello', business_info='Name: Acme\n' + 'y' * 400,
+                                history=history(10, size=200))
+
+    system = prompt.messages[0]['content']
+    assert system.endswith("end by asking for the booking date.")
+    rendered = json.loads(system.split('Conversation so far: ')[1].split('\n')[0])
+    assert 0 < len(rendered) < 10 and rendered[-1]['content'].startswith('09')
+    assert [m['role'] for m in prompt.messages] == ['system', 'user']
+    assert prompt.token_counts['business_info'] <= 20
+
+
+def test_stage_instructions_survive_a_full_history_at_default_budgets():
+    assembler = ContextAssembler('gpt-4', max_prompt_tokens=Config.LLM_CONTEXT_MAX_TOKENS, budgets=Config.LLM_CONTEXT_BUDGETS)
+    service = LLMService(Mock(), transport=Mock(), rate_limiter=Mock(), audit_sink=Mock(), context_assembler=assembler)
+
+    prompt = service._assemble(STAGE_TEMPLATE, 'Hello', {'date': None}, history=history(10, size=2000),
+                               business_info='Name: Acme\n' + 'y' * 4000)
+
+    assert prompt.messages[0]['content'].endswith("end by asking for the booking date.")
+    assert prompt.token_counts['history'] <= Config.LLM_CONTEXT_BUDGETS['history']
+    assert prompt.token_counts['total'] <= assembler.max_prompt_tokens
+
+
+def test_compact_json_drops_whitespace_and_empty_fields():
+    value = {'name': 'Ada', 'phone': None, 'tags': [], 'address': {'city': 'Paris', 'zip': ''}}
+
+    assert compact_json(value) == '{"name":"Ada","address":{"city":"Paris"}}'
+    assert json.loads(compact_json([{'a': 1}])) == [{'a': 1}]
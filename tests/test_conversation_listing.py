@@ -0,0 +1,159 @@
+"""
+Tests for keyset-paginated conversation listing and the message stats rollups.
+"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from flask import Flask
+
+from backend.routes import conversation_management, user_stats
+from backend.routes.utils import decode_cursor, encode_cursor
+
+BUSINESS_ID = '11111111-1111-1111-1111-111111111111'
+CONVERSATION_ID = '33333333-3333-3333-3333-333333333333'
+HEADERS = {'Authorization': 'Bearer test-key'}
+NOW = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db():
+    """Patched connection whose cursor returns the rows set by the test."""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    with patch.object(conversation_management, 'get_db_connection', return_value=conn), \
+            patch.object(conversation_management, 'release_db_connection'):
+        yield cursor
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config['ICMP_API_KEY'] = 'test-key'
+    app.register_blueprint(conversation_management.conversation_bp, url_prefix='/api/conversations')
+    return app.test_client()
+
+
+def conversation_row(i):
+    return {
+        'conversation_id': f'00000000-0000-0000-0000-{i:012d}',
+        'business_id': BUSINESS_ID,
+        'user_id': '22222222-2222-2222-2222-222222222222',
+        'session_id': None,
+        'start_time': NOW,
+        'last_updated': NOW - timedelta(minutes=i),
+        'stage_id': None,
+        'first_name': 'Ada',
+        'last_name': 'Lovelace',
+        'total_messages': 4,
+        'agent_messages': 1,
+        'last_message_time': NOW,
+        'last_user_message': 'hello',
+        'last_agent_message': 'hi there',
+    }
+
+
+def message_row(i):
+    return {
+        'message_id': f'00000000-0000-0000-0000-{i:012d}',
+        'message_content': f'message {i}',
+        'sender_type': 'assistant' if i % 2 else 'user',
+        'created_at': NOW - timedelta(minutes=i),
+    }
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(NOW, CONVERSATION_ID)
+
+    assert decode_cursor(cursor) == (NOW, CONVERSATION_ID)
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_listing_returns_page_with_summary_and_cursor(client, db):
+    """A full page reports a cursor at its last row and no message arrays."""
+    db.fetchall.return_value = [conversation_row(i) for i in range(3)]
+
+    response = client.get(f'/api/conversations?business_id={BUSINESS_ID}&limit=2', headers=HEADERS)
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert len(body['conversations']) == 2
+    assert body['has_more'] is True
+    assert decode_cursor(body['next_cursor']) == (NOW - timedelta(minutes=1), conversation_row(1)['conversation_id'])
+    conversation = body['conversations'][0]
+    assert 'messages' not in conversation
+    assert conversation['message_summary'] == {
+        'total_messages': 4,
+        'user_messages': 3,
+        'agent_messages': 1,
+        'last_user_message': 'hello',
+        'last_agent_message': 'hi there',
+        'last_message_time': NOW.isoformat(),
+    }
+    sql, params = db.execute.call_args.args
+    assert 'LIMIT %s' in sql and 'json_agg' not in sql
+    assert params == (BUSINESS_ID, 3)
+
+
+def test_listing_continues_after_cursor(client, db):
+    db.fetchall.return_value = [conversation_row(5)]
+    cursor = encode_cursor(NOW, CONVERSATION_ID)
+
+    body = client.get(f'/api/conversations?cursor={cursor}', headers=HEADERS).get_json()
+
+    assert body['has_more'] is False and body['next_cursor'] is None
+    sql, params = db.execute.call_args.args
+    assert '(c.last_updated, c.conversation_id) < (%s, %s)' in sql
+    assert params == (NOW, CONVERSATION_ID, 51)
+
+
+def test_listing_rejects_bad_cursor(client, db):
+    response = client.get('/api/conversations?cursor=garbage', headers=HEADERS)
+
+    assert response.status_code == 400
+    db.execute.assert_not_called()
+
+
+def test_messages_page_is_chronological_with_older_cursor(client, db):
+    """Messages come newest page first; each page reads oldest to newest."""
+    db.fetchall.return_value = [message_row(i) for i in range(4)]
+
+    body = client.get(f'/api/conversations/{CONVERSATION_ID}/messages?limit=3', headers=HEADERS).get_json()
+
+    assert [m['content'] for m in body['messages']] == ['message 2', 'message 1', 'message 0']
+    assert body['messages'][1]['is_from_agent'] is True
+    assert decode_cursor(body['next_cursor']) == (NOW - timedelta(minutes=2), message_row(2)['message_id'])
+    sql, params = db.execute.call_args.args
+    assert params == (CONVERSATION_ID, 4)
+
+
+def test_listing_reads_summary_from_rollup(client, db):
+    """Counts come from conversation_stats, not from scanning messages."""
+    row = conversation_row(0)
+    row.update(total_messages=None, agent_messages=None, last_message_time=None,
+               last_user_message=None, last_agent_message=None)
+    db.fetchall.return_value = [row]
+
+    body = client.get('/api/conversations', headers=HEADERS).get_json()
+
+    sql = db.execute.call_args.args[0]
+    assert 'LEFT JOIN conversation_stats' in sql
+    assert 'FROM messages' not in sql
+    assert body['conversations'][0]['message_summary']['total_messages'] == 0
+
+
+def test_user_message_counts_read_rollup():
+    app = Flask(__name__)
+    app.config['ICMP_API_KEY'] = 'test-key'
+    app.register_blueprint(user_stats.bp)
+    conn = MagicMock()
+    conn.cursor.return_value.fetchall.return_value = [('22222222-2222-2222-2222-222222222222', 7)]
+
+    with patch.object(user_stats, 'get_db_connection', return_value=conn), \
+            patch.object(user_stats, 'release_db_connection'):
+        response = app.test_client().get(f'/api/user-stats/message-counts?business_id={BUSINESS_ID}', headers=HEADERS)
+
+    assert response.get_json() == [{'user_id': '22222222-2222-2222-2222-222222222222', 'message_count': 7}]
+    assert 'FROM user_message_stats' in conn.cursor.return_value.execute.call_args.args[0]
@@ -0,0 +1,114 @@
+"""
+Tests for per-conversation leases and message coalescing.
+"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from backend.message_processing.core.errors import StateManagementError
+from backend.message_processing.services.conversation_lock import ConversationLock, ConversationSerializer
+
+_keys = itertools.count()
+
+BUSINESS_ID = '11111111-1111-1111-1111-111111111111'
+USER_ID = '22222222-2222-2222-2222-222222222222'
+
+
+def new_conversation():
+    """A conversation ID no other test has leased in this process."""
+    return f"conv-test-{next(_keys)}"
+
+
+@pytest.mark.asyncio
+async def test_lease_excludes_other_holders_and_fencing_tokens_grow():
+    lock = ConversationLock(ttl=5, wait=0.05)
+    key = new_conversation()
+
+    first = await lock.acquire(key)
+    with pytest.raises(StateManagementError):
+        await lock.acquire(key)
+    assert await lock.release(first)
+
+    second = await lock.acquire(key)
+    assert second.token > first.token
+    assert not await lock.release(first)
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_lost_to_the_next_holder():
+    lock = ConversationLock(ttl=0.05, wait=1)
+    key = new_conversation()
+
+    stale = await lock.acquire(key)
+    await asyncio.sleep(0.1)
+    current = await lock.acquire(key)
+
+    assert not await lock.renew(stale)
+    assert stale.lost
+    assert current.token > stale.token
+
+
+@pytest.mark.asyncio
+async def test_turns_of_a_conversation_run_one_at_a_time():
+    serializer = ConversationSerializer(ConversationLock(ttl=5, wait=5))
+    conversation_id = new_conversation()
+    running = []
+    overlap = []
+
+    async def process(messages, lease):
+        running.append(lease.token)
+        overlap.append(len(running))
+        await asyncio.sleep(0.02)
+        running.remove(lease.token)
+        return [{'content': message['content']} for message in messages]
+
+    results = await asyncio.gather(*[
+        serializer.run({'business_id': BUSINESS_ID, 'user_id': USER_ID,
+                        'conversation_id': conversation_id, 'content': str(i)}, process)
+        for i in range(3)
+    ])
+
+    assert [result['content'] for result in results] == ['0', '1', '2']
+    assert max(overlap) == 1
+
+
+@pytest.mark.asyncio
+async def test_burst_is_answered_in_one_turn():
+    serializer = ConversationSerializer(ConversationLock(ttl=5, wait=5), coalesce_window=0.05)
+    conversation_id = new_conversation()
+    turns = []
+
+    async def process(messages, lease):
+        turns.append([message['content'] for message in messages])
+        return [{'message': message['content'], 'response': 'one reply'} for message in messages]
+
+    async def send(content, delay):
+        await asyncio.sleep(delay)
+        return await serializer.run({'business_id': BUSINESS_ID, 'user_id': USER_ID,
+                                     'conversation_id': conversation_id, 'content': content}, process)
+
+    results = await asyncio.gather(send('hi', 0), send('are you', 0.01), send('there?', 0.02))
+
+    assert turns == [['hi', 'are you', 'there?']]
+    assert [result['message'] for result in results] == ['hi', 'are you', 'there?']
+    assert {result['response'] for result in results} == {'one reply'}
+
+
+@pytest.mark.asyncio
+async def test_failed_turn_fails_every_coalesced_message():
+    serializer = ConversationSerializer(ConversationLock(ttl=5, wait=5), coalesce_window=0.05)
+    conversation_id = new_conversation()
+
+    async def process(messages, lease):
+        raise RuntimeError("LLM unavailable")
+
+    async def send(content):
+        return await serializer.run({'business_id': BUSINESS_ID, 'user_id': USER_ID,
+                                     'conversation_id': conversation_id, 'content': content}, process)
+
+    results = await asyncio.gather(send('a'), send('b'), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert serializer._batches == {}
@@ -0,0 +1,165 @@
+"""
+Tests for hash-based conversation state and the pipelined message context read.
+"""
+
+import json
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import pytest
+
+from backend.message_processing.message_handler import MessageHandler
+from backend.rate_limiter import RateLimitResult
+from backend.message_processing.storage.redis_manager import RedisStateManager
+
+BUSINESS_ID = '11111111-1111-1111-1111-111111111111'
+USER_ID = '22222222-2222-2222-2222-222222222222'
+STAGE = {'id': 'stage-1', 'template_id': 'tpl-1'}
+RULES = [('messages:business:biz', 100, 60)]
+ALLOWED = RateLimitResult(True, 99, 0.0)
+
+
+def make_manager(replies):
+    """Manager whose Redis pipeline returns the given replies."""
+    pipe = MagicMock(execute=AsyncMock(return_value=replies))
+    client = MagicMock(pipeline=Mock(return_value=pipe))
+    return RedisStateManager(client), client, pipe
+
+
+@pytest.mark.asyncio
+async def test_message_context_is_read_in_one_round_trip():
+    manager, client, pipe = make_manager([
+        [1, 92, '0'],
+        json.dumps(STAGE),
+        {'current_stage_id': '"stage-1"', 'messages_processed': '3'},
+    ])
+
+    with patch('backend.rate_limiter.time.time', return_value=6030.0):
+        context = await manager.read_message_context(RULES, 1, 'conv-1', 'stage:conv-1')
+
+    assert context == {
+        'rate_limit': RateLimitResult(True, 92, 0.0),
+        'stage': STAGE,
+        'state': {'current_stage_id': 'stage-1', 'messages_processed': 3},
+    }
+    pipe.execute.assert_awaited_once()
+    assert pipe.evalsha.call_args.args == (
+        client.register_script.return_value.sha, 2,
+        'ratelimit:sw:messages:business:biz:100', 'ratelimit:sw:messages:business:biz:99', 1, 100, 60, 6000)
+    pipe.hgetall.assert_called_once_with('conv:conv-1:state')
+
+
+@pytest.mark.asyncio
+async def test_failed_cache_reads_fall_back_to_empty_context():
+    manager, _, _ = make_manager([[0, 0, '12.5'], Exception("WRONGTYPE"), {}])
+
+    context = await manager.read_message_context(RULES, 1, 'conv-1', 'stage:conv-1')
+
+    assert context == {'rate_limit': RateLimitResult(False, 0, 12.5), 'stage': None, 'state': None}
+
+
+@pytest.mark.asyncio
+async def test_state_update_sends_encoded_fields_and_increments():
+    script = AsyncMock(return_value=1)
+    manager = RedisStateManager(MagicMock(register_script=Mock(return_value=script)))
+
+    applied = await manager.update_conversation_state(
+        'conv-1', {'current_stage_id': 'stage-2'}, fencing_token=5, increments={'messages_processed': 1}
+    )
+
+    assert applied is True
+    call = script.await_args.kwargs
+    assert call['keys'] == ['conv:conv-1:state', 'conv:conv-1:stage_history']
+    assert json.loads(call['args'][0]) == {'current_stage_id': '"stage-2"'}
+    assert json.loads(call['args'][1]) == {'messages_processed': 1}
+    assert call['args'][2] == 5
+
+
+def make_handler(context):
+    redis_manager = AsyncMock(read_message_context=AsyncMock(return_value=context))
+    handler = MessageHandler(Mock(), redis_manager, Mock(generate_response=AsyncMock(return_value='Hi!')))
+    handler.stage_service = Mock(
+        stage_key=Mock(return_value='stage:conv-1'),
+        get_current_stage=AsyncMock(return_value={'id': 'stage-9', 'template_id': 'tpl-9'}),
+        determine_next_stage=AsyncMock(return_value={'id': 'stage-1'})
+    )
+    handler.template_service = Mock(get_template=AsyncMock(return_value={'content': 'Be brief.'}))
+
+    async def run(operation):
+        return await operation(MagicMock())
+
+    handler.connection_manager = Mock(execute_with_retry=AsyncMock(side_effect=run))
+    handler._save_user_message = AsyncMock(return_value=('conv-1', 'msg-1'))
+    handler._save_message = AsyncMock(return_value='reply-1')
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_turn_uses_prefetched_stage():
+    handler = make_handler({'rate_limit': ALLOWED, 'stage': STAGE, 'state': {'current_stage_id': 'stage-1'}})
+
+    result = await handler.process_message(
+        {'business_id': BUSINESS_ID, 'user_id': USER_ID, 'conversation_id': 'conv-1', 'content': 'hi'}
+    )
+
+    assert result['success'] is True
+    handler.stage_service.get_current_stage.assert_not_awaited()
+    handler.redis_manager.check_rate_limit.assert_not_awaited()
+    handler.template_service.get_template.assert_awaited_once_with('tpl-1', BUSINESS_ID)
+    update = handler.redis_manager.update_conversation_state.await_args.kwargs
+    assert update['increments'] == {'messages_processed': 1}
+
+
+@pytest.mark.asyncio
+async def test_stage_that_disagrees_with_state_is_looked_up():
+    handler = make_handler({'rate_limit': ALLOWED, 'stage': STAGE, 'state': {'current_stage_id': 'stage-9'}})
+
+    await handler.process_message(
+        {'business_id': BUSINESS_ID, 'user_id': USER_ID, 'conversation_id': 'conv-1', 'content': 'hi'}
+    )
+
+    handler.stage_service.get_current_stage.assert_awaited_once_with('conv-1', BUSINESS_ID)
+
+
+@pytest.mark.asyncio
+async def test_retried_platform_message_is_not_saved_again():
+    """A retry of an event whose user message was already saved reuses that message."""
+    handler = MessageHandler(Mock(), AsyncMock(), Mock())
+    handler._save_message = AsyncMock()
+    conn = MagicMock(fetchrow=AsyncMock(return_value={'conversation_id': 'conv-1', 'message_id': 'msg-1'}))
+    conn.transaction.return_value.__aenter__ = AsyncMock()
+    conn.transaction.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    saved = await handler._save_user_message(conn, {
+        'business_id': BUSINESS_ID, 'user_id': USER_ID, 'content': 'hi', 'platform_message_id': 'm-1'
+    })
+
+    assert saved == ('conv-1', 'msg-1')
+    assert conn.fetchrow.await_args.args[1] == 'm-1'
+    handler._save_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_template_sections_come_from_the_window_and_business_cache(monkeypatch):
+    """History and business info of a template are read without querying the database."""
+    from backend.message_processing import template_variables
+    cache = template_variables.business_data_cache
+    monkeypatch.setattr(cache, 'use_redis', False)
+    cache.clear_local()
+    handler = MessageHandler(Mock(), AsyncMock(), Mock(), message_window=Mock(aget_or_load=AsyncMock(return_value=[
+        {'message_content': 'hi', 'sender_type': 'user'},
+        {'message_content': 'Hello!', 'sender_type': 'assistant'},
+    ])))
+    handler.connection_manager = Mock(fetchrow=AsyncMock(return_value={
+        'business_id': BUSINESS_ID, 'business_name': 'Acme', 'stages': '[]'
+    }))
+    template = {'content': 'Know {{business_info}} and {{last_10_messages}}'}
+
+    try:
+        await handler._template_sections('conv-1', BUSINESS_ID, template)
+        sections = await handler._template_sections('conv-1', BUSINESS_ID, template)
+    finally:
+        cache.clear_local()
+
+    assert sections['history'] == [{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'Hello!'}]
+    assert sections['business_info'] == 'Name: Acme'
+    handler.connection_manager.fetchrow.assert_awaited_once()
@@ -0,0 +1,118 @@
+"""
+Tests for incremental conversation summaries.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, Mock
+
+from backend.services.conversation_summary_service import ConversationSummaryService
+
+NOW = datetime.now(timezone.utc)
+PREVIOUS = {'overview': 'Asked about prices', 'key_points': [], 'decisions': [], 'pending_items': [],
+            'next_steps': [], 'sentiment': 'neutral', 'confidence_score': 0.9}
+UPDATED = {**PREVIOUS, 'overview': 'Asked about prices, then booked'}
+
+
+def conversation_row(**overrides):
+    row = {
+        'conversation_id': 'c1', 'business_id': 'b1', 'start_time': NOW, 'last_updated': NOW,
+        'conversation_summary': PREVIOUS, 'summary_watermark_id': 'm2', 'summary_watermark_at': NOW,
+        'summary_message_count': 2, 'summary_updated_at': NOW - timedelta(hours=1),
+        'last_message_time': NOW + timedelta(minutes=5),
+        'business_name': 'Acme', 'first_name': 'Ada', 'last_name': 'Lovelace',
+    }
+    row.update(overrides)
+    return row
+
+
+def message(message_id, content, minutes):
+    return {'message_id': message_id, 'sender_type': 'user', 'message_content': content,
+            'created_at': NOW + timedelta(minutes=minutes)}
+
+
+def make_connection(conversations, new_messages=(), saved=True):
+    """Connection answering conversation, message and save queries by SQL text."""
+    cursor = MagicMock()
+    cursor.__enter__.return_value = cursor
+    cursor.fetchone.side_effect = list(conversations)
+    cursor.fetchall.side_effect = [list(batch) for batch in new_messages] + [[]] * 5
+    cursor.rowcount = 1 if saved else 0
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+def make_service(replies=(UPDATED,), batch_size=100):
+    llm = Mock(generate_response=Mock(side_effect=[json.dumps(reply) for reply in replies]))
+    return ConversationSummaryService(max_age=300, batch_size=batch_size, llm_service=llm), llm
+
+
+def test_summary_covering_the_latest_message_is_served_without_the_llm():
+    service, llm = make_service()
+    conn, cursor = make_connection([conversation_row(last_message_time=NOW)])
+
+    assert service.get_summary(conn, 'c1') == PREVIOUS
+    llm.generate_response.assert_not_called()
+    assert cursor.execute.call_count == 1
+
+
+def test_only_new_messages_are_sent_with_the_previous_summary():
+    service, llm = make_service()
+    conn, cursor = make_connection([conversation_row()], [[message('m3', 'Book me for Friday', 5)]])
+
+    assert service.get_summary(conn, 'c1') == UPDATED
+
+    call = llm.generate_response.call_args.kwargs
+    assert 'Book me for Friday' in call['input_text']
+    assert 'Asked about prices' in call['system_prompt']
+    assert 'first 2 messages' in call['system_prompt']
+    save_args = cursor.execute.call_args_list[-1].args[1]
+    assert save_args[1:5] == ('m3', NOW + timedelta(minutes=5), 3, 'c1')
+    assert save_args[5] == 'm2'
+
+
+def test_long_backlog_is_folded_in_batches():
+    service, llm = make_service(replies=(PREVIOUS, UPDATED), batch_size=2)
+    conn, _ = make_connection(
+        [conversation_row(conversation_summary=None, summary_watermark_id=None, summary_watermark_at=None,
+                          summary_message_count=0, summary_updated_at=None)],
+        [[message('m1', 'Hi', 1), message('m2', 'Prices?', 2)], [message('m3', 'Book me', 3)]]
+    )
+
+    assert service.get_summary(conn, 'c1') == UPDATED
+    first, second = (call.kwargs for call in llm.generate_response.call_args_list)
+    assert 'Prices?' in first['system_prompt']
+    assert 'Book me' in second['input_text'] and 'Prices?' not in second['input_text']
+    assert llm.generate_response.call_count == 2
+
+
+def test_recent_summary_is_served_until_it_ages_out_unless_refreshing():
+    service, llm = make_service()
+    recent = conversation_row(summary_updated_at=NOW - timedelta(seconds=30))
+
+    conn, _ = make_connection([recent])
+    assert service.get_summary(conn, 'c1') == PREVIOUS
+    llm.generate_response.assert_not_called()
+
+    conn, _ = make_connection([recent], [[message('m3', 'Book me', 5)]])
+    assert service.get_summary(conn, 'c1', refresh=True) == UPDATED
+
+
+def test_lost_race_serves_the_summary_saved_by_the_other_writer():
+    service, _ = make_service()
+    theirs = {**PREVIOUS, 'overview': 'Saved by the refresher'}
+    conn, _ = make_connection(
+        [conversation_row(), conversation_row(conversation_summary=theirs)],
+        [[message('m3', 'Book me', 5)]],
+        saved=False
+    )
+
+    assert service.get_summary(conn, 'c1') == theirs
+
+
+def test_conversation_of_another_business_is_not_found():
+    service, _ = make_service()
+    conn, _ = make_connection([conversation_row()])
+
+    assert service.get_summary(conn, 'c1', business_id='b2') is None
@@ -0,0 +1,173 @@
+"""
+Tests for the webhook ingestion queue, run against the in-memory backend.
+"""
+
+import os
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+from flask import Flask
+
+from backend.message_processing import whatsapp
+from backend.message_processing.ingestion_queue import (
+    IngestionQueue,
+    IngestionWorker,
+    LocalStreamBackend,
+)
+from backend.routes import message_handling
+
+
+def make_event(sender='user-1', mid='m-1', content='hello', platform='facebook'):
+    return {
+        'platform': platform,
+        'sender_id': sender,
+        'recipient_id': 'page-1',
+        'content': content,
+        'platform_message_id': mid,
+    }
+
+
+@pytest.fixture
+def queue():
+    return IngestionQueue(LocalStreamBackend(), partitions=4)
+
+
+def make_worker(queue, process, **kwargs):
+    kwargs.setdefault('retry_backoff', 0)
+    kwargs.setdefault('block_ms', 0)
+    return IngestionWorker(queue, process, **kwargs)
+
+
+def test_redelivered_message_is_enqueued_once(queue):
+    assert queue.enqueue(make_event()) is True
+    assert queue.enqueue(make_event()) is False
+
+    assert sum(queue.backend.length(queue.stream_name(p)) for p in range(4)) == 1
+
+
+def test_conversation_maps_to_one_partition_and_keeps_order(queue):
+    """Messages of one sender are handled in the order they arrived."""
+    for i in range(5):
+        queue.enqueue(make_event(mid=f'm-{i}', content=f'message {i}'))
+    partitions = {queue.partition_for(make_event(mid=f'm-{i}')) for i in range(5)}
+    seen = []
+
+    worker = make_worker(queue, lambda event: seen.append(event['content']))
+    worker.run_once()
+
+    assert len(partitions) == 1
+    assert seen == [f'message {i}' for i in range(5)]
+
+
+def test_partitions_are_split_between_workers(queue):
+    owners = [make_worker(queue, Mock(), worker_index=i, worker_count=3).partitions for i in range(3)]
+
+    assert sorted(p for partitions in owners for p in partitions) == list(range(4))
+
+
+def test_failures_are_retried_before_moving_on(queue):
+    queue.enqueue(make_event(mid='m-1', content='first'))
+    queue.enqueue(make_event(mid='m-2', content='second'))
+    process = Mock(side_effect=[Exception('LLM timeout'), None, None])
+
+    worker = make_worker(queue, process, max_attempts=3)
+    worker.run_once()
+
+    assert [c.args[0]['content'] for c in process.call_args_list] == ['first', 'first', 'second']
+    assert queue.backend.entries(queue.dead_letter_stream) == []
+    assert worker.run_once(pending=True) == 0
+
+
+def test_exhausted_event_goes_to_dead_letter_stream(queue):
+    queue.enqueue(make_event())
+
+    worker = make_worker(queue, Mock(side_effect=Exception('boom')), max_attempts=2)
+    worker.run_once()
+
+    dead = queue.backend.entries(queue.dead_letter_stream)
+    assert len(dead) == 1
+    assert json.loads(dead[0]['event'])['platform_message_id'] == 'm-1'
+    assert dead[0]['error'] == 'boom'
+    # Acknowledged, so it isn't delivered again
+    assert worker.run_once(pending=True) == 0
+
+
+def test_processed_but_unacked_event_is_not_processed_again(queue):
+    """An event processed before a crash is only acknowledged on recovery."""
+    queue.enqueue(make_event())
+    process = Mock()
+    worker = make_worker(queue, process)
+    backend = queue.backend
+    stream, entry_id, fields = backend.read([queue.stream_name(p) for p in range(4)], worker.consumer, 10, 0)[0]
+    queue.mark_processed(json.loads(fields['event']))
+
+    assert worker.run_once(pending=True) == 1
+
+    process.assert_not_called()
+    assert worker.run_once(pending=True) == 0
+
+
+def test_entries_left_by_a_gone_consumer_are_claimed_in_order(queue):
+    """A scaled-down worker's pending entries are handled by the partition's new owner."""
+    for i in range(3):
+        queue.enqueue(make_event(mid=f'm-{i}', content=f'message {i}'))
+    queue.backend.read([queue.stream_name(p) for p in range(4)], 'worker-0-old-host-1', 10, 0)
+    seen = []
+
+    worker = make_worker(queue, lambda event: seen.append(event['content']), claim_idle_ms=0)
+    assert worker.run_once(pending=True) == 0
+    assert worker.claim_once() == 3
+
+    assert seen == [f'message {i}' for i in range(3)]
+    assert worker.claim_once() == 0
+
+
+def test_consumer_names_differ_across_processes(queue):
+    worker = make_worker(queue, Mock())
+
+    assert worker.consumer.startswith('worker-0-')
+    assert worker.consumer.endswith(f"-{os.getpid()}")
+
+
+def test_facebook_webhook_enqueues_and_acks():
+    app = Flask(__name__)
+    app.register_blueprint(message_handling.bp, url_prefix='/api/messages')
+    queue = IngestionQueue(LocalStreamBackend(), partitions=2)
+    payload = {
+        'object': 'page',
+        'entry': [{'messaging': [{
+            'sender': {'id': 'user-1'},
+            'recipient': {'id': 'page-1'},
+            'message': {'mid': 'm-1', 'text': 'hi'},
+        }]}],
+    }
+
+    with patch.object(message_handling, 'verify_facebook_signature', return_value=True), \
+            patch.object(message_handling, 'get_ingestion_queue', return_value=queue), \
+            patch.object(message_handling, 'get_db_connection') as get_db_connection:
+        response = app.test_client().post('/api/messages/facebook', json=payload)
+
+    assert response.status_code == 200
+    get_db_connection.assert_not_called()
+    assert queue.backend.length(queue.stream_name(queue.partition_for(make_event()))) == 1
+
+
+def test_webhook_is_not_acked_when_enqueue_fails():
+    """An unacknowledged webhook is redelivered by the platform."""
+    app = Flask(__name__)
+    whatsapp.setup_whatsapp_routes(app)
+    queue = Mock()
+    queue.enqueue.side_effect = Exception('redis down')
+    payload = {'entry': [{'changes': [{'value': {
+        'metadata': {'phone_number_id': 'phone-1'},
+        'messages': [{'type': 'text', 'from': '15550001', 'id': 'wamid.1', 'text': {'body': 'hi'}}],
+    }}]}]}
+
+    with patch.object(whatsapp, 'get_ingestion_queue', return_value=queue), \
+            patch.object(whatsapp, 'send_whatsapp_message') as send:
+        response = app.test_client().post('/whatsapp-webhook', json=payload)
+
+    assert response.status_code == 503
+    send.assert_not_called()
+    assert queue.enqueue.call_args.args[0]['recipient_id'] == 'phone-1'
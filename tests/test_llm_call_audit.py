@@ -0,0 +1,109 @@
+"""
+Tests for the batched llm_calls audit writer.
+"""
+
+import time
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+
+from backend.ai.llm_call_audit import LLMCallAuditSink
+
+
+@pytest.fixture
+def written():
+    """Rows passed to execute_values, one list per batch."""
+    batches = []
+    with patch('backend.ai.llm_call_audit.execute_values',
+               side_effect=lambda cursor, sql, rows, page_size: batches.append(list(rows))):
+        yield batches
+
+
+def make_sink(**kwargs):
+    conn = MagicMock()
+    release = Mock()
+    sink = LLMCallAuditSink(get_connection=lambda: conn, release_connection=release, **kwargs)
+    return sink, conn, release
+
+
+def record(sink, n, start=0):
+    return [sink.record('biz-1', f"input {i}", f"reply {i}", 'system', 'response') for i in range(start, start + n)]
+
+
+def test_full_batch_is_written_in_one_insert(written):
+    """Reaching batch_size triggers a single multi-row INSERT and commit."""
+    sink, conn, release = make_sink(batch_size=5, flush_interval=60)
+
+    record(sink, 5)
+    deadline = time.monotonic() + 2
+    while not written and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sink.close()
+
+    assert [len(batch) for batch in written] == [5]
+    assert conn.commit.call_count == 1
+    release.assert_called_once_with(conn)
+    assert written[0][0][1:6] == ('biz-1', 'input 0', 'reply 0', 'system', 'response')
+
+
+def test_partial_batch_is_written_after_flush_interval(written):
+    """Rows below batch_size are written once the interval passes."""
+    sink, _, _ = make_sink(batch_size=100, flush_interval=0.05)
+
+    record(sink, 3)
+    time.sleep(0.3)
+
+    assert sum(len(batch) for batch in written) == 3
+    sink.close()
+
+
+def test_close_flushes_queued_rows(written):
+    """close() writes everything still queued and rejects later rows."""
+    sink, _, _ = make_sink(batch_size=100, flush_interval=60)
+    record(sink, 7)
+
+    sink.close()
+
+    assert sum(len(batch) for batch in written) == 7
+    assert sink.record('biz-1', 'late', 'reply') is False
+
+
+def test_drop_oldest_keeps_newest_rows(written):
+    """A full queue discards its oldest row to make room."""
+    sink, _, _ = make_sink(max_queue_size=3, batch_size=100, flush_interval=60)
+    sink._ensure_started = Mock()  # keep rows queued
+
+    assert all(record(sink, 5))
+    sink.flush()
+
+    assert [row[2] for row in written[0]] == ['input 2', 'input 3', 'input 4']
+
+
+def test_drop_newest_rejects_new_rows(written):
+    """Under drop_newest, rows that don't fit are refused."""
+    sink, _, _ = make_sink(max_queue_size=2, batch_size=100, flush_interval=60, overflow_policy='drop_newest')
+    sink._ensure_started = Mock()
+
+    assert record(sink, 3) == [True, True, False]
+    sink.flush()
+
+    assert [row[2] for row in written[0]] == ['input 0', 'input 1']
+
+
+def test_failed_batch_is_retried_then_dropped():
+    """A write error is retried; a batch that keeps failing is dropped."""
+    sink, conn, release = make_sink(batch_size=10, flush_interval=60, max_retries=1)
+    sink._ensure_started = Mock()
+    record(sink, 4)
+
+    with patch('backend.ai.llm_call_audit.execute_values', side_effect=Exception('db down')):
+        sink.flush()
+
+    assert sink._queue.empty()
+    assert conn.rollback.call_count == 2
+    assert release.call_count == 2
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError):
+        LLMCallAuditSink(get_connection=Mock(), overflow_policy='spill')
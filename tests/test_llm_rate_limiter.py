@@ -0,0 +1,89 @@
+"""
+Tests for the LLM token-bucket rate limiter.
+"""
+
+import itertools
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from backend.message_processing.core.errors import RateLimitError
+from backend.message_processing.services.llm_rate_limiter import LLMRateLimiter
+
+_scopes = itertools.count()
+
+
+def make_limiter(**kwargs):
+    """In-process limiter with its own budget."""
+    return LLMRateLimiter(scope=f"test-{next(_scopes)}", **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_burst_up_to_capacity_does_not_wait():
+    """Calls within the bucket capacity go through immediately."""
+    limiter = make_limiter(requests_per_minute=600, tokens_per_minute=60000, burst_seconds=1)
+
+    waits = [await limiter.acquire(tokens=100) for _ in range(10)]
+
+    assert all(wait < 0.01 for wait in waits)
+
+
+@pytest.mark.asyncio
+async def test_call_near_limit_waits_instead_of_failing():
+    """An empty bucket makes the caller wait for the refill."""
+    limiter = make_limiter(requests_per_minute=1200, tokens_per_minute=10 ** 6, burst_seconds=0.05)
+    await limiter.acquire()  # capacity is one request, refilled every 50 ms
+
+    waited = await limiter.acquire(max_wait=1)
+
+    assert 0.02 < waited < 0.5
+
+
+@pytest.mark.asyncio
+async def test_raises_when_wait_exceeds_deadline():
+    """RateLimitError is raised when capacity won't return before the deadline."""
+    limiter = make_limiter(requests_per_minute=1, tokens_per_minute=10 ** 6, burst_seconds=60)
+    await limiter.acquire()
+
+    with pytest.raises(RateLimitError) as excinfo:
+        await limiter.acquire(max_wait=0.05)
+
+    assert excinfo.value.details['retry_after'] > 0
+
+
+@pytest.mark.asyncio
+async def test_token_budget_is_corrected_with_actual_usage():
+    """Usage above the estimate overdraws the token bucket for later calls."""
+    limiter = make_limiter(requests_per_minute=10 ** 6, tokens_per_minute=600, burst_seconds=60)
+    await limiter.acquire(tokens=10)
+    await limiter.record_usage(estimated_tokens=10, actual_tokens=600)
+
+    with pytest.raises(RateLimitError):
+        await limiter.acquire(tokens=10, max_wait=0)
+
+
+@pytest.mark.asyncio
+async def test_redis_script_is_used_when_configured():
+    """With Redis, both buckets are checked in one script call."""
+    script = AsyncMock(return_value=[1, '0'])
+    redis_client = Mock()
+    redis_client.register_script.return_value = script
+    limiter = LLMRateLimiter(redis_client, requests_per_minute=60, tokens_per_minute=6000, scope='model-x')
+
+    await limiter.acquire(tokens=50)
+
+    keys = script.await_args.kwargs['keys']
+    assert keys == ['ratelimit:llm:model-x:requests', 'ratelimit:llm:model-x:tokens']
+    assert script.await_args.kwargs['args'][-1] == 50
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_local_budget_when_redis_fails():
+    """Redis errors don't fail the call; the in-process budget is used."""
+    script = AsyncMock(side_effect=ConnectionError('redis down'))
+    redis_client = Mock()
+    redis_client.register_script.return_value = script
+    limiter = LLMRateLimiter(redis_client, scope=f"test-{next(_scopes)}")
+
+    assert await limiter.acquire() < 0.01
+    script.assert_awaited_once()
@@ -0,0 +1,85 @@
+"""
+Tests for the deterministic LLM response cache.
+"""
+
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+from backend.ai.llm_response_cache import LLMResponseCache, normalize_text
+from backend.ai.llm_service import LLMService
+
+STAGES = ['Greeting', 'Pricing', 'Default Conversation Stage']
+
+
+@pytest.fixture
+def cache():
+    return LLMResponseCache(use_redis=False)
+
+
+def test_normalize_text():
+    assert normalize_text("  Hello   THERE!! ") == "hello there"
+
+
+def test_normalized_message_hits_exact_entry(cache):
+    """Case, spacing and trailing punctuation don't change the key."""
+    cache.set('intent', 'model', '', 'Hello there', 'Greeting', stages=STAGES)
+
+    assert cache.get('intent', 'model', '', 'hello   there!', stages=STAGES, business_id='b1') == 'Greeting'
+    assert cache.stats()['businesses']['b1']['hits'] == 1
+
+
+def test_key_includes_prompt_model_and_stages(cache):
+    """A different stage list, prompt or model is a different entry."""
+    cache.set('intent', 'model', '', 'hello', 'Greeting', stages=STAGES)
+
+    assert cache.get('intent', 'model', '', 'hello', stages=STAGES[1:]) is None
+    assert cache.get('intent', 'model', 'other prompt', 'hello', stages=STAGES) is None
+    assert cache.get('intent', 'other-model', '', 'hello', stages=STAGES) is None
+    assert cache.get('intent', 'model', '', 'hello', stages=list(reversed(STAGES))) == 'Greeting'
+
+
+def test_non_deterministic_call_types_are_not_cached(cache):
+    cache.set('response', 'model', '', 'hello', 'Hi! How can I help?')
+
+    assert cache.get('response', 'model', '', 'hello') is None
+    assert cache.stats()['misses'] == 0
+
+
+def test_near_duplicate_lookup():
+    """With a threshold, a close variant reuses the cached answer."""
+    cache = LLMResponseCache(use_redis=False, near_duplicate_threshold=0.6)
+    cache.set('intent', 'model', '', 'what are your prices', 'Pricing', stages=STAGES)
+
+    assert cache.get('intent', 'model', '', 'what are your price', stages=STAGES, business_id='b1') == 'Pricing'
+    assert cache.get('intent', 'model', '', 'book a table', stages=STAGES, business_id='b1') is None
+    stats = cache.stats('b1')['businesses']['b1']
+    assert stats['near_hits'] == 1
+    assert stats['hit_rate'] == 0.5
+
+
+def test_redis_backend_uses_ttl():
+    redis_manager = Mock()
+    redis_manager.get_state.return_value = None
+    cache = LLMResponseCache(redis_manager=redis_manager, ttl=120)
+
+    cache.set('intent', 'model', '', 'hello', 'Greeting', stages=STAGES)
+
+    key, value = redis_manager.set_state.call_args.args
+    assert key.startswith('llm_cache:')
+    assert value == {'response': 'Greeting'}
+    assert redis_manager.set_state.call_args.kwargs['ttl'] == 120
+
+
+def test_intent_call_skips_llm_on_repeat(cache):
+    """The second identical intent classification is served without an API call."""
+    service = LLMService(db_pool=Mock(), api_key='sk-test', audit_sink=Mock(), response_cache=cache)
+    service.client = MagicMock()
+    service.client.chat.completions.create.return_value.choices = [Mock(message=Mock(content='Greeting'))]
+
+    first = service.generate_response('Hi!', call_type='intent', available_stages=STAGES, business_id='b1')
+    second = service.generate_response('hi', call_type='intent', available_stages=STAGES, business_id='b1')
+
+    assert first == second == 'Greeting'
+    assert service.client.chat.completions.create.call_count == 1
+    assert cache.stats('b1')['businesses']['b1'] == {'hits': 1, 'near_hits': 0, 'misses': 1, 'hit_rate': 0.5}
@@ -0,0 +1,130 @@
+"""
+Tests for the shared LLM transport, run against a local mock LLM server.
+"""
+
+import time
+import asyncio
+import threading
+from unittest.mock import Mock
+
+import aiohttp
+import pytest
+import pytest_asyncio
+
+from backend.ai.llm_transport import LLMTransport
+from backend.message_processing.services.llm_service import LLMService
+from backend.message_processing.services.llm_rate_limiter import LLMRateLimiter
+from mock_llm_server import MockLLMServer
+
+
+@pytest_asyncio.fixture
+async def server():
+    """Mock LLM server with a simulated connection setup cost."""
+    server = MockLLMServer(handshake_latency=0.02)
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest_asyncio.fixture
+async def transport():
+    transport = LLMTransport(max_connections_per_host=4)
+    yield transport
+    await transport.aclose()
+
+
+def make_service(server, transport):
+    limiter = LLMRateLimiter(requests_per_minute=100000, tokens_per_minute=10 ** 9, scope='transport-test')
+    service = LLMService(Mock(), transport=transport, rate_limiter=limiter)
+    service.api_endpoint = server.base_url
+    service._log_request = Mock(side_effect=lambda *args: asyncio.sleep(0))
+    return service
+
+
+@pytest.mark.asyncio
+async def test_requests_reuse_one_connection(server, transport):
+    """Sequential completions share a single keep-alive connection."""
+    service = make_service(server, transport)
+    session = transport.get_session()
+
+    for i in range(5):
+        assert await service.generate_response("system", f"message {i}", {}) == "Mock reply"
+
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+    assert transport.get_session() is session
+
+
+@pytest.mark.asyncio
+async def test_per_host_limit_bounds_connections(server, transport):
+    """Concurrent completions never open more than the per-host limit."""
+    server.latency = 0.01
+    service = make_service(server, transport)
+
+    await asyncio.gather(*(service.generate_response("system", "hi", {}) for _ in range(12)))
+
+    assert len(server.connections) <= 4
+
+
+@pytest.mark.asyncio
+async def test_shared_session_is_faster_than_session_per_call(server, transport):
+    """Reusing connections avoids paying connection setup on every call."""
+    service = make_service(server, transport)
+    url = f"{server.base_url}/chat/completions"
+    payload = {'model': 'mock', 'messages': [{'role': 'user', 'content': 'hi'}]}
+
+    started = time.perf_counter()
+    for _ in range(5):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=payload) as response:
+                await response.json()
+    per_call_session = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(5):
+        await service.generate_response("system", "hi", {})
+    shared_session = time.perf_counter() - started
+
+    assert shared_session < per_call_session
+
+
+@pytest.mark.asyncio
+async def test_aclose_closes_session(transport):
+    """aclose() closes the session for the running loop; a new one is created on demand."""
+    session = transport.get_session()
+    await transport.aclose()
+
+    assert session.closed
+    assert transport.get_session() is not session
+
+
+def test_openai_client_is_shared_per_key():
+    """The same key gets the same OpenAI client; close() drops them."""
+    transport = LLMTransport()
+
+    client = transport.get_openai_client('sk-test')
+
+    assert transport.get_openai_client('sk-test') is client
+    assert transport.get_openai_client('sk-other') is not client
+    transport.close()
+    assert transport.get_openai_client('sk-test') is not client
+
+
+def test_close_closes_sessions_of_loops_running_in_other_threads():
+    """close() closes a session on the loop that owns it, even while that loop runs."""
+    transport = LLMTransport()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def open_session():
+        return transport.get_session()
+
+    session = asyncio.run_coroutine_threadsafe(open_session(), loop).result()
+    transport.close()
+
+    assert session.closed
+    assert not transport._sessions
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
@@ -0,0 +1,119 @@
+"""
+Tests for streaming LLM responses through MessageHandler and the SSE endpoint.
+"""
+
+import json
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import pytest
+import pytest_asyncio
+from flask import Flask
+
+from backend.ai.llm_transport import LLMTransport
+from backend.message_processing.message_handler import MessageHandler
+from backend.message_processing.handler_loop import HandlerLoop
+from backend.message_processing.services.llm_service import LLMService
+from backend.message_processing.services.llm_rate_limiter import LLMRateLimiter
+from backend.routes import message_handling
+from mock_llm_server import MockLLMServer
+
+BUSINESS_ID = '11111111-1111-1111-1111-111111111111'
+USER_ID = '22222222-2222-2222-2222-222222222222'
+
+
+@pytest_asyncio.fixture
+async def llm_service():
+    """LLMService pointed at a mock server that streams three tokens."""
+    server = MockLLMServer(reply="Hello there friend")
+    await server.start()
+    transport = LLMTransport()
+    limiter = LLMRateLimiter(requests_per_minute=100000, tokens_per_minute=10 ** 9, scope='stream-test')
+    service = LLMService(Mock(), transport=transport, rate_limiter=limiter, audit_sink=Mock())
+    service.api_endpoint = server.base_url
+    yield service
+    await transport.aclose()
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_stream_response_yields_tokens(llm_service):
+    """Tokens arrive one by one and the full reply is audited at the end."""
+    tokens = [token async for token in llm_service.stream_response("system", "hi", {}, business_id=BUSINESS_ID)]
+
+    assert tokens == ['Hello ', 'there ', 'friend ']
+    row = llm_service.audit_sink.record.call_args.kwargs
+    assert row['response'] == 'Hello there friend '
+    assert row['business_id'] == BUSINESS_ID
+
+
+@pytest.mark.asyncio
+async def test_stream_message_persists_reply_when_complete(llm_service):
+    """The handler streams tokens and saves the assistant message after the last one."""
+    handler = MessageHandler(Mock(), AsyncMock(get_rate_limit=AsyncMock(return_value=0)), llm_service)
+    handler.stage_service = Mock(
+        get_current_stage=AsyncMock(return_value={'id': 'stage-1', 'template_id': 'tpl-1'}),
+        determine_next_stage=AsyncMock(return_value={'id': 'stage-2'})
+    )
+    handler.template_service = Mock(get_template=AsyncMock(return_value={'content': 'Be brief.'}))
+    conn = MagicMock()
+
+    async def run(operation):
+        return await operation(conn)
+
+    handler.connection_manager = Mock(execute_with_retry=AsyncMock(side_effect=run))
+    handler._save_user_message = AsyncMock(return_value=('conv-1', 'msg-1'))
+    handler._save_message = AsyncMock(return_value='reply-1')
+
+    events = [event async for event in handler.stream_message(
+        {'business_id': BUSINESS_ID, 'user_id': USER_ID, 'content': 'hi'}
+    )]
+
+    assert [event['event'] for event in events] == ['start', 'token', 'token', 'token', 'done']
+    assert events[0]['conversation_id'] == 'conv-1'
+    assert events[-1]['response'] == 'Hello there friend '
+    assert events[-1]['stage_id'] == 'stage-2'
+    assert handler._save_message.await_args.args[2] == 'Hello there friend '
+
+
+@pytest.mark.asyncio
+async def test_stream_message_reports_errors_as_event():
+    handler = MessageHandler(Mock(), AsyncMock(), Mock())
+
+    events = [event async for event in handler.stream_message({'business_id': BUSINESS_ID})]
+
+    assert len(events) == 1
+    assert events[0]['event'] == 'error'
+    assert 'Missing required fields' in events[0]['error']
+
+
+def test_stream_endpoint_sends_server_sent_events():
+    """The endpoint forwards handler events as SSE frames."""
+    app = Flask(__name__)
+    app.config['ICMP_API_KEY'] = 'test-key'
+    app.register_blueprint(message_handling.bp)
+
+    async def stream_message(message_data):
+        yield {'event': 'start', 'conversation_id': 'conv-1'}
+        yield {'event': 'token', 'content': 'Hi'}
+        yield {'event': 'done', 'response': 'Hi'}
+
+    handler = Mock(stream_message=stream_message, close=AsyncMock())
+    loop = HandlerLoop()
+    create = AsyncMock(return_value=handler)
+    with patch.object(MessageHandler, 'create', create), patch.object(message_handling, 'handler_loop', loop):
+        for _ in range(2):
+            response = app.test_client().post(
+                '/api/message/stream',
+                json={'business_id': BUSINESS_ID, 'user_id': USER_ID, 'content': 'hi'},
+                headers={'Authorization': 'Bearer test-key'}
+            )
+            body = response.get_data(as_text=True)
+        loop.close()
+
+    assert response.mimetype == 'text/event-stream'
+    frames = [frame.split('\n') for frame in body.strip().split('\n\n')]
+    assert [frame[0] for frame in frames] == ['event: start', 'event: token', 'event: done']
+    assert json.loads(frames[1][1][len('data: '):]) == {'content': 'Hi'}
+    # One handler serves every request and is closed with its loop
+    create.assert_awaited_once()
+    handler.close.assert_awaited_once()
@@ -0,0 +1,128 @@
+"""
+Tests for the rolling message window.
+"""
+
+import json
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+import pytest
+
+from backend.message_processing.services.storage.message_window import MessageWindow, sanitize_content, window_entry
+
+CREATED_AT = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+ROWS = [
+    {'message_id': 'm1', 'message_content': ' Hello ', 'sender_type': 'user', 'created_at': CREATED_AT},
+    {'message_id': 'm2', 'message_content': 'user message:Hi there\n,\nconversation sumary:[...]',
+     'sender_type': 'assistant', 'created_at': CREATED_AT},
+]
+
+
+def make_window(window_values, version='4', size=20):
+    """Window whose Redis returns the given list and version, with a seed script stub."""
+    pipe = MagicMock(execute=Mock(return_value=[window_values, version]))
+    seed = Mock(return_value=1)
+    client = MagicMock(pipeline=Mock(return_value=pipe), register_script=Mock(return_value=seed))
+    return MessageWindow(client, size=size), pipe, seed
+
+
+def test_echoed_prompts_are_stripped_from_assistant_messages():
+    assert sanitize_content(ROWS[1]['message_content'], 'assistant') == 'Hi there'
+    assert sanitize_content('user message: kept', 'user') == 'user message: kept'
+
+
+def test_hit_is_served_without_the_database():
+    stored = [json.dumps({'message_content': 'Hello', 'sender_type': 'user', 'created_at': CREATED_AT.isoformat()})]
+    window, pipe, _ = make_window(stored)
+    loader = Mock()
+
+    messages = window.get_or_load('c1', 10, loader)
+
+    assert messages == [{'message_content': 'Hello', 'sender_type': 'user', 'created_at': CREATED_AT}]
+    pipe.lrange.assert_called_once_with('conv:c1:window', -10, -1)
+    loader.assert_not_called()
+
+
+def test_llm_history_borrows_a_connection_only_on_a_miss(monkeypatch):
+    from backend.ai import llm_service
+    stored = [json.dumps({'message_content': 'Hello', 'sender_type': 'user', 'created_at': CREATED_AT.isoformat()})]
+    window, _, _ = make_window(stored)
+    monkeypatch.setattr(llm_service, 'message_window', window)
+    pool = Mock()
+    cache = Mock(get=Mock(return_value=None))
+    service = llm_service.LLMService(pool, api_key='sk-test', audit_sink=Mock(), response_cache=cache,
+                                     context_assembler=Mock())
+    service.context_assembler.assemble.return_value.messages = []
+    service.client = Mock()
+    pool.reset_mock()
+    service.client.chat.completions.create.return_value.choices = [Mock(message=Mock(content='Hi'))]
+
+    service.generate_response('Hi', 'Be brief', conversation_id='c1')
+
+    history = service.context_assembler.assemble.call_args.kwargs['history']
+    assert history == [{'role': 'user', 'content': 'Hello'}]
+    pool.getconn.assert_not_called()
+
+
+def test_miss_loads_from_the_database_and_seeds_against_the_version_read():
+    window, _, seed = make_window([], version='4', size=20)
+    loader = Mock(return_value=ROWS)
+
+    messages = window.get_or_load('c1', 1, loader)
+
+    loader.assert_called_once_with(20)
+    assert [m['message_content'] for m in messages] == ['Hi there']
+    call = seed.call_args.kwargs
+    assert call['keys'] == ['conv:c1:window', 'conv:c1:window_version']
+    assert call['args'][0] == '4'
+    assert [json.loads(entry)['message_content'] for entry in call['args'][2:]] == ['Hello', 'Hi there']
+
+
+def test_limit_beyond_the_window_goes_to_the_database():
+    window, pipe, _ = make_window([], size=5)
+    loader = Mock(return_value=ROWS)
+
+    assert len(window.get_or_load('c1', 50, loader)) == 2
+    loader.assert_called_once_with(50)
+    pipe.execute.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_append_only_creates_the_window_for_new_conversations():
+    script = AsyncMock(return_value=1)
+    window = MessageWindow(MagicMock(register_script=Mock(return_value=script)), size=20, ttl=60)
+
+    assert await window.aappend('c1', [window_entry('Hello', 'user', CREATED_AT, 'm1')], create=True)
+    await window.aappend('c1', [window_entry('Hi', 'assistant', CREATED_AT, 'm2')])
+
+    first, second = (call.kwargs for call in script.await_args_list)
+    assert first['args'][:3] == ['1', 20, 60]
+    assert second['args'][:3] == ['0', 20, 60]
+    assert json.loads(second['args'][3])['message_id'] == 'm2'
+
+
+def test_redis_errors_fall_back_to_the_database():
+    window, pipe, _ = make_window([])
+    pipe.execute.side_effect = ConnectionError("down")
+
+    messages = window.get_or_load('c1', 10, Mock(return_value=ROWS))
+
+    assert len(messages) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_miss_loads_once_and_later_reads_are_served_from_the_window():
+    pipe = MagicMock(execute=AsyncMock(return_value=[[], '4']))
+    seed = AsyncMock(return_value=1)
+    window = MessageWindow(MagicMock(pipeline=Mock(return_value=pipe), register_script=Mock(return_value=seed)))
+    loader = AsyncMock(return_value=ROWS)
+
+    messages = await window.aget_or_load('c1', 10, loader)
+
+    loader.assert_awaited_once_with(20)
+    assert [m['message_content'] for m in messages] == ['Hello', 'Hi there']
+    assert seed.await_args.kwargs['args'][0] == '4'
+
+    pipe.execute.return_value = [[json.dumps({'message_content': 'Hello', 'sender_type': 'user'})], '5']
+    assert await window.aget_or_load('c1', 10, loader) == [{'message_content': 'Hello', 'sender_type': 'user'}]
+    loader.assert_awaited_once()
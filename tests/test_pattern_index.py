@@ -0,0 +1,99 @@
+"""
+Tests for the pattern learning similarity index.
+"""
+
+from unittest.mock import Mock
+
+import pytest
+
+from backend.message_processing.pattern_index import PatternIndex
+from backend.message_processing.pattern_learning import PatternLearningService
+
+PAYMENT = "Payment of $100.50 made on 01/01/2023"
+PAYMENT_AGAIN = "Payment of $100.50 made on 02/01/2023"
+BOOKING = "Please book a table for four people tonight"
+
+
+def test_similar_messages_share_a_cluster_and_others_do_not():
+    index = PatternIndex(threshold=0.5)
+
+    first, created = index.assign(PAYMENT, 't1', 'c1')
+    again, created_again = index.assign(PAYMENT_AGAIN, 't1', 'c2')
+    other, _ = index.assign(BOOKING, 't1', 'c3')
+
+    assert (first, created) == ('c1', True)
+    assert (again, created_again) == ('c1', False)
+    assert other == 'c3'
+
+
+def test_clusters_are_partitioned_by_template():
+    index = PatternIndex(threshold=0.5)
+
+    index.assign(PAYMENT, 't1', 'c1')
+
+    assert index.assign(PAYMENT, 't2', 'c2') == ('c2', True)
+    assert len(index._partitions) == 2
+
+
+def test_large_partitions_score_only_lsh_candidates():
+    index = PatternIndex(threshold=0.9, brute_force_limit=10)
+    for i in range(200):
+        index.assign(f"unrelated message number {i} about topic{i} and thing{i * 7}", 't1', f"c{i}")
+    message = "unrelated message number 42 about topic42 and thing294"
+    keys = tuple(int(key) for key in index._band_keys(index.vectorize(message))[0])
+
+    cluster_id, created = index.assign(message, 't1', 'new')
+
+    assert (cluster_id, created) == ('c42', False)
+    assert len(index._partitions['t1'].candidates(keys)) < 200
+
+
+def test_saved_index_is_reloaded(tmp_path):
+    path = str(tmp_path / 'index.npz')
+    index = PatternIndex(threshold=0.5)
+    index.assign(PAYMENT, 't1', 'c1')
+    index.assign(BOOKING, None, 'c2')
+    index.save(path)
+
+    reloaded = PatternIndex(threshold=0.5)
+    assert reloaded.load(path) == 2
+    assert reloaded.assign(PAYMENT_AGAIN, 't1', 'c3') == ('c1', False)
+    assert reloaded.assign(BOOKING, None, 'c4') == ('c2', False)
+
+
+def test_workers_saving_to_one_file_keep_each_others_clusters(tmp_path):
+    path = str(tmp_path / 'index.npz')
+    first, second = PatternIndex(threshold=0.5), PatternIndex(threshold=0.5)
+    first.assign(PAYMENT, 't1', 'c1')
+    second.assign(BOOKING, 't1', 'c2')
+    second.assign(BOOKING, 't1', 'c3')
+
+    first.save(path)
+    second.save(path)
+    first.save(path)
+
+    reloaded = PatternIndex(threshold=0.5)
+    assert reloaded.load(path) == 2
+    assert reloaded.assign(PAYMENT_AGAIN, 't1', 'c4') == ('c1', False)
+    assert reloaded.assign(BOOKING, 't1', 'c5') == ('c2', False)
+    # The second save merged the first worker's cluster into the second worker's index
+    assert second.assign(PAYMENT_AGAIN, 't1', 'c6') == ('c1', False)
+
+
+def test_index_saved_with_other_dimensions_is_rejected(tmp_path):
+    path = str(tmp_path / 'index.npz')
+    PatternIndex(n_features=256).save(path)
+
+    with pytest.raises(ValueError):
+        PatternIndex(n_features=512).load(path)
+
+
+def test_service_loads_its_index_at_startup(tmp_path):
+    path = str(tmp_path / 'index.npz')
+    service = PatternLearningService(Mock(), index=PatternIndex(threshold=0.5), index_path=path, save_interval=0)
+    cluster_id = service._get_cluster_id(PAYMENT, {'template_id': 't1'})
+
+    restarted = PatternLearningService(Mock(), index=PatternIndex(threshold=0.5), index_path=path)
+
+    assert restarted._get_cluster_id(PAYMENT_AGAIN, {'template_id': 't1'}) == cluster_id
+    assert cluster_id in restarted.pattern_clusters
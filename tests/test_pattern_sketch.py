@@ -0,0 +1,114 @@
+"""
+Tests for bounded pattern statistics and their batched writes.
+"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from backend.message_processing.pattern_index import PatternIndex
+from backend.message_processing.pattern_learning import PatternLearningService
+from backend.message_processing.pattern_sketch import SpaceSaving
+
+TEMPLATE = {'template_id': 't1'}
+MESSAGE = "Payment of $100.50 made on 01/01/2023"
+
+
+def test_sketch_keeps_heavy_hitters_within_capacity():
+    sketch = SpaceSaving(capacity=3)
+    for value in ['a'] * 50 + [f"rare{i}" for i in range(100)] + ['a'] * 30:
+        sketch.add(value)
+
+    # Any value seen more than total / capacity times is tracked
+    assert len(sketch) == 3
+    assert sketch.top(1)[0][0] == 'a'
+    count_a = dict(sketch.top())['a']
+    assert 80 <= count_a <= 80 + sketch.error('a')
+    assert sketch.total == 180
+
+
+def test_weights_are_normalized_when_read():
+    sketch = SpaceSaving()
+    for value in ['x', 'x', 'x', 'y']:
+        sketch.add(value)
+
+    assert sketch.counts() == {'x': 3, 'y': 1}
+    assert sketch.weights() == {'x': 0.75, 'y': 0.25}
+
+
+def test_non_string_values_are_counted_by_their_json():
+    sketch = SpaceSaving()
+    sketch.add({'b': 1, 'a': 2})
+    sketch.add({'a': 2, 'b': 1})
+
+    assert sketch.counts() == {'{"a": 2, "b": 1}': 2}
+
+
+@pytest.fixture
+def written():
+    """SQL and rows passed to execute_values, one entry per statement."""
+    statements = []
+    with patch('backend.message_processing.pattern_learning.execute_values',
+               side_effect=lambda cursor, sql, rows: statements.append((sql, list(rows)))):
+        yield statements
+
+
+def make_service(stored=()):
+    conn = MagicMock()
+    conn.cursor.return_value.fetchall.return_value = list(stored)
+    pool = MagicMock()
+    pool.getconn.return_value = conn
+    service = PatternLearningService(pool, index=PatternIndex(threshold=0.5), index_path='')
+    service.flush_batch_size = 1000
+    service.flush_interval = 3600
+    return service, conn
+
+
+def test_repeated_extractions_write_each_field_once_per_flush(written):
+    service, conn = make_service()
+    for amount in ['100.50', '100.50', '20.00']:
+        service.learn_from_extraction(MESSAGE, TEMPLATE, {'amount': amount})
+    assert written == []
+
+    service.flush()
+
+    results, fields = written
+    assert 'extraction_results' in results[0] and len(results[1]) == 3
+    assert 'pattern_data' in fields[0] and len(fields[1]) == 1
+    _, field, values, weights, _ = fields[1][0]
+    assert field == 'amount'
+    assert json.loads(values) == ['100.50', '20.00']
+    assert json.loads(weights) == {'100.50': 2, '20.00': 1}
+    conn.commit.assert_called_once()
+
+
+def test_stored_stats_are_merged_before_the_first_write(written):
+    service, _ = make_service()
+    cluster_id = service._get_cluster_id(MESSAGE, TEMPLATE)
+    service, _ = make_service(stored=[(cluster_id, 'amount', json.dumps({'20.00': 5}), 0.5)])
+    service.index = PatternIndex(threshold=0.5)
+    service.index.assign(MESSAGE, 't1', cluster_id)
+
+    service.learn_from_extraction(MESSAGE, TEMPLATE, {'amount': '100.50'})
+    service.flush()
+
+    _, _, _, weights, success_rate = written[-1][1][0]
+    assert json.loads(weights) == {'20.00': 5, '100.50': 1}
+    assert success_rate == pytest.approx(0.5 * 0.9 + 0.1)
+
+
+def test_failed_flush_keeps_everything_for_the_next_one(written):
+    service, conn = make_service()
+    conn.commit.side_effect = [Exception('database down'), None]
+    service.learn_from_extraction(MESSAGE, TEMPLATE, {'amount': '100.50'})
+
+    service.flush()
+    assert len(service._pending_results) == 1
+    assert len(service._dirty_fields) == 1
+
+    service.flush()
+    assert service._pending_results == [] and service._dirty_fields == set()
+    results, fields = written[-2:]
+    assert 'extraction_results' in results[0] and len(results[1]) == 1
+    assert 'pattern_data' in fields[0] and len(fields[1]) == 1
@@ -0,0 +1,88 @@
+"""
+Tests for the bounded process log store.
+"""
+
+import json
+from unittest.mock import Mock, patch
+
+from backend.message_processing.process_log_store import ProcessLogStore
+
+BUSINESS_ID = '11111111-1111-1111-1111-111111111111'
+
+
+def started(i, business_id=BUSINESS_ID):
+    return {'status': 'started', 'timestamp': f'2024-05-01T12:00:{i:02d}', 'message_data': {'business_id': business_id}}
+
+
+def test_ring_buffer_evicts_oldest_log_of_business():
+    store = ProcessLogStore(capacity=3, use_redis=False)
+    for i in range(5):
+        store.store(f'log-{i}', started(i))
+    store.store('other', started(0, business_id='other-business'))
+
+    assert store.get('log-0') is None and store.get('log-1') is None
+    assert [entry['log_id'] for entry in store.recent(BUSINESS_ID, limit=10)] == ['log-4', 'log-3', 'log-2']
+    assert store.get('other') is not None
+    assert len(store._entries) == 4
+
+
+def test_recent_returns_newest_first_up_to_limit():
+    store = ProcessLogStore(use_redis=False)
+    for i in range(15):
+        store.store(f'log-{i}', started(i))
+
+    recent = store.recent(BUSINESS_ID, limit=10)
+
+    assert len(recent) == 10
+    assert recent[0]['log_id'] == 'log-14'
+
+
+def test_update_merges_into_started_log():
+    """The completed update keeps the business and message of the started log."""
+    store = ProcessLogStore(use_redis=False)
+    store.store('log-1', started(1))
+    store.store('log-1', {'status': 'completed', 'timestamp': '2024-05-01T12:00:05'})
+
+    log_data = store.get('log-1')
+    assert log_data['status'] == 'completed'
+    assert log_data['message_data'] == {'business_id': BUSINESS_ID}
+    assert [entry['status'] for entry in store.recent(BUSINESS_ID)] == ['completed']
+
+
+def test_expired_logs_are_not_served():
+    store = ProcessLogStore(ttl=60, use_redis=False)
+    with patch('backend.message_processing.process_log_store.time.monotonic', return_value=1000.0):
+        store.store('log-1', started(1))
+    with patch('backend.message_processing.process_log_store.time.monotonic', return_value=1061.0):
+        assert store.get('log-1') is None
+        assert store.recent(BUSINESS_ID) == []
+
+
+def test_flush_spills_logs_and_evicted_logs_to_redis():
+    redis_manager = Mock()
+    pipe = redis_manager.redis_client.pipeline.return_value
+    store = ProcessLogStore(capacity=1, redis_capacity=50, redis_manager=redis_manager)
+    store._flusher = Mock()  # flush by hand
+    store.store('log-1', started(1))
+    store.store('log-2', started(2))
+
+    assert store.flush() == 2
+
+    written = {c.args[0]: json.loads(c.args[1]) for c in pipe.set.call_args_list}
+    assert set(written) == {'process_log:log-1', 'process_log:log-2'}
+    pipe.ltrim.assert_called_with(f'process_logs:{BUSINESS_ID}', 0, 49)
+    assert store.flush() == 0
+
+
+def test_recent_includes_logs_of_other_workers_from_redis():
+    redis_manager = Mock()
+    redis_manager.redis_client.lrange.return_value = ['remote', 'local']
+    redis_manager.redis_client.mget.return_value = [json.dumps(started(9))]
+    store = ProcessLogStore(redis_manager=redis_manager)
+    store._flusher = Mock()
+    store.store('local', started(1))
+
+    recent = store.recent(BUSINESS_ID, limit=5)
+
+    assert [entry['log_id'] for entry in recent] == ['remote', 'local']
+    redis_manager.redis_client.mget.assert_called_once_with(['process_log:remote'])
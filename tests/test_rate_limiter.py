@@ -0,0 +1,116 @@
+"""
+Tests for the sliding-window rate limiter.
+"""
+
+import itertools
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from redis.exceptions import NoScriptError
+
+from backend.rate_limiter import RateLimitResult, SlidingWindowRateLimiter, SlidingWindowStorage
+
+_keys = itertools.count()
+
+
+def new_key():
+    """A limit key no other test has counted against in this process."""
+    return f"test-{next(_keys)}"
+
+
+def test_calls_beyond_the_limit_are_denied_with_retry_after():
+    limiter = SlidingWindowRateLimiter()
+    key = new_key()
+
+    results = [limiter.hit([(key, 3, 60)]) for _ in range(4)]
+
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [result.remaining for result in results[:3]] == [2, 1, 0]
+    assert 0 < results[3].retry_after <= 120
+
+
+def test_previous_window_is_weighted_by_its_overlap():
+    limiter = SlidingWindowRateLimiter()
+    key = new_key()
+
+    with patch('backend.rate_limiter.time.time', return_value=1000.0):
+        for _ in range(10):
+            assert limiter.hit([(key, 10, 10)]).allowed
+    # A quarter into the next window three quarters of the old count still apply
+    with patch('backend.rate_limiter.time.time', return_value=1012.5):
+        results = [limiter.hit([(key, 10, 10)]) for _ in range(3)]
+
+    assert [result.allowed for result in results] == [True, True, False]
+    assert results[2].retry_after == pytest.approx(0.5)
+
+
+def test_denied_call_is_counted_in_no_window():
+    limiter = SlidingWindowRateLimiter()
+    business, user = new_key(), new_key()
+
+    assert limiter.hit([(user, 1, 60)]).allowed
+    assert not limiter.hit([(business, 5, 60), (user, 1, 60)]).allowed
+
+    assert limiter.hit([(business, 5, 60)]).remaining == 4
+
+
+def test_cost_above_the_limit_is_never_allowed():
+    result = SlidingWindowRateLimiter().hit([(new_key(), 2, 60)], cost=3)
+
+    assert result == RateLimitResult(False, 2, -1.0)
+
+
+@pytest.mark.asyncio
+async def test_script_reply_is_parsed_and_errors_fall_back_to_process_windows():
+    script = AsyncMock(side_effect=[[0, 0, '4.25'], ConnectionError("down")])
+    limiter = SlidingWindowRateLimiter(Mock(register_script=Mock(return_value=script)))
+    key = new_key()
+
+    with patch('backend.rate_limiter.time.time', return_value=6030.0):
+        assert await limiter.ahit([(key, 5, 60)]) == RateLimitResult(False, 0, 4.25)
+    assert await limiter.ahit([(key, 5, 60)]) == RateLimitResult(True, 4, 0.0)
+    # Both bucket keys are passed in KEYS, with the current bucket's start
+    assert script.await_args_list[0].kwargs == {
+        'keys': [f"ratelimit:sw:{key}:100", f"ratelimit:sw:{key}:99"],
+        'args': [1, 5, 60, 6000],
+    }
+
+
+def test_flask_limiter_storage_uses_the_sliding_window():
+    storage = SlidingWindowStorage(limiter=SlidingWindowRateLimiter())
+    key = new_key()
+
+    assert storage.acquire_entry(key, 2, 60)
+    assert storage.acquire_entry(key, 2, 60)
+    assert not storage.acquire_entry(key, 2, 60)
+    window_start, count = storage.get_moving_window(key, 2, 60)
+    assert count == 2
+    storage.clear(key)
+    assert storage.acquire_entry(key, 2, 60)
+
+
+@pytest.mark.asyncio
+async def test_pipelined_check_is_rerun_when_redis_lost_the_script():
+    script = AsyncMock(return_value=[1, 4, '0'])
+    limiter = SlidingWindowRateLimiter(Mock(register_script=Mock(return_value=script)))
+
+    result = await limiter.aresult(NoScriptError("No matching script"), [(new_key(), 5, 60)])
+
+    assert result == RateLimitResult(True, 4, 0.0)
+    script.assert_awaited_once()
+
+
+def test_flask_limiter_storage_supports_fixed_windows_and_reset():
+    storage = SlidingWindowStorage(limiter=SlidingWindowRateLimiter())
+    key = new_key()
+
+    assert storage.incr(key, 60) == 1
+    assert storage.incr(key, 60, amount=2) == 3
+    assert storage.get(key) == 3
+    assert 0 < storage.get_expiry(key) - time.time() <= 60
+    assert storage.acquire_entry(key, 1, 60)
+
+    assert storage.reset() >= 2
+    assert storage.get(key) == 0
+    assert storage.acquire_entry(key, 1, 60)
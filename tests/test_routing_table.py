@@ -0,0 +1,79 @@
+"""
+Tests for the in-memory webhook routing table.
+"""
+
+from unittest.mock import MagicMock, Mock, patch
+
+from backend.message_processing.routing_table import RoutingTable, get_or_create_user
+
+ACME = {'business_id': 'biz-1', 'internal_api_key': 'internal-1'}
+
+
+def make_table(routes=None, **kwargs):
+    routes = routes if routes is not None else [('facebook', 'page-1', ACME), ('whatsapp', 'phone-1', ACME)]
+    business_loader = Mock(side_effect=lambda: list(routes))
+    user_loader = Mock(side_effect=lambda platform, external_id: f'user-{external_id}')
+    return RoutingTable(business_loader=business_loader, user_loader=user_loader, **kwargs), business_loader, user_loader
+
+
+def test_businesses_load_once_and_resolve_from_memory():
+    table, business_loader, _ = make_table()
+
+    assert table.resolve_business('facebook', 'page-1') == ACME
+    assert table.resolve_business('whatsapp', 'phone-1') == ACME
+    assert table.resolve_business('facebook', 'unknown-page') is None
+    assert table.resolve_business('whatsapp', 'page-1') is None
+
+    assert business_loader.call_count == 1
+
+
+def test_business_notification_reloads_mapping():
+    routes = [('facebook', 'page-1', ACME)]
+    table, business_loader, _ = make_table(routes)
+    table.resolve_business('facebook', 'page-1')
+
+    routes[:] = [('facebook', 'page-2', ACME)]
+    table.handle_notifications(['businesses', 'businesses'])
+
+    assert business_loader.call_count == 2
+    assert table.resolve_business('facebook', 'page-1') is None
+    assert table.resolve_business('facebook', 'page-2') == ACME
+
+
+def test_users_are_cached_in_bounded_lru():
+    table, _, user_loader = make_table(max_users=2)
+
+    assert table.resolve_user('facebook', 'a') == 'user-a'
+    table.resolve_user('facebook', 'b')
+    table.resolve_user('facebook', 'a')
+    table.resolve_user('facebook', 'c')
+    table.resolve_user('facebook', 'a')
+
+    # b was least recently used when c came in
+    assert [c.args[1] for c in user_loader.call_args_list] == ['a', 'b', 'c']
+    assert len(table._users) == 2
+
+
+def test_user_notification_drops_sender():
+    table, _, user_loader = make_table()
+    table.resolve_user('facebook', 'a')
+
+    table.handle_notifications(['user:a'])
+    table.resolve_user('facebook', 'a')
+
+    assert user_loader.call_count == 2
+
+
+def test_sender_created_concurrently_resolves_to_the_existing_user():
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    # Not found, insert hits the unique index, found on the second lookup
+    cursor.fetchone.side_effect = [None, None, ('user-1',)]
+
+    with patch('backend.message_processing.routing_table.get_db_connection', return_value=conn), \
+            patch('backend.message_processing.routing_table.release_db_connection'):
+        assert get_or_create_user('whatsapp', '123') == 'user-1'
+
+    lookup, insert, _ = [c.args for c in cursor.execute.call_args_list]
+    assert lookup[1] == ('whatsapp', '123')
+    assert 'ON CONFLICT (platform, external_id) DO NOTHING' in insert[0]
@@ -0,0 +1,42 @@
+"""
+Tests for the template compiler.
+"""
+
+from backend.message_processing.templates.compiler import (
+    CompiledTemplate,
+    compile_template,
+    render_template,
+)
+
+
+def test_both_placeholder_styles():
+    """{x} and {{ x }} are both substituted."""
+    result = render_template("Hi {name}, stage {{ stage }}.", {'name': 'Ann', 'stage': 'Greeting'})
+
+    assert result == "Hi Ann, stage Greeting."
+
+
+def test_reports_required_variables():
+    """The compiled template lists the variables it uses."""
+    compiled = CompiledTemplate('{a} and {{b}} but not {"json": 1}')
+
+    assert compiled.variables == frozenset({'a', 'b'})
+    assert compiled.missing_variables({'a': 1}) == frozenset({'b'})
+
+
+def test_missing_values_are_left_as_written():
+    """Placeholders without a context value are not touched."""
+    assert render_template("{known} {{unknown}}", {'known': 'yes'}) == "yes {{unknown}}"
+
+
+def test_values_are_not_re_expanded():
+    """Substituted values containing placeholders are not rendered again."""
+    assert render_template("{a}", {'a': '{b}', 'b': 'nope'}) == "{b}"
+
+
+def test_compiled_templates_are_cached_by_id_and_content():
+    """Same id and content reuse the compiled template; edited content recompiles."""
+    first = compile_template("Hello {name}", 'tpl-1')
+
+    assert compile_template("Hello {name}", 'tpl-1') is first
+    assert compile_template("Hello {name}!", 'tpl-1') is not first
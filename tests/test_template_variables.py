@@ -0,0 +1,133 @@
+"""
+Tests for batched template variable resolution.
+"""
+
+import json
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from backend.message_processing.services.storage.message_window import message_window
+from backend.message_processing.template_variables import (
+    TemplateVariableProvider,
+    business_data_cache,
+    invalidate_business_data,
+)
+
+BUSINESS_ID = 'b1'
+CONVERSATION_ID = 'c1'
+CREATED_AT = datetime(2024, 1, 1, 12, 0, 0)
+
+MESSAGE_ROWS = [
+    {'message_content': 'Hi there', 'sender_type': 'assistant', 'created_at': CREATED_AT},
+    {'message_content': 'Hello', 'sender_type': 'user', 'created_at': CREATED_AT},
+]
+
+BUSINESS_ROW = {
+    'business_id': BUSINESS_ID, 'api_key': 'key', 'internal_api_key': 'internal', 'owner_id': 'o1',
+    'business_name': 'Acme', 'business_description': 'Widgets', 'address': '1 Main St',
+    'phone_number': '555', 'website': 'acme.test', 'first_stage_id': 's1', 'facebook_page_id': None,
+    'created_at': CREATED_AT, 'updated_at': CREATED_AT, 'business_information': 'Open daily',
+    'stages': [{'stage_name': 'Greeting', 'stage_description': 'Say hello'}],
+}
+
+
+@pytest.fixture(autouse=True)
+def local_business_cache(monkeypatch):
+    """Use only the in-process tier of the business cache, empty for each test."""
+    monkeypatch.setattr(business_data_cache, 'use_redis', False)
+    business_data_cache.clear_local()
+    yield business_data_cache
+    business_data_cache.clear_local()
+
+
+@pytest.fixture(autouse=True)
+def database_messages(monkeypatch):
+    """Read recent messages from the database, not a shared message window."""
+    monkeypatch.setattr(message_window, 'use_redis', False)
+
+
+def make_connection():
+    """Mock connection answering the messages and business queries."""
+    cursor = MagicMock()
+    cursor.__enter__.return_value = cursor
+    cursor.fetchall.return_value = MESSAGE_ROWS  # newest first, as queried
+    cursor.fetchone.side_effect = lambda: dict(BUSINESS_ROW)
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    return conn
+
+
+def generate(conn, variables, db_pool=None):
+    return TemplateVariableProvider.generate_variable_values(
+        conn, BUSINESS_ID, 'u1', CONVERSATION_ID, 'Hello',
+        template_vars=variables, db_pool=db_pool
+    )
+
+
+def test_shared_data_is_loaded_once():
+    """History and business variables share one messages and one business query."""
+    conn = make_connection()
+
+    values = generate(conn, {'conversation_history', 'last_10_messages', 'available_stages', 'business_info'})
+
+    assert conn.cursor.return_value.execute.call_count == 2
+    assert values['conversation_history'] == "User: Hello\nAssistant: Hi there"
+    assert [m['content'] for m in json.loads(values['last_10_messages'])] == ['Hello', 'Hi there']
+    assert values['available_stages'] == "Greeting: Say hello"
+    assert 'Name: Acme' in values['business_info']
+
+
+def test_loads_run_on_pooled_connections():
+    """With a pool, each data load checks out and returns its own connection."""
+    conn = make_connection()
+    pooled = [make_connection(), make_connection()]
+    pool = MagicMock()
+    pool.getconn.side_effect = list(pooled)
+
+    values = generate(conn, {'conversation_history', 'business_info'}, db_pool=pool)
+
+    conn.cursor.assert_not_called()
+    assert pool.putconn.call_count == 2
+    assert all(c.cursor.return_value.execute.call_count == 1 for c in pooled)
+    assert values['conversation_history'].startswith('User: Hello')
+
+
+def test_failed_load_falls_back_to_provider_query():
+    """If a shared load fails, the provider queries for itself."""
+    conn = make_connection()
+    cursor = conn.cursor.return_value
+    cursor.execute.side_effect = [Exception('boom'), None]
+
+    values = generate(conn, {'conversation_history'})
+
+    assert cursor.execute.call_count == 2
+    assert values['conversation_history'] == "User: Hello\nAssistant: Hi there"
+
+
+def test_business_data_is_served_from_cache():
+    """Repeated renders don't query businesses/stages until invalidated."""
+    conn = make_connection()
+    cursor = conn.cursor.return_value
+    hits_before = business_data_cache.stats()['local_hits']
+
+    generate(conn, {'business_info', 'available_stages'})
+    generate(conn, {'business_info', 'available_stages'})
+    assert cursor.execute.call_count == 1
+    assert business_data_cache.stats()['local_hits'] == hits_before + 1
+
+    invalidate_business_data(BUSINESS_ID)
+    values = generate(conn, {'available_stages'})
+    assert cursor.execute.call_count == 2
+    assert values['available_stages'] == "Greeting: Say hello"
+
+
+@pytest.mark.parametrize('variable, expected', [
+    ('business_id', BUSINESS_ID),
+    ('conversation_id', CONVERSATION_ID),
+    ('message_content', 'Hello'),
+])
+def test_context_providers(variable, expected):
+    """Providers taking the context dict are called with it."""
+    assert generate(make_connection(), {variable})[variable] == expected
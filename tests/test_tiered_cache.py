@@ -0,0 +1,101 @@
+"""
+Tests for the two-tier (process memory + Redis) cache.
+"""
+
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from backend.message_processing.services.storage.tiered_cache import TieredCache
+
+
+@pytest.fixture
+def redis_manager():
+    """Dictionary-backed stand-in for RedisStateManager."""
+    store = {}
+    manager = Mock()
+    manager.get_state.side_effect = store.get
+    manager.set_state.side_effect = lambda key, state, ttl=3600: store.__setitem__(key, state) or True
+    manager.delete_state.side_effect = lambda key: store.pop(key, None) is not None
+    manager.store = store
+    return manager
+
+
+def test_miss_then_local_hit(redis_manager):
+    """The loader runs once; the next lookup is served from process memory."""
+    cache = TieredCache('test', redis_manager=redis_manager)
+    loader = Mock(return_value={'name': 'Acme'})
+
+    assert cache.get_or_load('b1', loader) == {'name': 'Acme'}
+    assert cache.get_or_load('b1', loader) == {'name': 'Acme'}
+
+    loader.assert_called_once()
+    assert redis_manager.store['cache:test:b1'] == {'value': {'name': 'Acme'}}
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['local_hits'] == 1
+
+
+def test_redis_hit_after_local_expiry(redis_manager):
+    """Once the local entry expires the value comes from Redis, not the loader."""
+    cache = TieredCache('test', local_ttl=0, redis_manager=redis_manager)
+    loader = Mock(return_value='value')
+
+    cache.get_or_load('k', loader)
+    cache.get_or_load('k', loader)
+
+    loader.assert_called_once()
+    assert cache.stats()['redis_hits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_lookup_shares_the_tiers(redis_manager):
+    """An async miss fills Redis, so a sync lookup elsewhere does not reload."""
+    cache = TieredCache('test', redis_manager=redis_manager)
+
+    async def loader():
+        return 'value'
+
+    assert await cache.aget_or_load('k', loader) == 'value'
+    cache.clear_local()
+
+    assert cache.get_or_load('k', Mock()) == 'value'
+    assert cache.stats()['redis_hits'] == 1
+
+
+def test_invalidate_clears_both_tiers(redis_manager):
+    """Invalidation forces the next lookup to reload."""
+    cache = TieredCache('test', redis_manager=redis_manager)
+    loader = Mock(side_effect=['old', 'new'])
+
+    cache.get_or_load('k', loader)
+    cache.invalidate('k')
+
+    assert 'cache:test:k' not in redis_manager.store
+    assert cache.get_or_load('k', loader) == 'new'
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_lru_eviction():
+    """The least recently used entry is evicted past max_entries."""
+    cache = TieredCache('test', max_entries=2, use_redis=False)
+    for key in ('a', 'b'):
+        cache.get_or_load(key, lambda: key)
+    cache.get_or_load('a', Mock())  # touch a so b is least recently used
+    cache.get_or_load('c', lambda: 'c')
+
+    loader = Mock(return_value='b2')
+    assert cache.get_or_load('b', loader) == 'b2'
+    loader.assert_called_once()
+    assert cache.stats()['evictions'] >= 1
+
+
+def test_local_ttl_expiry():
+    """Entries older than local_ttl are reloaded when there is no Redis tier."""
+    cache = TieredCache('test', local_ttl=0.01, use_redis=False)
+    loader = Mock(side_effect=[1, 2])
+
+    cache.get_or_load('k', loader)
+    time.sleep(0.02)
+
+    assert cache.get_or_load('k', loader) == 2